@@ -0,0 +1,132 @@
+from sqlalchemy import event, false, select
+from sqlalchemy.orm import with_loader_criteria
+from models import Appointment, MedicalRecord, Prescription
+
+
+class AccessPolicy:
+    """Ограничение доступа к строкам, встраиваемое в SQL-запросы
+
+    Для пациента и врача ко всем ORM-запросам к Appointment, MedicalRecord и
+    Prescription добавляется условие WHERE через with_loader_criteria, поэтому
+    фильтрация выполняется в базе по тем же индексам, что и у запросов,
+    написанных вручную. Пользователь берется из session.info['principal']
+    (для многопользовательских сервисов) или из AuthManager.current_user.
+    Системные задания могут отключить ограничение опцией
+    execution_options(skip_access_policy=True).
+    """
+
+    def __init__(self, auth_manager):
+        self.auth_manager = auth_manager
+        # Готовые опции по ключу (роль, id): не строятся заново на каждый запрос
+        self._criteria_cache = {}
+
+    def install(self, session_factory):
+        """Подключение политики к фабрике сессий"""
+        event.listen(session_factory, "do_orm_execute", self._apply_criteria)
+
+    def current_principal(self, session):
+        """Пользователь, от имени которого выполняется запрос"""
+        principal = session.info.get('principal')
+        if principal is None:
+            principal = self.auth_manager.current_user
+        return principal
+
+    def criteria_for(self, principal):
+        """Набор опций with_loader_criteria для пользователя"""
+        if not principal:
+            return ()
+        key = (principal['role'], principal.get('patient_id'), principal.get('employee_id'))
+        criteria = self._criteria_cache.get(key)
+        if criteria is None:
+            if len(self._criteria_cache) >= 10000:
+                self._criteria_cache.clear()
+            criteria = self._criteria_cache[key] = tuple(self._build_criteria(principal))
+        return criteria
+
+    def _build_criteria(self, principal):
+        """Построение опций with_loader_criteria для роли пользователя"""
+        role = principal['role']
+
+        if role == 'patient':
+            return self._patient_criteria(principal.get('patient_id'))
+        if role == 'doctor':
+            return self._doctor_criteria(principal.get('employee_id'))
+        if role == 'registrar':
+            # Регистратор работает с записями на прием, но не с медицинскими данными
+            return [
+                with_loader_criteria(MedicalRecord, false(), include_aliases=True),
+                with_loader_criteria(Prescription, false(), include_aliases=True),
+            ]
+        # Администратор видит все
+        return []
+
+    @staticmethod
+    def medical_record_conditions(principal, records):
+        """Условия WHERE для запросов Core к медицинским записям
+
+        records - таблица или представление со столбцами patient_id и
+        doctor_id (например, all_medical_records из archive.py), к которым
+        with_loader_criteria не применяется. Правила те же, что у ORM-запросов.
+        """
+        if not principal:
+            return []
+        role = principal['role']
+        if role == 'patient':
+            return [records.c.patient_id == principal.get('patient_id')]
+        if role == 'doctor':
+            return [records.c.doctor_id == principal.get('employee_id')]
+        if role == 'registrar':
+            return [false()]
+        return []
+
+    @staticmethod
+    def _patient_criteria(patient_id):
+        # Лямбды кэшируются по месту определения, patient_id становится параметром запроса
+        return [
+            with_loader_criteria(
+                Appointment, lambda cls: cls.patient_id == patient_id, include_aliases=True
+            ),
+            with_loader_criteria(
+                MedicalRecord, lambda cls: cls.patient_id == patient_id, include_aliases=True
+            ),
+            with_loader_criteria(
+                Prescription,
+                lambda cls: cls.medical_record_id.in_(
+                    select(MedicalRecord.id).where(MedicalRecord.patient_id == patient_id)
+                ),
+                include_aliases=True
+            ),
+        ]
+
+    @staticmethod
+    def _doctor_criteria(employee_id):
+        return [
+            with_loader_criteria(
+                Appointment, lambda cls: cls.doctor_id == employee_id, include_aliases=True
+            ),
+            with_loader_criteria(
+                MedicalRecord, lambda cls: cls.doctor_id == employee_id, include_aliases=True
+            ),
+            with_loader_criteria(
+                Prescription,
+                lambda cls: cls.medical_record_id.in_(
+                    select(MedicalRecord.id).where(MedicalRecord.doctor_id == employee_id)
+                ),
+                include_aliases=True
+            ),
+        ]
+
+    def _apply_criteria(self, execute_state):
+        """Обработчик do_orm_execute: добавление условий к SELECT, UPDATE и DELETE"""
+        if execute_state.is_column_load or execute_state.is_relationship_load:
+            # Условия основного запроса уже распространяются на догрузку связей
+            return
+        if not (execute_state.is_select or execute_state.is_update or execute_state.is_delete):
+            return
+        if execute_state.execution_options.get('skip_access_policy', False):
+            return
+
+        # Без пользователя (системные задания до входа в систему) ограничений нет
+        criteria = self.criteria_for(self.current_principal(execute_state.session))
+        if criteria:
+            execute_state.statement = execute_state.statement.options(*criteria)
@@ -0,0 +1,826 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import secrets
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qsl
+from sqlalchemy import select, func
+from database import DatabaseManager
+from auth import AuthManager
+from access_policy import AccessPolicy
+from backup import BackupManager
+from pagination import KeysetPaginator
+from slot_finder import SlotFinder
+from schedule_conflicts import ScheduleConflictChecker
+from waitlist import WaitlistManager
+from prescriptions import current_medications
+from metrics import MetricsExporter, install_booking_metrics
+from models import (
+    Appointment, AppointmentStatus, Employee, MedicalRecord, Patient, Position, Schedule,
+    Specialization
+)
+import booking
+
+# Размер страницы списков по умолчанию и максимальный
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Ограничение размера тела запроса (байт)
+MAX_BODY_SIZE = 1024 * 1024
+
+# Методы DataExporter, доступные через API
+EXPORT_METHODS = {
+    'appointments_json': 'export_appointments_to_json',
+    'patients_csv': 'export_patients_to_csv',
+    'schedule_pdf': 'export_schedule_to_pdf',
+    'medical_records_docx': 'export_medical_records_to_docx',
+    'statistics_xlsx': 'export_statistics_to_xlsx',
+}
+
+
+class APIError(Exception):
+    """Ошибка обработки запроса с HTTP-статусом"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _json_default(value):
+    """Сериализация дат, времени и перечислений в JSON"""
+    if isinstance(value, time):
+        return value.strftime('%H:%M')
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def _full_name(last_name, first_name, patronymic):
+    return f"{last_name} {first_name} {patronymic or ''}".strip()
+
+
+def _parse_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise APIError(400, f"Некорректная дата в параметре {name}: {value}")
+
+
+def _parse_time(value, name):
+    try:
+        return time.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise APIError(400, f"Некорректное время в параметре {name}: {value}")
+
+
+def _parse_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise APIError(400, f"Параметр {name} должен быть целым числом")
+
+
+class APIRequest:
+    """Разобранный запрос: параметры, тело, пользователь"""
+
+    def __init__(self, method, path, query, headers, body, match):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.match = match
+        self.principal = None
+        self.token = None
+
+
+class ClinicAPI:
+    """Обработчики JSON API поверх моделей ORM
+
+    Один экземпляр на рабочий процесс: общий пул соединений, кэш токенов и
+    политика доступа. Каждый запрос выполняется в своей сессии, пользователь
+    запроса передается политике через session.info['principal'].
+    """
+
+    # (метод, шаблон пути, обработчик, требуемое разрешение или None для входа)
+    ROUTES = [
+        ('POST', r'/api/login', 'login', None),
+        ('POST', r'/api/logout', 'logout', ''),
+        ('GET', r'/api/patients', 'list_patients', 'view_information'),
+        ('GET', r'/api/patients/(\d+)', 'get_patient', 'view_information'),
+        ('GET', r'/api/patients/(\d+)/medications', 'list_current_medications', 'view_information'),
+        ('GET', r'/api/doctors', 'list_doctors', 'view_information'),
+        ('GET', r'/api/schedules', 'list_schedules', 'view_information'),
+        ('GET', r'/api/slots/next', 'next_free_slots', 'view_information'),
+        ('GET', r'/api/appointments', 'list_appointments', 'view_information'),
+        ('POST', r'/api/appointments', 'create_appointment', 'manage_appointments'),
+        ('POST', r'/api/appointments/(\d+)/cancel', 'cancel_appointment', 'manage_appointments'),
+        ('POST', r'/api/waitlist', 'create_waitlist_entry', 'manage_appointments'),
+        ('POST', r'/api/waitlist/(\d+)/cancel', 'cancel_waitlist_entry', 'manage_appointments'),
+        ('GET', r'/api/medical-records', 'list_medical_records', 'view_information'),
+        ('POST', r'/api/exports/(\w+)', 'create_export', 'export_data'),
+        ('GET', r'/api/backups', 'list_backups', 'manage_backups'),
+        ('POST', r'/api/backups', 'create_backup', 'manage_backups'),
+    ]
+
+    def __init__(self, db_path='medical_clinic.db', pool_size=8, max_export_concurrency=2):
+        # Пул соединений по числу потоков обработки: соединение не открывается на каждый запрос
+        self.db_manager = DatabaseManager(db_path, pool_size=pool_size, max_overflow=0, pool_timeout=30)
+        self.Session = self.db_manager.init_database()
+        self.auth_manager = AuthManager(self.db_manager)
+        self.access_policy = AccessPolicy(self.auth_manager)
+        self.access_policy.install(self.Session)
+        ScheduleConflictChecker.install(self.Session)
+        # Индекс свободных слотов свой в каждом рабочем процессе
+        self.slot_finder = SlotFinder(self.Session)
+        self.slot_finder.install()
+        # Отмена записи в этом процессе сразу предлагает место листу ожидания
+        self.waitlist = WaitlistManager(self.Session, self.slot_finder)
+        self.waitlist.install()
+        install_booking_metrics()
+        self.backup_manager = BackupManager(db_path)
+        self._export_limit = threading.BoundedSemaphore(max_export_concurrency)
+        self._routes = [
+            (method, re.compile(f'^{pattern}$'), getattr(self, handler), permission)
+            for method, pattern, handler, permission in self.ROUTES
+        ]
+
+    def close(self):
+        """Закрытие пула соединений"""
+        self.waitlist.uninstall()
+        self.slot_finder.uninstall()
+        if self.db_manager.engine:
+            self.db_manager.engine.dispose()
+
+    def resolve(self, method, path):
+        """Обработчик и разрешение для пути; APIError 404/405, если маршрута нет"""
+        path_found = False
+        for route_method, pattern, handler, permission in self._routes:
+            match = pattern.match(path)
+            if match:
+                path_found = True
+                if route_method == method:
+                    return handler, permission, match
+        if path_found:
+            raise APIError(405, "Метод не поддерживается")
+        raise APIError(404, "Ресурс не найден")
+
+    def handle(self, request, permission, handler):
+        """Проверка токена и разрешения и вызов обработчика
+
+        Возвращает (статус, данные, дополнительные заголовки).
+        """
+        if permission is not None:
+            authorization = request.headers.get('Authorization', '')
+            if not authorization.startswith('Bearer '):
+                raise APIError(401, "Требуется авторизация")
+            request.token = authorization[len('Bearer '):].strip()
+            request.principal = self.auth_manager.authenticate_token(request.token)
+            if request.principal is None:
+                raise APIError(401, "Недействительный или истекший токен")
+            if permission and permission not in request.principal['permissions']:
+                raise APIError(403, "Недостаточно прав")
+        return handler(request)
+
+    def _session(self, principal):
+        session = self.Session()
+        # Явный пользователь запроса: политика не должна брать AuthManager.current_user
+        session.info['principal'] = principal
+        return session
+
+    @staticmethod
+    def _page_args(request):
+        limit = _parse_int(request.query.get('limit', DEFAULT_PAGE_SIZE), 'limit')
+        return {
+            'limit': max(1, min(limit, MAX_PAGE_SIZE)),
+            'after': request.query.get('after'),
+            'before': request.query.get('before'),
+        }
+
+    @staticmethod
+    def _paginate(session, paginator, page_args):
+        try:
+            return paginator.page(session, **page_args)
+        except ValueError as e:
+            raise APIError(400, str(e))
+
+    # --- Вход и выход ---
+
+    def login(self, request):
+        username = request.body.get('username')
+        password = request.body.get('password')
+        if not username or not password:
+            raise APIError(400, "Укажите username и password")
+        success, message, user_info = self.auth_manager.login(username, password)
+        if not success:
+            raise APIError(401, message)
+        return 200, {'token': user_info.pop('token'), 'user': user_info}, {}
+
+    def logout(self, request):
+        self.auth_manager.sessions.revoke(request.token)
+        return 200, {'message': "Выход выполнен успешно"}, {}
+
+    # --- Пациенты и врачи ---
+
+    def list_patients(self, request):
+        statement = select(
+            Patient.id, Patient.last_name, Patient.first_name, Patient.patronymic,
+            Patient.birth_date, Patient.phone, Patient.email
+        )
+        if request.principal['role'] == 'patient':
+            # Пациент видит только себя
+            statement = statement.where(Patient.id == request.principal.get('patient_id'))
+        paginator = KeysetPaginator(statement, [Patient.last_name, Patient.first_name, Patient.id])
+
+        with self._session(request.principal) as session:
+            page = self._paginate(session, paginator, self._page_args(request))
+
+        page['items'] = [
+            {
+                'id': row.id,
+                'full_name': _full_name(row.last_name, row.first_name, row.patronymic),
+                'birth_date': row.birth_date,
+                'phone': row.phone,
+                'email': row.email,
+            }
+            for row in page['items']
+        ]
+        return 200, page, {}
+
+    def get_patient(self, request):
+        patient_id = int(request.match.group(1))
+        principal = request.principal
+        if principal['role'] == 'patient' and principal.get('patient_id') != patient_id:
+            raise APIError(404, "Пациент не найден")
+
+        with self._session(principal) as session:
+            patient = session.get(Patient, patient_id)
+            if patient is None:
+                raise APIError(404, "Пациент не найден")
+            data = {
+                'id': patient.id,
+                'last_name': patient.last_name,
+                'first_name': patient.first_name,
+                'patronymic': patient.patronymic,
+                'full_name': patient.full_name,
+                'birth_date': patient.birth_date,
+                'gender': patient.gender,
+                'phone': patient.phone,
+                'address': patient.address,
+                'email': patient.email,
+                'registration_date': patient.registration_date,
+            }
+        return 200, data, {}
+
+    def list_current_medications(self, request):
+        patient_id = int(request.match.group(1))
+        on_date = _parse_date(request.query['date'], 'date') if 'date' in request.query else None
+
+        # Назначения чужих пациентов AccessPolicy отфильтрует сама
+        with self._session(request.principal) as session:
+            rows = current_medications(session, patient_id, on_date)
+        items = []
+        for row in rows:
+            item = dict(row._mapping)
+            item['doctor'] = _full_name(item.pop('doctor_last_name'), item.pop('doctor_first_name'),
+                                        item.pop('doctor_patronymic'))
+            items.append(item)
+        return 200, {'items': items}, {}
+
+    def list_doctors(self, request):
+        statement = (
+            select(
+                Employee.id, Employee.last_name, Employee.first_name, Employee.patronymic,
+                Employee.cabinet_number, Employee.specialization_id,
+                Position.name.label('position'), Specialization.name.label('specialization')
+            )
+            .join(Position, Position.id == Employee.position_id)
+            .outerjoin(Specialization, Specialization.id == Employee.specialization_id)
+            .where(Position.name.ilike('%врач%'))
+        )
+        if 'specialization_id' in request.query:
+            statement = statement.where(
+                Employee.specialization_id == _parse_int(request.query['specialization_id'], 'specialization_id')
+            )
+        paginator = KeysetPaginator(statement, [Employee.last_name, Employee.first_name, Employee.id])
+
+        with self._session(request.principal) as session:
+            page = self._paginate(session, paginator, self._page_args(request))
+
+        page['items'] = [
+            {
+                'id': row.id,
+                'full_name': _full_name(row.last_name, row.first_name, row.patronymic),
+                'position': row.position,
+                'specialization_id': row.specialization_id,
+                'specialization': row.specialization,
+                'cabinet_number': row.cabinet_number,
+            }
+            for row in page['items']
+        ]
+        return 200, page, {}
+
+    # --- Расписание ---
+
+    def _schedule_filters(self, request):
+        query = request.query
+        start_date = _parse_date(query['date_from'], 'date_from') if 'date_from' in query else date.today()
+        end_date = _parse_date(query['date_to'], 'date_to') if 'date_to' in query else start_date + timedelta(days=7)
+        if end_date < start_date:
+            raise APIError(400, "date_to раньше date_from")
+        if (end_date - start_date).days > 92:
+            raise APIError(400, "Период расписания не может превышать 92 дня")
+        doctor_id = _parse_int(query['doctor_id'], 'doctor_id') if 'doctor_id' in query else None
+        only_free = query.get('only_free', '').lower() in ('1', 'true', 'yes')
+        return start_date, end_date, doctor_id, only_free
+
+    def _schedule_etag(self, session, start_date, end_date, doctor_id, only_free):
+        """ETag расписания по агрегатам слотов и записей за период
+
+        Два агрегирующих запроса по индексам на даты заметно дешевле построения
+        самого ответа: при совпадении ETag клиенту отдается 304 без тела.
+        Любое изменение слота (updated_at) или записи в периоде меняет ETag.
+        """
+        schedule_filter = [Schedule.work_date >= start_date, Schedule.work_date <= end_date]
+        appointment_filter = [Appointment.appointment_date >= start_date, Appointment.appointment_date <= end_date]
+        if doctor_id:
+            schedule_filter.append(Schedule.employee_id == doctor_id)
+            appointment_filter.append(Appointment.doctor_id == doctor_id)
+
+        schedules = session.execute(
+            select(func.count(Schedule.id), func.max(Schedule.id),
+                   func.max(Schedule.created_at), func.max(Schedule.updated_at))
+            .where(*schedule_filter)
+        ).one()
+        appointments = session.execute(
+            select(func.count(Appointment.id), func.max(Appointment.id), func.max(Appointment.updated_at))
+            .where(*appointment_filter)
+            .execution_options(skip_access_policy=True)
+        ).one()
+
+        fingerprint = json.dumps(
+            [start_date, end_date, doctor_id, only_free, list(schedules), list(appointments)],
+            default=_json_default
+        )
+        return 'W/"' + hashlib.sha1(fingerprint.encode('utf-8')).hexdigest() + '"'
+
+    @staticmethod
+    def _etag_matches(if_none_match, etag):
+        """Слабое сравнение ETag из заголовка If-None-Match"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        weak = etag[2:] if etag.startswith('W/') else etag
+        for candidate in if_none_match.split(','):
+            candidate = candidate.strip()
+            if (candidate[2:] if candidate.startswith('W/') else candidate) == weak:
+                return True
+        return False
+
+    def list_schedules(self, request):
+        start_date, end_date, doctor_id, only_free = self._schedule_filters(request)
+
+        with self._session(request.principal) as session:
+            etag = self._schedule_etag(session, start_date, end_date, doctor_id, only_free)
+            headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+            if self._etag_matches(request.headers.get('If-None-Match'), etag):
+                return 304, None, headers
+
+            free_slots = (Schedule.max_patients - booking.booked_count_subquery()).label('free_slots')
+            statement = (
+                select(
+                    Schedule.id, Schedule.work_date, Schedule.start_time, Schedule.end_time,
+                    Schedule.cabinet_number, Schedule.max_patients, Schedule.employee_id,
+                    Employee.last_name, Employee.first_name, Employee.patronymic,
+                    Specialization.name.label('specialization'), free_slots
+                )
+                .join(Employee, Employee.id == Schedule.employee_id)
+                .outerjoin(Specialization, Specialization.id == Employee.specialization_id)
+                .where(Schedule.work_date >= start_date, Schedule.work_date <= end_date)
+                .order_by(Schedule.work_date, Schedule.start_time, Schedule.id)
+                .execution_options(skip_access_policy=True)
+            )
+            if doctor_id:
+                statement = statement.where(Schedule.employee_id == doctor_id)
+            if only_free:
+                statement = statement.where(Schedule.max_patients > booking.booked_count_subquery())
+            rows = session.execute(statement).all()
+
+        items = [
+            {
+                'id': row.id,
+                'work_date': row.work_date,
+                'start_time': row.start_time,
+                'end_time': row.end_time,
+                'cabinet_number': row.cabinet_number,
+                'max_patients': row.max_patients,
+                'free_slots': row.free_slots,
+                'doctor_id': row.employee_id,
+                'doctor': _full_name(row.last_name, row.first_name, row.patronymic),
+                'specialization': row.specialization,
+            }
+            for row in rows
+        ]
+        return 200, {'items': items, 'date_from': start_date, 'date_to': end_date}, headers
+
+    def next_free_slots(self, request):
+        query = request.query
+        specialization_id = _parse_int(query['specialization_id'], 'specialization_id') if 'specialization_id' in query else None
+        doctor_id = _parse_int(query['doctor_id'], 'doctor_id') if 'doctor_id' in query else None
+        within_days = _parse_int(query.get('days', 14), 'days')
+        if not 1 <= within_days <= self.slot_finder.horizon_days:
+            raise APIError(400, f"Параметр days должен быть от 1 до {self.slot_finder.horizon_days}")
+        limit = max(1, min(_parse_int(query.get('limit', 1), 'limit'), MAX_PAGE_SIZE))
+
+        items = self.slot_finder.find(specialization_id, doctor_id, within_days, limit=limit)
+        return 200, {'items': items}, {}
+
+    # --- Записи на прием ---
+
+    def list_appointments(self, request):
+        statement = (
+            select(
+                Appointment.id, Appointment.appointment_date, Appointment.appointment_time,
+                Appointment.status, Appointment.reason, Appointment.patient_id, Appointment.doctor_id,
+                Patient.last_name.label('patient_last_name'),
+                Patient.first_name.label('patient_first_name'),
+                Patient.patronymic.label('patient_patronymic'),
+                Employee.last_name.label('doctor_last_name'),
+                Employee.first_name.label('doctor_first_name'),
+                Employee.patronymic.label('doctor_patronymic'),
+            )
+            .join(Patient, Patient.id == Appointment.patient_id)
+            .join(Employee, Employee.id == Appointment.doctor_id)
+        )
+        if 'status' in request.query:
+            try:
+                status = AppointmentStatus(request.query['status'])
+            except ValueError:
+                raise APIError(400, f"Неизвестный статус записи: {request.query['status']}")
+            statement = statement.where(Appointment.status == status)
+        if 'patient_id' in request.query:
+            statement = statement.where(Appointment.patient_id == _parse_int(request.query['patient_id'], 'patient_id'))
+        if 'doctor_id' in request.query:
+            statement = statement.where(Appointment.doctor_id == _parse_int(request.query['doctor_id'], 'doctor_id'))
+
+        # Новые записи первыми; пациент и врач видят только свои - условие добавляет AccessPolicy
+        paginator = KeysetPaginator(
+            statement,
+            [Appointment.appointment_date, Appointment.appointment_time, Appointment.id],
+            descending=True
+        )
+        with self._session(request.principal) as session:
+            page = self._paginate(session, paginator, self._page_args(request))
+
+        page['items'] = [
+            {
+                'id': row.id,
+                'appointment_date': row.appointment_date,
+                'appointment_time': row.appointment_time,
+                'status': row.status,
+                'reason': row.reason,
+                'patient_id': row.patient_id,
+                'patient': _full_name(row.patient_last_name, row.patient_first_name, row.patient_patronymic),
+                'doctor_id': row.doctor_id,
+                'doctor': _full_name(row.doctor_last_name, row.doctor_first_name, row.doctor_patronymic),
+            }
+            for row in page['items']
+        ]
+        return 200, page, {}
+
+    def create_appointment(self, request):
+        body = request.body
+        for field in ('patient_id', 'doctor_id', 'date', 'time'):
+            if field not in body:
+                raise APIError(400, f"Не указано поле {field}")
+
+        with self._session(request.principal) as session:
+            success, message, appointment_id = booking.book_appointment(
+                session,
+                _parse_int(body['patient_id'], 'patient_id'),
+                _parse_int(body['doctor_id'], 'doctor_id'),
+                _parse_date(body['date'], 'date'),
+                _parse_time(body['time'], 'time'),
+                body.get('reason')
+            )
+        if not success:
+            raise APIError(409, message)
+        return 201, {'id': appointment_id, 'message': message}, {'Location': f'/api/appointments/{appointment_id}'}
+
+    def cancel_appointment(self, request):
+        appointment_id = int(request.match.group(1))
+        with self._session(request.principal) as session:
+            success, message = booking.cancel_appointment(session, appointment_id)
+        if not success:
+            raise APIError(404 if message == "Запись не найдена" else 409, message)
+        return 200, {'id': appointment_id, 'message': message}, {}
+
+    # --- Лист ожидания ---
+
+    def create_waitlist_entry(self, request):
+        body = request.body
+        for field in ('patient_id', 'date_from', 'date_to'):
+            if field not in body:
+                raise APIError(400, f"Не указано поле {field}")
+        success, message, entry_id = self.waitlist.add_entry(
+            _parse_int(body['patient_id'], 'patient_id'),
+            _parse_date(body['date_from'], 'date_from'),
+            _parse_date(body['date_to'], 'date_to'),
+            doctor_id=_parse_int(body['doctor_id'], 'doctor_id') if body.get('doctor_id') else None,
+            specialization_id=_parse_int(body['specialization_id'], 'specialization_id') if body.get('specialization_id') else None,
+            time_from=_parse_time(body['time_from'], 'time_from') if body.get('time_from') else None,
+            time_to=_parse_time(body['time_to'], 'time_to') if body.get('time_to') else None,
+            priority=_parse_int(body.get('priority', 0), 'priority'),
+            notes=body.get('notes')
+        )
+        if not success:
+            raise APIError(400, message)
+        return 201, {'id': entry_id, 'message': message}, {}
+
+    def cancel_waitlist_entry(self, request):
+        entry_id = int(request.match.group(1))
+        success, message = self.waitlist.cancel_entry(entry_id)
+        if not success:
+            raise APIError(409, message)
+        return 200, {'id': entry_id, 'message': message}, {}
+
+    # --- Медицинские записи ---
+
+    def list_medical_records(self, request):
+        statement = select(
+            MedicalRecord.id, MedicalRecord.record_date, MedicalRecord.appointment_id,
+            MedicalRecord.patient_id, MedicalRecord.doctor_id, MedicalRecord.diagnosis_id,
+            MedicalRecord.complaints, MedicalRecord.recommendations,
+            MedicalRecord.next_visit_date, MedicalRecord.is_emergency
+        )
+        if 'patient_id' in request.query:
+            statement = statement.where(MedicalRecord.patient_id == _parse_int(request.query['patient_id'], 'patient_id'))
+
+        # Регистратору AccessPolicy не покажет ни одной записи
+        paginator = KeysetPaginator(statement, [MedicalRecord.record_date, MedicalRecord.id], descending=True)
+        with self._session(request.principal) as session:
+            page = self._paginate(session, paginator, self._page_args(request))
+
+        page['items'] = [dict(row._mapping) for row in page['items']]
+        return 200, page, {}
+
+    # --- Экспорт и резервные копии ---
+
+    def create_export(self, request):
+        kind = request.match.group(1)
+        method_name = EXPORT_METHODS.get(kind)
+        if method_name is None:
+            raise APIError(404, f"Неизвестный формат экспорта: {kind}")
+        # Экспорт тяжелый: лишние запросы сразу получают отказ, а не занимают потоки
+        kwargs = {
+            key: _parse_date(value, key) if key.endswith('_date') and value else value
+            for key, value in request.body.items()
+        }
+        if not self._export_limit.acquire(timeout=1):
+            raise APIError(503, "Сервер занят экспортом, повторите позже")
+        try:
+            # Тяжелые библиотеки экспорта загружаются только при первом экспорте
+            from export_data import DataExporter
+            with self._session(request.principal) as session:
+                success, message, path = getattr(DataExporter(session), method_name)(**kwargs)
+        except TypeError as e:
+            raise APIError(400, f"Некорректные параметры экспорта: {e}")
+        finally:
+            self._export_limit.release()
+        if not success:
+            raise APIError(500, message)
+        return 201, {'message': message, 'path': path}, {}
+
+    def list_backups(self, request):
+        return 200, {'items': self.backup_manager.list_backups()}, {}
+
+    def create_backup(self, request):
+        backup_type = request.body.get('type', 'local')
+        if backup_type not in ('local', 'remote', 'cloud'):
+            raise APIError(400, f"Неизвестный тип резервной копии: {backup_type}")
+        success, message = self.backup_manager.create_backup(backup_type)
+        if not success:
+            raise APIError(500, message)
+        return 201, {'message': message}, {}
+
+
+class ClinicRequestHandler(BaseHTTPRequestHandler):
+    """Разбор HTTP-запроса и сериализация ответа JSON"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ClinicAPI/1.0'
+    # Простаивающее keep-alive соединение не держит поток бесконечно
+    timeout = 15
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_SIZE:
+            raise APIError(413, "Слишком большое тело запроса")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise APIError(400, "Тело запроса должно быть в формате JSON")
+        if not isinstance(body, dict):
+            raise APIError(400, "Тело запроса должно быть объектом JSON")
+        return body
+
+    def _dispatch(self, method):
+        api = self.server.api
+        headers = {}
+        try:
+            url = urlsplit(self.path)
+            # Тело читается до проверок, чтобы keep-alive соединение осталось согласованным
+            body = self._read_body() if method == 'POST' else {}
+            handler, permission, match = api.resolve(method, url.path.rstrip('/') or '/')
+            request = APIRequest(method, url.path, dict(parse_qsl(url.query)), self.headers, body, match)
+            status, payload, headers = api.handle(request, permission, handler)
+        except APIError as e:
+            status, payload = e.status, {'error': e.message}
+            if e.status == 413:
+                self.close_connection = True
+        except Exception as e:
+            self.log_error("Ошибка обработки запроса %s: %s", self.path, e)
+            status, payload = 500, {'error': "Внутренняя ошибка сервера"}
+        self._send(status, payload, headers)
+
+    def _send(self, status, payload, headers):
+        data = b'' if payload is None else json.dumps(
+            payload, default=_json_default, ensure_ascii=False
+        ).encode('utf-8')
+        self.send_response(status)
+        if payload is not None:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP-сервер с ограниченным пулом потоков обработки соединений
+
+    В отличие от ThreadingHTTPServer число потоков не растет с числом
+    клиентов и совпадает с размером пула соединений с базой.
+    """
+
+    def __init__(self, server_address, api, threads=16, verbose=False, bind_and_activate=True):
+        super().__init__(server_address, ClinicRequestHandler, bind_and_activate)
+        self.api = api
+        self.verbose = verbose
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='clinic-api')
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_worker(listener, db_path, threads, verbose, worker=None):
+    """Рабочий процесс: свой пул соединений и потоков на общем сокете"""
+    api = ClinicAPI(db_path, pool_size=threads)
+    # Метрики процесса: у рабочего процесса свой файл с меткой worker
+    metrics_exporter = MetricsExporter.from_env(worker=worker)
+    if metrics_exporter.enabled:
+        print(metrics_exporter.start()[1])
+    server = PooledHTTPServer(listener.getsockname(), api, threads, verbose, bind_and_activate=False)
+    server.socket.close()
+    server.socket = listener
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        metrics_exporter.stop()
+        api.close()
+
+
+def serve(host='127.0.0.1', port=8080, db_path='medical_clinic.db', workers=None, threads=16, verbose=False):
+    """Запуск API-сервера
+
+    Родительский процесс открывает сокет и порождает workers рабочих процессов
+    (по числу ядер), которые принимают соединения с общего сокета: запросы
+    обрабатываются на нескольких ядрах без блокировки GIL. Упавший рабочий
+    процесс перезапускается. Без os.fork (Windows) сервер работает в одном процессе.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    # Один ключ подписи для всех процессов: токен, выданный одним процессом, принимают остальные
+    os.environ.setdefault('CLINIC_SECRET_KEY', secrets.token_hex(32))
+
+    # Схема создается и обновляется один раз до запуска рабочих процессов
+    db_manager = DatabaseManager(db_path)
+    db_manager.init_database()
+    db_manager.engine.dispose()
+
+    listener = socket.create_server((host, port), backlog=1024)
+    print(f"API-сервер клиники: http://{host}:{listener.getsockname()[1]}/api "
+          f"(процессов: {workers}, потоков в процессе: {threads})")
+
+    if workers == 1 or not hasattr(os, 'fork'):
+        try:
+            _run_worker(listener, db_path, threads, verbose)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+        return
+
+    # Номер рабочего процесса по pid: перезапущенный процесс пишет метрики в тот же файл
+    children = {}
+    stopping = False
+
+    def spawn(worker):
+        pid = os.fork()
+        if pid == 0:
+            # Ctrl+C обрабатывает родительский процесс
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            exit_code = 0
+            try:
+                _run_worker(listener, db_path, threads, verbose, worker)
+            except Exception as e:
+                print(f"Рабочий процесс {os.getpid()} завершился с ошибкой: {e}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        children[pid] = worker
+
+    def stop(signum=None, frame=None):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                children.pop(pid, None)
+
+    signal.signal(signal.SIGTERM, stop)
+    for worker in range(workers):
+        spawn(worker)
+
+    try:
+        while children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            except KeyboardInterrupt:
+                stop()
+                continue
+            worker = children.pop(pid, None)
+            if not stopping and worker is not None:
+                print(f"Рабочий процесс {pid} остановлен, запускается новый")
+                spawn(worker)
+    finally:
+        listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API медицинской клиники")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - число ядер)")
+    parser.add_argument('--threads', type=int, default=16, help="потоков и соединений с базой в процессе")
+    parser.add_argument('--verbose', action='store_true', help="журнал запросов")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.db, args.workers, args.threads, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+import argparse
+import os
+from collections import Counter
+from datetime import date, datetime
+from pathlib import Path
+import pandas as pd
+from sqlalchemy import Integer, Text, insert, select, func, bindparam, literal
+from models import Appointment, AppointmentStatus, Employee, Patient, Schedule
+from booking import booked_count_subquery, notify_booking_listeners
+from normalization import fold_name, name_key
+from patient_import import parse_dates, read_chunks, rename_columns
+
+# Названия столбцов файла записей -> поля (сравниваются без регистра и пробелов по краям)
+COLUMN_ALIASES = {
+    'patient_id': ('patient_id', 'id пациента'),
+    'passport': ('passport', 'паспорт'),
+    'phone': ('phone', 'телефон'),
+    'birth_date': ('birth_date', 'дата рождения'),
+    'doctor_id': ('doctor_id', 'id врача'),
+    'doctor': ('doctor', 'врач'),
+    'appointment_date': ('appointment_date', 'date', 'дата приема', 'дата'),
+    'appointment_time': ('appointment_time', 'time', 'время приема', 'время'),
+    'reason': ('reason', 'причина', 'причина приема'),
+}
+
+TIME_FORMATS = ('%H:%M', '%H:%M:%S')
+
+# Значений в одном IN (ниже предела переменных SQLite)
+IN_BATCH_SIZE = 5000
+
+# Причины, по которым строка не записывается (в порядке проверки)
+REASON_NO_DATE = "неверная дата или время приема"
+REASON_PAST = "дата приема в прошлом"
+REASON_NO_PATIENT = "пациент не найден"
+REASON_AMBIGUOUS_PATIENT = "найдено несколько пациентов"
+REASON_NO_DOCTOR = "врач не найден"
+REASON_AMBIGUOUS_DOCTOR = "найдено несколько врачей"
+REASON_NO_SLOT = "нет слота в расписании врача на это время"
+REASON_DUPLICATE = "пациент уже записан на это время"
+REASON_FILE_DUPLICATE = "запись повторяется в файле"
+REASON_FULL = "нет свободных мест в слоте"
+REASON_TAKEN = "места заняты параллельной записью"
+
+
+def _parse_times(values):
+    """Время в форматах ЧЧ:ММ и ЧЧ:ММ:СС (None, если не распознано)"""
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for time_format in TIME_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(values[missing], format=time_format, errors='coerce')
+    return parsed.dt.time.where(parsed.notna(), None)
+
+
+def _integers(values):
+    """Целые числа из текста (NaN для пустых и нечисловых значений)"""
+    return pd.to_numeric(values.where(values.str.fullmatch(r'\d+'), None), errors='coerce').astype(float)
+
+
+def _unique_matches(matches, key_columns):
+    """Однозначные совпадения: ключ -> id и множество ключей с несколькими id"""
+    if matches.empty:
+        return {}, set()
+    groups = matches.groupby(key_columns)['id']
+    sizes = groups.size()
+    firsts = groups.first()
+    unique = firsts[sizes == 1].to_dict()
+    return unique, set(sizes[sizes > 1].index)
+
+
+class AppointmentImporter:
+    """Пакетный импорт записей на прием из файлов внешних каналов записи
+
+    Пациенты, врачи и слоты расписания находятся для всего файла сразу
+    несколькими запросами по множествам значений, а не запросами на каждую
+    строку. Вместимость слотов проверяется в целом по файлу: строки одного
+    слота нумеруются по порядку и сравниваются со свободными местами.
+    Принятые строки вставляются одним executemany оператором INSERT ... SELECT,
+    который, как и обычная запись, повторно проверяет свободные места, так что
+    параллельные записи не переполнят слот. Непринятые строки с причиной
+    сохраняются в отчет о конфликтах.
+    """
+
+    def __init__(self, engine, report_dir='exports'):
+        self.engine = engine
+        self.report_dir = Path(report_dir)
+
+    def _fetch_in(self, conn, columns, column, values, *conditions):
+        """Строки, у которых column входит в values (запросы порциями по IN_BATCH_SIZE)"""
+        # Числа numpy драйвер SQLite передал бы как BLOB
+        values = [value.item() if hasattr(value, 'item') else value for value in values]
+        rows = []
+        for start in range(0, len(values), IN_BATCH_SIZE):
+            rows.extend(conn.execute(
+                select(*columns).where(column.in_(values[start:start + IN_BATCH_SIZE]), *conditions)
+            ).all())
+        return pd.DataFrame(rows, columns=[c.key for c in columns])
+
+    def _normalize(self, frame):
+        """Приведение столбцов к типам: ключи поиска пациента и врача, дата и время приема"""
+        for column in COLUMN_ALIASES:
+            if column not in frame:
+                frame[column] = ''
+            frame[column] = frame[column].fillna('').astype(str).str.strip()
+        phone_digits = frame['phone'].str.replace(r'\D', '', regex=True)
+        phone_digits = phone_digits.where(~((phone_digits.str.len() == 11) & phone_digits.str.startswith('8')),
+                                          '7' + phone_digits.str[1:])
+        phone_digits = phone_digits.where(phone_digits.str.len() != 10, '7' + phone_digits)
+        passport_keys = frame['passport'].str.replace(r'\D', '', regex=True)
+        birth_dates = parse_dates(frame['birth_date'])
+        dates = parse_dates(frame['appointment_date'])
+        return pd.DataFrame({
+            'patient_id': _integers(frame['patient_id']),
+            'passport_key': passport_keys.where(passport_keys != ''),
+            'phone_digits': phone_digits.where(phone_digits != ''),
+            'birth_date': birth_dates.dt.date.where(birth_dates.notna(), None),
+            'doctor_id': _integers(frame['doctor_id']),
+            'doctor_key': frame['doctor'].map(lambda value: fold_name(value) or None),
+            'appointment_date': dates.dt.date.where(dates.notna(), None),
+            'appointment_time': _parse_times(frame['appointment_time']),
+            'reason': frame['reason'].where(frame['reason'] != ''),
+        }, index=frame.index)
+
+    def _resolve_patients(self, conn, rows):
+        """id пациента по id, паспорту или телефону с датой рождения; -1 - неоднозначно"""
+        resolved = pd.Series(float('nan'), index=rows.index)
+
+        by_id = rows['patient_id'].dropna()
+        known = set(self._fetch_in(conn, [Patient.id], Patient.id, by_id.unique())['id']) if len(by_id) else set()
+        resolved[by_id.index] = by_id.where(by_id.isin(known))
+
+        pending = resolved.isna() & rows['passport_key'].notna()
+        if pending.any():
+            matches = self._fetch_in(conn, [Patient.id, Patient.passport_key], Patient.passport_key,
+                                     rows.loc[pending, 'passport_key'].unique())
+            unique, ambiguous = _unique_matches(matches, 'passport_key')
+            keys = rows.loc[pending, 'passport_key']
+            resolved[pending] = keys.map(unique).where(~keys.isin(ambiguous), -1)
+
+        pending = resolved.isna() & rows['phone_digits'].notna() & rows['birth_date'].notna()
+        if pending.any():
+            matches = self._fetch_in(conn, [Patient.id, Patient.phone_digits, Patient.birth_date],
+                                     Patient.phone_digits, rows.loc[pending, 'phone_digits'].unique())
+            unique, ambiguous = _unique_matches(matches, ['phone_digits', 'birth_date'])
+            keys = pd.Series(list(zip(rows.loc[pending, 'phone_digits'], rows.loc[pending, 'birth_date'])),
+                             index=rows.index[pending])
+            resolved[pending] = keys.map(unique).where(~keys.isin(ambiguous), -1)
+        return resolved
+
+    def _resolve_doctors(self, conn, rows):
+        """id врача по id или по ФИО (полному или без отчества); -1 - неоднозначно"""
+        doctors = conn.execute(
+            select(Employee.id, Employee.last_name, Employee.first_name, Employee.patronymic)
+            .where(Employee.specialization_id.isnot(None))
+        ).all()
+        by_key = {}
+        for doctor in doctors:
+            for key in {name_key(doctor.last_name, doctor.first_name, doctor.patronymic),
+                        name_key(doctor.last_name, doctor.first_name)}:
+                by_key[key] = doctor.id if by_key.get(key, doctor.id) == doctor.id else -1
+        doctor_ids = {doctor.id for doctor in doctors}
+
+        resolved = rows['doctor_id'].where(rows['doctor_id'].isin(doctor_ids))
+        by_name = resolved.isna() & rows['doctor_key'].notna()
+        resolved[by_name] = rows.loc[by_name, 'doctor_key'].map(by_key)
+        return resolved
+
+    def _schedules(self, conn, doctor_ids, date_from, date_to):
+        """Слоты врачей файла за период с числом активных записей"""
+        booked = (
+            select(Appointment.schedule_id, func.count().label('booked'))
+            .where(Appointment.appointment_date.between(date_from, date_to),
+                   Appointment.status == AppointmentStatus.SCHEDULED)
+            .group_by(Appointment.schedule_id)
+            .subquery()
+        )
+        rows = conn.execute(
+            select(Schedule.id, Schedule.employee_id, Schedule.work_date, Schedule.start_time, Schedule.end_time,
+                   Schedule.max_patients, func.coalesce(booked.c.booked, 0).label('booked'))
+            .outerjoin(booked, booked.c.schedule_id == Schedule.id)
+            .where(Schedule.employee_id.in_(doctor_ids), Schedule.work_date.between(date_from, date_to))
+        ).all()
+        return pd.DataFrame(rows, columns=['schedule_id', 'doctor_id', 'appointment_date', 'start_time', 'end_time',
+                                           'max_patients', 'booked'])
+
+    def _match_schedules(self, rows, schedules):
+        """Слот каждой строки: самый ранний слот врача, в который попадает время приема"""
+        if schedules.empty:
+            return pd.DataFrame(columns=['schedule_id', 'free'], index=rows.index[:0])
+        requests = rows[['doctor_id', 'appointment_date', 'appointment_time']].reset_index(names='row')
+        requests['doctor_id'] = requests['doctor_id'].astype('int64')
+        merged = requests.merge(schedules, on=['doctor_id', 'appointment_date'])
+        inside = [start <= value < end for start, value, end in
+                  zip(merged['start_time'], merged['appointment_time'], merged['end_time'])]
+        merged = merged[inside].sort_values(['row', 'start_time']).drop_duplicates('row')
+        merged['free'] = merged['max_patients'].fillna(0) - merged['booked']
+        return merged.set_index('row')[['schedule_id', 'free']]
+
+    def _existing_appointments(self, conn, rows):
+        """Ключи (пациент, дата, время) активных записей пациентов файла"""
+        if rows.empty:
+            return set()
+        existing = self._fetch_in(
+            conn, [Appointment.patient_id, Appointment.appointment_date, Appointment.appointment_time],
+            Appointment.patient_id, rows['patient'].dropna().astype(int).unique(),
+            Appointment.appointment_date.between(rows['appointment_date'].min(), rows['appointment_date'].max()),
+            Appointment.status == AppointmentStatus.SCHEDULED
+        )
+        return set(zip(existing['patient_id'], existing['appointment_date'], existing['appointment_time']))
+
+    def reconcile(self, frame):
+        """Сверка строк с базой: для каждой строки слот для записи или причина отказа"""
+        rows = self._normalize(frame)
+        reasons = pd.Series('', index=rows.index)
+
+        def reject(mask, reason):
+            mask = pd.Series(mask, index=reasons.index).fillna(False).astype(bool)
+            reasons[(reasons == '') & mask] = reason
+
+        reject(rows['appointment_date'].isna() | rows['appointment_time'].isna(), REASON_NO_DATE)
+        reject(rows['appointment_date'].map(lambda value: value is not None and value < date.today()), REASON_PAST)
+
+        with self.engine.connect() as conn:
+            rows['patient'] = self._resolve_patients(conn, rows)
+            reject(rows['patient'].isna(), REASON_NO_PATIENT)
+            reject(rows['patient'] == -1, REASON_AMBIGUOUS_PATIENT)
+            rows['doctor_id'] = self._resolve_doctors(conn, rows)
+            reject(rows['doctor_id'].isna(), REASON_NO_DOCTOR)
+            reject(rows['doctor_id'] == -1, REASON_AMBIGUOUS_DOCTOR)
+
+            candidates = rows[reasons == '']
+            if not candidates.empty:
+                schedules = self._schedules(conn, [int(value) for value in candidates['doctor_id'].unique()],
+                                            candidates['appointment_date'].min(), candidates['appointment_date'].max())
+                slots = self._match_schedules(candidates, schedules)
+                rows['schedule_id'] = slots['schedule_id']
+                rows['free'] = slots['free']
+                reject(reasons.index.isin(candidates.index) & rows['schedule_id'].isna(), REASON_NO_SLOT)
+                existing = self._existing_appointments(conn, rows[reasons == ''])
+            else:
+                rows['schedule_id'] = rows['free'] = None
+                existing = set()
+
+        keys = pd.Series(list(zip(rows['patient'], rows['appointment_date'], rows['appointment_time'])),
+                         index=rows.index)
+        reject(keys.isin(existing), REASON_DUPLICATE)
+        reject(keys.duplicated() & (reasons == ''), REASON_FILE_DUPLICATE)
+
+        # Вместимость в целом по файлу: строки слота по порядку занимают свободные места
+        accepted = reasons == ''
+        rank = rows[accepted].groupby('schedule_id').cumcount() + 1
+        reject((rank > rows.loc[rank.index, 'free']).reindex(rows.index, fill_value=False), REASON_FULL)
+        return rows, reasons
+
+    def _insert(self, rows):
+        """Вставка принятых строк с проверкой мест на каждой строке; возвращает вставленные записи"""
+        now = datetime.now()
+        source = (
+            select(
+                bindparam('patient_id', type_=Integer), Schedule.id, Schedule.employee_id, Schedule.work_date,
+                bindparam('appointment_time', type_=Appointment.appointment_time.type),
+                literal(AppointmentStatus.SCHEDULED, Appointment.status.type),
+                bindparam('reason', type_=Text),
+                literal(now, Appointment.created_at.type), literal(now, Appointment.updated_at.type)
+            )
+            .where(Schedule.id == bindparam('schedule_id', type_=Integer),
+                   Schedule.max_patients > booked_count_subquery())
+        )
+        statement = insert(Appointment).from_select(
+            ['patient_id', 'schedule_id', 'doctor_id', 'appointment_date', 'appointment_time',
+             'status', 'reason', 'created_at', 'updated_at'],
+            source
+        )
+        parameters = [
+            {'patient_id': int(row.patient), 'schedule_id': int(row.schedule_id),
+             'appointment_time': row.appointment_time, 'reason': row.reason}
+            for row in rows.itertuples()
+        ]
+        with self.engine.begin() as conn:
+            inserted = conn.execute(statement, parameters).rowcount
+            if not inserted:
+                return []
+            # Вставленные строки получают подряд идущие id (транзакция держит блокировку записи)
+            last_id = conn.execute(select(func.max(Appointment.id))).scalar()
+            return conn.execute(
+                select(Appointment.id, Appointment.patient_id, Appointment.doctor_id, Appointment.schedule_id,
+                       Appointment.appointment_date, Appointment.appointment_time)
+                .where(Appointment.id > last_id - inserted)
+                .order_by(Appointment.id)
+            ).all()
+
+    def import_frame(self, frame, source_name='appointments'):
+        """Импорт записей из DataFrame с исходными столбцами файла; возвращает (успех, сообщение, отчет)"""
+        started = datetime.now()
+        frame = frame.rename(columns=rename_columns(frame.columns, COLUMN_ALIASES))
+        if 'appointment_date' not in frame or 'appointment_time' not in frame:
+            return False, "В файле нет столбцов даты и времени приема", None
+        if not {'patient_id', 'passport', 'phone'} & set(frame.columns):
+            return False, "В файле нет столбцов для поиска пациента (id, паспорт или телефон)", None
+        if not {'doctor_id', 'doctor'} & set(frame.columns):
+            return False, "В файле нет столбцов для поиска врача (id или ФИО)", None
+
+        try:
+            rows, reasons = self.reconcile(frame)
+            accepted = rows[reasons == '']
+            inserted = self._insert(accepted) if not accepted.empty else []
+        except Exception as e:
+            return False, f"Ошибка импорта записей: {str(e)}", None
+
+        # Строки, которым не хватило места из-за параллельных записей (по парам пациент-слот)
+        remaining = Counter((row.patient_id, row.schedule_id) for row in inserted)
+        for index, row in accepted.iterrows():
+            key = (int(row['patient']), int(row['schedule_id']))
+            if remaining[key]:
+                remaining[key] -= 1
+            else:
+                reasons[index] = REASON_TAKEN
+
+        # Столбцы выборки совпадают с данными события записи
+        for row in inserted:
+            notify_booking_listeners('booked', dict(row._mapping))
+
+        conflicts = reasons[reasons != '']
+        report = {
+            'rows': len(rows),
+            'inserted': len(inserted),
+            'conflicts': len(conflicts),
+            'reasons': dict(Counter(conflicts)),
+            'report_path': None,
+        }
+        if len(conflicts):
+            self.report_dir.mkdir(exist_ok=True)
+            report_path = self.report_dir / f"appointment_conflicts_{source_name}_{started.strftime('%Y%m%d_%H%M%S')}.csv"
+            columns = [column for column in COLUMN_ALIASES if column in frame]
+            frame.loc[conflicts.index, columns].assign(row=conflicts.index + 2, conflict=conflicts)[
+                ['row', *columns, 'conflict']
+            ].to_csv(report_path, index=False, encoding='utf-8-sig')
+            report['report_path'] = str(report_path)
+        report['elapsed'] = (datetime.now() - started).total_seconds()
+
+        message = f"Строк: {report['rows']}, записей создано: {report['inserted']}, конфликтов: {report['conflicts']}"
+        if report['report_path']:
+            message += f". Отчет: {report['report_path']}"
+        return True, message, report
+
+    def import_file(self, path):
+        """Импорт записей из файла CSV/XLSX"""
+        if not os.path.exists(path):
+            return False, f"Файл не найден: {path}", None
+        try:
+            frame = pd.concat(read_chunks(path), ignore_index=True)
+        except Exception as e:
+            return False, f"Ошибка чтения файла: {str(e)}", None
+        return self.import_frame(frame, Path(path).stem)
+
+
+def main():
+    """Ежедневная загрузка: python appointment_import.py bookings.csv --db medical_clinic.db"""
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Пакетный импорт записей на прием со сверкой с расписанием")
+    parser.add_argument('path')
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--report-dir', default='exports')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    db_manager.init_database()
+    success, message, report = AppointmentImporter(db_manager.engine, args.report_dir).import_file(args.path)
+    print(message)
+    if report:
+        for reason, count in sorted(report['reasons'].items(), key=lambda item: -item[1]):
+            print(f"  {reason}: {count}")
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,349 @@
+import argparse
+import os
+import re
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from sqlalchemy import create_engine, inspect, select, insert, delete, exists, func, false, table, column
+from access_policy import AccessPolicy
+from models import Appointment, AppointmentStatus, Diagnosis, Employee, MedicalRecord, Prescription
+
+# Записи старше этого срока переносятся в архив по умолчанию
+ARCHIVE_AFTER_DAYS = 2 * 365
+
+# Число записей на прием, переносимых одной короткой транзакцией
+ARCHIVE_BATCH_SIZE = 1000
+
+# Архивируемые таблицы в порядке переноса; удаляются в обратном порядке
+ARCHIVED_TABLES = (Appointment.__table__, MedicalRecord.__table__, Prescription.__table__)
+
+ARCHIVE_FILE_PATTERN = re.compile(r'^medical_clinic_(\d{4})\.db$')
+
+
+def view_name(source_table):
+    """Имя временного представления, объединяющего оперативные и архивные строки"""
+    return f'all_{source_table.name}'
+
+
+def hot_and_cold(source_table):
+    """Представление all_<таблица> для запросов Core на соединении из ArchiveManager.connect
+
+    Столбцы те же, что у таблицы, плюс archive_year (NULL для оперативной базы).
+    """
+    columns = [column(c.name, c.type) for c in source_table.columns]
+    return table(view_name(source_table), *columns, column('archive_year'))
+
+
+class ArchiveManager:
+    """Перенос закрытых записей прошлых лет в годовые архивные базы SQLite
+
+    Завершенные, отмененные и неявочные записи на прием старше даты отсечения
+    переносятся вместе с медицинскими записями и назначениями в файл
+    archive/medical_clinic_<год>.db (год - по дате приема). Перенос идет
+    пачками по ARCHIVE_BATCH_SIZE записей: INSERT OR IGNORE в подключенный
+    через ATTACH архив фиксируется первой короткой транзакцией, DELETE из
+    оперативной базы - второй. В режиме WAL транзакция не атомарна между
+    файлами, поэтому строки удаляются только после фиксации их копии:
+    после сбоя между транзакциями строки остаются в обеих базах, и
+    повторный запуск пропустит уже скопированное и удалит их.
+
+    Записи с действующими назначениями не переносятся. Самые новые строки
+    каждой таблицы остаются в оперативной базе, чтобы SQLite не выдал
+    повторно id архивных строк.
+
+    Архивы подключаются только по запросу: connect() отдает соединение с
+    подключенными архивами и временными представлениями all_appointments,
+    all_medical_records и all_prescriptions поверх оперативных и архивных данных.
+    """
+
+    def __init__(self, engine, archive_dir='archive', batch_size=ARCHIVE_BATCH_SIZE):
+        self.engine = engine
+        self.archive_dir = Path(archive_dir)
+        self.batch_size = batch_size
+        self._prepared = set()
+
+    # --- Архивные файлы ---
+
+    def archive_path(self, year):
+        return self.archive_dir / f'medical_clinic_{year}.db'
+
+    def list_years(self):
+        """Годы, для которых есть архивные файлы"""
+        if not self.archive_dir.exists():
+            return []
+        return sorted(
+            int(match.group(1)) for match in map(ARCHIVE_FILE_PATTERN.match, os.listdir(self.archive_dir)) if match
+        )
+
+    def _prepare_archive(self, year):
+        """Создание архивного файла года и недостающих столбцов и индексов в нем"""
+        if year in self._prepared:
+            return
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        archive_engine = create_engine(f'sqlite:///{self.archive_path(year)}')
+        try:
+            inspector = inspect(archive_engine)
+            with archive_engine.begin() as conn:
+                for source_table in ARCHIVED_TABLES:
+                    if not inspector.has_table(source_table.name):
+                        source_table.create(conn)
+                        continue
+                    existing_columns = {c['name'] for c in inspector.get_columns(source_table.name)}
+                    for source_column in source_table.columns:
+                        if source_column.name not in existing_columns:
+                            column_type = source_column.type.compile(dialect=archive_engine.dialect)
+                            conn.exec_driver_sql(
+                                f'ALTER TABLE "{source_table.name}" ADD COLUMN "{source_column.name}" {column_type}'
+                            )
+                    for index in source_table.indexes:
+                        index.create(conn, checkfirst=True)
+        finally:
+            archive_engine.dispose()
+        self._prepared.add(year)
+
+    @staticmethod
+    def _schema(year):
+        return f'archive_{year}'
+
+    def _attach(self, conn, year):
+        conn.exec_driver_sql(f'ATTACH DATABASE ? AS {self._schema(year)}', (str(self.archive_path(year)),))
+        conn.commit()
+
+    def _detach(self, conn, year):
+        conn.exec_driver_sql(f'DETACH DATABASE {self._schema(year)}')
+        conn.commit()
+
+    # --- Перенос в архив ---
+
+    def _protected_appointments(self, conn):
+        """Записи на прием, которым принадлежат строки с наибольшими id"""
+        newest_record = select(func.max(MedicalRecord.id)).scalar_subquery()
+        newest_prescription = select(func.max(Prescription.id)).scalar_subquery()
+        protected = set(conn.execute(select(func.max(Appointment.id))).scalars())
+        protected.update(conn.execute(
+            select(MedicalRecord.appointment_id).where(MedicalRecord.id == newest_record)
+        ).scalars())
+        protected.update(conn.execute(
+            select(MedicalRecord.appointment_id)
+            .join(Prescription, Prescription.medical_record_id == MedicalRecord.id)
+            .where(Prescription.id == newest_prescription)
+        ).scalars())
+        protected.discard(None)
+        return protected
+
+    def _candidates(self, conn, start, end, after_id, protected):
+        """Очередная пачка id закрытых записей на прием за период [start, end)"""
+        active_prescription = (
+            exists()
+            .where(
+                MedicalRecord.appointment_id == Appointment.id,
+                Prescription.medical_record_id == MedicalRecord.id,
+                Prescription.is_completed == false()
+            )
+        )
+        query = (
+            select(Appointment.id)
+            .where(
+                Appointment.appointment_date >= start,
+                Appointment.appointment_date < end,
+                Appointment.status != AppointmentStatus.SCHEDULED,
+                Appointment.id > after_id,
+                ~active_prescription
+            )
+            .order_by(Appointment.id)
+            .limit(self.batch_size)
+        )
+        if protected:
+            query = query.where(Appointment.id.not_in(sorted(protected)))
+        return conn.execute(query).scalars().all()
+
+    def _batch_keys(self, conn, appointment_ids):
+        """Ключи строк пачки по таблицам: {таблица: (столбец, список id)}"""
+        record_ids = conn.execute(
+            select(MedicalRecord.id).where(MedicalRecord.appointment_id.in_(appointment_ids))
+        ).scalars().all()
+        return {
+            Appointment.__table__: (Appointment.__table__.c.id, appointment_ids),
+            MedicalRecord.__table__: (MedicalRecord.__table__.c.id, record_ids),
+            Prescription.__table__: (Prescription.__table__.c.medical_record_id, record_ids),
+        }
+
+    def _copy_batch(self, conn, year, keys):
+        """Копирование пачки в архив (уже скопированные строки пропускаются)"""
+        for source_table in ARCHIVED_TABLES:
+            key_column, ids = keys[source_table]
+            if not ids:
+                continue
+            names = [c.name for c in source_table.columns]
+            target = table(source_table.name, *[column(name) for name in names], schema=self._schema(year))
+            conn.execute(
+                insert(target).prefix_with('OR IGNORE')
+                .from_select(names, select(*source_table.columns).where(key_column.in_(ids)))
+            )
+
+    def _delete_batch(self, conn, keys):
+        """Удаление скопированной пачки из оперативной базы; возвращает число строк по таблицам"""
+        moved = {}
+        for source_table in reversed(ARCHIVED_TABLES):
+            key_column, ids = keys[source_table]
+            moved[source_table.name] = 0
+            if ids:
+                moved[source_table.name] = conn.execute(delete(source_table).where(key_column.in_(ids))).rowcount
+        return moved
+
+    def archive(self, cutoff=None, pause=0.0):
+        """Перенос закрытых записей с датой приема раньше cutoff в годовые архивы
+
+        pause - пауза в секундах между пачками, чтобы не мешать работе клиники.
+        Возвращает (успех, сообщение, {год: {таблица: число строк}}).
+        """
+        cutoff = cutoff or date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        stats = {}
+        try:
+            with self.engine.connect() as conn:
+                first_date = conn.execute(
+                    select(func.min(Appointment.appointment_date))
+                    .where(Appointment.appointment_date < cutoff, Appointment.status != AppointmentStatus.SCHEDULED)
+                ).scalar()
+                protected = self._protected_appointments(conn)
+                conn.rollback()
+                if first_date is None:
+                    return True, "Нет записей для переноса в архив", stats
+
+                for year in range(first_date.year, cutoff.year + 1):
+                    start, end = date(year, 1, 1), min(date(year + 1, 1, 1), cutoff)
+                    # Архивный файл создается только для года, в котором есть что переносить
+                    if not self._candidates(conn, start, end, 0, protected):
+                        continue
+                    self._prepare_archive(year)
+                    # ATTACH нельзя выполнить внутри транзакции
+                    self._attach(conn, year)
+                    try:
+                        year_stats = {source_table.name: 0 for source_table in ARCHIVED_TABLES}
+                        last_id = 0
+                        while True:
+                            with conn.begin():
+                                appointment_ids = self._candidates(conn, start, end, last_id, protected)
+                                if appointment_ids:
+                                    keys = self._batch_keys(conn, appointment_ids)
+                                    self._copy_batch(conn, year, keys)
+                            if not appointment_ids:
+                                break
+                            # Удаление - только после фиксации копии в архиве
+                            with conn.begin():
+                                for name, count in self._delete_batch(conn, keys).items():
+                                    year_stats[name] += count
+                            last_id = appointment_ids[-1]
+                            if pause:
+                                time.sleep(pause)
+                    finally:
+                        self._detach(conn, year)
+                    if year_stats['appointments']:
+                        stats[year] = year_stats
+                        print(f"Архив {year}: записей на прием {year_stats['appointments']}, "
+                              f"медицинских записей {year_stats['medical_records']}, "
+                              f"назначений {year_stats['prescriptions']}")
+        except Exception as e:
+            return False, f"Ошибка переноса в архив: {str(e)}", stats
+
+        total = sum(year_stats['appointments'] for year_stats in stats.values())
+        return True, f"Перенесено в архив записей на прием: {total}", stats
+
+    # --- Запросы по оперативным и архивным данным ---
+
+    @contextmanager
+    def connect(self, years=None):
+        """Соединение с подключенными архивами и представлениями all_<таблица>
+
+        По умолчанию подключаются все архивные годы. SQLite ограничивает число
+        одновременно подключенных баз (обычно 10), поэтому для запросов за
+        период лучше передавать только нужные годы.
+        """
+        years = [year for year in (years or self.list_years()) if self.archive_path(year).exists()]
+        with self.engine.connect() as conn:
+            attached = []
+            try:
+                for year in years:
+                    self._prepare_archive(year)
+                    self._attach(conn, year)
+                    attached.append(year)
+                for source_table in ARCHIVED_TABLES:
+                    names = ', '.join(f'"{c.name}"' for c in source_table.columns)
+                    parts = [f'SELECT {names}, NULL AS archive_year FROM main."{source_table.name}"']
+                    parts.extend(
+                        f'SELECT {names}, {year} AS archive_year FROM {self._schema(year)}."{source_table.name}"'
+                        for year in attached
+                    )
+                    conn.exec_driver_sql(
+                        f'CREATE TEMP VIEW IF NOT EXISTS {view_name(source_table)} AS ' + ' UNION ALL '.join(parts)
+                    )
+                conn.commit()
+                yield conn
+            finally:
+                # Соединение вернется в пул: представления и архивы отключаются
+                conn.rollback()
+                for source_table in ARCHIVED_TABLES:
+                    conn.exec_driver_sql(f'DROP VIEW IF EXISTS temp.{view_name(source_table)}')
+                for year in attached:
+                    self._detach(conn, year)
+
+    def patient_history(self, patient_id, principal=None):
+        """Все медицинские записи пациента, включая архивные, от новых к старым
+
+        principal - пользователь, от имени которого выполняется запрос: к
+        представлению применяются правила AccessPolicy (врач видит свои
+        записи, пациент - только свои, регистратор - ничего).
+        """
+        records = hot_and_cold(MedicalRecord.__table__)
+        with self.connect() as conn:
+            return conn.execute(
+                select(
+                    records.c.id, records.c.record_date, records.c.complaints, records.c.recommendations,
+                    records.c.archive_year, Employee.last_name.label('doctor_last_name'),
+                    Employee.first_name.label('doctor_first_name'), Diagnosis.code.label('diagnosis_code'),
+                    Diagnosis.name.label('diagnosis_name')
+                )
+                .join(Employee, Employee.id == records.c.doctor_id)
+                .outerjoin(Diagnosis, Diagnosis.id == records.c.diagnosis_id)
+                .where(records.c.patient_id == patient_id,
+                       *AccessPolicy.medical_record_conditions(principal, records))
+                .order_by(records.c.record_date.desc())
+            ).all()
+
+
+def main():
+    """Ежемесячный запуск: python archive.py --db medical_clinic.db --vacuum"""
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Перенос закрытых записей прошлых лет в годовые архивы")
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--archive-dir', default='archive')
+    parser.add_argument('--cutoff', type=date.fromisoformat,
+                        help=f"дата отсечения (по умолчанию - {ARCHIVE_AFTER_DAYS} дней назад)")
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.05, help="пауза между пачками, с")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="сжать оперативную базу после переноса (блокирует базу, запускать вне приема)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    db_manager.init_database()
+    success, message, _ = ArchiveManager(db_manager.engine, args.archive_dir, args.batch_size).archive(
+        args.cutoff, args.pause
+    )
+    print(message)
+    if not success:
+        return 1
+    if args.vacuum:
+        with db_manager.engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        print(f"Размер оперативной базы после сжатия: {os.path.getsize(args.db) / 1024 / 1024:.1f} МБ")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
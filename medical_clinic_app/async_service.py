@@ -0,0 +1,220 @@
+import asyncio
+import threading
+from datetime import date, timedelta
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session as SyncSession
+from database import DatabaseManager, configure_sqlite_connection
+from models import (
+    Appointment, AppointmentStatus, Employee, MedicalRecord, Prescription,
+    Schedule, Specialization
+)
+import booking
+import patient_search
+
+# Асинхронный драйвер SQLite нужен только для этого модуля
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+    import aiosqlite  # noqa: F401
+    ASYNC_AVAILABLE = True
+except ImportError:
+    ASYNC_AVAILABLE = False
+
+# Методы DataExporter, доступные через export()
+EXPORT_METHODS = {
+    'appointments_json': 'export_appointments_to_json',
+    'patients_csv': 'export_patients_to_csv',
+    'schedule_pdf': 'export_schedule_to_pdf',
+    'medical_records_docx': 'export_medical_records_to_docx',
+    'statistics_xlsx': 'export_statistics_to_xlsx',
+}
+
+
+class AsyncClinicService:
+    """Асинхронный сервисный слой поверх моделей ORM
+
+    Все операции - корутины; число одновременно выполняемых запросов к базе
+    ограничено семафором, экспорт (тяжелые синхронные библиотеки) выполняется
+    в потоках с отдельным, меньшим ограничением.
+    """
+
+    def __init__(self, db_path='medical_clinic.db', max_concurrency=32, max_export_concurrency=2,
+                 pool_size=8, access_policy=None):
+        if not ASYNC_AVAILABLE:
+            raise RuntimeError("Библиотека aiosqlite не установлена")
+        self.db_path = db_path
+        self.engine = create_async_engine(
+            f'sqlite+aiosqlite:///{db_path}',
+            # Пул соединений вместо NullPool по умолчанию: соединение не открывается на каждый запрос
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=pool_size,
+            max_overflow=0,
+            connect_args={'timeout': 30}
+        )
+        event.listen(self.engine.sync_engine, "connect", configure_sqlite_connection)
+
+        # Отдельный класс синхронной сессии, чтобы политика доступа не затрагивала другие сессии
+        self._sync_session_class = type('AsyncServiceSession', (SyncSession,), {})
+        if access_policy is not None:
+            access_policy.install(self._sync_session_class)
+        self.Session = async_sessionmaker(
+            self.engine, expire_on_commit=False, sync_session_class=self._sync_session_class
+        )
+
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._export_limit = asyncio.Semaphore(max_export_concurrency)
+        self._sync_db = None
+        self._sync_db_lock = threading.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Закрытие пула соединений"""
+        await self.engine.dispose()
+        if self._sync_db and self._sync_db.engine:
+            self._sync_db.engine.dispose()
+
+    def _session(self, principal=None):
+        session = self.Session()
+        if principal is not None:
+            session.sync_session.info['principal'] = principal
+        return session
+
+    async def book_appointment(self, patient_id, doctor_id, appointment_date, appointment_time,
+                               reason=None, principal=None):
+        """Запись на прием; возвращает (успех, сообщение, id записи)"""
+        async with self._limit:
+            async with self._session(principal) as session:
+                # Логика записи общая с консольным приложением
+                return await session.run_sync(
+                    booking.book_appointment, patient_id, doctor_id,
+                    appointment_date, appointment_time, reason
+                )
+
+    async def cancel_appointment(self, appointment_id, principal=None):
+        """Отмена записи; возвращает (успех, сообщение)"""
+        async with self._limit:
+            async with self._session(principal) as session:
+                return await session.run_sync(booking.cancel_appointment, appointment_id)
+
+    async def get_schedule(self, start_date=None, end_date=None, doctor_id=None,
+                           specialization_id=None, only_free=False):
+        """Расписание с количеством свободных мест (одним запросом)"""
+        start_date = start_date or date.today()
+        end_date = end_date or start_date + timedelta(days=7)
+        free_slots = (Schedule.max_patients - booking.booked_count_subquery()).label('free_slots')
+
+        query = (
+            select(
+                Schedule.id, Schedule.work_date, Schedule.start_time, Schedule.end_time,
+                Schedule.cabinet_number, Schedule.employee_id,
+                Employee.last_name, Employee.first_name, Employee.patronymic,
+                Specialization.name.label('specialization'), free_slots
+            )
+            .join(Employee, Employee.id == Schedule.employee_id)
+            .outerjoin(Specialization, Specialization.id == Employee.specialization_id)
+            .where(Schedule.work_date >= start_date, Schedule.work_date <= end_date)
+            .order_by(Schedule.work_date, Schedule.start_time, Schedule.id)
+        )
+        if doctor_id:
+            query = query.where(Schedule.employee_id == doctor_id)
+        if specialization_id:
+            query = query.where(Employee.specialization_id == specialization_id)
+        if only_free:
+            query = query.where(Schedule.max_patients > booking.booked_count_subquery())
+
+        async with self._limit:
+            async with self._session() as session:
+                rows = (await session.execute(query)).all()
+
+        return [
+            {
+                'id': row.id,
+                'work_date': row.work_date.isoformat(),
+                'start_time': row.start_time.strftime('%H:%M'),
+                'end_time': row.end_time.strftime('%H:%M'),
+                'cabinet_number': row.cabinet_number,
+                'doctor_id': row.employee_id,
+                'doctor': f"{row.last_name} {row.first_name} {row.patronymic or ''}".strip(),
+                'specialization': row.specialization,
+                'free_slots': row.free_slots,
+            }
+            for row in rows
+        ]
+
+    async def search_patients(self, text, limit=20):
+        """Поиск пациентов по ФИО, телефону, паспорту или email (по индексам ключей поиска)"""
+        if not text.strip():
+            return []
+        async with self._limit:
+            async with self._session() as session:
+                return await session.run_sync(patient_search.search_patients, text, limit)
+
+    async def create_medical_record(self, appointment_id, complaints=None, diagnosis_id=None,
+                                    examination_results=None, recommendations=None,
+                                    next_visit_date=None, is_emergency=False, prescriptions=(),
+                                    principal=None):
+        """Создание медицинской записи по приему; прием отмечается завершенным
+
+        prescriptions - последовательность словарей с полями Prescription.
+        Возвращает (успех, сообщение, id записи).
+        """
+        async with self._limit:
+            async with self._session(principal) as session:
+                try:
+                    appointment = (await session.execute(
+                        select(Appointment.patient_id, Appointment.doctor_id)
+                        .where(Appointment.id == appointment_id)
+                    )).first()
+                    if appointment is None:
+                        return False, "Запись на прием не найдена", None
+
+                    record = MedicalRecord(
+                        appointment_id=appointment_id,
+                        patient_id=appointment.patient_id,
+                        doctor_id=appointment.doctor_id,
+                        complaints=complaints,
+                        diagnosis_id=diagnosis_id,
+                        examination_results=examination_results,
+                        recommendations=recommendations,
+                        next_visit_date=next_visit_date,
+                        is_emergency=is_emergency
+                    )
+                    record.prescriptions = [Prescription(**item) for item in prescriptions]
+                    session.add(record)
+
+                    appt = await session.get(Appointment, appointment_id)
+                    appt.status = AppointmentStatus.COMPLETED
+
+                    await session.commit()
+                    return True, "Медицинская запись создана", record.id
+                except Exception as e:
+                    await session.rollback()
+                    return False, f"Ошибка создания медицинской записи: {str(e)}", None
+
+    def _run_export(self, method_name, kwargs):
+        """Синхронный экспорт в рабочем потоке со своей сессией"""
+        # Тяжелые библиотеки экспорта загружаются только при первом экспорте
+        from export_data import DataExporter
+
+        with self._sync_db_lock:
+            if self._sync_db is None:
+                self._sync_db = DatabaseManager(self.db_path)
+                self._sync_db.init_database()
+        session = self._sync_db.get_session()
+        try:
+            return getattr(DataExporter(session), method_name)(**kwargs)
+        finally:
+            self._sync_db.close_session(session)
+
+    async def export(self, kind, **kwargs):
+        """Экспорт данных; возвращает (успех, сообщение, путь к файлу)"""
+        method_name = EXPORT_METHODS.get(kind)
+        if method_name is None:
+            return False, f"Неизвестный формат экспорта: {kind}", None
+        async with self._export_limit:
+            return await asyncio.to_thread(self._run_export, method_name, kwargs)
@@ -1,7 +1,192 @@
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import User, UserRole, Employee, Patient
+from sqlalchemy import select, insert, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import User, UserRole, Employee, Patient, RevokedToken
 from database import DatabaseManager
+from metrics import LOGINS
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+# Поля записи для массовой регистрации (порядок как у register_user)
+BULK_USER_FIELDS = ('username', 'password', 'role', 'email', 'employee_id', 'patient_id')
+
+# Меньше этого числа пароли хэшируются в текущем процессе: запуск пула дороже
+PARALLEL_HASH_THRESHOLD = 32
+
+# Ограничение числа параметров в одном запросе IN (...) для SQLite
+USERNAME_QUERY_CHUNK = 900
+
+# Разрешения по ролям (вычисляются один раз, проверка - поиск в множестве)
+ROLE_PERMISSIONS = {
+    UserRole.ADMIN: frozenset({
+        'view_information', 'export_data', 'manage_backups',
+        'manage_appointments', 'manage_medical_records', 'manage_system'
+    }),
+    UserRole.DOCTOR: frozenset({
+        'view_information', 'export_data', 'manage_backups', 'manage_medical_records'
+    }),
+    UserRole.REGISTRAR: frozenset({
+        'view_information', 'export_data', 'manage_backups', 'manage_appointments'
+    }),
+    UserRole.PATIENT: frozenset({
+        'view_information', 'export_data', 'manage_backups'
+    }),
+}
+
+
+def _full_name(last_name, first_name, patronymic):
+    """ФИО в том же формате, что и Patient.full_name / Employee.full_name"""
+    return f"{last_name} {first_name} {patronymic or ''}".strip()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class RevokedTokenStore:
+    """Отозванные токены в базе данных
+    
+    Рабочие процессы API-сервера используют общий ключ подписи, поэтому
+    токен, отозванный только в памяти одного процесса, остался бы
+    действительным в остальных. Запись в таблице revoked_tokens видна всем
+    процессам; проверка - один поиск по первичному ключу.
+    """
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    @staticmethod
+    def _hash(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+    
+    def _engine(self):
+        if self.db_manager.Session is None:
+            self.db_manager.init_database()
+        return self.db_manager.engine
+    
+    def add(self, token, expires_at):
+        """Запись об отзыве токена; заодно удаляются записи об истекших токенах"""
+        with self._engine().begin() as conn:
+            conn.execute(
+                sqlite_insert(RevokedToken)
+                .values(token_hash=self._hash(token), expires_at=int(expires_at))
+                .on_conflict_do_nothing(index_elements=['token_hash'])
+            )
+            conn.execute(delete(RevokedToken).where(RevokedToken.expires_at <= int(time.time())))
+    
+    def contains(self, token):
+        """Отозван ли токен в каком-либо процессе"""
+        with self._engine().connect() as conn:
+            return conn.execute(
+                select(RevokedToken.token_hash).where(RevokedToken.token_hash == self._hash(token))
+            ).first() is not None
+
+
+class SessionTokenCache:
+    """Подписанные токены сессий и кэш пользователей в памяти с ограниченным сроком жизни
+    
+    revocations - общее хранилище отозванных токенов (RevokedTokenStore);
+    без него отзыв действует только в текущем процессе.
+    """
+    
+    def __init__(self, secret_key=None, ttl_seconds=8 * 3600, max_entries=10000, revocations=None):
+        # Без заданного ключа токены действуют только до перезапуска процесса
+        self.secret_key = secret_key.encode() if secret_key else secrets.token_bytes(32)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._revoked = {}
+        self.revocations = revocations
+        self._lock = threading.Lock()
+    
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret_key, payload.encode('ascii'), hashlib.sha256).digest())
+    
+    def issue(self, principal):
+        """Выпуск токена и помещение пользователя в кэш"""
+        expires_at = int(time.time()) + self.ttl_seconds
+        payload = _b64encode(json.dumps({
+            'uid': principal['id'],
+            'exp': expires_at,
+            'nonce': secrets.token_hex(8)
+        }, separators=(',', ':')).encode('utf-8'))
+        token = f"{payload}.{self._sign(payload)}"
+        self.put(token, principal, expires_at)
+        return token
+    
+    def verify(self, token):
+        """Проверка подписи и срока действия; возвращает id пользователя или None"""
+        try:
+            payload, signature = token.split('.', 1)
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except (ValueError, AttributeError):
+            return None
+        if claims.get('exp', 0) <= time.time() or token in self._revoked:
+            return None
+        # Выход мог быть выполнен в другом процессе
+        if self.revocations is not None and self.revocations.contains(token):
+            return None
+        return claims.get('uid')
+    
+    def put(self, token, principal, expires_at=None):
+        """Помещение пользователя в кэш вместе с набором его разрешений"""
+        if expires_at is None:
+            expires_at = json.loads(_b64decode(token.split('.', 1)[0]))['exp']
+        role = UserRole(principal['role'])
+        entry = dict(principal, token=token, expires_at=expires_at,
+                     permissions=ROLE_PERMISSIONS.get(role, frozenset()))
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._purge_expired()
+            if len(self._entries) >= self.max_entries:
+                # Вытесняется запись, которая истекает раньше всех
+                oldest = min(self._entries, key=lambda key: self._entries[key]['expires_at'])
+                del self._entries[oldest]
+            self._entries[token] = entry
+        return entry
+    
+    def get(self, token):
+        """Пользователь из кэша (None, если запись отсутствует или истекла)"""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if entry['expires_at'] <= time.time():
+            # Истекший токен отклоняется verify, отзывать его в базе не нужно
+            with self._lock:
+                self._entries.pop(token, None)
+            return None
+        return entry
+    
+    def revoke(self, token):
+        """Отзыв токена"""
+        with self._lock:
+            entry = self._entries.pop(token, None)
+            # Отозванный токен запоминается до истечения срока, чтобы его нельзя было восстановить из базы
+            expires_at = self._revoked[token] = entry['expires_at'] if entry else time.time() + self.ttl_seconds
+        if self.revocations is not None:
+            self.revocations.add(token, expires_at)
+    
+    def _purge_expired(self):
+        now = time.time()
+        for token in [key for key, entry in self._entries.items() if entry['expires_at'] <= now]:
+            del self._entries[token]
+        for token in [key for key, expires_at in self._revoked.items() if expires_at <= now]:
+            del self._revoked[token]
+
 
 class AuthManager:
     """Менеджер аутентификации и авторизации"""
@@ -9,6 +194,8 @@ class AuthManager:
     def __init__(self, db_manager):
         self.db_manager = db_manager
         self.current_user = None
+        self.sessions = SessionTokenCache(os.environ.get('CLINIC_SECRET_KEY'),
+                                          revocations=RevokedTokenStore(db_manager))
     
     def register_user(self, username, password, role, email=None, employee_id=None, patient_id=None):
         """Регистрация нового пользователя"""
@@ -47,52 +234,193 @@ class AuthManager:
         finally:
             self.db_manager.close_session(session)
     
+    def _hash_passwords(self, passwords, workers=None):
+        """Хэширование паролей в пуле процессов (хэширование упирается в CPU)"""
+        if len(passwords) < PARALLEL_HASH_THRESHOLD:
+            return [generate_password_hash(password) for password in passwords]
+        
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(passwords) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(generate_password_hash, passwords, chunksize=chunksize))
+    
+    def bulk_register_users(self, users, batch_size=500, workers=None):
+        """Массовая регистрация пользователей
+        
+        users - последовательность словарей или кортежей с полями
+        (username, password, role, email, employee_id, patient_id).
+        Возвращает (успех, сообщение, отчет); в отчете - число созданных
+        пользователей, пропущенные записи с причинами и пропускная способность.
+        """
+        started = time.perf_counter()
+        report = {'requested': 0, 'created': 0, 'skipped': []}
+        
+        # Нормализация и проверка входных данных без обращения к базе
+        candidates = {}
+        for item in users:
+            record = dict(item) if isinstance(item, dict) else dict(zip(BULK_USER_FIELDS, item))
+            report['requested'] += 1
+            username = record.get('username')
+            if not username or not record.get('password'):
+                report['skipped'].append((username, "Не указаны имя пользователя или пароль"))
+                continue
+            try:
+                record['role'] = UserRole(record['role'])
+            except (KeyError, ValueError):
+                report['skipped'].append((username, "Недопустимая роль"))
+                continue
+            if username in candidates:
+                report['skipped'].append((username, "Повтор имени в загружаемых данных"))
+                continue
+            candidates[username] = record
+        
+        session = self.db_manager.get_session()
+        try:
+            # Конфликты имен проверяются одним запросом на порцию имен, а не на каждого пользователя
+            usernames = list(candidates)
+            existing = set()
+            for i in range(0, len(usernames), USERNAME_QUERY_CHUNK):
+                chunk = usernames[i:i + USERNAME_QUERY_CHUNK]
+                existing.update(session.scalars(select(User.username).where(User.username.in_(chunk))))
+            for username in existing:
+                candidates.pop(username)
+                report['skipped'].append((username, "Пользователь с таким именем уже существует"))
+            
+            records = list(candidates.values())
+            
+            hash_started = time.perf_counter()
+            hashes = self._hash_passwords([record['password'] for record in records], workers)
+            report['hash_seconds'] = time.perf_counter() - hash_started
+            
+            # Вставка порциями: одна транзакция и один executemany на порцию
+            insert_started = time.perf_counter()
+            now = datetime.now()
+            for i in range(0, len(records), batch_size):
+                rows = [
+                    {
+                        'username': record['username'],
+                        'password_hash': password_hash,
+                        'role': record['role'],
+                        'email': record.get('email'),
+                        'employee_id': record.get('employee_id'),
+                        'patient_id': record.get('patient_id'),
+                        'created_at': now,
+                        'is_active': True
+                    }
+                    for record, password_hash in zip(records[i:i + batch_size], hashes[i:i + batch_size])
+                ]
+                session.execute(insert(User), rows)
+                session.commit()
+                report['created'] += len(rows)
+            report['insert_seconds'] = time.perf_counter() - insert_started
+        except Exception as e:
+            session.rollback()
+            report['elapsed'] = time.perf_counter() - started
+            return False, f"Ошибка массовой регистрации: {str(e)}", report
+        finally:
+            self.db_manager.close_session(session)
+        
+        report['elapsed'] = time.perf_counter() - started
+        report['users_per_sec'] = report['created'] / report['elapsed'] if report['elapsed'] else 0.0
+        
+        return True, (f"Создано пользователей: {report['created']} из {report['requested']} "
+                      f"за {report['elapsed']:.2f} с ({report['users_per_sec']:.0f} польз./с)"), report
+    
+    def _resolve_principal(self, session, user_filter):
+        """Пользователь и связанный профиль одним запросом с LEFT JOIN"""
+        row = session.execute(
+            select(
+                User.id, User.username, User.password_hash, User.role,
+                User.employee_id, User.patient_id,
+                Employee.last_name.label('employee_last_name'),
+                Employee.first_name.label('employee_first_name'),
+                Employee.patronymic.label('employee_patronymic'),
+                Patient.last_name.label('patient_last_name'),
+                Patient.first_name.label('patient_first_name'),
+                Patient.patronymic.label('patient_patronymic'),
+            )
+            .outerjoin(Employee, Employee.id == User.employee_id)
+            .outerjoin(Patient, Patient.id == User.patient_id)
+            .where(user_filter, User.is_active == True)
+        ).first()
+        
+        if row is None:
+            return None, None
+        
+        # Данные профиля в зависимости от роли
+        principal = {
+            'id': row.id,
+            'username': row.username,
+            'role': row.role.value,
+            'full_name': row.username
+        }
+        if row.role == UserRole.DOCTOR and row.employee_id:
+            if row.employee_last_name:
+                principal['full_name'] = _full_name(
+                    row.employee_last_name, row.employee_first_name, row.employee_patronymic
+                )
+            principal['employee_id'] = row.employee_id
+        elif row.role == UserRole.PATIENT and row.patient_id:
+            if row.patient_last_name:
+                principal['full_name'] = _full_name(
+                    row.patient_last_name, row.patient_first_name, row.patient_patronymic
+                )
+            principal['patient_id'] = row.patient_id
+        
+        return principal, row.password_hash
+    
     def login(self, username, password):
         """Аутентификация пользователя"""
         session = self.db_manager.get_session()
         try:
-            user = session.query(User).filter_by(username=username, is_active=True).first()
+            principal, password_hash = self._resolve_principal(session, User.username == username)
             
-            if user and check_password_hash(user.password_hash, password):
-                self.current_user = user
-                
-                # Получаем связанные данные в зависимости от роли
-                if user.role == UserRole.DOCTOR and user.employee_id:
-                    employee = session.query(Employee).filter_by(id=user.employee_id).first()
-                    user_info = {
-                        'id': user.id,
-                        'username': user.username,
-                        'role': user.role.value,
-                        'full_name': employee.full_name if employee else user.username,
-                        'employee_id': user.employee_id
-                    }
-                elif user.role == UserRole.PATIENT and user.patient_id:
-                    patient = session.query(Patient).filter_by(id=user.patient_id).first()
-                    user_info = {
-                        'id': user.id,
-                        'username': user.username,
-                        'role': user.role.value,
-                        'full_name': patient.full_name if patient else user.username,
-                        'patient_id': user.patient_id
-                    }
-                else:
-                    user_info = {
-                        'id': user.id,
-                        'username': user.username,
-                        'role': user.role.value,
-                        'full_name': user.username
-                    }
+            if principal and check_password_hash(password_hash, password):
+                user_info = dict(principal)
+                user_info['token'] = self.sessions.issue(principal)
+                self.current_user = self.sessions.get(user_info['token'])
                 
+                LOGINS.labels(result='success').inc()
                 return True, "Вход выполнен успешно", user_info
             else:
+                LOGINS.labels(result='failure').inc()
                 return False, "Неверное имя пользователя или пароль", None
         except Exception as e:
+            LOGINS.labels(result='error').inc()
             return False, f"Ошибка входа: {str(e)}", None
         finally:
             self.db_manager.close_session(session)
     
-    def logout(self):
+    def authenticate_token(self, token):
+        """Получение пользователя по токену сессии
+        
+        Обычно ответ берется из кэша без обращения к базе; если запись
+        вытеснена из кэша, пользователь загружается заново одним запросом.
+        """
+        user_id = self.sessions.verify(token)
+        if user_id is None:
+            return None
+        
+        principal = self.sessions.get(token)
+        if principal is not None:
+            return principal
+        
+        session = self.db_manager.get_session()
+        try:
+            principal, _ = self._resolve_principal(session, User.id == user_id)
+        finally:
+            self.db_manager.close_session(session)
+        
+        if principal is None:
+            return None
+        return self.sessions.put(token, principal)
+    
+    def logout(self, token=None):
         """Выход из системы"""
+        if token is None and self.current_user:
+            token = self.current_user.get('token')
+        if token:
+            self.sessions.revoke(token)
         self.current_user = None
         return True, "Выход выполнен успешно"
     
@@ -100,15 +428,21 @@ class AuthManager:
         """Получение текущего пользователя"""
         return self.current_user
     
-    def has_permission(self, required_roles):
-        """Проверка прав доступа"""
-        if not self.current_user:
+    def has_permission(self, required_roles, token=None):
+        """Проверка прав доступа по роли (без обращения к базе)"""
+        principal = self.authenticate_token(token) if token else self.current_user
+        if not principal:
             return False
         
         if isinstance(required_roles, str):
             required_roles = [required_roles]
         
-        return self.current_user.role.value in required_roles
+        return principal['role'] in required_roles
+    
+    def can(self, permission, token=None):
+        """Проверка разрешения на действие по заранее вычисленному набору прав"""
+        principal = self.authenticate_token(token) if token else self.current_user
+        return bool(principal) and permission in principal['permissions']
     
     def create_default_admin(self):
         """Создание администратора по умолчанию"""
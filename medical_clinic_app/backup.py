@@ -1,120 +1,313 @@
-import shutil
 import os
 from datetime import datetime
 from pathlib import Path
 import zipfile
-import schedule
+import sqlite3
 import time
-import threading
+from archive import ARCHIVE_FILE_PATTERN
+from backup_verifier import BackupVerifier
+from backup_scheduler import BackupLock, BackupScheduler, GFSRetention
+from backup_storage import LocalDirectoryBackend, S3Backend, S3_AVAILABLE
+from metrics import BACKUPS, BACKUP_SECONDS, BACKUP_SIZE, BACKUP_LAST_SUCCESS
 
 class BackupManager:
     """Менеджер резервного копирования базы данных"""
     
     def __init__(self, db_path='medical_clinic.db'):
         self.db_path = Path(db_path)
+        # Годовые архивные базы (archive.py) входят в каждую резервную копию
+        self.archive_dir = Path("archive")
         self.backup_dir = Path("backups")
         self.backup_dir.mkdir(exist_ok=True)
-        self.remote_backup_dir = None
+        self.verifier = BackupVerifier(self.backup_dir)
+        self.lock = BackupLock(self.backup_dir / ".backup.lock")
+        self.retention = GFSRetention(daily=7, weekly=4, monthly=12)
+        self.scheduler = None
+        self.remote_backup_dir = Path(os.environ['CLINIC_REMOTE_BACKUP_DIR']) if os.environ.get('CLINIC_REMOTE_BACKUP_DIR') else None
+        self.cloud_backend = None
         self.is_scheduled = False
     
+    def _snapshot_database(self, target_path, pages=256, sleep=0.005, source_path=None):
+        """Согласованный снимок базы через online backup API SQLite
+        
+        Копирование идет порциями страниц с паузами, поэтому писатели
+        не блокируются на все время создания копии. По умолчанию
+        копируется оперативная база, source_path - другая база (архив).
+        """
+        source = sqlite3.connect(source_path or self.db_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=pages, sleep=sleep)
+            # Снимок должен открываться как самостоятельный файл, без -wal/-shm
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+    
+    def _restore_database(self, source_path, pages=256, target_path=None):
+        """Перенос снимка в рабочую базу (или target_path) через online backup API SQLite
+        
+        Страницы записываются через SQLite, поэтому журнал WAL рабочей базы
+        учитывается: простое копирование файла поверх базы оставило бы
+        старый -wal, который SQLite применил бы к восстановленной базе.
+        """
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path or self.db_path, timeout=30)
+        try:
+            source.backup(target, pages=pages)
+            # Изменения переносятся из WAL в файл базы сразу
+            target.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            target.close()
+            source.close()
+    
     def create_backup(self, backup_type='local'):
         """Создание резервной копии базы данных"""
+        # Одновременно выполняется только одно копирование (в том числе между процессами)
+        if not self.lock.acquire():
+            return False, "Резервное копирование уже выполняется"
+        started = time.perf_counter()
+        try:
+            success, message = self._create_backup(backup_type)
+        finally:
+            self.lock.release()
+        BACKUP_SECONDS.labels(type=backup_type).observe(time.perf_counter() - started)
+        BACKUPS.labels(type=backup_type, result='success' if success else 'failure').inc()
+        if success:
+            BACKUP_LAST_SUCCESS.labels(type=backup_type).set(time.time())
+        return success, message
+    
+    def _create_local_archive(self, timestamp, prefix="backup"):
+        """Создание локального архива со снимком базы данных"""
+        backup_filename = f"{prefix}_{timestamp}.db"
+        backup_path = self.backup_dir / backup_filename
+        
+        self._snapshot_database(backup_path)
+        
+        # Годовые архивы снимаются после оперативной базы: перенос в архив
+        # сначала фиксирует копию в архиве, поэтому запись, переносимая во
+        # время копирования, окажется хотя бы в одном из снимков
+        archive_snapshots = {}
+        for archive_path in self._archive_files():
+            snapshot_path = self.backup_dir / f"{archive_path.stem}_{timestamp}.db"
+            self._snapshot_database(snapshot_path, source_path=archive_path)
+            archive_snapshots[f"{self.archive_dir.name}/{archive_path.name}"] = snapshot_path
+        
+        # Архивирование для экономии места
+        zip_filename = f"{prefix}_{timestamp}.zip"
+        zip_path = self.backup_dir / zip_filename
+        
+        try:
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                # Снимок оперативной базы - первый файл архива
+                zipf.write(backup_path, arcname=backup_filename)
+                for arcname, snapshot_path in archive_snapshots.items():
+                    zipf.write(snapshot_path, arcname=arcname)
+            
+            # Запись контрольной суммы и статистики снимков в манифест
+            self.verifier.record_backup(zip_path, backup_path, archive_snapshots)
+        finally:
+            # Удаление снимков после архивирования
+            os.remove(backup_path)
+            for snapshot_path in archive_snapshots.values():
+                os.remove(snapshot_path)
+        
+        return zip_path
+    
+    def _archive_files(self):
+        """Годовые архивные базы archive/medical_clinic_<год>.db"""
+        if not self.archive_dir.exists():
+            return []
+        return sorted(path for path in self.archive_dir.iterdir() if ARCHIVE_FILE_PATTERN.match(path.name))
+    
+    def get_storage_backend(self, backup_type):
+        """Хранилище для удаленного или облачного копирования"""
+        if backup_type == 'remote':
+            if not self.remote_backup_dir:
+                return None
+            return LocalDirectoryBackend(self.remote_backup_dir, state_dir=self.backup_dir / ".upload_state")
+        if backup_type == 'cloud':
+            if self.cloud_backend is None:
+                self.cloud_backend = S3Backend.from_env(state_dir=self.backup_dir / ".upload_state")
+            return self.cloud_backend
+        return None
+    
+    def _create_backup(self, backup_type):
+        """Создание резервной копии (вызывается под блокировкой)"""
         try:
             if not self.db_path.exists():
                 return False, f"Файл базы данных не найден: {self.db_path}"
             
+            if backup_type not in ('local', 'remote', 'cloud'):
+                return False, f"Неизвестный тип резервного копирования: {backup_type}"
+            
+            storage = None
+            if backup_type == 'remote':
+                storage = self.get_storage_backend('remote')
+                if storage is None:
+                    return False, "Не указана удаленная директория для резервного копирования"
+            elif backup_type == 'cloud':
+                if not S3_AVAILABLE:
+                    return False, "Библиотека boto3 не установлена"
+                storage = self.get_storage_backend('cloud')
+                if storage is None:
+                    return False, "Не настроено облачное хранилище (переменная CLINIC_S3_BUCKET)"
+            
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            zip_path = self._create_local_archive(timestamp)
+            BACKUP_SIZE.labels(type=backup_type).set(zip_path.stat().st_size)
             
-            if backup_type == 'local':
-                # Локальная копия
-                backup_filename = f"backup_{timestamp}.db"
-                backup_path = self.backup_dir / backup_filename
-                
-                shutil.copy2(self.db_path, backup_path)
-                
-                # Архивирование для экономии места
-                zip_filename = f"backup_{timestamp}.zip"
-                zip_path = self.backup_dir / zip_filename
-                
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    zipf.write(backup_path, arcname=backup_filename)
-                
-                # Удаление нефайла после архивирования
-                os.remove(backup_path)
-                
-                # Удаление старых резервных копий (старше 7 дней)
-                self._clean_old_backups(days=7)
-                
+            # Удаление лишних копий по политике хранения
+            self._clean_old_backups(storage)
+            
+            if storage is None:
                 return True, f"Локальная резервная копия создана: {zip_path}"
             
-            elif backup_type == 'remote':
-                # Имитация копирования на удаленный сервер
-                if not self.remote_backup_dir:
-                    return False, "Не указана удаленная директория для резервного копирования"
-                
-                remote_backup_path = self.remote_backup_dir / f"backup_{timestamp}.db"
-                
-                # В реальном приложении здесь было бы копирование по сети
-                # Например, через FTP, SCP или облачное API
-                print(f"[Имитация] Копирование {self.db_path} -> {remote_backup_path}")
-                
-                return True, f"Резервная копия отправлена на удаленный сервер: {remote_backup_path}"
+            # Внешняя копия передается частями параллельно и возобновляется после сбоя
+            location = storage.upload(zip_path, zip_path.name)
+            self.verifier.record_copy(zip_path.name, backup_type, location)
             
-            elif backup_type == 'cloud':
-                # Имитация копирования в облачное хранилище
-                # В реальном приложении здесь было бы использование cloud storage API
-                print(f"[Имитация] Загрузка {self.db_path} в облачное хранилище")
-                
-                return True, f"Резервная копия загружена в облачное хранилище"
+            # Архивы, передача которых прервалась в прошлые запуски, догружаются
+            retried, failed = self._upload_pending_copies(storage, backup_type)
+            details = ""
+            if retried:
+                details += f"; догружено ранее не переданных копий: {len(retried)}"
+            if failed:
+                details += f"; не удалось передать: {', '.join(failed)}"
             
-            else:
-                return False, f"Неизвестный тип резервного копирования: {backup_type}"
+            if backup_type == 'remote':
+                return True, f"Резервная копия отправлена на удаленный сервер: {location}{details}"
+            return True, f"Резервная копия загружена в облачное хранилище: {location}{details}"
         
         except Exception as e:
             return False, f"Ошибка создания резервной копии: {str(e)}"
     
-    def _clean_old_backups(self, days=7):
-        """Удаление старых резервных копий"""
+    def _upload_pending_copies(self, storage, backup_type):
+        """Передача архивов из манифеста, у которых нет копии в этом хранилище
+        
+        Прерванная передача продолжается по сохраненному состоянию:
+        уже переданные части повторно не отправляются.
+        """
+        manifest = self.verifier.load_manifest()
+        retried, failed = [], []
+        
+        for filename in sorted(manifest):
+            zip_path = self.backup_dir / filename
+            if backup_type in manifest[filename].get('copies', {}) or not zip_path.exists():
+                continue
+            try:
+                location = storage.upload(zip_path, filename)
+            except Exception as e:
+                print(f"Ошибка передачи резервной копии {filename}: {e}")
+                failed.append(filename)
+                continue
+            self.verifier.record_copy(filename, backup_type, location)
+            retried.append(filename)
+        
+        return retried, failed
+    
+    def _clean_upload_states(self, storage=None):
+        """Удаление состояний передачи архивов, которых больше нет локально"""
+        state_dir = self.backup_dir / ".upload_state"
+        if not state_dir.exists():
+            return
+        existing = {path.name for path in self.backup_dir.glob("*.zip")}
+        
+        for state_path in state_dir.glob("*.json"):
+            # Имя файла состояния: <хранилище>_<ключ>.json
+            storage_name, _, safe_key = state_path.stem.partition('_')
+            key = safe_key.replace('__', '/')
+            if key in existing:
+                continue
+            if storage is not None and storage.name == storage_name:
+                # Хранилище заодно удаляет переданные части (.part, многочастная загрузка S3)
+                storage.discard_upload(key)
+            else:
+                state_path.unlink()
+    
+    def _clean_old_backups(self, storage=None):
+        """Удаление старых резервных копий по политике «дед-отец-сын»
+        
+        Политика применяется к локальным архивам, состояниям незавершенных
+        передач и к копиям во внешнем хранилище текущего запуска.
+        """
         try:
-            cutoff_time = time.time() - (days * 86400)  # дней в секундах
-            
-            for backup_file in self.backup_dir.glob("*.zip"):
-                if backup_file.stat().st_mtime < cutoff_time:
-                    backup_file.unlink()
-                    print(f"Удалена старая резервная копия: {backup_file}")
+            for filename in self.retention.apply(self.backup_dir, self.verifier):
+                print(f"Удалена старая резервная копия: {filename}")
+            self._clean_upload_states(storage)
+            if storage is not None:
+                for key in self.retention.apply_storage(storage):
+                    print(f"Удалена старая внешняя копия ({storage.name}): {key}")
         except Exception as e:
             print(f"Ошибка при удалении старых резервных копий: {e}")
     
     def list_backups(self):
         """Список доступных резервных копий"""
         backups = []
+        manifest = self.verifier.load_manifest()
         
         for backup_file in sorted(self.backup_dir.glob("*.zip"), key=os.path.getmtime, reverse=True):
             file_stat = backup_file.stat()
+            entry = manifest.get(backup_file.name)
             backups.append({
                 'filename': backup_file.name,
                 'path': str(backup_file),
                 'size_mb': file_stat.st_size / (1024 * 1024),
-                'created': datetime.fromtimestamp(file_stat.st_mtime).strftime("%d.%m.%Y %H:%M:%S")
+                'created': datetime.fromtimestamp(file_stat.st_mtime).strftime("%d.%m.%Y %H:%M:%S"),
+                'sha256': entry['sha256'] if entry else None,
+                'schema_version': entry['schema_version'] if entry else None,
+                'total_rows': sum(entry['row_counts'].values()) if entry else None
             })
         
         return backups
     
+    def verify_backups(self, deep_sample_size=1):
+        """Проверка резервных копий: быстрая для всех архивов и глубокая для выборки"""
+        try:
+            self.verifier.adopt_untracked()
+            results = self.verifier.verify_all()
+            if not results:
+                return False, "Резервные копии не найдены", []
+            
+            deep_results = {r['filename']: r for r in self.verifier.deep_verify_sample(deep_sample_size)}
+            for result in results:
+                deep = deep_results.get(result['filename'])
+                result['deep_checked'] = deep is not None
+                if deep is not None:
+                    result['ok'] = deep['ok']
+                    result['errors'] = deep['errors']
+            
+            failed = [r for r in results if not r['ok']]
+            if failed:
+                return False, f"Проверку не прошли {len(failed)} из {len(results)} резервных копий", results
+            return True, f"Все резервные копии прошли проверку ({len(results)})", results
+        except Exception as e:
+            return False, f"Ошибка проверки резервных копий: {str(e)}", []
+    
     def restore_backup(self, backup_filename):
         """Восстановление из резервной копии"""
+        # Копирование во время восстановления сняло бы наполовину замененные базы
+        if not self.lock.acquire():
+            return False, "Выполняется резервное копирование, повторите восстановление позже"
+        try:
+            return self._restore_backup(backup_filename)
+        finally:
+            self.lock.release()
+    
+    def _restore_backup(self, backup_filename):
+        """Восстановление из резервной копии (вызывается под блокировкой)"""
         try:
             backup_path = self.backup_dir / backup_filename
             
             if not backup_path.exists():
                 return False, f"Резервная копия не найдена: {backup_filename}"
             
-            # Создание резервной копии текущей базы данных перед восстановлением
-            current_backup_name = f"pre_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-            current_backup_path = self.backup_dir / current_backup_name
-            shutil.copy2(self.db_path, current_backup_path)
-            
-            # Распаковка резервной копии
-            temp_backup_path = self.backup_dir / "temp_restore.db"
+            # Проверка архива перед восстановлением
+            entry = self.verifier.load_manifest().get(backup_filename)
+            if entry:
+                check = self.verifier.deep_verify(backup_path, entry)
+                if not check['ok']:
+                    return False, f"Резервная копия не прошла проверку: {'; '.join(check['errors'])}"
             
             with zipfile.ZipFile(backup_path, 'r') as zipf:
                 # Получаем имя файла внутри архива
@@ -122,43 +315,70 @@ class BackupManager:
                 if not zip_files:
                     return False, "Архив пустой"
                 
-                # Извлекаем первый файл
-                zipf.extract(zip_files[0], path=self.backup_dir)
-                extracted_file = self.backup_dir / zip_files[0]
+                # Снимок оперативной базы - первый файл, годовые архивы - в каталоге archive/
+                archive_prefix = f"{self.archive_dir.name}/"
+                archive_members = [name for name in zip_files if name.startswith(archive_prefix)]
+                snapshot_member = entry['snapshot'] if entry else zip_files[0]
+                restored_archives = {member[len(archive_prefix):] for member in archive_members}
                 
-                # Копируем извлеченный файл как основную базу данных
-                shutil.copy2(extracted_file, self.db_path)
+                # Копия текущего состояния перед восстановлением: оперативная база
+                # и все годовые архивы (снимки через backup API включают изменения из WAL;
+                # микросекунды в имени: копия не перезапишет восстанавливаемый архив)
+                current_backup_path = self._create_local_archive(
+                    datetime.now().strftime('%Y%m%d_%H%M%S_%f'), prefix="pre_restore")
                 
-                # Удаляем временный файл
-                os.remove(extracted_file)
+                for member in [snapshot_member] + archive_members:
+                    zipf.extract(member, path=self.backup_dir)
+                    extracted_file = self.backup_dir / member
+                    if member == snapshot_member:
+                        target_path = self.db_path
+                    else:
+                        self.archive_dir.mkdir(parents=True, exist_ok=True)
+                        target_path = self.archive_dir / member[len(archive_prefix):]
+                    
+                    # Переносим извлеченный снимок в основную или архивную базу данных
+                    try:
+                        self._restore_database(extracted_file, target_path=target_path)
+                    finally:
+                        # Удаляем временный файл
+                        os.remove(extracted_file)
+                
+                if archive_members:
+                    (self.backup_dir / archive_prefix).rmdir()
+            
+            # Годовые архивы, которых нет в копии, появились после нее: их записи
+            # есть в восстановленной оперативной базе и при повторном переносе
+            # задвоились бы (сами файлы сохранены в копии перед восстановлением)
+            for archive_path in self._archive_files():
+                if archive_path.name not in restored_archives:
+                    for path in (archive_path, Path(f"{archive_path}-wal"), Path(f"{archive_path}-shm")):
+                        if path.exists():
+                            path.unlink()
+                    print(f"Удален архив, отсутствующий в резервной копии: {archive_path}")
             
-            return True, f"База данных восстановлена из {backup_filename}"
+            return True, f"База данных восстановлена из {backup_filename} (текущее состояние сохранено в {current_backup_path.name})"
         
         except Exception as e:
             return False, f"Ошибка восстановления: {str(e)}"
     
-    def schedule_backup(self, interval_hours=24, backup_type='local'):
+    def schedule_backup(self, interval_hours=24, backup_type='local', start_time=None):
         """Планирование автоматического резервного копирования"""
-        def backup_job():
-            success, message = self.create_backup(backup_type)
-            print(f"[Планировщик] {message}")
-        
-        # Ежедневное резервное копирование
-        schedule.every(interval_hours).hours.do(backup_job)
+        if interval_hours <= 0:
+            return False, "Интервал резервного копирования должен быть больше нуля"
         
-        # Запуск планировщика в отдельном потоке
-        def run_scheduler():
-            while self.is_scheduled:
-                schedule.run_pending()
-                time.sleep(60)  # Проверка каждую минуту
+        if self.scheduler:
+            self.scheduler.stop()
         
+        self.scheduler = BackupScheduler(self, interval_hours, backup_type, start_time=start_time)
+        self.scheduler.start()
         self.is_scheduled = True
-        scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-        scheduler_thread.start()
         
         return True, f"Автоматическое резервное копирование запущено каждые {interval_hours} часов"
     
     def stop_scheduled_backup(self):
         """Остановка планировщика резервного копирования"""
+        if self.scheduler:
+            self.scheduler.stop()
+            self.scheduler = None
         self.is_scheduled = False
-        return True, "Автоматическое резервное копирование остановлено"
\ No newline at end of file
+        return True, "Автоматическое резервное копирование остановлено"
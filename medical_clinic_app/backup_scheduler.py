@@ -0,0 +1,266 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# Имя архива содержит время создания: backup_ГГГГММДД_ЧЧММСС.zip
+BACKUP_NAME_RE = re.compile(r'^backup_(\d{8}_\d{6})\.zip$')
+
+
+def backup_timestamp(path):
+    """Время создания резервной копии по имени файла (или по mtime)"""
+    path = Path(path)
+    match = BACKUP_NAME_RE.match(path.name)
+    if match:
+        return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+    return datetime.fromtimestamp(path.stat().st_mtime)
+
+
+def measure_write_rate(db_path, window=2.0, step=0.1):
+    """Оценка интенсивности записи в базу (фиксаций в секунду)
+
+    PRAGMA data_version меняется, когда другое соединение фиксирует транзакцию,
+    поэтому частый опрос дает нижнюю оценку числа фиксаций за окно.
+    """
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=step)
+    try:
+        changes = 0
+        last_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        deadline = time.monotonic() + window
+        while time.monotonic() < deadline:
+            time.sleep(step)
+            try:
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.OperationalError:
+                # База заблокирована писателем - это тоже запись
+                changes += 1
+                continue
+            if version != last_version:
+                changes += 1
+                last_version = version
+        return changes / window
+    finally:
+        conn.close()
+
+
+class BackupLock:
+    """Межпроцессная блокировка: одновременно выполняется только одно резервное копирование"""
+
+    def __init__(self, lock_path):
+        self.lock_path = Path(lock_path)
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self):
+        """Неблокирующий захват; False, если копирование уже идет"""
+        if not self._thread_lock.acquire(blocking=False):
+            return False
+        try:
+            self._file = open(self.lock_path, 'a+')
+            if os.name == 'nt':
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            if self._file:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+            return False
+
+    def release(self):
+        """Освобождение блокировки"""
+        if self._file:
+            if os.name == 'nt':
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+class GFSRetention:
+    """Политика хранения «дед-отец-сын»: дневные, недельные и месячные копии"""
+
+    def __init__(self, daily=7, weekly=4, monthly=12):
+        self.daily = daily
+        self.weekly = weekly
+        self.monthly = monthly
+
+    def select_to_keep(self, backups):
+        """Выбор копий для хранения из списка пар (путь, время создания)"""
+        ordered = sorted(backups, key=lambda item: item[1], reverse=True)
+        keep = set()
+
+        tiers = [
+            (self.daily, lambda ts: ts.date()),
+            (self.weekly, lambda ts: ts.isocalendar()[:2]),
+            (self.monthly, lambda ts: (ts.year, ts.month)),
+        ]
+        for limit, period_key in tiers:
+            seen_periods = set()
+            for path, created in ordered:
+                if len(seen_periods) >= limit:
+                    break
+                period = period_key(created)
+                if period not in seen_periods:
+                    # Самая свежая копия периода представляет весь период
+                    seen_periods.add(period)
+                    keep.add(path)
+
+        # Последняя копия не удаляется никогда
+        if ordered:
+            keep.add(ordered[0][0])
+        return keep
+
+    def apply(self, backup_dir, verifier=None):
+        """Удаление копий, не попавших ни в один уровень хранения"""
+        backups = [(path, backup_timestamp(path)) for path in Path(backup_dir).glob("backup_*.zip")]
+        keep = self.select_to_keep(backups)
+        removed = []
+
+        for path, _ in backups:
+            if path not in keep:
+                path.unlink()
+                if verifier:
+                    verifier.forget_backup(path.name)
+                removed.append(path.name)
+
+        return removed
+
+    def apply_storage(self, storage):
+        """Удаление внешних копий (удаленный каталог, S3) по той же политике"""
+        backups = []
+        for key in storage.list_objects():
+            match = BACKUP_NAME_RE.match(key)
+            if match:
+                backups.append((key, datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")))
+        keep = self.select_to_keep(backups)
+        removed = []
+
+        for key, _ in backups:
+            if key not in keep:
+                storage.delete(key)
+                removed.append(key)
+
+        return removed
+
+
+class BackupScheduler:
+    """Планировщик резервного копирования с точным пробуждением и отсрочкой под нагрузкой"""
+
+    def __init__(self, backup_manager, interval_hours=24, backup_type='local', start_time=None,
+                 peak_hours=((8, 20),), max_write_rate=5.0, initial_backoff=60,
+                 max_backoff=1800, max_deferral_hours=6):
+        # При нулевом интервале расчет следующего запуска никогда не продвинулся бы в будущее
+        if interval_hours <= 0:
+            raise ValueError("Интервал резервного копирования должен быть больше нуля")
+        self.backup_manager = backup_manager
+        self.interval = timedelta(hours=interval_hours)
+        self.backup_type = backup_type
+        self.start_time = start_time  # время первого запуска (datetime.time) или None
+        self.peak_hours = peak_hours  # интервалы часов [начало, конец), когда копирование не запускается
+        self.max_write_rate = max_write_rate
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_deferral = timedelta(hours=max_deferral_hours)
+
+        self.next_run = None
+        self.last_result = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _first_run(self, now):
+        """Время первого запуска"""
+        if self.start_time is None:
+            return now + self.interval
+        first = datetime.combine(now.date(), self.start_time)
+        return first if first > now else first + timedelta(days=1)
+
+    def _peak_end(self, moment):
+        """Конец текущего интервала часов пик или None, если сейчас не час пик"""
+        for start, end in self.peak_hours:
+            if start <= moment.hour < end:
+                return datetime.combine(moment.date(), datetime.min.time()) + timedelta(hours=end)
+        return None
+
+    def _write_load_high(self):
+        """Высокая ли сейчас интенсивность записи в базу"""
+        try:
+            return measure_write_rate(self.backup_manager.db_path) > self.max_write_rate
+        except sqlite3.Error:
+            return True
+
+    def _sleep_until(self, moment):
+        """Ожидание до заданного момента; True, если планировщик остановлен"""
+        while not self._stopped.is_set():
+            remaining = (moment - datetime.now()).total_seconds()
+            if remaining <= 0:
+                return False
+            # Event.wait прерывается сразу при остановке, без периодического опроса
+            self._wakeup.wait(remaining)
+            self._wakeup.clear()
+        return True
+
+    def _run(self):
+        """Основной цикл планировщика"""
+        self.next_run = self._first_run(datetime.now())
+
+        while not self._sleep_until(self.next_run):
+            due = self.next_run
+            backoff = self.initial_backoff
+
+            while True:
+                now = datetime.now()
+                # В часы пик копирование не запускается никогда
+                peak_end = self._peak_end(now)
+                if peak_end:
+                    if self._sleep_until(peak_end):
+                        return
+                    continue
+                # При высокой нагрузке - экспоненциальная отсрочка, но не дольше max_deferral
+                if now - due < self.max_deferral and self._write_load_high():
+                    if self._sleep_until(now + timedelta(seconds=backoff)):
+                        return
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                break
+
+            success, message = self.backup_manager.create_backup(self.backup_type)
+            self.last_result = (datetime.now(), success, message)
+            print(f"[Планировщик] {message}")
+
+            # Пропущенные запуски не накапливаются: следующий - строго в будущем
+            now = datetime.now()
+            self.next_run = due + self.interval
+            while self.next_run <= now:
+                self.next_run += self.interval
+
+    def start(self):
+        """Запуск планировщика в фоновом потоке"""
+        if self._thread and self._thread.is_alive():
+            return False
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        """Остановка планировщика"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
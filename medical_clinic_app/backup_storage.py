@@ -0,0 +1,429 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from pathlib import Path
+
+from backup_verifier import file_sha256
+
+# Библиотека boto3 нужна только для S3-совместимого хранилища и загружается
+# при создании S3Backend: проверка наличия не импортирует сам пакет
+S3_AVAILABLE = find_spec('boto3') is not None
+
+# S3 требует, чтобы все части, кроме последней, были не меньше 5 МБ
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+class TokenBucket:
+    """Ограничитель пропускной способности, общий для всех потоков загрузки"""
+
+    def __init__(self, rate_bytes_per_sec):
+        self.rate = rate_bytes_per_sec
+        self.capacity = rate_bytes_per_sec
+        self.tokens = rate_bytes_per_sec
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Ожидание, пока не будет разрешена передача amount байт"""
+        if not self.rate:
+            return
+        while amount > 0:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Крупные части передаются порциями не больше емкости ведра
+                portion = min(amount, self.capacity)
+                if self.tokens >= portion:
+                    self.tokens -= portion
+                    amount -= portion
+                    continue
+                wait = (portion - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def with_retries(func, attempts=5, base_delay=0.5, max_delay=30, retry_on=(Exception,)):
+    """Вызов функции с повторами и экспоненциальной задержкой со случайным разбросом"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except retry_on:
+            if attempt == attempts:
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def split_parts(size, part_size):
+    """Разбиение файла на части: список (номер части, смещение, длина)"""
+    parts = []
+    offset = 0
+    number = 1
+    while offset < size or number == 1:
+        length = min(part_size, size - offset)
+        parts.append((number, offset, length))
+        offset += length
+        number += 1
+    return parts
+
+
+def read_part(path, offset, length):
+    """Чтение части файла"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+class UploadState:
+    """Состояние незавершенной передачи для возобновления после сбоя"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.data = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+
+    def matches(self, source_sha256, part_size):
+        """Относится ли сохраненное состояние к тому же файлу и разбиению"""
+        return self.data.get('sha256') == source_sha256 and self.data.get('part_size') == part_size
+
+    def reset(self, **fields):
+        """Начало новой передачи"""
+        with self._lock:
+            self.data = dict(fields, parts={})
+            self._save()
+
+    def completed_parts(self):
+        """Номера и метаданные уже переданных частей"""
+        return {int(number): meta for number, meta in self.data.get('parts', {}).items()}
+
+    def mark_part(self, number, meta):
+        """Отметка о переданной части"""
+        with self._lock:
+            self.data.setdefault('parts', {})[str(number)] = meta
+            self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Удаление состояния после успешного завершения"""
+        if self.path.exists():
+            self.path.unlink()
+
+
+class StorageBackend(ABC):
+    """Базовый класс хранилища резервных копий
+
+    Файл передается частями параллельно; переданные части фиксируются
+    в файле состояния, поэтому прерванная передача продолжается с места сбоя.
+    """
+
+    name = 'base'
+    retry_on = (OSError,)
+
+    def __init__(self, part_size=DEFAULT_PART_SIZE, max_workers=4, bandwidth_limit=None,
+                 retries=5, state_dir=None):
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.throttle = TokenBucket(bandwidth_limit) if bandwidth_limit else None
+        self.retries = retries
+        self.state_dir = Path(state_dir or Path("backups") / ".upload_state")
+
+    def _state_for(self, key):
+        safe_key = key.replace('/', '__')
+        return UploadState(self.state_dir / f"{self.name}_{safe_key}.json")
+
+    def _transfer_part(self, upload_part, path, number, offset, length):
+        """Передача одной части с ограничением скорости и повторами"""
+        def attempt():
+            data = read_part(path, offset, length)
+            if self.throttle:
+                self.throttle.consume(len(data))
+            return upload_part(number, data)
+
+        return with_retries(attempt, attempts=self.retries, retry_on=self.retry_on)
+
+    def _upload_parts(self, path, parts, state, upload_part):
+        """Параллельная передача недостающих частей"""
+        done = state.completed_parts()
+        pending = [part for part in parts if part[0] not in done]
+
+        def worker(part):
+            number, offset, length = part
+            meta = self._transfer_part(upload_part, path, number, offset, length)
+            state.mark_part(number, meta)
+            return number, meta
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for number, meta in executor.map(worker, pending):
+                done[number] = meta
+
+        return done
+
+    @abstractmethod
+    def upload(self, local_path, key):
+        """Загрузка файла в хранилище; возвращает итоговый ключ"""
+
+    @abstractmethod
+    def list_objects(self):
+        """Список ключей в хранилище"""
+
+    @abstractmethod
+    def download(self, key, local_path):
+        """Загрузка файла из хранилища"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Удаление файла из хранилища"""
+
+    def discard_upload(self, key):
+        """Отказ от незавершенной передачи: удаление ее состояния"""
+        self._state_for(key).clear()
+
+
+class LocalDirectoryBackend(StorageBackend):
+    """«Удаленное» хранилище в локальном или смонтированном сетевом каталоге"""
+
+    name = 'remote'
+
+    def __init__(self, root, **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root)
+
+    def upload(self, local_path, key):
+        local_path = Path(local_path)
+        target = self.root / key
+        part_path = target.with_name(target.name + '.part')
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        size = local_path.stat().st_size
+        source_sha256 = file_sha256(local_path)
+        state = self._state_for(key)
+
+        if not (state.matches(source_sha256, self.part_size) and part_path.exists()):
+            state.reset(sha256=source_sha256, part_size=self.part_size)
+            # Файл нужного размера создается заранее, части пишутся по смещениям
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+
+        def upload_part(number, data):
+            offset = (number - 1) * self.part_size
+            with open(part_path, 'r+b') as f:
+                f.seek(offset)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            return {'sha256': hashlib.sha256(data).hexdigest()}
+
+        self._upload_parts(local_path, split_parts(size, self.part_size), state, upload_part)
+
+        if file_sha256(part_path) != source_sha256:
+            state.clear()
+            part_path.unlink()
+            raise OSError(f"Контрольная сумма копии {target} не совпадает с исходным файлом")
+
+        os.replace(part_path, target)
+        state.clear()
+        return str(target)
+
+    def list_objects(self):
+        if not self.root.exists():
+            return []
+        return sorted(
+            str(path.relative_to(self.root)) for path in self.root.rglob('*')
+            if path.is_file() and not path.name.endswith('.part')
+        )
+
+    def download(self, key, local_path):
+        with open(self.root / key, 'rb') as src, open(local_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(self.part_size), b''):
+                if self.throttle:
+                    self.throttle.consume(len(chunk))
+                dst.write(chunk)
+        return str(local_path)
+
+    def delete(self, key):
+        (self.root / key).unlink()
+
+    def discard_upload(self, key):
+        part_path = self.root / (key + '.part')
+        if part_path.exists():
+            part_path.unlink()
+        super().discard_upload(key)
+
+
+class S3Backend(StorageBackend):
+    """S3-совместимое хранилище (AWS S3, MinIO, Ceph RGW)
+
+    Для проверки без облака достаточно указать endpoint_url локального
+    сервера, совместимого с S3 (например, MinIO или moto_server).
+    """
+
+    name = 'cloud'
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region_name=None,
+                 access_key=None, secret_key=None, client=None, **kwargs):
+        if client is None and not S3_AVAILABLE:
+            raise RuntimeError("Библиотека boto3 не установлена")
+        kwargs['part_size'] = max(kwargs.get('part_size', DEFAULT_PART_SIZE), MIN_PART_SIZE)
+        super().__init__(**kwargs)
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        if S3_AVAILABLE:
+            from botocore.exceptions import BotoCoreError, ClientError
+            self.retry_on = (BotoCoreError, ClientError, OSError)
+            self.client_error = ClientError
+        else:
+            self.retry_on = (Exception,)
+            self.client_error = Exception
+        if client is None:
+            import boto3
+            from botocore.config import Config as BotoConfig
+            client = boto3.client(
+                's3',
+                endpoint_url=endpoint_url,
+                region_name=region_name,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                # Пул соединений должен покрывать все потоки загрузки
+                config=BotoConfig(max_pool_connections=max(10, self.max_workers),
+                                  retries={'max_attempts': 1}),
+            )
+        self.client = client
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Создание хранилища по переменным окружения CLINIC_S3_*"""
+        bucket = os.environ.get('CLINIC_S3_BUCKET')
+        if not bucket:
+            return None
+        bandwidth = os.environ.get('CLINIC_S3_BANDWIDTH_LIMIT')
+        return cls(
+            bucket,
+            prefix=os.environ.get('CLINIC_S3_PREFIX', 'backups'),
+            endpoint_url=os.environ.get('CLINIC_S3_ENDPOINT'),
+            region_name=os.environ.get('CLINIC_S3_REGION'),
+            access_key=os.environ.get('CLINIC_S3_ACCESS_KEY'),
+            secret_key=os.environ.get('CLINIC_S3_SECRET_KEY'),
+            bandwidth_limit=int(bandwidth) if bandwidth else None,
+            **kwargs
+        )
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _resume_upload_id(self, state, object_key):
+        """Проверка, что сохраненная многочастная загрузка еще существует на сервере"""
+        upload_id = state.data.get('upload_id')
+        if not upload_id:
+            return None
+        try:
+            server_parts = {}
+            paginator = self.client.get_paginator('list_parts')
+            for page in paginator.paginate(Bucket=self.bucket, Key=object_key, UploadId=upload_id):
+                for part in page.get('Parts', []):
+                    server_parts[part['PartNumber']] = part['ETag']
+        except self.client_error:
+            return None
+        # Доверяем только частям, которые подтверждает сервер
+        state.data['parts'] = {
+            str(number): meta for number, meta in state.completed_parts().items()
+            if server_parts.get(number) == meta.get('ETag')
+        }
+        return upload_id
+
+    def upload(self, local_path, key):
+        local_path = Path(local_path)
+        object_key = self._object_key(key)
+        size = local_path.stat().st_size
+        source_sha256 = file_sha256(local_path)
+
+        # Небольшие файлы загружаются одним запросом
+        if size <= self.part_size:
+            def put():
+                data = local_path.read_bytes()
+                if self.throttle:
+                    self.throttle.consume(len(data))
+                self.client.put_object(Bucket=self.bucket, Key=object_key, Body=data,
+                                       Metadata={'sha256': source_sha256})
+            with_retries(put, attempts=self.retries, retry_on=self.retry_on)
+            return f"s3://{self.bucket}/{object_key}"
+
+        state = self._state_for(key)
+        upload_id = None
+        if state.matches(source_sha256, self.part_size):
+            upload_id = self._resume_upload_id(state, object_key)
+        if upload_id is None:
+            response = with_retries(
+                lambda: self.client.create_multipart_upload(
+                    Bucket=self.bucket, Key=object_key, Metadata={'sha256': source_sha256}
+                ),
+                attempts=self.retries, retry_on=self.retry_on
+            )
+            upload_id = response['UploadId']
+            state.reset(sha256=source_sha256, part_size=self.part_size, upload_id=upload_id)
+
+        def upload_part(number, data):
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                PartNumber=number, Body=data
+            )
+            return {'ETag': response['ETag']}
+
+        done = self._upload_parts(local_path, split_parts(size, self.part_size), state, upload_part)
+
+        with_retries(
+            lambda: self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': number, 'ETag': done[number]['ETag']} for number in sorted(done)
+                ]}
+            ),
+            attempts=self.retries, retry_on=self.retry_on
+        )
+        state.clear()
+        return f"s3://{self.bucket}/{object_key}"
+
+    def list_objects(self):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        prefix = f"{self.prefix}/" if self.prefix else ''
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                keys.append(item['Key'][len(prefix):])
+        return keys
+
+    def download(self, key, local_path):
+        self.client.download_file(self.bucket, self._object_key(key), str(local_path))
+        return str(local_path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def discard_upload(self, key):
+        # Загруженные части хранятся на сервере, пока многочастная загрузка не отменена
+        upload_id = self._state_for(key).data.get('upload_id')
+        if upload_id:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._object_key(key),
+                                                   UploadId=upload_id)
+            except self.client_error:
+                pass
+        super().discard_upload(key)
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# Размер блока при потоковом вычислении контрольной суммы
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """Потоковое вычисление SHA-256 файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_stats(db_path):
+    """Количество строк по таблицам и версия схемы снимка базы данных"""
+    # Снимок открывается только для чтения, чтобы проверка не могла его изменить
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        schema_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        row_counts = {}
+        for table in tables:
+            row_counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        return schema_version, row_counts
+    finally:
+        conn.close()
+
+
+def integrity_check(db_path):
+    """Результат PRAGMA integrity_check снимка (['ok'] для целой базы)"""
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        return [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+
+
+class BackupVerifier:
+    """Проверка целостности резервных копий и ведение манифеста контрольных сумм"""
+
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(self, backup_dir="backups", max_workers=None):
+        self.backup_dir = Path(backup_dir)
+        self.manifest_path = self.backup_dir / self.MANIFEST_NAME
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 2)
+        self._lock = threading.Lock()
+
+    def load_manifest(self):
+        """Чтение манифеста резервных копий"""
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        """Атомарная запись манифеста"""
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def record_backup(self, zip_path, snapshot_path, archive_snapshots=None):
+        """Добавление записи о резервной копии в манифест
+
+        archive_snapshots - {имя в архиве: путь к снимку} годовых архивных баз.
+        """
+        zip_path = Path(zip_path)
+        schema_version, row_counts = snapshot_stats(snapshot_path)
+        entry = {
+            'sha256': file_sha256(zip_path),
+            'size': zip_path.stat().st_size,
+            'snapshot': Path(snapshot_path).name,
+            'schema_version': schema_version,
+            'row_counts': row_counts,
+            'archives': {
+                arcname: {'row_counts': snapshot_stats(path)[1]}
+                for arcname, path in (archive_snapshots or {}).items()
+            },
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self._lock:
+            manifest = self.load_manifest()
+            manifest[zip_path.name] = entry
+            self._save_manifest(manifest)
+        return entry
+
+    def record_copy(self, filename, storage_name, location):
+        """Запись о внешней копии архива в манифест"""
+        with self._lock:
+            manifest = self.load_manifest()
+            if filename in manifest:
+                manifest[filename].setdefault('copies', {})[storage_name] = location
+                self._save_manifest(manifest)
+
+    def adopt_untracked(self):
+        """Добавление в манифест архивов, созданных до появления манифеста"""
+        manifest = self.load_manifest()
+        adopted = []
+
+        for zip_path in sorted(self.backup_dir.glob("*.zip")):
+            if zip_path.name in manifest:
+                continue
+            try:
+                with tempfile.TemporaryDirectory(dir=self.backup_dir) as tmp_dir:
+                    with zipfile.ZipFile(zip_path, 'r') as zipf:
+                        members = zipf.namelist()
+                        if not members or zipf.testzip() is not None:
+                            continue
+                        snapshot_path = zipf.extract(members[0], path=tmp_dir)
+                    self.record_backup(zip_path, snapshot_path)
+                    adopted.append(zip_path.name)
+            except (zipfile.BadZipFile, sqlite3.DatabaseError, OSError):
+                # Нечитаемый архив остается без записи и не пройдет проверку
+                continue
+
+        return adopted
+
+    def forget_backup(self, filename):
+        """Удаление записи о резервной копии из манифеста"""
+        with self._lock:
+            manifest = self.load_manifest()
+            if manifest.pop(filename, None) is not None:
+                self._save_manifest(manifest)
+
+    def _verify_checksum(self, zip_path, entry):
+        """Быстрая проверка: контрольная сумма архива и читаемость каталога ZIP"""
+        result = {'filename': zip_path.name, 'ok': False, 'errors': []}
+
+        if entry is None:
+            result['errors'].append("Нет записи в манифесте")
+            return result
+
+        if file_sha256(zip_path) != entry['sha256']:
+            result['errors'].append("Контрольная сумма не совпадает")
+            return result
+
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zipf:
+                members = set(zipf.namelist())
+                missing = [name for name in [entry['snapshot']] + sorted(entry.get('archives', {}))
+                           if name not in members]
+                if missing:
+                    result['errors'].append(f"В архиве отсутствует {', '.join(missing)}")
+                    return result
+        except zipfile.BadZipFile as e:
+            result['errors'].append(f"Поврежденный архив: {e}")
+            return result
+
+        result['ok'] = True
+        return result
+
+    def verify_all(self):
+        """Параллельная быстрая проверка всех архивов"""
+        manifest = self.load_manifest()
+        archives = sorted(self.backup_dir.glob("*.zip"))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(
+                lambda path: self._verify_checksum(path, manifest.get(path.name)),
+                archives
+            ))
+
+        return results
+
+    def deep_verify(self, zip_path, entry):
+        """Глубокая проверка: распаковка снимка, integrity_check и сверка количества строк"""
+        zip_path = Path(zip_path)
+        result = self._verify_checksum(zip_path, entry)
+        if not result['ok']:
+            return result
+        result['ok'] = False
+
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as tmp_dir:
+            with zipfile.ZipFile(zip_path, 'r') as zipf:
+                # testzip проверяет CRC распакованных данных
+                bad_member = zipf.testzip()
+                if bad_member:
+                    result['errors'].append(f"Ошибка CRC: {bad_member}")
+                    return result
+                snapshot_path = Path(zipf.extract(entry['snapshot'], path=tmp_dir))
+                archive_paths = {
+                    arcname: Path(zipf.extract(arcname, path=tmp_dir)) for arcname in entry.get('archives', {})
+                }
+
+            check = integrity_check(snapshot_path)
+            if check != ['ok']:
+                result['errors'].extend(check)
+                return result
+
+            schema_version, row_counts = snapshot_stats(snapshot_path)
+
+            # Годовые архивные базы: целостность и количество строк
+            for arcname, archive_path in archive_paths.items():
+                check = integrity_check(archive_path)
+                if check != ['ok']:
+                    result['errors'].extend(f"{arcname}: {message}" for message in check)
+                elif snapshot_stats(archive_path)[1] != entry['archives'][arcname]['row_counts']:
+                    result['errors'].append(f"Количество строк не совпадает: {arcname}")
+
+        if schema_version != entry['schema_version']:
+            result['errors'].append(
+                f"Версия схемы {schema_version} не совпадает с манифестом ({entry['schema_version']})"
+            )
+        if row_counts != entry['row_counts']:
+            mismatched = sorted(
+                name for name in set(row_counts) | set(entry['row_counts'])
+                if row_counts.get(name) != entry['row_counts'].get(name)
+            )
+            result['errors'].append(f"Количество строк не совпадает: {', '.join(mismatched)}")
+
+        result['ok'] = not result['errors']
+        return result
+
+    def deep_verify_sample(self, sample_size=1, seed=None):
+        """Глубокая проверка случайной выборки архивов (последний архив проверяется всегда)"""
+        manifest = self.load_manifest()
+        archives = sorted(
+            (path for path in self.backup_dir.glob("*.zip") if path.name in manifest),
+            key=os.path.getmtime,
+            reverse=True
+        )
+        if not archives:
+            return []
+
+        sample = [archives[0]]
+        rest = archives[1:]
+        if sample_size > 1 and rest:
+            sample.extend(random.Random(seed).sample(rest, min(sample_size - 1, len(rest))))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda path: self.deep_verify(path, manifest[path.name]), sample))
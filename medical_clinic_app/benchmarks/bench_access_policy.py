@@ -0,0 +1,133 @@
+"""Сравнение запросов с ограничением доступа AccessPolicy и написанных вручную
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_access_policy.py --appointments 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as dt_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, text
+from database import DatabaseManager
+from access_policy import AccessPolicy
+from models import Appointment, AppointmentStatus, Employee, Patient, Position, Schedule
+
+
+class _StaticAuth:
+    """Подстановка AuthManager с фиксированным пользователем"""
+
+    def __init__(self, principal=None):
+        self.current_user = principal
+
+
+def populate(db_manager, patients, doctors, appointments):
+    """Быстрое заполнение базы синтетическими данными через Core"""
+    engine = db_manager.engine
+    rng = random.Random(42)
+    today = date.today()
+
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач-терапевт'}])
+        conn.execute(insert(Employee), [
+            {'id': i, 'last_name': f'Врач{i}', 'first_name': 'Тест', 'position_id': 1}
+            for i in range(1, doctors + 1)
+        ])
+        conn.execute(insert(Patient), [
+            {'id': i, 'last_name': f'Пациент{i}', 'first_name': 'Тест', 'birth_date': date(1980, 1, 1)}
+            for i in range(1, patients + 1)
+        ])
+        conn.execute(insert(Schedule), [
+            {'id': i, 'employee_id': i, 'work_date': today, 'start_time': dt_time(9), 'end_time': dt_time(18)}
+            for i in range(1, doctors + 1)
+        ])
+        batch = []
+        for i in range(1, appointments + 1):
+            doctor_id = rng.randint(1, doctors)
+            batch.append({
+                'id': i,
+                'patient_id': rng.randint(1, patients),
+                'doctor_id': doctor_id,
+                'schedule_id': doctor_id,
+                'appointment_date': today - timedelta(days=rng.randint(0, 3650)),
+                'appointment_time': dt_time(9 + rng.randint(0, 8)),
+                'status': AppointmentStatus.COMPLETED,
+            })
+            if len(batch) == 10000:
+                conn.execute(insert(Appointment), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Appointment), batch)
+        conn.execute(text("ANALYZE"))
+
+
+def query_plan(session, statement):
+    """План выполнения запроса SQLite"""
+    compiled = statement.compile(session.get_bind(), compile_kwargs={'literal_binds': True})
+    rows = session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return [row[-1] for row in rows]
+
+
+def timed(func, repeat):
+    """Медиана времени выполнения в миллисекундах"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--appointments', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        populate(db_manager, args.patients, args.doctors, args.appointments)
+
+        auth = _StaticAuth()
+        AccessPolicy(auth).install(Session)
+        session = Session()
+
+        cases = [
+            ('patient', {'role': 'patient', 'patient_id': 7}, Appointment.patient_id == 7),
+            ('doctor', {'role': 'doctor', 'employee_id': 3}, Appointment.doctor_id == 3),
+        ]
+        for name, principal, manual_filter in cases:
+            base = select(Appointment).order_by(Appointment.appointment_date.desc()).limit(50)
+
+            auth.current_user = None
+            manual = base.where(manual_filter)
+            manual_ms = timed(lambda: session.scalars(manual).all(), args.repeat)
+            manual_plan = query_plan(session, manual)
+
+            auth.current_user = principal
+            scoped_ms = timed(lambda: session.scalars(base).all(), args.repeat)
+            scoped_statement = base.options(*AccessPolicy(auth).criteria_for(principal))
+            scoped_plan = query_plan(session, scoped_statement)
+            session.expunge_all()
+
+            print(f"[{name}] вручную: {manual_ms:.3f} мс, AccessPolicy: {scoped_ms:.3f} мс, "
+                  f"разница: {scoped_ms - manual_ms:+.3f} мс")
+            print(f"  план вручную:     {manual_plan}")
+            print(f"  план AccessPolicy: {scoped_plan}")
+            print(f"  планы совпадают: {'да' if manual_plan == scoped_plan else 'НЕТ'}")
+
+        session.close()
+        db_manager.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
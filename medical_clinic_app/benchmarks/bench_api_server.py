@@ -0,0 +1,202 @@
+"""Нагрузочный тест HTTP/JSON API-сервера клиники
+
+Запускает сервер на временной базе и нагружает его клиентами с постоянными
+(keep-alive) соединениями из нескольких процессов.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_api_server.py --workers 4 --clients 32 --duration 10
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from auth import AuthManager
+from seed_data import seed_database, create_test_users
+from api_server import serve
+
+
+def percentile(samples, fraction):
+    """Перцентиль по отсортированному списку"""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def request(conn, method, path, token=None, body=None, headers=None):
+    """Запрос по постоянному соединению; возвращает (статус, заголовки, JSON)"""
+    headers = dict(headers or {})
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    conn.request(method, path, body=data, headers=headers)
+    response = conn.getresponse()
+    payload = response.read()
+    return response.status, response, json.loads(payload) if payload else None
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("API-сервер не запустился")
+
+
+def client_process(port, token, threads, duration, seed, results):
+    """Процесс-генератор нагрузки: threads клиентов в потоках"""
+    import threading
+
+    stats = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    today = date.today()
+
+    def client(rng):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        etags = {}
+        local = {}
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            started = time.perf_counter()
+            if roll < 0.5:
+                # Клиент расписания повторяет запрос с If-None-Match
+                path = f'/api/schedules?date_from={today}&date_to={today + timedelta(days=6)}'
+                headers = {'If-None-Match': etags[path]} if path in etags else None
+                status, response, _ = request(conn, 'GET', path, token, headers=headers)
+                if response.getheader('ETag'):
+                    etags[path] = response.getheader('ETag')
+                kind = 'schedule_304' if status == 304 else 'schedule'
+            elif roll < 0.75:
+                kind = 'patients'
+                cursor = None
+                for _ in range(3):
+                    path = '/api/patients?limit=5' + (f'&after={cursor}' if cursor else '')
+                    status, _, page = request(conn, 'GET', path, token)
+                    cursor = page.get('next') if page else None
+                    if not cursor:
+                        break
+            elif roll < 0.95:
+                kind = 'appointments'
+                status, _, _ = request(conn, 'GET', '/api/appointments?limit=20', token)
+            else:
+                kind = 'booking'
+                status, _, slots = request(
+                    conn, 'GET', f'/api/schedules?only_free=1&date_from={today}', token
+                )
+                if slots and slots['items']:
+                    slot = rng.choice(slots['items'])
+                    status, _, _ = request(conn, 'POST', '/api/appointments', token, body={
+                        'patient_id': rng.randint(1, 5), 'doctor_id': slot['doctor_id'],
+                        'date': slot['work_date'], 'time': slot['start_time'],
+                        'reason': 'Нагрузочный тест'
+                    })
+            elapsed = (time.perf_counter() - started) * 1000
+            local.setdefault(kind, []).append(elapsed)
+            if status >= 500:
+                local.setdefault('errors', []).append(elapsed)
+        conn.close()
+        with lock:
+            for kind, samples in local.items():
+                stats.setdefault(kind, []).extend(samples)
+
+    rng = random.Random(seed)
+    workers = [threading.Thread(target=client, args=(random.Random(rng.random()),)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="процессов сервера")
+    parser.add_argument('--threads', type=int, default=16, help="потоков в процессе сервера")
+    parser.add_argument('--clients', type=int, default=32, help="всего клиентов")
+    parser.add_argument('--client-procs', type=int, default=2, help="процессов генератора нагрузки")
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        db_manager = DatabaseManager(db_path)
+        session = db_manager.get_session()
+        seed_database(session)
+        session.close()
+        create_test_users(AuthManager(db_manager))
+        db_manager.engine.dispose()
+
+        port = free_port()
+        os.chdir(tmp_dir)
+        server = multiprocessing.Process(
+            target=serve, args=('127.0.0.1', port, db_path, args.workers, args.threads)
+        )
+        server.start()
+        try:
+            wait_for_server(port)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            status, _, login = request(conn, 'POST', '/api/login',
+                                       body={'username': 'admin', 'password': 'admin123'})
+            conn.close()
+            if status != 200:
+                raise RuntimeError(f"Не удалось войти: {login}")
+
+            results = multiprocessing.Queue()
+            per_proc = max(1, args.clients // args.client_procs)
+            clients = [
+                multiprocessing.Process(
+                    target=client_process,
+                    args=(port, login['token'], per_proc, args.duration, index, results)
+                )
+                for index in range(args.client_procs)
+            ]
+            started = time.perf_counter()
+            for proc in clients:
+                proc.start()
+            stats = {}
+            for _ in clients:
+                for kind, samples in results.get().items():
+                    stats.setdefault(kind, []).extend(samples)
+            for proc in clients:
+                proc.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.join()
+
+    errors = len(stats.pop('errors', []))
+    total = sum(len(samples) for samples in stats.values())
+    print(f"Процессов сервера: {args.workers}, потоков: {args.threads}, "
+          f"клиентов: {per_proc * args.client_procs}")
+    print(f"Операций: {total} за {elapsed:.1f} с - {total / elapsed:.0f} операций/с, ошибок 5xx: {errors}")
+    for kind, samples in sorted(stats.items()):
+        samples.sort()
+        print(f"  {kind:<13} {len(samples):>7}  p50 {percentile(samples, 0.5):7.2f} мс  "
+              f"p95 {percentile(samples, 0.95):7.2f} мс  p99 {percentile(samples, 0.99):7.2f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Импорт файла записей внешнего канала: пакетная сверка против записи по одной строке
+
+Расписание врачей на месяц, файл на десять тысяч записей с пациентами по id,
+паспорту и телефону, врачами по id и ФИО и долей конфликтных строк.
+Построчный вариант повторяет create_appointment: поиск пациента и врача,
+затем book_appointment.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_appointment_import.py --rows 10000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from sqlalchemy import insert, select, func, text
+from database import DatabaseManager
+from models import Employee, Patient, Position, Schedule, Specialization, patient_search_keys
+from booking import book_appointment, booked_count_subquery
+from appointment_import import AppointmentImporter
+
+SLOTS_PER_DAY = 8
+
+
+def populate(engine, doctors, days, capacity, patients):
+    start_day = date.today() + timedelta(days=1)
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+        conn.execute(insert(Specialization), [{'id': 1, 'name': 'Терапия'}])
+        conn.execute(insert(Patient), [
+            dict(id=patient_id, last_name=f'Пациент{patient_id}', first_name='Тест', birth_date=date(1980, 1, 1),
+                 phone=f'+7921{patient_id:07d}', passport_series='4500', passport_number=f'{patient_id:06d}',
+                 **patient_search_keys(f'Пациент{patient_id}', 'Тест', None, f'+7921{patient_id:07d}', None,
+                                       '4500', f'{patient_id:06d}'))
+            for patient_id in range(1, patients + 1)
+        ])
+        conn.execute(insert(Employee), [
+            {'id': doctor_id, 'last_name': f'Врачев{doctor_id}', 'first_name': 'Тест', 'position_id': 1,
+             'specialization_id': 1}
+            for doctor_id in range(1, doctors + 1)
+        ])
+        conn.execute(insert(Schedule), [
+            {'employee_id': doctor_id, 'work_date': start_day + timedelta(days=day),
+             'start_time': day_time(9 + slot), 'end_time': day_time(10 + slot), 'max_patients': capacity}
+            for day in range(days) for doctor_id in range(1, doctors + 1) for slot in range(SLOTS_PER_DAY)
+        ])
+        conn.execute(text("ANALYZE"))
+    return start_day
+
+
+def generate_file(rows, doctors, days, patients, start_day, rng):
+    records = []
+    for number in range(rows):
+        patient_id = rng.randint(1, patients + patients // 50)
+        doctor_id = rng.randint(1, doctors)
+        record = {
+            'Дата приема': (start_day + timedelta(days=rng.randrange(days))).strftime('%d.%m.%Y'),
+            'Время приема': f'{rng.randint(9, 17 if rng.random() < 0.02 else 16)}:{rng.choice(["00", "20", "40"])}',
+            'Причина': 'Консультация',
+        }
+        kind = number % 3
+        if kind == 0:
+            record['id пациента'] = str(patient_id)
+        elif kind == 1:
+            record['Паспорт'] = f'4500 {patient_id:06d}'
+        else:
+            record['Телефон'] = f'8 921 {patient_id:07d}'
+            record['Дата рождения'] = '01.01.1980'
+        if number % 2:
+            record['id врача'] = str(doctor_id)
+        else:
+            record['Врач'] = f'Врачев{doctor_id} Тест'
+        records.append(record)
+    return pd.DataFrame(records).fillna('')
+
+
+def book_row_by_row(Session, frame):
+    """Запись по одной строке, как в create_appointment (пациент и врач уже известны по id)"""
+    session = Session()
+    booked = 0
+    for row in frame.itertuples(index=False):
+        patient = session.get(Patient, int(row.patient_id))
+        doctor = session.get(Employee, int(row.doctor_id))
+        if patient is None or doctor is None:
+            continue
+        success, _, _ = book_appointment(session, patient.id, doctor.id, row.appointment_date,
+                                         row.appointment_time, row.reason)
+        booked += success
+    session.close()
+    return booked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--doctors', type=int, default=60)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--capacity', type=int, default=3)
+    parser.add_argument('--patients', type=int, default=50000)
+    parser.add_argument('--row-by-row', type=int, default=1000, help="строк для построчного варианта")
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        start_day = populate(db_manager.engine, args.doctors, args.days, args.capacity, args.patients)
+        frame = generate_file(args.rows, args.doctors, args.days, args.patients, start_day, rng)
+
+        importer = AppointmentImporter(db_manager.engine, report_dir=os.path.join(tmp_dir, 'reports'))
+        started = time.perf_counter()
+        success, message, report = importer.import_frame(frame)
+        elapsed = time.perf_counter() - started
+        print(f"Пакетный импорт {args.rows} строк: {elapsed:.2f} с - {message}")
+        for reason, count in sorted(report['reasons'].items(), key=lambda item: -item[1]):
+            print(f"  {reason}: {count}")
+
+        # Построчный вариант на другом месяце, чтобы слоты были свободны так же
+        later_day = start_day + timedelta(days=args.days)
+        with db_manager.engine.begin() as conn:
+            conn.execute(insert(Schedule), [
+                {'employee_id': doctor_id, 'work_date': later_day + timedelta(days=day),
+                 'start_time': day_time(9 + slot), 'end_time': day_time(10 + slot), 'max_patients': args.capacity}
+                for day in range(args.days) for doctor_id in range(1, args.doctors + 1) for slot in range(SLOTS_PER_DAY)
+            ])
+        sample = pd.DataFrame({
+            'patient_id': [rng.randint(1, args.patients) for _ in range(args.row_by_row)],
+            'doctor_id': [rng.randint(1, args.doctors) for _ in range(args.row_by_row)],
+            'appointment_date': [later_day + timedelta(days=rng.randrange(args.days)) for _ in range(args.row_by_row)],
+            'appointment_time': [day_time(rng.randint(9, 16), 20) for _ in range(args.row_by_row)],
+            'reason': 'Консультация',
+        })
+        started = time.perf_counter()
+        booked = book_row_by_row(Session, sample)
+        per_row = (time.perf_counter() - started) / args.row_by_row
+        print(f"По одной строке: {per_row * 1000:.2f} мс на строку ({booked} записей), "
+              f"на {args.rows} строк ушло бы ~{per_row * args.rows:.0f} с")
+
+        session = Session()
+        overbooked = session.execute(
+            select(func.count()).select_from(Schedule).where(Schedule.max_patients < booked_count_subquery())
+        ).scalar()
+        print(f"Переполненных слотов: {overbooked}")
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
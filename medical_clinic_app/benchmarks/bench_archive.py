@@ -0,0 +1,186 @@
+"""Архивирование прошлых лет: размер оперативной базы, снимка и время запросов
+
+Клиника с историей за несколько лет: записи на прием, медицинские записи
+и назначения. После переноса всего старше двух лет в годовые архивы
+сравниваются размер оперативной базы и ее снимка (как в резервной копии),
+время полного просмотра таблицы записей, история пациента через
+представления all_* и неизменность общего числа строк.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_archive.py --years 5 --per-day 300
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, func, text
+from database import DatabaseManager
+from models import (
+    Appointment, AppointmentStatus, Employee, MedicalRecord, Patient, Position, Prescription, Schedule,
+    Specialization, patient_search_keys
+)
+from archive import ArchiveManager, ARCHIVED_TABLES, hot_and_cold
+
+DOCTORS = 50
+
+
+def populate(engine, years, per_day, patients, rng):
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+        conn.execute(insert(Specialization), [{'id': 1, 'name': 'Терапия'}])
+        conn.execute(insert(Employee), [
+            {'id': doctor_id, 'last_name': f'Врачев{doctor_id}', 'first_name': 'Тест', 'position_id': 1,
+             'specialization_id': 1}
+            for doctor_id in range(1, DOCTORS + 1)
+        ])
+        conn.execute(insert(Patient), [
+            dict(id=patient_id, last_name=f'Пациент{patient_id}', first_name='Тест', birth_date=date(1980, 1, 1),
+                 **patient_search_keys(f'Пациент{patient_id}', 'Тест', None, None, None, None, None))
+            for patient_id in range(1, patients + 1)
+        ])
+        conn.execute(insert(Schedule), [{'id': 1, 'employee_id': 1, 'work_date': today,
+                                         'start_time': day_time(8), 'end_time': day_time(20)}])
+        day = today - timedelta(days=years * 365)
+        while day <= today + timedelta(days=14):
+            appointments, records, prescriptions = [], [], []
+            next_id = conn.execute(select(func.coalesce(func.max(Appointment.id), 0))).scalar() + 1
+            for number in range(per_day):
+                appointment_id = next_id + number
+                past = day < today
+                status = (AppointmentStatus.SCHEDULED if not past
+                          else AppointmentStatus.CANCELLED if number % 10 == 0 else AppointmentStatus.COMPLETED)
+                patient_id = rng.randint(1, patients)
+                doctor_id = rng.randint(1, DOCTORS)
+                appointments.append({
+                    'id': appointment_id, 'patient_id': patient_id, 'doctor_id': doctor_id, 'schedule_id': 1,
+                    'appointment_date': day, 'appointment_time': day_time(8 + number % 12), 'status': status,
+                    'reason': 'Плановый осмотр, жалобы на головную боль и слабость',
+                })
+                if status == AppointmentStatus.COMPLETED:
+                    records.append({
+                        'id': appointment_id, 'appointment_id': appointment_id, 'patient_id': patient_id,
+                        'doctor_id': doctor_id, 'record_date': datetime.combine(day, day_time(12)),
+                        'complaints': 'Головная боль, слабость, повышение давления по вечерам' * 2,
+                        'examination_results': 'АД 140/90, ЧСС 78, тоны сердца ясные, ритмичные' * 2,
+                        'recommendations': 'Контроль давления, ограничение соли, повторный прием через месяц',
+                    })
+                    prescriptions.append({
+                        'medical_record_id': appointment_id, 'medication_name': 'Эналаприл', 'dosage': '10 мг',
+                        'frequency': '2 раза в день', 'duration': '14 дней', 'duration_days': 14,
+                        'start_date': day, 'end_date': day + timedelta(days=13),
+                        'is_completed': day + timedelta(days=13) < today,
+                    })
+            for table, rows in ((Appointment, appointments), (MedicalRecord, records), (Prescription, prescriptions)):
+                if rows:
+                    conn.execute(insert(table), rows)
+            day += timedelta(days=1)
+        conn.execute(text("ANALYZE"))
+
+
+def counts(engine):
+    with engine.connect() as conn:
+        return {t.name: conn.execute(select(func.count()).select_from(t)).scalar() for t in ARCHIVED_TABLES}
+
+
+def snapshot_size(db_path, target_path):
+    """Размер снимка через backup API, как у BackupManager._snapshot_database"""
+    source, target = sqlite3.connect(db_path), sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    size = os.path.getsize(target_path)
+    os.remove(target_path)
+    return size
+
+
+def full_scan(engine):
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(select(func.count()).select_from(Appointment).where(Appointment.reason.like('%давлен%'))).scalar()
+    return time.perf_counter() - started
+
+
+def history_latency(manager, patient_ids):
+    """Средняя задержка истории пациента через представления (соединение с архивами открыто один раз)"""
+    records = hot_and_cold(MedicalRecord.__table__)
+    with manager.connect() as conn:
+        started = time.perf_counter()
+        total = 0
+        for patient_id in patient_ids:
+            total += len(conn.execute(
+                select(records.c.id, records.c.record_date, records.c.archive_year)
+                .where(records.c.patient_id == patient_id)
+                .order_by(records.c.record_date.desc())
+            ).all())
+        elapsed = (time.perf_counter() - started) / len(patient_ids)
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM all_medical_records WHERE patient_id = 1"
+        ).all()
+    return elapsed, total, plan
+
+
+def mb(size):
+    return f"{size / 1024 / 1024:.1f} МБ"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--per-day', type=int, default=300)
+    parser.add_argument('--patients', type=int, default=50000)
+    parser.add_argument('--history-queries', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(21)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        db_manager = DatabaseManager(db_path)
+        db_manager.init_database()
+        populate(db_manager.engine, args.years, args.per_day, args.patients, rng)
+        before = counts(db_manager.engine)
+        print(f"До архивирования: {before}")
+        print(f"  снимок {mb(snapshot_size(db_path, db_path + '.snap'))}, "
+              f"полный просмотр записей на прием {full_scan(db_manager.engine) * 1000:.0f} мс")
+
+        manager = ArchiveManager(db_manager.engine, os.path.join(tmp_dir, 'archive'))
+        started = time.perf_counter()
+        success, message, _ = manager.archive()
+        elapsed = time.perf_counter() - started
+        moved = sum(before.values()) - sum(counts(db_manager.engine).values())
+        print(f"{message}: {elapsed:.1f} с, {moved / elapsed:.0f} строк/с")
+        with db_manager.engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+
+        print(f"После архивирования: {counts(db_manager.engine)}")
+        print(f"  снимок {mb(snapshot_size(db_path, db_path + '.snap'))}, "
+              f"полный просмотр записей на прием {full_scan(db_manager.engine) * 1000:.0f} мс")
+        archive_sizes = {year: os.path.getsize(manager.archive_path(year)) for year in manager.list_years()}
+        print("  архивы: " + ", ".join(f"{year} - {mb(size)}" for year, size in archive_sizes.items()))
+
+        with manager.connect() as conn:
+            combined = {t.name: conn.execute(select(func.count()).select_from(hot_and_cold(t))).scalar()
+                        for t in ARCHIVED_TABLES}
+        print(f"Строк в оперативной базе и архивах вместе: {combined}, совпадает: {combined == before}")
+
+        success, message, _ = manager.archive()
+        print(f"Повторный запуск: {message}")
+
+        patient_ids = [rng.randint(1, args.patients) for _ in range(args.history_queries)]
+        latency, found, plan = history_latency(manager, patient_ids)
+        print(f"История пациента через all_medical_records: {latency * 1000:.2f} мс, найдено записей {found}")
+        for row in plan:
+            print(f"  {row[-1]}")
+
+
+if __name__ == '__main__':
+    main()
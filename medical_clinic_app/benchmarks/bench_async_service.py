@@ -0,0 +1,98 @@
+"""Нагрузочный тест асинхронного сервисного слоя AsyncClinicService
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_async_service.py --clients 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from seed_data import seed_database
+from async_service import AsyncClinicService
+
+
+def percentile(samples, fraction):
+    """Перцентиль по отсортированному списку"""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def client(service, deadline, stats, rng, doctors, patients):
+    """Один клиент: смесь чтения расписания, поиска и записи на прием"""
+    today = date.today()
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        started = time.perf_counter()
+        if roll < 0.6:
+            kind = 'schedule'
+            await service.get_schedule(today, today + timedelta(days=7), doctor_id=rng.choice(doctors))
+        elif roll < 0.9:
+            kind = 'search'
+            await service.search_patients(rng.choice(['В', 'Нико', 'сидор', '111-22', '+7 921 222-33-44']))
+        else:
+            kind = 'booking'
+            free = await service.get_schedule(today, today + timedelta(days=7), only_free=True)
+            if free:
+                slot = rng.choice(free)
+                await service.book_appointment(
+                    rng.choice(patients), slot['doctor_id'],
+                    date.fromisoformat(slot['work_date']),
+                    datetime.strptime(slot['start_time'], '%H:%M').time(), 'Нагрузочный тест'
+                )
+        stats.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+
+
+async def run(args, db_path):
+    stats = {}
+    rng = random.Random(1)
+    async with AsyncClinicService(db_path, max_concurrency=args.concurrency) as service:
+        doctors = sorted({row['doctor_id'] for row in await service.get_schedule()})
+        patients = sorted({
+            row['id'] for letter in 'АВДНФ' for row in await service.search_patients(letter, limit=1000)
+        }) or [1]
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            client(service, deadline, stats, random.Random(rng.random()), doctors, patients)
+            for _ in range(args.clients)
+        ))
+        elapsed = time.perf_counter() - started
+
+    total = sum(len(samples) for samples in stats.values())
+    print(f"Клиентов: {args.clients}, ограничение параллелизма: {args.concurrency}")
+    print(f"Запросов: {total} за {elapsed:.1f} с - {total / elapsed:.0f} запросов/с")
+    for kind, samples in sorted(stats.items()):
+        samples.sort()
+        print(f"  {kind:<9} {len(samples):>7}  p50 {percentile(samples, 0.5):7.2f} мс  "
+              f"p95 {percentile(samples, 0.95):7.2f} мс  p99 {percentile(samples, 0.99):7.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        db_manager = DatabaseManager(db_path)
+        session = db_manager.get_session()
+        seed_database(session)
+        session.close()
+        db_manager.engine.dispose()
+
+        asyncio.run(run(args, db_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Очистка устаревших данных под нагрузкой: один большой DELETE против пакетного обслуживания
+
+Очередь напоминаний за несколько лет, из которых большая часть подлежит
+удалению. Пока идет очистка, фоновый поток имитирует работу регистратуры:
+короткие транзакции записи каждые несколько миллисекунд. Сравнивается
+задержка этих транзакций и число ошибок database is locked.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_maintenance.py --rows 1500000
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from database import DatabaseManager
+from models import ReminderOutbox, ReminderStatus
+from maintenance import DEFAULT_RULES, MaintenanceEngine
+
+RULE = next(rule for rule in DEFAULT_RULES if rule.name == 'reminders')
+
+
+def populate(engine, rows):
+    now = datetime.now()
+    with engine.begin() as conn:
+        for start in range(0, rows, 50000):
+            conn.execute(insert(ReminderOutbox), [
+                {'kind': 'appointment', 'source_id': number, 'event_date': date(2020, 1, 1), 'patient_id': 1,
+                 'channel': 'sms', 'recipient': '+7 (921) 000-00-00', 'message': 'Напоминаем о приеме ' * 5,
+                 'status': ReminderStatus.SENT, 'attempts': 1,
+                 # Три четверти строк старше срока хранения
+                 'created_at': now - timedelta(days=1000 if number % 4 else 10), 'sent_at': now}
+                for number in range(start, min(rows, start + 50000))
+            ])
+
+
+class Writer(threading.Thread):
+    """Короткие транзакции записи, как у регистратуры, с замером задержки"""
+
+    def __init__(self, db_path, interval=0.005):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.latencies = []
+        self.errors = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        number = 0
+        while not self.stopped.is_set():
+            started = time.perf_counter()
+            try:
+                connection.execute(
+                    "INSERT INTO reminder_outbox (kind, source_id, event_date, patient_id, channel, recipient, "
+                    "message, status, attempts) VALUES ('bench', ?, '2030-01-01', 1, 'sms', '+7', 'x', 'PENDING', 0)",
+                    (number,)
+                )
+                connection.commit()
+                self.latencies.append(time.perf_counter() - started)
+            except sqlite3.OperationalError:
+                connection.rollback()
+                self.errors += 1
+            number += 1
+            time.sleep(self.interval)
+        connection.close()
+
+
+def measure(db_path, cleanup):
+    writer = Writer(db_path)
+    writer.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    deleted = cleanup()
+    elapsed = time.perf_counter() - started
+    writer.stopped.set()
+    writer.join()
+    latencies = sorted(writer.latencies) or [0.0]
+    return {
+        'deleted': deleted, 'seconds': elapsed, 'writes': len(writer.latencies), 'errors': writer.errors,
+        'p50': latencies[len(latencies) // 2], 'p99': latencies[int(len(latencies) * 0.99)], 'max': latencies[-1],
+    }
+
+
+def report(name, result):
+    print(f"{name}: удалено {result['deleted']} за {result['seconds']:.1f} с; записей регистратуры "
+          f"{result['writes']}, ошибок блокировки {result['errors']}, задержка p50 {result['p50'] * 1000:.1f} мс, "
+          f"p99 {result['p99'] * 1000:.1f} мс, max {result['max'] * 1000:.0f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1500000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, 'source.db')
+        db_manager = DatabaseManager(source_path)
+        db_manager.init_database()
+        populate(db_manager.engine, args.rows)
+        db_manager.engine.dispose()
+
+        results = {}
+        for name in ('single', 'batched'):
+            db_path = os.path.join(tmp_dir, f'{name}.db')
+            shutil.copy(source_path, db_path)
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(source_path + suffix):
+                    shutil.copy(source_path + suffix, db_path + suffix)
+            db_manager = DatabaseManager(db_path)
+            db_manager.init_database()
+            engine = db_manager.engine
+
+            if name == 'single':
+                def cleanup():
+                    with engine.begin() as conn:
+                        return conn.execute(RULE.statement(date.today(), 0, 2 ** 62)).rowcount
+            else:
+                maintenance = MaintenanceEngine(engine)
+
+                def cleanup():
+                    return maintenance.run_rule(RULE)[0]
+
+            results[name] = measure(db_path, cleanup)
+            if name == 'batched':
+                print(f"Пакетное обслуживание: наибольшее ожидание блокировки {maintenance.max_lock_wait * 1000:.1f} мс, "
+                      f"итоговый шаг {maintenance.step}")
+                started = time.perf_counter()
+                free_pages, released = maintenance.optimize()
+                print(f"ANALYZE, optimize и incremental_vacuum: {time.perf_counter() - started:.1f} с, "
+                      f"возвращено страниц {released}")
+            engine.dispose()
+
+        report("Один DELETE", results['single'])
+        report("Пакетное обслуживание", results['batched'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Счетчики метрик: ячейки по потокам против счетчика под блокировкой
+
+Несколько потоков одновременно увеличивают один счетчик, как потоки
+API-сервера при записи на прием. Сравнивается время одного увеличения
+и точность итоговой суммы; в конце - время формирования текста метрик.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_metrics.py --threads 8 --increments 200000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import MetricsRegistry
+
+
+class LockedCounter:
+    """Обычный счетчик: увеличение под threading.Lock"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def run_threads(inc, threads, increments):
+    """Наносекунды на одно увеличение при параллельной работе потоков"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(increments):
+            inc()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - started) / (threads * increments) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--increments', type=int, default=200000)
+    args = parser.parse_args()
+
+    for threads in (1, args.threads):
+        registry = MetricsRegistry()
+        counter = registry.counter('bench_total', "Тестовый счетчик", ['event']).labels(event='booked')
+        locked = LockedCounter()
+        locked_ns = run_threads(locked.inc, threads, args.increments)
+        sharded_ns = run_threads(counter.inc, threads, args.increments)
+        expected = threads * args.increments
+        print(f"Потоков {threads}: под блокировкой {locked_ns:.0f} нс (сумма {locked.value}), "
+              f"ячейки по потокам {sharded_ns:.0f} нс (сумма {counter.get()}, ожидалось {expected})")
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram('bench_duration_seconds', "Тестовая гистограмма", ['format'])
+    for number in range(50):
+        registry.counter('bench_events_total', "Тестовый счетчик", ['kind']).labels(kind=str(number)).inc()
+        histogram.labels(format=str(number % 5)).observe(number / 10)
+    started = time.perf_counter()
+    text = registry.render()
+    print(f"Текст метрик: {len(text.splitlines())} строк за {(time.perf_counter() - started) * 1000:.2f} мс")
+
+
+if __name__ == '__main__':
+    main()
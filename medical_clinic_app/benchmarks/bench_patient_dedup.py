@@ -0,0 +1,128 @@
+"""Поиск дубликатов карт пациентов на большом реестре
+
+Создает синтетический реестр с известной долей дубликатов (другой формат
+телефона, опечатка в фамилии, латиница) и измеряет время, число сравнений,
+точность и полноту.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_patient_dedup.py --patients 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from database import DatabaseManager
+from models import Patient, patient_search_keys
+from normalization import transliterate
+from patient_dedup import PatientDeduplicator
+
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+              'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов',
+              'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров',
+              'Никитин', 'Захаров', 'Зайцев', 'Соловьев', 'Борисов', 'Яковлев', 'Григорьев', 'Романов']
+FIRST_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Максим', 'Иван', 'Михаил',
+               'Николай', 'Евгений', 'Владимир', 'Павел', 'Роман', 'Олег', 'Артем', 'Игорь']
+PATRONYMICS = ['Александрович', 'Сергеевич', 'Дмитриевич', 'Андреевич', 'Иванович', 'Петрович',
+               'Николаевич', 'Михайлович']
+
+
+def make_patient(rng):
+    return {
+        'last_name': rng.choice(LAST_NAMES), 'first_name': rng.choice(FIRST_NAMES),
+        'patronymic': rng.choice(PATRONYMICS),
+        'birth_date': date(1940, 1, 1) + timedelta(days=rng.randint(0, 365 * 70)),
+        'phone': f"+7 (9{rng.randint(10, 99)}) {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}",
+        'email': None, 'passport_series': str(rng.randint(1000, 9999)),
+        'passport_number': str(rng.randint(100000, 999999)),
+    }
+
+
+def make_duplicate(rng, original):
+    """Дубликат, внесенный с типичными расхождениями"""
+    duplicate = dict(original)
+    variant = rng.randint(0, 3)
+    if variant == 0:
+        # Телефон в другом формате, без паспорта
+        digits = ''.join(char for char in original['phone'] if char.isdigit())
+        duplicate.update(phone='8' + digits[1:], passport_series=None, passport_number=None)
+    elif variant == 1:
+        # Опечатка в фамилии, тот же паспорт
+        name = original['last_name']
+        position = rng.randint(1, len(name) - 2)
+        duplicate['last_name'] = name[:position] + name[position + 1] + name[position] + name[position + 2:]
+    elif variant == 2:
+        # Латиница, тот же телефон
+        duplicate.update(last_name=transliterate(original['last_name']).capitalize(),
+                         first_name=transliterate(original['first_name']).capitalize(),
+                         patronymic=None, passport_series=None, passport_number=None)
+    else:
+        # Без отчества и телефона, тот же паспорт
+        duplicate.update(patronymic=None, phone=None)
+    return duplicate
+
+
+def populate(engine, patients, duplicate_rate, rng):
+    """Реестр через Core; возвращает множество пар (оригинал, дубликат)"""
+    rows, expected = [], set()
+    originals = []
+    for patient_id in range(1, patients + 1):
+        if originals and rng.random() < duplicate_rate:
+            original_id, original = rng.choice(originals)
+            row = make_duplicate(rng, original)
+            expected.add((original_id, patient_id))
+        else:
+            row = make_patient(rng)
+            originals.append((patient_id, row))
+        rows.append(dict(row, id=patient_id, **patient_search_keys(
+            row['last_name'], row['first_name'], row['patronymic'], row['phone'], row['email'],
+            row['passport_series'], row['passport_number']
+        )))
+    with engine.begin() as conn:
+        for start in range(0, len(rows), 20000):
+            conn.execute(insert(Patient), rows[start:start + 20000])
+        conn.execute(text("ANALYZE"))
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=200000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        expected = populate(db_manager.engine, args.patients, args.duplicate_rate, rng)
+
+        session = Session()
+        deduplicator = PatientDeduplicator(session)
+        started = time.perf_counter()
+        groups, review = deduplicator.find_duplicates()
+        elapsed = time.perf_counter() - started
+
+        found = {(group[0], member) for group in groups for member in group[1:]}
+        found_any = found | {(left, right) for left, right, _ in review}
+        true_positive = len(found & expected)
+        print(f"Пациентов: {args.patients}, внесено дубликатов: {len(expected)}")
+        print(f"Время поиска: {elapsed:.1f} с, сравнений: {deduplicator.comparisons} "
+              f"(попарно было бы {args.patients * (args.patients - 1) // 2})")
+        print(f"Автообъединение: групп {len(groups)}, точность "
+              f"{true_positive / len(found) if found else 0:.3f}, полнота {true_positive / len(expected):.3f}")
+        print(f"С учетом пар для проверки ({len(review)}): полнота "
+              f"{len(found_any & expected) / len(expected):.3f}")
+
+        session.close()
+        db_manager.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
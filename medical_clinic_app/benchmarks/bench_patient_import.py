@@ -0,0 +1,99 @@
+"""Импорт реестра пациентов: потоковый импорт порциями против добавления по одному через ORM
+
+Генерируется CSV на сотни тысяч строк с небольшой долей ошибок и повторов
+паспортов. Замеряется скорость PatientImporter и добавления пациентов по
+одному через сессию на небольшой выборке.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_patient_import.py --rows 200000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, func
+from database import DatabaseManager
+from models import Patient, PatientNameNgram, PatientNgramCount
+from patient_import import PatientImporter
+
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Лебедев', 'Козлов', 'Новиков', 'Морозов']
+FIRST_NAMES = ['Иван', 'Петр', 'Анна', 'Мария', 'Олег', 'Елена', 'Сергей', 'Ольга']
+
+
+def generate_row(number, rng):
+    birth_date = date(1940, 1, 1) + timedelta(days=rng.randint(0, 30000))
+    passport = number if rng.random() > 0.01 else rng.randint(0, max(number, 1))
+    row = {
+        'Фамилия': f'{rng.choice(LAST_NAMES)}{"а" if number % 2 else ""}-{number % 997}',
+        'Имя': rng.choice(FIRST_NAMES),
+        'Отчество': 'Иванович',
+        'Дата рождения': birth_date.strftime('%d.%m.%Y') if number % 3 else birth_date.isoformat(),
+        'Пол': 'Ж' if number % 2 else 'м',
+        'Телефон': f'8 (9{rng.randint(10, 99)}) {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}',
+        'Серия паспорта': f'{4000 + passport // 1000000}',
+        'Номер паспорта': f'{passport % 1000000:06d}',
+        'Email': f'user{number}@example.ru',
+    }
+    if rng.random() < 0.02:
+        row[rng.choice(['Дата рождения', 'Телефон', 'Email'])] = 'ошибка'
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--orm-rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, 'registry.csv')
+        with open(source, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(generate_row(0, rng)), delimiter=';')
+            writer.writeheader()
+            for number in range(args.rows):
+                writer.writerow(generate_row(number, rng))
+
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+
+        # Базовый вариант: по одному пациенту через ORM с фиксацией каждой записи
+        session = Session()
+        started = time.perf_counter()
+        for number in range(args.orm_rows):
+            session.add(Patient(last_name=f'Орм{number}', first_name='Тест', birth_date=date(1980, 1, 1),
+                                passport_series='9999', passport_number=f'{number:06d}'))
+            session.commit()
+        orm_rate = args.orm_rows / (time.perf_counter() - started)
+        session.close()
+        print(f"ORM по одному: {orm_rate:,.0f} строк/с, на {args.rows} строк ушло бы ~{args.rows / orm_rate:.0f} с")
+
+        importer = PatientImporter(db_manager.engine, args.chunk_size, report_dir=os.path.join(tmp_dir, 'reports'))
+        started = time.perf_counter()
+        success, message, report = importer.import_file(source)
+        elapsed = time.perf_counter() - started
+        print(f"Потоковый импорт: {elapsed:.1f} с, {args.rows / elapsed:,.0f} строк/с - {message}")
+
+        session = Session()
+        patients = session.execute(select(func.count()).select_from(Patient)).scalar()
+        mismatched = session.execute(
+            select(func.count()).select_from(PatientNgramCount).where(
+                PatientNgramCount.patients != select(func.count()).select_from(PatientNameNgram)
+                .where(PatientNameNgram.ngram == PatientNgramCount.ngram).scalar_subquery()
+            )
+        ).scalar()
+        print(f"Пациентов в базе: {patients} (ожидалось {args.orm_rows + report['inserted']}), "
+              f"расхождений частот n-грамм: {mismatched}")
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Время поиска пациентов по индексам ключей поиска на большом реестре
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_patient_search.py --patients 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from database import DatabaseManager
+from models import Patient, PatientNameNgram, patient_search_keys, patient_ngram_rows
+from patient_search import search_patients, rebuild_ngram_counts
+
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+              'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов',
+              'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров']
+FIRST_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Максим', 'Иван', 'Михаил']
+PATRONYMICS = ['Александрович', 'Сергеевич', 'Дмитриевич', 'Андреевич', 'Иванович', 'Петрович']
+
+
+def populate(engine, patients, rng):
+    """Синтетический реестр: фамилии с числовым суффиксом дают много разных ключей"""
+    batch, ngram_batch = [], []
+    with engine.begin() as conn:
+        for patient_id in range(1, patients + 1):
+            last_name = f"{rng.choice(LAST_NAMES)}{'а' if rng.random() < 0.5 else ''}-{rng.randint(1, 50000)}"
+            first_name, patronymic = rng.choice(FIRST_NAMES), rng.choice(PATRONYMICS)
+            phone = f"+7 (9{rng.randint(10, 99)}) {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}"
+            email = f"user{patient_id}@mail.ru"
+            series, number = f"{rng.randint(1000, 9999)}", f"{rng.randint(100000, 999999)}"
+            row = {
+                'id': patient_id, 'last_name': last_name, 'first_name': first_name,
+                'patronymic': patronymic, 'birth_date': date(1950 + patient_id % 60, 1, 1),
+                'phone': phone, 'email': email, 'passport_series': series, 'passport_number': number,
+            }
+            row.update(patient_search_keys(last_name, first_name, patronymic, phone, email, series, number))
+            batch.append(row)
+            ngram_batch.extend(patient_ngram_rows(patient_id, last_name))
+            if len(batch) == 20000:
+                conn.execute(insert(Patient), batch)
+                conn.execute(insert(PatientNameNgram), ngram_batch)
+                batch, ngram_batch = [], []
+        if batch:
+            conn.execute(insert(Patient), batch)
+            conn.execute(insert(PatientNameNgram), ngram_batch)
+        rebuild_ngram_counts(conn)
+        conn.execute(text("ANALYZE"))
+
+
+def timed(func, repeat):
+    """Медиана времени выполнения в миллисекундах"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        started = time.perf_counter()
+        populate(db_manager.engine, args.patients, rng)
+        print(f"Пациентов: {args.patients}, заполнение: {time.perf_counter() - started:.1f} с")
+
+        session = Session()
+        sample = session.get(Patient, args.patients // 2)
+        cases = [
+            ('начало фамилии', sample.last_name[:5].upper()),
+            ('фамилия и имя', f"{sample.last_name} {sample.first_name[:2]}"),
+            ('телефон полностью', sample.phone),
+            ('последние цифры телефона', sample.phone[-5:]),
+            ('паспорт', f"{sample.passport_series} {sample.passport_number}"),
+            ('email', sample.email),
+            ('фамилия с опечаткой', sample.last_name[:3] + sample.last_name[4] + sample.last_name[3] + sample.last_name[5:]),
+        ]
+        for name, query in cases:
+            results = search_patients(session, query)
+            found = any(row['id'] == sample.id for row in results)
+            elapsed = timed(lambda: search_patients(session, query), args.repeat)
+            print(f"  {name:<26} {query!r:<40} {elapsed:8.2f} мс  найден: {'да' if found else 'нет'}")
+
+        session.close()
+        db_manager.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
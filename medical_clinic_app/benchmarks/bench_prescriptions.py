@@ -0,0 +1,178 @@
+"""Текущие назначения пациента и ночное закрытие истекших назначений
+
+История назначений за несколько лет: у каждого пациента около сотни назначений,
+действующих из них единицы. Сравнивается прежний способ (прочитать все
+назначения и разобрать текст длительности) с запросом по частичному индексу,
+и закрытие истекших по одному через ORM с одним оператором UPDATE.
+
+Перед замером проверяется разбор длительности по таблице DURATION_CASES;
+при расхождении скрипт завершается с кодом 1.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_prescriptions.py --patients 2000 --visits 60
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, text
+from database import DatabaseManager
+from models import (
+    Appointment, AppointmentStatus, Employee, MedicalRecord, Patient, Position, Prescription, Schedule,
+    Specialization, patient_search_keys, prescription_end_date
+)
+from normalization import parse_duration_days
+from prescriptions import complete_expired_prescriptions, current_medications
+
+DURATIONS = ['5 дней', '7 дней', '10 дней', '14 дней', '2 недели', '1 месяц', '3 месяца', 'постоянно']
+# Текст длительности и ожидаемое число дней
+DURATION_CASES = [
+    ('5 дней', 5), ('2 недели', 14), ('две недели', 14), ('1 месяц 2 недели', 44), ('1-2 мес.', 60),
+    ('1,5 месяца', 45), ('1.5 недели', 10), ('полгода', 182), ('пол года', 182), ('пол-года', 182),
+    ('месяц', 30), ('2 раза в день 5 дней', 5), ('по 1 таблетке 3 раза в день 10 дней', 10),
+    ('30', 30), ('ежедневно', None), ('постоянно', None), ('', None),
+]
+MEDICATIONS = ['Эналаприл', 'Диклофенак', 'Амлодипин', 'Арбидол', 'Омепразол', 'Метформин', 'Аторвастатин']
+
+
+def populate(engine, patients, visits, history_days, rng):
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+        conn.execute(insert(Specialization), [{'id': 1, 'name': 'Терапия'}])
+        conn.execute(insert(Employee), [{'id': 1, 'last_name': 'Врачев', 'first_name': 'Тест', 'position_id': 1,
+                                         'specialization_id': 1}])
+        conn.execute(insert(Schedule), [{'id': 1, 'employee_id': 1, 'work_date': today,
+                                         'start_time': datetime.min.time(), 'end_time': datetime.max.time()}])
+        conn.execute(insert(Patient), [
+            dict(id=patient_id, last_name=f'Пациент{patient_id}', first_name='Тест', birth_date=date(1970, 1, 1),
+                 **patient_search_keys(f'Пациент{patient_id}', 'Тест', None, None, None, None, None))
+            for patient_id in range(1, patients + 1)
+        ])
+        appointments, records, prescriptions = [], [], []
+        for patient_id in range(1, patients + 1):
+            for _ in range(visits):
+                visit_date = today - timedelta(days=rng.randint(0, history_days))
+                record_id = len(records) + 1
+                appointments.append({'id': record_id, 'patient_id': patient_id, 'doctor_id': 1, 'schedule_id': 1,
+                                     'appointment_date': visit_date, 'appointment_time': datetime.min.time(),
+                                     'status': AppointmentStatus.COMPLETED})
+                records.append({'id': record_id, 'appointment_id': record_id, 'patient_id': patient_id,
+                                'doctor_id': 1, 'record_date': datetime.combine(visit_date, datetime.min.time())})
+                for _ in range(rng.randint(1, 2)):
+                    duration = rng.choice(DURATIONS)
+                    duration_days = parse_duration_days(duration)
+                    prescriptions.append({
+                        'medical_record_id': record_id, 'medication_name': rng.choice(MEDICATIONS),
+                        'duration': duration, 'duration_days': duration_days, 'start_date': visit_date,
+                        'end_date': prescription_end_date(visit_date, duration_days), 'is_completed': False,
+                    })
+        for table, rows in ((Appointment, appointments), (MedicalRecord, records), (Prescription, prescriptions)):
+            for start in range(0, len(rows), 20000):
+                conn.execute(insert(table), rows[start:start + 20000])
+        conn.execute(text("ANALYZE"))
+    return len(prescriptions)
+
+
+def scan_and_parse(session, patient_id, today):
+    """Прежний способ: все назначения пациента с разбором длительности в Python"""
+    rows = session.execute(
+        select(Prescription.id, Prescription.medication_name, Prescription.dosage, Prescription.frequency,
+               Prescription.duration, Prescription.instructions, Prescription.start_date,
+               MedicalRecord.doctor_id, Employee.last_name, Employee.first_name, Employee.patronymic)
+        .join(MedicalRecord, MedicalRecord.id == Prescription.medical_record_id)
+        .join(Employee, Employee.id == MedicalRecord.doctor_id)
+        .where(MedicalRecord.patient_id == patient_id)
+    ).all()
+    current = []
+    for row in rows:
+        days = parse_duration_days(row.duration)
+        if row.start_date <= today and (days is None or row.start_date + timedelta(days=days - 1) >= today):
+            current.append(row.id)
+    return current
+
+
+def check_durations():
+    """Проверка разбора длительности по таблице; возвращает список расхождений"""
+    failures = []
+    for text_value, expected in DURATION_CASES:
+        actual = parse_duration_days(text_value)
+        if actual != expected:
+            failures.append(f"{text_value!r}: ожидалось {expected}, получено {actual}")
+    return failures
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--visits', type=int, default=60, help="визитов с назначениями на пациента")
+    parser.add_argument('--history-days', type=int, default=3 * 365)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--orm-rows', type=int, default=3000, help="назначений для закрытия по одному через ORM")
+    args = parser.parse_args()
+
+    failures = check_durations()
+    if failures:
+        print("✗ Разбор длительности:\n  " + "\n  ".join(failures))
+        return 1
+    print(f"✓ Разбор длительности: {len(DURATION_CASES)} случаев")
+
+    rng = random.Random(13)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        total = populate(db_manager.engine, args.patients, args.visits, args.history_days, rng)
+        today = date.today()
+        print(f"Назначений: {total}")
+
+        # Закрытие по одному через ORM (как без пакетного задания) на части назначений
+        session = Session()
+        started = time.perf_counter()
+        expired = session.query(Prescription).filter(
+            Prescription.is_completed == False, Prescription.end_date < today  # noqa: E712
+        ).limit(args.orm_rows).all()
+        for prescription in expired:
+            prescription.is_completed = True
+            session.commit()
+        orm_rate = len(expired) / (time.perf_counter() - started)
+        session.close()
+
+        started = time.perf_counter()
+        with db_manager.engine.begin() as conn:
+            completed = complete_expired_prescriptions(conn, today)
+        print(f"Ночное закрытие одним UPDATE: {(time.perf_counter() - started) * 1000:.0f} мс, закрыто {completed}; "
+              f"по одному через ORM ушло бы ~{completed / orm_rate:.0f} с")
+
+        session = Session()
+        patient_ids = [rng.randint(1, args.patients) for _ in range(args.queries)]
+        for name, query in (('Все назначения с разбором длительности', lambda pid: scan_and_parse(session, pid, today)),
+                            ('Частичный индекс действующих', lambda pid: current_medications(session, pid, today))):
+            samples = []
+            for patient_id in patient_ids:
+                started = time.perf_counter()
+                query(patient_id)
+                samples.append((time.perf_counter() - started) * 1000)
+            p50, p99 = percentiles(samples)
+            print(f"{name}: p50 {p50:.3f} мс, p99 {p99:.3f} мс")
+
+        mismatched = sum(
+            sorted(scan_and_parse(session, patient_id, today)) != sorted(row.id for row in current_medications(session, patient_id, today))
+            for patient_id in patient_ids[:300]
+        )
+        print(f"Расхождений между способами: {mismatched}")
+        session.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
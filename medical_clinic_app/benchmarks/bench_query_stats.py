@@ -0,0 +1,126 @@
+"""Накладные расходы статистики запросов: выключена, выборка 1% и все запросы
+
+Типичная нагрузка регистратуры: поиск пациента по id, записи пациента
+и свободные слоты врача на день. Задержка замеряется на одних и тех же
+запросах с отключенной статистикой и с разной долей выборки; в конце
+показывается отчет и медленный запрос с планом выполнения.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_query_stats.py --queries 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, func, text
+from database import DatabaseManager
+from models import Appointment, AppointmentStatus, Employee, Patient, Position, Schedule, Specialization, patient_search_keys
+
+
+def populate(engine, patients, doctors, days):
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+        conn.execute(insert(Specialization), [{'id': 1, 'name': 'Терапия'}])
+        conn.execute(insert(Employee), [
+            {'id': doctor_id, 'last_name': f'Врачев{doctor_id}', 'first_name': 'Тест', 'position_id': 1,
+             'specialization_id': 1}
+            for doctor_id in range(1, doctors + 1)
+        ])
+        conn.execute(insert(Patient), [
+            dict(id=patient_id, last_name=f'Пациент{patient_id}', first_name='Тест', birth_date=date(1980, 1, 1),
+                 **patient_search_keys(f'Пациент{patient_id}', 'Тест', None, None, None, None, None))
+            for patient_id in range(1, patients + 1)
+        ])
+        schedules = [
+            {'employee_id': doctor_id, 'work_date': today + timedelta(days=day), 'start_time': day_time(9 + slot),
+             'end_time': day_time(10 + slot), 'max_patients': 2}
+            for day in range(days) for doctor_id in range(1, doctors + 1) for slot in range(8)
+        ]
+        conn.execute(insert(Schedule), schedules)
+        rng = random.Random(3)
+        conn.execute(insert(Appointment), [
+            {'patient_id': rng.randint(1, patients), 'doctor_id': schedule['employee_id'], 'schedule_id': number + 1,
+             'appointment_date': schedule['work_date'], 'appointment_time': schedule['start_time'],
+             'status': AppointmentStatus.SCHEDULED}
+            for number, schedule in enumerate(schedules) if number % 3
+        ])
+        conn.execute(text("ANALYZE"))
+
+
+def workload(Session, queries, patients, doctors, days, rng):
+    """Средняя задержка одного запроса, мкс"""
+    session = Session()
+    today = date.today()
+    started = time.perf_counter()
+    for number in range(queries):
+        kind = number % 3
+        if kind == 0:
+            session.execute(select(Patient.id, Patient.last_name).where(Patient.id == rng.randint(1, patients))).all()
+        elif kind == 1:
+            session.execute(
+                select(Appointment.id, Appointment.appointment_date)
+                .where(Appointment.patient_id == rng.randint(1, patients))
+            ).all()
+        else:
+            session.execute(
+                select(Schedule.id, Schedule.start_time)
+                .where(Schedule.employee_id == rng.randint(1, doctors),
+                       Schedule.work_date == today + timedelta(days=rng.randrange(days)))
+            ).all()
+    elapsed = time.perf_counter() - started
+    session.close()
+    return elapsed / queries * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--patients', type=int, default=50000)
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        populate(db_manager.engine, args.patients, args.doctors, args.days)
+
+        results = {}
+        for _ in range(args.rounds):
+            for name, sample_rate in (('выключена', 0.0), ('выборка 1%', 0.01), ('все запросы', 1.0)):
+                if sample_rate:
+                    db_manager.enable_query_stats(sample_rate)
+                else:
+                    db_manager.disable_query_stats()
+                latency = workload(Session, args.queries, args.patients, args.doctors, args.days, random.Random(7))
+                results[name] = min(results.get(name, latency), latency)
+        baseline = results['выключена']
+        for name, latency in results.items():
+            print(f"Статистика {name}: {latency:.1f} мкс на запрос (+{latency - baseline:.1f} мкс)")
+
+        # Медленный запрос: число записей по фамилиям пациентов (соединение без подходящего индекса)
+        db_manager.enable_query_stats(1.0, slow_ms=5)
+        session = Session()
+        session.execute(
+            select(Patient.last_name, func.count(Appointment.id))
+            .join(Appointment, Appointment.patient_id == Patient.id)
+            .where(Patient.last_name.like('%99%'))
+            .group_by(Patient.last_name)
+            .order_by(func.count(Appointment.id).desc())
+        ).all()
+        session.close()
+        print()
+        print(db_manager.query_stats.report(limit=4))
+        print(f"\nСохранено в {db_manager.query_stats.dump(os.path.join(tmp_dir, 'query_stats.json'))}")
+
+
+if __name__ == '__main__':
+    main()
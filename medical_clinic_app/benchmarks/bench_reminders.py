@@ -0,0 +1,160 @@
+"""Напоминания на день для крупной клиники: потоковое задание против ORM по одной записи
+
+Несколько сотен врачей с полным расписанием на два месяца и медицинские
+записи с рекомендованным повторным приемом. Вариант по одной записи
+загружает записи через ORM, пациента и врача - ленивыми связями,
+проверяет наличие напоминания отдельным запросом и каждый раз читает шаблон.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_reminders.py --doctors 300 --per-day 40
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, func, text
+from database import DatabaseManager
+from models import (
+    Appointment, AppointmentStatus, Employee, MedicalRecord, Patient, Position, ReminderOutbox, ReminderStatus,
+    Schedule, Specialization, patient_search_keys
+)
+from reminders import APPOINTMENT_DAYS_AHEAD, FOLLOW_UP_DAYS_AHEAD, ReminderJob, contact_channel, load_template, short_name
+
+
+def populate(engine, doctors, per_day, days, patients, rng):
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+        conn.execute(insert(Specialization), [{'id': 1, 'name': 'Терапия'}])
+        conn.execute(insert(Employee), [
+            {'id': doctor_id, 'last_name': f'Врачев{doctor_id}', 'first_name': 'Тест', 'patronymic': 'Тестович',
+             'position_id': 1, 'specialization_id': 1, 'cabinet_number': str(100 + doctor_id)}
+            for doctor_id in range(1, doctors + 1)
+        ])
+        conn.execute(insert(Patient), [
+            dict(id=patient_id, last_name=f'Пациент{patient_id}', first_name='Тест', patronymic='Тестович',
+                 birth_date=date(1980, 1, 1), phone=f'+7921{patient_id:07d}' if patient_id % 10 else None,
+                 email=f'p{patient_id}@example.com' if patient_id % 20 else None,
+                 **patient_search_keys(f'Пациент{patient_id}', 'Тест', 'Тестович', None, None, None, None))
+            for patient_id in range(1, patients + 1)
+        ])
+        schedules, appointments, records = [], [], []
+        for day in range(-days // 2, days // 2):
+            work_date = today + timedelta(days=day)
+            for doctor_id in range(1, doctors + 1):
+                schedule_id = len(schedules) + 1
+                schedules.append({'id': schedule_id, 'employee_id': doctor_id, 'work_date': work_date,
+                                  'start_time': day_time(8), 'end_time': day_time(20), 'max_patients': per_day})
+                for slot in range(per_day):
+                    appointment_id = len(appointments) + 1
+                    past = day < 0
+                    appointments.append({
+                        'id': appointment_id, 'patient_id': rng.randint(1, patients), 'doctor_id': doctor_id,
+                        'schedule_id': schedule_id, 'appointment_date': work_date,
+                        'appointment_time': day_time(8 + slot * 12 // per_day, slot * 12 * 60 // per_day % 60),
+                        'status': AppointmentStatus.COMPLETED if past else AppointmentStatus.SCHEDULED,
+                    })
+                    if past:
+                        records.append({
+                            'id': appointment_id, 'appointment_id': appointment_id,
+                            'patient_id': appointments[-1]['patient_id'], 'doctor_id': doctor_id,
+                            'record_date': datetime.combine(work_date, day_time(12)),
+                            'next_visit_date': work_date + timedelta(days=rng.choice((14, 30, 60, 90))),
+                        })
+        for table, rows in ((Schedule, schedules), (Appointment, appointments), (MedicalRecord, records)):
+            for start in range(0, len(rows), 20000):
+                conn.execute(insert(table), rows[start:start + 20000])
+        conn.execute(text("ANALYZE"))
+    return len(appointments), len(records)
+
+
+def orm_one_by_one(Session, on_date):
+    """Напоминания о записях на завтра через ORM по одной записи"""
+    session = Session()
+    event_date = on_date + timedelta(days=APPOINTMENT_DAYS_AHEAD)
+    queued = 0
+    appointments = session.query(Appointment).filter(
+        Appointment.appointment_date == event_date, Appointment.status == AppointmentStatus.SCHEDULED
+    ).all()
+    for appointment in appointments:
+        exists = session.query(ReminderOutbox.id).filter_by(
+            kind='appointment', source_id=appointment.id, event_date=appointment.appointment_date
+        ).first()
+        if exists:
+            continue
+        patient, doctor = appointment.patient, appointment.doctor
+        channel, recipient = contact_channel(patient.phone, patient.email)
+        if channel is None:
+            continue
+        template = load_template.__wrapped__('appointment', channel)
+        message = template.safe_substitute(
+            patient_name=f"{patient.first_name} {patient.patronymic or ''}".strip(),
+            doctor_name=short_name(doctor.last_name, doctor.first_name, doctor.patronymic),
+            date=appointment.appointment_date.strftime('%d.%m.%Y'),
+            time=appointment.appointment_time.strftime('%H:%M'),
+            cabinet=appointment.schedule.cabinet_number or doctor.cabinet_number or '-'
+        )
+        session.add(ReminderOutbox(
+            kind='appointment', source_id=appointment.id, event_date=appointment.appointment_date,
+            patient_id=patient.id, channel=channel, recipient=recipient, message=message,
+            status=ReminderStatus.PENDING
+        ))
+        queued += 1
+    session.commit()
+    session.close()
+    return queued
+
+
+def outbox_count(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(ReminderOutbox)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=300)
+    parser.add_argument('--per-day', type=int, default=40, help="записей на врача в день")
+    parser.add_argument('--days', type=int, default=60, help="дней расписания (половина - в прошлом)")
+    parser.add_argument('--patients', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        appointments, records = populate(db_manager.engine, args.doctors, args.per_day, args.days,
+                                         args.patients, rng)
+        print(f"Записей на прием: {appointments}, медицинских записей: {records}")
+
+        started = time.perf_counter()
+        orm_queued = orm_one_by_one(Session, today)
+        orm_elapsed = time.perf_counter() - started
+        print(f"ORM по одной записи (только записи на прием): {orm_elapsed:.2f} с, напоминаний {orm_queued}")
+
+        # Очередь очищается, чтобы задание поставило те же напоминания заново
+        with db_manager.engine.begin() as conn:
+            conn.execute(ReminderOutbox.__table__.delete())
+
+        job = ReminderJob(db_manager.engine, template_dir=os.path.join(tmp_dir, 'templates'))
+        started = time.perf_counter()
+        _, _, stats = job.run(today)
+        print(f"Потоковое задание (записи и повторные приемы): {time.perf_counter() - started:.2f} с")
+
+        total = outbox_count(db_manager.engine)
+        started = time.perf_counter()
+        job.run(today)
+        print(f"Повторный запуск: {time.perf_counter() - started:.2f} с, "
+              f"новых напоминаний {outbox_count(db_manager.engine) - total}")
+        print(f"Сходится с ORM-вариантом: {stats['appointment'] == orm_queued}, "
+              f"повторных приемов через {FOLLOW_UP_DAYS_AHEAD} дня: {stats['follow_up']}")
+
+
+if __name__ == '__main__':
+    main()
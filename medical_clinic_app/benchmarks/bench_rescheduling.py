@@ -0,0 +1,124 @@
+"""Перенос записей заболевшего врача к врачам той же специализации
+
+Одна специализация, несколько врачей со слотами на несколько мест; у одного
+врача на период есть сотни записей, остальные врачи частично заняты.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_rescheduling.py --doctors 12 --period 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, func, text
+from database import DatabaseManager
+from models import (
+    Appointment, AppointmentStatus, Employee, Patient, Position, Schedule, Specialization,
+    patient_search_keys
+)
+from booking import booked_count_subquery
+from rescheduling import AppointmentRescheduler
+
+SLOTS_PER_DAY = 8
+
+
+def populate(engine, doctors, days, capacity, fill, patients, rng):
+    start_day = date.today() + timedelta(days=1)
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+        conn.execute(insert(Specialization), [{'id': 1, 'name': 'Терапия'}])
+        conn.execute(insert(Patient), [
+            dict(id=patient_id, last_name=f'Пациент{patient_id}', first_name='Тест', birth_date=date(1980, 1, 1),
+                 **patient_search_keys(f'Пациент{patient_id}', 'Тест', None, None, None, None, None))
+            for patient_id in range(1, patients + 1)
+        ])
+        conn.execute(insert(Employee), [
+            {'id': doctor_id, 'last_name': f'Врач{doctor_id}', 'first_name': 'Тест', 'position_id': 1,
+             'specialization_id': 1, 'cabinet_number': str(doctor_id)}
+            for doctor_id in range(1, doctors + 1)
+        ])
+        schedules, appointments = [], []
+        for day in range(days):
+            work_date = start_day + timedelta(days=day)
+            for doctor_id in range(1, doctors + 1):
+                for slot in range(SLOTS_PER_DAY):
+                    schedule_id = len(schedules) + 1
+                    start = day_time(9 + slot)
+                    schedules.append({
+                        'id': schedule_id, 'employee_id': doctor_id, 'work_date': work_date,
+                        'start_time': start, 'end_time': day_time(10 + slot),
+                        'cabinet_number': str(doctor_id), 'max_patients': capacity,
+                    })
+                    # Первый врач (заболевший) занят полностью
+                    booked = capacity if doctor_id == 1 else sum(rng.random() < fill for _ in range(capacity))
+                    for _ in range(booked):
+                        appointments.append({
+                            'patient_id': rng.randint(1, patients), 'doctor_id': doctor_id,
+                            'schedule_id': schedule_id, 'appointment_date': work_date,
+                            'appointment_time': start, 'status': AppointmentStatus.SCHEDULED,
+                        })
+        conn.execute(insert(Schedule), schedules)
+        for start in range(0, len(appointments), 20000):
+            conn.execute(insert(Appointment), appointments[start:start + 20000])
+        conn.execute(text("ANALYZE"))
+    return start_day
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=12)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--period', type=int, default=5, help="дней недоступности врача")
+    parser.add_argument('--capacity', type=int, default=6, help="мест в слоте")
+    parser.add_argument('--fill', type=float, default=0.7, help="доля занятых мест у остальных врачей")
+    parser.add_argument('--patients', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        start_day = populate(db_manager.engine, args.doctors, args.days, args.capacity, args.fill,
+                             args.patients, rng)
+        date_from = start_day + timedelta(days=7)
+        date_to = date_from + timedelta(days=args.period - 1)
+
+        session = Session()
+        rescheduler = AppointmentRescheduler(session)
+        started = time.perf_counter()
+        plan = rescheduler.plan(1, date_from, date_to)
+        plan_time = time.perf_counter() - started
+        assignments = plan['assignments']
+        shifts = [abs((item['new']['date'] - item['old']['date']).days) for item in assignments]
+        same_day = sum(shift == 0 for shift in shifts)
+        print(f"Записей врача за период: {len(assignments) + len(plan['unassigned'])}")
+        print(f"План: {plan_time * 1000:.0f} мс, перенесено {len(assignments)}, без слота {len(plan['unassigned'])}")
+        if assignments:
+            print(f"  в тот же день: {same_day}, средний сдвиг {sum(shifts) / len(shifts):.2f} дн., "
+                  f"средняя стоимость {sum(item['cost'] for item in assignments) / len(assignments):.1f}")
+
+        started = time.perf_counter()
+        success, message = rescheduler.apply(plan)
+        print(f"Применение: {(time.perf_counter() - started) * 1000:.0f} мс - {message}")
+
+        overbooked = session.execute(
+            select(func.count()).select_from(Schedule).where(Schedule.max_patients < booked_count_subquery())
+        ).scalar()
+        left = session.execute(
+            select(func.count()).select_from(Appointment).where(
+                Appointment.doctor_id == 1, Appointment.appointment_date.between(date_from, date_to),
+                Appointment.status == AppointmentStatus.SCHEDULED
+            )
+        ).scalar()
+        print(f"Переполненных слотов: {overbooked}, осталось записей у врача: {left}")
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Поиск пересечений в расписании: заметающая прямая против попарного сравнения
+
+Расписание на несколько месяцев: два врача на кабинет в разные смены и
+несколько внесенных пересечений по врачам и кабинетам.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_schedule_conflicts.py --doctors 200 --days 90
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from database import DatabaseManager
+from models import Employee, Position, Schedule
+from schedule_conflicts import ScheduleConflictChecker, sweep_conflicts
+
+SLOTS_PER_SHIFT = 5
+
+
+def generate(doctors, days, injected, rng):
+    """Слоты расписания; внесенное пересечение задевает один или два соседних слота"""
+    today = date.today()
+    rows = []
+    for day in range(days):
+        work_date = today + timedelta(days=day)
+        for doctor_id in range(1, doctors + 1):
+            # Четные врачи работают утром, нечетные - после обеда в том же кабинете
+            first_hour = 8 if doctor_id % 2 == 0 else 8 + SLOTS_PER_SHIFT
+            for slot in range(SLOTS_PER_SHIFT):
+                rows.append({
+                    'employee_id': doctor_id, 'work_date': work_date,
+                    'start_time': day_time(first_hour + slot), 'end_time': day_time(first_hour + slot + 1),
+                    'cabinet_number': str(100 + (doctor_id + 1) // 2), 'max_patients': 1,
+                })
+    for number in range(injected):
+        base = rng.choice(rows)
+        if number % 2:
+            # Второй слот того же врача в другом кабинете
+            rows.append(dict(base, start_time=day_time(base['start_time'].hour, 30),
+                             end_time=day_time(base['end_time'].hour, 30), cabinet_number=f'X{number}'))
+        else:
+            # Другой врач вне смен в том же кабинете
+            rows.append(dict(base, employee_id=doctors + 1 + number, start_time=day_time(base['start_time'].hour, 15),
+                             end_time=day_time(base['start_time'].hour, 45)))
+    return rows
+
+
+def pairwise_conflicts(rows):
+    """Попарное сравнение всех слотов: O(n^2)"""
+    found = 0
+    for i, first in enumerate(rows):
+        for second in rows[i + 1:]:
+            if (first['work_date'] == second['work_date']
+                    and first['start_time'] < second['end_time'] and second['start_time'] < first['end_time']
+                    and (first['employee_id'] == second['employee_id']
+                         or first['cabinet_number'] == second['cabinet_number'])):
+                found += 1
+    return found
+
+
+def as_intervals(rows):
+    ordered = sorted(rows, key=lambda row: (row['work_date'], row['start_time']))
+    return [
+        (row['work_date'], row['start_time'], row['end_time'], row['employee_id'], row['cabinet_number'], index)
+        for index, row in enumerate(ordered)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--injected', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    rows = generate(args.doctors, args.days, args.injected, rng)
+    print(f"Слотов: {len(rows)}, внесено пересечений: {args.injected}")
+
+    for size in (1000, 2000, 4000):
+        # Внесенные пересечения в конце списка, их пары - в случайных днях
+        sample = rows[-size:]
+        started = time.perf_counter()
+        pairwise = pairwise_conflicts(sample)
+        pairwise_time = time.perf_counter() - started
+        started = time.perf_counter()
+        swept = len(sweep_conflicts(as_intervals(sample)))
+        sweep_time = time.perf_counter() - started
+        print(f"  {size:>6} слотов: попарно {pairwise_time * 1000:8.1f} мс ({pairwise}), "
+              f"заметающая прямая {sweep_time * 1000:6.1f} мс ({swept})")
+
+    started = time.perf_counter()
+    conflicts = sweep_conflicts(as_intervals(rows))
+    print(f"Все слоты в памяти: {(time.perf_counter() - started) * 1000:.0f} мс, конфликтов: {len(conflicts)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        with db_manager.engine.begin() as conn:
+            conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+            conn.execute(insert(Employee), [
+                {'id': doctor_id, 'last_name': f'Врач{doctor_id}', 'first_name': 'Тест', 'position_id': 1}
+                for doctor_id in range(1, args.doctors + args.injected + 2)
+            ])
+            for start in range(0, len(rows), 20000):
+                conn.execute(insert(Schedule), rows[start:start + 20000])
+            conn.execute(text("ANALYZE"))
+
+        session = Session()
+        checker = ScheduleConflictChecker(session)
+        started = time.perf_counter()
+        conflicts = checker.find_conflicts()
+        print(f"Полная проверка из базы: {(time.perf_counter() - started) * 1000:.0f} мс, "
+              f"конфликтов: {len(conflicts)}")
+
+        # Проверка одного нового слота, как при вставке
+        samples = []
+        for _ in range(500):
+            base = rng.choice(rows)
+            candidate = dict(base, start_time=day_time(base['start_time'].hour, 20), cabinet_number='Z')
+            started = time.perf_counter()
+            checker.validate([candidate])
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        print(f"Проверка нового слота: p50 {samples[len(samples) // 2]:.2f} мс, "
+              f"p99 {samples[int(len(samples) * 0.99)]:.2f} мс")
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Сравнение поиска ближайшего свободного слота запросом к базе и индексом SlotFinder
+
+Расписание на horizon дней для многих врачей; большая часть слотов уже занята.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_slot_finder.py --doctors 300 --fill 0.8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, text, or_, and_
+from database import DatabaseManager
+from models import (
+    Appointment, AppointmentStatus, Employee, Patient, Position, Schedule, Specialization,
+    patient_search_keys
+)
+from booking import booked_count_subquery, book_into_schedule, notify_booking_listeners
+from slot_finder import SlotFinder, DEFAULT_HORIZON_DAYS
+
+SPECIALIZATIONS = ['Терапия', 'Кардиология', 'Неврология', 'Хирургия', 'Педиатрия', 'Офтальмология',
+                   'Стоматология']
+SLOTS_PER_DAY = 8
+
+
+def populate(engine, doctors, days, fill, rng):
+    """Врачи, расписание и записи через Core"""
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+        conn.execute(insert(Specialization), [
+            {'id': index, 'name': name} for index, name in enumerate(SPECIALIZATIONS, 1)
+        ])
+        conn.execute(insert(Patient), [dict(
+            id=1, last_name='Тестов', first_name='Тест', birth_date=date(1980, 1, 1),
+            **patient_search_keys('Тестов', 'Тест', None, None, None, None, None)
+        )])
+        conn.execute(insert(Employee), [
+            {'id': doctor_id, 'last_name': f'Врач{doctor_id}', 'first_name': 'Тест', 'position_id': 1,
+             'specialization_id': rng.randint(1, len(SPECIALIZATIONS)), 'cabinet_number': str(doctor_id)}
+            for doctor_id in range(1, doctors + 1)
+        ])
+
+        schedules, appointments = [], []
+        schedule_id = 0
+        for day in range(days + 1):
+            work_date = today + timedelta(days=day)
+            for doctor_id in range(1, doctors + 1):
+                for slot in range(SLOTS_PER_DAY):
+                    schedule_id += 1
+                    start = day_time(9 + slot)
+                    schedules.append({
+                        'id': schedule_id, 'employee_id': doctor_id, 'work_date': work_date,
+                        'start_time': start, 'end_time': day_time(10 + slot),
+                        'cabinet_number': str(doctor_id), 'max_patients': 1,
+                    })
+                    # Ближайшие дни заполнены плотнее
+                    if rng.random() < fill * (1.2 if day < 7 else 0.9):
+                        appointments.append({
+                            'patient_id': 1, 'doctor_id': doctor_id, 'schedule_id': schedule_id,
+                            'appointment_date': work_date, 'appointment_time': start,
+                            'status': AppointmentStatus.SCHEDULED,
+                        })
+        for start in range(0, len(schedules), 20000):
+            conn.execute(insert(Schedule), schedules[start:start + 20000])
+        for start in range(0, len(appointments), 20000):
+            conn.execute(insert(Appointment), appointments[start:start + 20000])
+        conn.execute(text("ANALYZE"))
+    return len(schedules), len(appointments)
+
+
+def earliest_sql(session, specialization_id, doctor_id, within_days):
+    """Ближайший свободный слот одним запросом (как без индекса)"""
+    now = datetime.now()
+    statement = (
+        select(Schedule.id, Schedule.work_date, Schedule.start_time)
+        .join(Employee, Employee.id == Schedule.employee_id)
+        .where(
+            or_(Schedule.work_date > now.date(),
+                and_(Schedule.work_date == now.date(), Schedule.start_time >= now.time())),
+            Schedule.work_date <= now.date() + timedelta(days=within_days),
+            Schedule.max_patients > booked_count_subquery()
+        )
+        .order_by(Schedule.work_date, Schedule.start_time, Schedule.id)
+        .limit(1)
+    )
+    if specialization_id:
+        statement = statement.where(Employee.specialization_id == specialization_id)
+    if doctor_id:
+        statement = statement.where(Schedule.employee_id == doctor_id)
+    return session.execute(statement).first()
+
+
+def measure(function, queries):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        function(*query)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=300)
+    parser.add_argument('--days', type=int, default=DEFAULT_HORIZON_DAYS)
+    parser.add_argument('--fill', type=float, default=0.8, help="доля занятых слотов")
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        Session = db_manager.init_database()
+        started = time.perf_counter()
+        schedules, appointments = populate(db_manager.engine, args.doctors, args.days, args.fill, rng)
+        print(f"Слотов: {schedules}, записей: {appointments}, заполнение: {time.perf_counter() - started:.1f} с")
+
+        finder = SlotFinder(Session, horizon_days=args.days)
+        finder.install()
+        started = time.perf_counter()
+        finder.rebuild()
+        print(f"Построение индекса: {(time.perf_counter() - started) * 1000:.0f} мс")
+
+        queries = [
+            (rng.choice([None, rng.randint(1, len(SPECIALIZATIONS))]),
+             rng.choice([None, None, rng.randint(1, args.doctors)]),
+             rng.choice([1, 7, 14, 30]))
+            for _ in range(args.queries)
+        ]
+        session = Session()
+        mismatches = sum(
+            (getattr(earliest_sql(session, *query), 'id', None)
+             != (finder.earliest(*query) or {}).get('schedule_id'))
+            for query in queries[:200]
+        )
+        sql_p50, sql_p99 = measure(lambda *query: earliest_sql(session, *query), queries[:200])
+        index_p50, index_p99 = measure(finder.earliest, queries)
+        print(f"Запрос к базе: p50 {sql_p50:9.1f} мкс  p99 {sql_p99:9.1f} мкс")
+        print(f"SlotFinder:    p50 {index_p50:9.1f} мкс  p99 {index_p99:9.1f} мкс")
+        print(f"Расхождений с запросом к базе: {mismatches} из 200")
+
+        # Запись в найденный слот: индекс обновляется по событию без перестроения
+        booked = missed = 0
+        started = time.perf_counter()
+        for _ in range(200):
+            slot = finder.earliest(specialization_id=rng.randint(1, len(SPECIALIZATIONS)))
+            if slot is None:
+                continue
+            appointment_id = book_into_schedule(session, slot['schedule_id'], 1, 'Нагрузочный тест')
+            session.commit()
+            if appointment_id:
+                booked += 1
+                notify_booking_listeners('booked', dict(slot, id=appointment_id, patient_id=1))
+            else:
+                missed += 1
+        elapsed = time.perf_counter() - started
+        print(f"Записей в ближайший слот: {booked} за {elapsed * 1000:.0f} мс, "
+              f"слот уже занят: {missed}")
+        session.close()
+        finder.uninstall()
+
+
+if __name__ == '__main__':
+    main()
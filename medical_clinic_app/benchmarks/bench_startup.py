@@ -0,0 +1,99 @@
+"""Время запуска приложения: импорт main по -X importtime и бюджет холодного старта
+
+Каждый замер - отдельный процесс python -X importtime -c "import main":
+замеряется время всего процесса, а из вывода importtime берутся время
+импорта main и самые дорогие модули, которые он загружает. Для
+сравнения замеряется тот же запуск с заранее загруженными pandas,
+reportlab, python-docx, openpyxl и boto3 (как до отложенной загрузки).
+Скрипт завершается с кодом 1, если медиана времени процесса превышает
+бюджет или при запуске загружается одна из тяжелых библиотек.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_startup.py --runs 7 --budget-ms 1000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Библиотеки, которые не должны загружаться до первого экспорта, импорта из файла или облачной копии
+HEAVY_MODULES = ('pandas', 'reportlab', 'docx', 'openpyxl', 'boto3')
+
+EAGER_IMPORTS = 'import pandas, reportlab.platypus, docx, openpyxl, boto3; '
+
+
+def run(code):
+    """Отдельный процесс; возвращает (время процесса, {модуль: суммарное время, мкс}, модули main, stdout)"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], cwd=APP_DIR, capture_output=True, text=True, check=True
+    )
+    elapsed = time.perf_counter() - started
+    modules = {}
+    # Модуль печатается после всех своих зависимостей: непосредственные зависимости
+    # модуля верхнего уровня - строки со вторым уровнем отступа перед ним
+    children, main_children = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        modules[name] = int(cumulative_us)
+        if depth == 1:
+            children.append(name)
+        elif depth == 0:
+            if name == 'main':
+                main_children = children
+            children = []
+    return elapsed, modules, main_children, result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget-ms', type=float, default=1000, help="бюджет медианы времени запуска процесса, мс")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    check = f"import sys, main; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    results = {}
+    for name, code in (('отложенная загрузка', check), ('с тяжелыми библиотеками', EAGER_IMPORTS + check)):
+        process_times, import_times = [], []
+        for _ in range(args.runs):
+            elapsed, modules, main_children, loaded = run(code)
+            process_times.append(elapsed * 1000)
+            import_times.append(modules['main'] / 1000)
+        results[name] = (statistics.median(process_times), statistics.median(import_times), modules, main_children,
+                         loaded)
+        print(f"{name}: процесс {results[name][0]:.0f} мс, импорт main {results[name][1]:.0f} мс "
+              f"(медиана {args.runs} запусков)")
+
+    lazy_process, lazy_import, modules, main_children, loaded = results['отложенная загрузка']
+    eager_process = results['с тяжелыми библиотеками'][0]
+    print(f"Экономия на запуске процесса: {eager_process - lazy_process:.0f} мс "
+          f"({(1 - lazy_process / eager_process) * 100:.0f}%)")
+
+    print("\nСамые дорогие модули, импортируемые main (последний замер):")
+    top = sorted(((modules[name], name) for name in main_children), reverse=True)[:args.top]
+    for cumulative, name in top:
+        print(f"  {cumulative / 1000:7.1f} мс  {name}")
+
+    failed = False
+    if loaded:
+        print(f"\n✗ При запуске загружены тяжелые библиотеки: {loaded}")
+        failed = True
+    if lazy_process > args.budget_ms:
+        print(f"\n✗ Запуск {lazy_process:.0f} мс превышает бюджет {args.budget_ms:.0f} мс")
+        failed = True
+    if not failed:
+        print(f"\n✓ Бюджет запуска соблюден: {lazy_process:.0f} мс из {args.budget_ms:.0f} мс")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
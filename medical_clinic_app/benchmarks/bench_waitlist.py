@@ -0,0 +1,170 @@
+"""Лист ожидания: подбор заявки на освободившееся место при параллельных отменах
+
+Все слоты на две недели заняты, в листе ожидания тысячи заявок. Потоки
+параллельно отменяют записи; два экземпляра WaitlistManager (как два рабочих
+процесса API) одновременно пытаются отдать место своей лучшей заявке.
+В конце проверяется, что слоты не переполнены и ни одна заявка не записана дважды.
+
+Запуск из каталога medical_clinic_app:
+    python benchmarks/bench_waitlist.py --entries 5000 --threads 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, func, text
+from database import DatabaseManager
+from models import (
+    Appointment, AppointmentStatus, Employee, Patient, Position, Schedule, Specialization,
+    WaitlistEntry, WaitlistStatus, patient_search_keys
+)
+from booking import booked_count_subquery, cancel_appointment
+from waitlist import WaitlistManager
+
+SPECIALIZATIONS = 7
+SLOTS_PER_DAY = 8
+
+
+def populate(engine, doctors, days, patients, entries, rng):
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Position), [{'id': 1, 'name': 'Врач'}])
+        conn.execute(insert(Specialization), [
+            {'id': index, 'name': f'Специализация {index}'} for index in range(1, SPECIALIZATIONS + 1)
+        ])
+        conn.execute(insert(Patient), [
+            dict(id=patient_id, last_name=f'Пациент{patient_id}', first_name='Тест', birth_date=date(1980, 1, 1),
+                 **patient_search_keys(f'Пациент{patient_id}', 'Тест', None, None, None, None, None))
+            for patient_id in range(1, patients + 1)
+        ])
+        conn.execute(insert(Employee), [
+            {'id': doctor_id, 'last_name': f'Врач{doctor_id}', 'first_name': 'Тест', 'position_id': 1,
+             'specialization_id': doctor_id % SPECIALIZATIONS + 1}
+            for doctor_id in range(1, doctors + 1)
+        ])
+        schedules, appointments = [], []
+        for day in range(1, days + 1):
+            work_date = today + timedelta(days=day)
+            for doctor_id in range(1, doctors + 1):
+                for slot in range(SLOTS_PER_DAY):
+                    schedule_id = len(schedules) + 1
+                    schedules.append({
+                        'id': schedule_id, 'employee_id': doctor_id, 'work_date': work_date,
+                        'start_time': day_time(9 + slot), 'end_time': day_time(10 + slot), 'max_patients': 1,
+                    })
+                    appointments.append({
+                        'patient_id': rng.randint(1, patients), 'doctor_id': doctor_id, 'schedule_id': schedule_id,
+                        'appointment_date': work_date, 'appointment_time': day_time(9 + slot),
+                        'status': AppointmentStatus.SCHEDULED,
+                    })
+        conn.execute(insert(Schedule), schedules)
+        conn.execute(insert(Appointment), appointments)
+
+        now = datetime.now()
+        rows = []
+        for _ in range(entries):
+            date_from = today + timedelta(days=rng.randint(1, days))
+            by_doctor = rng.random() < 0.4
+            rows.append({
+                'patient_id': rng.randint(1, patients),
+                'doctor_id': rng.randint(1, doctors) if by_doctor else None,
+                'specialization_id': None if by_doctor else rng.randint(1, SPECIALIZATIONS),
+                'date_from': date_from, 'date_to': date_from + timedelta(days=rng.randint(0, 6)),
+                'time_from': day_time(12) if rng.random() < 0.2 else None,
+                'priority': rng.choice([0, 0, 0, 1, 2]), 'status': WaitlistStatus.WAITING,
+                'created_at': now, 'updated_at': now,
+            })
+        conn.execute(insert(WaitlistEntry), rows)
+        conn.execute(text("ANALYZE"))
+    return len(appointments)
+
+
+class TimedWaitlistManager(WaitlistManager):
+    """Менеджер с замером времени подбора"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.samples = []
+        self.filled = 0
+
+    def fill_slot(self, *args):
+        started = time.perf_counter()
+        result = super().fill_slot(*args)
+        self.samples.append((time.perf_counter() - started) * 1000)
+        if result:
+            self.filled += 1
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--cancellations', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    rng = random.Random(9)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'), pool_size=args.threads + 2)
+        Session = db_manager.init_database()
+        appointments = populate(db_manager.engine, args.doctors, args.days, args.patients, args.entries, rng)
+
+        managers = [TimedWaitlistManager(Session) for _ in range(2)]
+        for manager in managers:
+            started = time.perf_counter()
+            manager.load()
+            print(f"Загрузка листа ожидания: {(time.perf_counter() - started) * 1000:.0f} мс, "
+                  f"заявок: {manager.waiting_count()}")
+            manager.install()
+
+        victims = rng.sample(range(1, appointments + 1), args.cancellations)
+        chunks = [victims[index::args.threads] for index in range(args.threads)]
+
+        def worker(appointment_ids):
+            session = Session()
+            for appointment_id in appointment_ids:
+                cancel_appointment(session, appointment_id)
+            session.close()
+
+        threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        for manager in managers:
+            manager.uninstall()
+
+        samples = sorted(sample for manager in managers for sample in manager.samples)
+        filled = sum(manager.filled for manager in managers)
+        print(f"Отмен: {args.cancellations} за {elapsed:.1f} с в {args.threads} потоках, "
+              f"мест отдано листу ожидания: {filled}")
+        print(f"Подбор заявки: p50 {samples[len(samples) // 2]:.2f} мс, "
+              f"p99 {samples[int(len(samples) * 0.99)]:.2f} мс")
+
+        session = Session()
+        overbooked = session.execute(
+            select(func.count()).select_from(Schedule).where(Schedule.max_patients < booked_count_subquery())
+        ).scalar()
+        booked_entries = session.execute(
+            select(func.count(), func.count(func.distinct(WaitlistEntry.appointment_id)))
+            .where(WaitlistEntry.status == WaitlistStatus.BOOKED)
+        ).one()
+        print(f"Переполненных слотов: {overbooked}, заявок записано: {booked_entries[0]}, "
+              f"различных записей у них: {booked_entries[1]}")
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
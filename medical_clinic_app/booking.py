@@ -0,0 +1,161 @@
+from datetime import datetime
+from sqlalchemy import select, insert, update, func, literal
+from models import Appointment, AppointmentStatus, Schedule
+
+# Подписчики на события записи: функция(событие, данные записи).
+# События: 'booked', 'cancelled'.
+_booking_listeners = []
+
+
+def add_booking_listener(listener):
+    """Подписка на события записи на прием"""
+    if listener not in _booking_listeners:
+        _booking_listeners.append(listener)
+
+
+def remove_booking_listener(listener):
+    """Отписка от событий записи на прием"""
+    if listener in _booking_listeners:
+        _booking_listeners.remove(listener)
+
+
+def notify_booking_listeners(event_name, info):
+    """Оповещение подписчиков; ошибка подписчика не отменяет саму запись"""
+    for listener in list(_booking_listeners):
+        try:
+            listener(event_name, info)
+        except Exception as e:
+            print(f"Ошибка обработчика события записи ({event_name}): {e}")
+
+
+def booked_count_subquery():
+    """Количество активных записей в слоте расписания (коррелированный подзапрос)"""
+    return (
+        select(func.count(Appointment.id))
+        .where(
+            Appointment.schedule_id == Schedule.id,
+            Appointment.status == AppointmentStatus.SCHEDULED
+        )
+        .correlate(Schedule)
+        .scalar_subquery()
+    )
+
+
+def find_free_schedule(session, doctor_id, appointment_date, appointment_time):
+    """Слот расписания врача на дату и время со свободными местами"""
+    return session.execute(
+        select(Schedule.id)
+        .where(
+            Schedule.employee_id == doctor_id,
+            Schedule.work_date == appointment_date,
+            Schedule.start_time <= appointment_time,
+            Schedule.end_time > appointment_time,
+            Schedule.max_patients > booked_count_subquery()
+        )
+        .order_by(Schedule.start_time)
+        .limit(1)
+        .execution_options(skip_access_policy=True)
+    ).scalar()
+
+
+def _appointment_info(appointment_id, patient_id, doctor_id, schedule_id, appointment_date, appointment_time):
+    return {
+        'id': appointment_id,
+        'patient_id': patient_id,
+        'doctor_id': doctor_id,
+        'schedule_id': schedule_id,
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_time,
+    }
+
+
+def book_into_schedule(session, schedule_id, patient_id, reason=None, appointment_time=None):
+    """Запись пациента в конкретный слот расписания без фиксации транзакции
+
+    Проверка свободных мест и вставка выполняются одним оператором
+    INSERT ... SELECT ... WHERE, поэтому параллельные записи не могут
+    превысить max_patients. Возвращает id записи или None, если мест нет.
+    """
+    now = datetime.now()
+    slot_time = Schedule.start_time if appointment_time is None else literal(appointment_time, Schedule.start_time.type)
+    source = (
+        select(
+            literal(patient_id), Schedule.id, Schedule.employee_id, Schedule.work_date, slot_time,
+            literal(AppointmentStatus.SCHEDULED, Appointment.status.type),
+            literal(reason, Appointment.reason.type),
+            literal(now, Appointment.created_at.type), literal(now, Appointment.updated_at.type)
+        )
+        .where(Schedule.id == schedule_id, Schedule.max_patients > booked_count_subquery())
+    )
+    result = session.execute(
+        insert(Appointment)
+        .from_select(
+            ['patient_id', 'schedule_id', 'doctor_id', 'appointment_date', 'appointment_time',
+             'status', 'reason', 'created_at', 'updated_at'],
+            source
+        )
+        .execution_options(skip_access_policy=True)
+    )
+    if result.rowcount != 1:
+        return None
+    return result.lastrowid
+
+
+def book_appointment(session, patient_id, doctor_id, appointment_date, appointment_time, reason=None):
+    """Запись на прием к врачу на дату и время
+
+    Возвращает (успех, сообщение, id записи).
+    """
+    try:
+        schedule_id = find_free_schedule(session, doctor_id, appointment_date, appointment_time)
+        if schedule_id is None:
+            return False, "Нет свободных слотов в расписании на выбранное время!", None
+
+        appointment_id = book_into_schedule(session, schedule_id, patient_id, reason, appointment_time)
+        if appointment_id is None:
+            session.rollback()
+            return False, "Свободные места в выбранном слоте закончились", None
+
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        return False, f"Ошибка создания записи: {str(e)}", None
+
+    notify_booking_listeners('booked', _appointment_info(
+        appointment_id, patient_id, doctor_id, schedule_id, appointment_date, appointment_time
+    ))
+    return True, "Запись создана успешно!", appointment_id
+
+
+def cancel_appointment(session, appointment_id):
+    """Отмена записи на прием; место в слоте освобождается
+
+    Возвращает (успех, сообщение).
+    """
+    try:
+        appointment = session.execute(
+            select(
+                Appointment.id, Appointment.patient_id, Appointment.doctor_id, Appointment.schedule_id,
+                Appointment.appointment_date, Appointment.appointment_time
+            ).where(Appointment.id == appointment_id)
+        ).first()
+        if appointment is None:
+            return False, "Запись не найдена"
+
+        # Условие на статус защищает от повторной отмены параллельным запросом
+        result = session.execute(
+            update(Appointment)
+            .where(Appointment.id == appointment_id, Appointment.status == AppointmentStatus.SCHEDULED)
+            .values(status=AppointmentStatus.CANCELLED, updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            session.rollback()
+            return False, "Запись уже не активна"
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        return False, f"Ошибка отмены записи: {str(e)}"
+
+    notify_booking_listeners('cancelled', _appointment_info(*appointment))
+    return True, "Запись отменена"
@@ -1,30 +1,109 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, event
 from sqlalchemy.orm import sessionmaker
 from models import Base
+from patient_search import backfill_search_keys
+from prescriptions import backfill_prescription_durations
+from query_stats import QueryStats
+from metrics import track_database
 import os
 
+# Версия схемы базы данных (хранится в PRAGMA user_version)
+SCHEMA_VERSION = 8
+
+# Миграции данных по версиям схемы: {версия: функция(connection)}.
+# Недостающие столбцы и индексы добавляются автоматически в _upgrade_schema.
+SCHEMA_MIGRATIONS = {
+    4: backfill_search_keys,
+    6: backfill_prescription_durations,
+}
+
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Настройки соединения SQLite для параллельной работы нескольких клиентов"""
+    cursor = dbapi_connection.cursor()
+    # Для новой базы: освобожденные страницы возвращаются через PRAGMA incremental_vacuum
+    # (должно выполняться до перевода в WAL; у существующей базы режим не меняется без VACUUM)
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL: читатели не блокируют писателя и наоборот
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Ожидание блокировки вместо немедленной ошибки database is locked
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
 class DatabaseManager:
     """Менеджер базы данных"""
     
-    def __init__(self, db_path='medical_clinic.db'):
+    def __init__(self, db_path='medical_clinic.db', **engine_options):
         self.db_path = db_path
+        # Дополнительные параметры create_engine (например, размер пула соединений)
+        self.engine_options = engine_options
         self.engine = None
         self.Session = None
+        # Статистика запросов (включается переменной CLINIC_QUERY_SAMPLE_RATE или из меню)
+        self.query_stats = QueryStats.from_env()
         
     def init_database(self):
         """Инициализация базы данных"""
         # Создаем подключение к SQLite
-        self.engine = create_engine(f'sqlite:///{self.db_path}', echo=False)
+        self.engine = create_engine(f'sqlite:///{self.db_path}', echo=False, **self.engine_options)
+        event.listen(self.engine, "connect", configure_sqlite_connection)
+        self.query_stats.install(self.engine)
+        # Размеры файла базы и журнала WAL в метриках
+        track_database(self.db_path)
         
         # Создаем таблицы
         Base.metadata.create_all(self.engine)
         
+        # Обновляем схему существующей базы и фиксируем ее версию
+        self._upgrade_schema()
+        
         # Создаем фабрику сессий
         self.Session = sessionmaker(bind=self.engine)
         
         print(f"База данных инициализирована: {self.db_path}")
         return self.Session
     
+    def _upgrade_schema(self):
+        """Добавление недостающих столбцов и индексов и миграции данных"""
+        inspector = inspect(self.engine)
+        
+        with self.engine.begin() as conn:
+            current_version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+            if current_version >= SCHEMA_VERSION:
+                return
+            
+            for table in Base.metadata.sorted_tables:
+                existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing_columns:
+                        column_type = column.type.compile(dialect=self.engine.dialect)
+                        conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+                
+                # create_all не создает новые индексы у уже существующих таблиц
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+            
+            for version in sorted(SCHEMA_MIGRATIONS):
+                if current_version < version <= SCHEMA_VERSION:
+                    SCHEMA_MIGRATIONS[version](conn)
+            
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    def enable_query_stats(self, sample_rate=1.0, slow_ms=None):
+        """Включение сбора статистики запросов для доли sample_rate операторов"""
+        self.query_stats.uninstall()
+        self.query_stats.sample_rate = sample_rate
+        if slow_ms is not None:
+            self.query_stats.slow_ms = slow_ms
+        if self.engine is not None:
+            self.query_stats.install(self.engine)
+        return self.query_stats.enabled
+    
+    def disable_query_stats(self):
+        """Отключение сбора статистики запросов (накопленная статистика сохраняется)"""
+        self.query_stats.uninstall()
+        self.query_stats.sample_rate = 0.0
+    
     def get_session(self):
         """Получение сессии базы данных"""
         if self.Session is None:
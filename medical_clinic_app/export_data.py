@@ -1,28 +1,68 @@
 import json
 import csv
-import pandas as pd
 from datetime import datetime
+from functools import lru_cache
+from importlib.util import find_spec
 from pathlib import Path
+from types import SimpleNamespace
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
+from models import Appointment, Position
+from metrics import track_export
 import os
 
-# Импорт библиотек для PDF и DOCX (установите через pip)
-try:
+def _load_pandas():
+    import pandas
+    return pandas
+
+
+def _load_pdf():
     from reportlab.lib.pagesizes import A4
     from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
     from reportlab.lib.styles import getSampleStyleSheet
     from reportlab.lib import colors
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-    print("Предупреждение: библиотека reportlab не установлена. Экспорт в PDF будет недоступен.")
+    return SimpleNamespace(A4=A4, SimpleDocTemplate=SimpleDocTemplate, Table=Table, TableStyle=TableStyle,
+                           Paragraph=Paragraph, Spacer=Spacer, getSampleStyleSheet=getSampleStyleSheet,
+                           colors=colors)
+
 
-try:
+def _load_docx():
     from docx import Document
-    from docx.shared import Inches, Pt
-    DOCX_AVAILABLE = True
-except ImportError:
-    DOCX_AVAILABLE = False
+    return SimpleNamespace(Document=Document)
+
+
+# Библиотеки форматов экспорта (установите через pip): {имя: (пакет, функция загрузки)}.
+# Загружаются при первом экспорте в формат, а не при запуске приложения.
+EXPORT_BACKENDS = {
+    'pandas': ('pandas', _load_pandas),
+    'pdf': ('reportlab', _load_pdf),
+    'docx': ('docx', _load_docx),
+}
+
+
+def register_backend(name, package, loader):
+    """Добавление библиотеки формата экспорта, загружаемой при первом использовании"""
+    EXPORT_BACKENDS[name] = (package, loader)
+    load_backend.cache_clear()
+
+
+def backend_available(name):
+    """Проверка наличия библиотеки без ее импорта"""
+    return find_spec(EXPORT_BACKENDS[name][0]) is not None
+
+
+@lru_cache(maxsize=None)
+def load_backend(name):
+    """Загрузка библиотеки формата при первом обращении (далее - из кэша)"""
+    return EXPORT_BACKENDS[name][1]()
+
+
+PDF_AVAILABLE = backend_available('pdf')
+if not PDF_AVAILABLE:
+    print("Предупреждение: библиотека reportlab не установлена. Экспорт в PDF будет недоступен.")
+
+DOCX_AVAILABLE = backend_available('docx')
+if not DOCX_AVAILABLE:
     print("Предупреждение: библиотека python-docx не установлена. Экспорт в DOCX будет недоступен.")
 
 class DataExporter:
@@ -33,6 +73,7 @@ class DataExporter:
         self.export_dir = Path("exports")
         self.export_dir.mkdir(exist_ok=True)
     
+    @track_export('json')
     def export_appointments_to_json(self, start_date=None, end_date=None, doctor_id=None):
         """Экспорт записей на прием в JSON"""
         try:
@@ -84,6 +125,7 @@ class DataExporter:
         except Exception as e:
             return False, f"Ошибка экспорта в JSON: {str(e)}", None
     
+    @track_export('csv')
     def export_patients_to_csv(self, min_age=None, max_age=None):
         """Экспорт пациентов в CSV"""
         try:
@@ -123,6 +165,7 @@ class DataExporter:
                 data = filtered_data
             
             # Создание DataFrame и экспорт в CSV
+            pd = load_backend('pandas')
             df = pd.DataFrame(data)
             
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -134,6 +177,7 @@ class DataExporter:
         except Exception as e:
             return False, f"Ошибка экспорта в CSV: {str(e)}", None
     
+    @track_export('pdf')
     def export_schedule_to_pdf(self, doctor_id=None, start_date=None, end_date=None):
         """Экспорт расписания в PDF"""
         if not PDF_AVAILABLE:
@@ -162,14 +206,15 @@ class DataExporter:
             filename = self.export_dir / f'schedule_{timestamp}.pdf'
             
             # Создание PDF документа
-            doc = SimpleDocTemplate(str(filename), pagesize=A4)
+            pdf = load_backend('pdf')
+            doc = pdf.SimpleDocTemplate(str(filename), pagesize=pdf.A4)
             elements = []
-            styles = getSampleStyleSheet()
+            styles = pdf.getSampleStyleSheet()
             
             # Заголовок
-            title = Paragraph("Расписание врачей", styles['Title'])
+            title = pdf.Paragraph("Расписание врачей", styles['Title'])
             elements.append(title)
-            elements.append(Spacer(1, 12))
+            elements.append(pdf.Spacer(1, 12))
             
             # Подготовка данных для таблицы
             table_data = [['Дата', 'Врач', 'Специализация', 'Время приема', 'Кабинет', 'Свободных мест']]
@@ -188,16 +233,16 @@ class DataExporter:
                 ])
             
             # Создание таблицы
-            table = Table(table_data)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            table = pdf.Table(table_data)
+            table.setStyle(pdf.TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), pdf.colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), pdf.colors.whitesmoke),
                 ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
                 ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
                 ('FONTSIZE', (0, 0), (-1, 0), 10),
                 ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('BACKGROUND', (0, 1), (-1, -1), pdf.colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, pdf.colors.black),
                 ('FONTSIZE', (0, 1), (-1, -1), 8),
                 ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
             ]))
@@ -205,8 +250,8 @@ class DataExporter:
             elements.append(table)
             
             # Добавление информации о дате экспорта
-            elements.append(Spacer(1, 20))
-            export_date = Paragraph(f"Дата экспорта: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}", styles['Normal'])
+            elements.append(pdf.Spacer(1, 20))
+            export_date = pdf.Paragraph(f"Дата экспорта: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}", styles['Normal'])
             elements.append(export_date)
             
             # Сборка документа
@@ -216,6 +261,7 @@ class DataExporter:
         except Exception as e:
             return False, f"Ошибка экспорта в PDF: {str(e)}", None
     
+    @track_export('docx')
     def export_medical_records_to_docx(self, patient_id=None, doctor_id=None):
         """Экспорт медицинских записей в DOCX"""
         if not DOCX_AVAILABLE:
@@ -244,7 +290,7 @@ class DataExporter:
             filename = self.export_dir / f'medical_records_{timestamp}.docx'
             
             # Создание DOCX документа
-            doc = Document()
+            doc = load_backend('docx').Document()
             
             # Заголовок
             doc.add_heading('Медицинские записи', 0)
@@ -299,6 +345,7 @@ class DataExporter:
         except Exception as e:
             return False, f"Ошибка экспорта в DOCX: {str(e)}", None
     
+    @track_export('xlsx')
     def export_statistics_to_xlsx(self):
         """Экспорт статистики в XLSX"""
         try:
@@ -308,6 +355,7 @@ class DataExporter:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = self.export_dir / f'statistics_{timestamp}.xlsx'
             
+            pd = load_backend('pandas')
             with pd.ExcelWriter(filename, engine='openpyxl') as writer:
                 # Лист с пациентами
                 patients = self.session.query(Patient).all()
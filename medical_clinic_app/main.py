@@ -1,10 +1,26 @@
 import os
 import sys
 from datetime import datetime, date
+from pathlib import Path
 from database import DatabaseManager
 from auth import AuthManager
 from export_data import DataExporter
 from backup import BackupManager
+from access_policy import AccessPolicy
+from booking import book_appointment, cancel_appointment
+from pagination import KeysetPaginator
+from patient_search import search_patients
+from patient_dedup import PatientDeduplicator
+from slot_finder import SlotFinder
+from schedule_conflicts import ScheduleConflictChecker
+from rescheduling import AppointmentRescheduler
+from waitlist import WaitlistManager
+from prescriptions import current_medications
+from archive import ArchiveManager
+from maintenance import MaintenanceEngine, DEFAULT_RULES
+from profiling import ActionProfiler, MODE_METRICS, MODE_CAPTURE
+from metrics import MetricsExporter, install_booking_metrics
+from sqlalchemy import select
 from seed_data import seed_database, create_test_users
 from models import *
 
@@ -14,10 +30,19 @@ class MedicalClinicApp:
     def __init__(self):
         self.db_manager = DatabaseManager()
         self.auth_manager = AuthManager(self.db_manager)
+        self.access_policy = AccessPolicy(self.auth_manager)
         self.current_user = None
         self.exporter = None
         self.backup_manager = None
         self.session = None
+        self.slot_finder = None
+        self.waitlist = None
+        # Профилирование действий (включается переменной CLINIC_PROFILE или из меню)
+        self.profiler = ActionProfiler.from_env()
+        # Публикация метрик (переменные CLINIC_METRICS_FILE и CLINIC_METRICS_PORT)
+        self.metrics_exporter = MetricsExporter.from_env()
+        # Размер страницы в списках (меняется командой на экране списка)
+        self.page_size = 20
         
     def init_application(self):
         """Инициализация приложения"""
@@ -27,14 +52,31 @@ class MedicalClinicApp:
         
         # Инициализация базы данных
         Session = self.db_manager.init_database()
+        
+        # Ограничение доступа к строкам применяется ко всем сессиям приложения
+        self.access_policy.install(Session)
+        # Пересекающиеся слоты врача или кабинета не записываются в базу
+        ScheduleConflictChecker.install(Session)
         self.session = Session()
         
+        # Индекс свободных слотов обновляется по событиям записи и отмены
+        self.slot_finder = SlotFinder(Session)
+        self.slot_finder.install()
+        # Освободившиеся места сразу предлагаются листу ожидания
+        self.waitlist = WaitlistManager(Session, self.slot_finder)
+        self.waitlist.install()
+        # Записи и отмены учитываются в метриках
+        install_booking_metrics()
+        if self.metrics_exporter.enabled:
+            print(self.metrics_exporter.start()[1])
+        
         # Создание администратора по умолчанию
         self.auth_manager.create_default_admin()
         
         # Инициализация менеджеров
         self.exporter = DataExporter(self.session)
         self.backup_manager = BackupManager()
+        self.install_profiler()
         
         # Заполнение тестовыми данными (если база пустая)
         if not self._has_data():
@@ -54,6 +96,15 @@ class MedicalClinicApp:
         except:
             return False
     
+    def _reset_session(self):
+        """Очистка сессии при смене пользователя
+        
+        Объекты, загруженные под прежним пользователем, прошли его фильтр
+        доступа; без очистки карта идентичности отдала бы их новому.
+        """
+        self.session.rollback()
+        self.session.expunge_all()
+    
     def clear_screen(self):
         """Очистка экрана консоли"""
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -81,6 +132,7 @@ class MedicalClinicApp:
             
             if success:
                 self.current_user = user_info
+                self._reset_session()
                 print(f"\n✓ {message}")
                 input("\nНажмите Enter для продолжения...")
                 return True
@@ -104,13 +156,13 @@ class MedicalClinicApp:
             print("3. 💾 Резервное копирование")
             
             # Функции в зависимости от роли
-            if self.current_user['role'] in ['admin', 'registrar']:
+            if self.auth_manager.can('manage_appointments'):
                 print("4. 👥 Управление записями на прием")
             
-            if self.current_user['role'] in ['admin', 'doctor']:
+            if self.auth_manager.can('manage_medical_records'):
                 print("5. 🏥 Медицинские записи")
             
-            if self.current_user['role'] == 'admin':
+            if self.auth_manager.can('manage_system'):
                 print("6. ⚙️ Управление системой")
             
             print("7. 👤 Сменить пользователя")
@@ -124,15 +176,16 @@ class MedicalClinicApp:
                 self.export_menu()
             elif choice == '3':
                 self.backup_menu()
-            elif choice == '4' and self.current_user['role'] in ['admin', 'registrar']:
+            elif choice == '4' and self.auth_manager.can('manage_appointments'):
                 self.appointment_management_menu()
-            elif choice == '5' and self.current_user['role'] in ['admin', 'doctor']:
+            elif choice == '5' and self.auth_manager.can('manage_medical_records'):
                 self.medical_records_menu()
-            elif choice == '6' and self.current_user['role'] == 'admin':
+            elif choice == '6' and self.auth_manager.can('manage_system'):
                 self.system_management_menu()
             elif choice == '7':
                 if self.auth_manager.logout():
                     self.current_user = None
+                    self._reset_session()
                     print("Выход выполнен успешно")
                     input("Нажмите Enter для продолжения...")
                     return True  # Вернуться к меню входа
@@ -154,6 +207,7 @@ class MedicalClinicApp:
             print("3. 🩺 Список врачей")
             print("4. 📋 Мои записи на прием")
             print("5. 📊 Статистика клиники")
+            print("6. 🔎 Поиск пациента")
             print("0. ↩️ Назад")
             
             choice = input("\nВыберите действие: ").strip()
@@ -168,6 +222,8 @@ class MedicalClinicApp:
                 self.view_my_appointments()
             elif choice == '5':
                 self.view_statistics()
+            elif choice == '6':
+                self.search_patient()
             elif choice == '0':
                 break
             else:
@@ -220,33 +276,131 @@ class MedicalClinicApp:
         
         input("\nНажмите Enter для продолжения...")
     
-    def view_patients(self):
-        """Просмотр списка пациентов"""
-        self.print_header("СПИСОК ПАЦИЕНТОВ")
+    def browse_pages(self, title, paginator, header, format_row, empty_message):
+        """Постраничный просмотр списка с переходом вперед и назад
         
-        try:
-            patients = self.session.query(Patient).order_by(Patient.last_name, Patient.first_name).all()
+        Загружается только видимая страница: переход выполняется по курсору
+        на столбцы сортировки, поэтому скорость не зависит от размера таблицы.
+        """
+        after = before = None
+        page_number = 1
+        
+        while True:
+            self.print_header(title)
+            try:
+                page = paginator.page(self.session, self.page_size, after=after, before=before)
+            except Exception as e:
+                print(f"Ошибка при получении данных: {e}")
+                input("\nНажмите Enter для продолжения...")
+                return
             
-            if not patients:
-                print("Пациенты не найдены.")
+            if not page['items']:
+                print(empty_message)
                 input("\nНажмите Enter для продолжения...")
                 return
             
-            print(f"{'ID':<5} {'ФИО':<30} {'Дата рождения':<15} {'Телефон':<15} {'Email':<20}")
+            print(header)
             print("-" * 90)
-            
-            for patient in patients:
-                print(f"{patient.id:<5} {patient.full_name:<30} "
-                      f"{patient.birth_date.strftime('%d.%m.%Y') if patient.birth_date else '':<15} "
-                      f"{patient.phone or '':<15} {patient.email or '':<20}")
-            
-            print(f"\nВсего пациентов: {len(patients)}")
+            for row in page['items']:
+                print(format_row(row))
+            
+            print(f"\nСтраница {page_number}, строк на странице: {self.page_size}")
+            commands = []
+            if page['next']:
+                commands.append("[n] следующая")
+            if page['prev']:
+                commands.append("[p] предыдущая")
+            commands.extend(["[s] размер страницы", "[Enter] назад"])
+            choice = input(", ".join(commands) + ": ").strip().lower()
+            
+            if choice == 'n' and page['next']:
+                after, before = page['next'], None
+                page_number += 1
+            elif choice == 'p' and page['prev']:
+                after, before = None, page['prev']
+                page_number -= 1
+            elif choice == 's':
+                try:
+                    size = int(input("Строк на странице (5-200): ").strip())
+                    self.page_size = max(5, min(size, 200))
+                except ValueError:
+                    print("Неверное число!")
+                    input("Нажмите Enter для продолжения...")
+                # Курсор не меняется: страница перечитывается от той же границы
+            elif choice == '':
+                return
+    
+    def view_patients(self):
+        """Просмотр списка пациентов"""
+        query = select(
+            Patient.id, Patient.last_name, Patient.first_name, Patient.patronymic,
+            Patient.birth_date, Patient.phone, Patient.email
+        )
+        paginator = KeysetPaginator(query, [Patient.last_name, Patient.first_name, Patient.id])
+        
+        def format_row(row):
+            full_name = f"{row.last_name} {row.first_name} {row.patronymic or ''}".strip()
+            return (f"{row.id:<5} {full_name:<30} "
+                    f"{row.birth_date.strftime('%d.%m.%Y') if row.birth_date else '':<15} "
+                    f"{row.phone or '':<15} {row.email or '':<20}")
+        
+        self.browse_pages(
+            "СПИСОК ПАЦИЕНТОВ", paginator,
+            f"{'ID':<5} {'ФИО':<30} {'Дата рождения':<15} {'Телефон':<15} {'Email':<20}",
+            format_row, "Пациенты не найдены."
+        )
+    
+    def print_patient_search_results(self, results):
+        """Печать результатов поиска пациентов"""
+        match_names = {
+            'name': 'ФИО', 'similar': 'похожая фамилия', 'phone': 'телефон',
+            'passport': 'паспорт', 'email': 'email'
+        }
+        print(f"{'ID':<5} {'ФИО':<30} {'Дата рождения':<15} {'Телефон':<20} {'Найден по':<15}")
+        print("-" * 90)
+        for patient in results:
+            birth_date = date.fromisoformat(patient['birth_date']).strftime('%d.%m.%Y') if patient['birth_date'] else ''
+            print(f"{patient['id']:<5} {patient['full_name']:<30} {birth_date:<15} "
+                  f"{patient['phone'] or '':<20} {match_names.get(patient['match'], ''):<15}")
+    
+    def search_patient(self):
+        """Поиск пациента по ФИО, телефону, паспорту или email"""
+        self.print_header("ПОИСК ПАЦИЕНТА")
         
+        text = input("ФИО, телефон, серия и номер паспорта или email: ").strip()
+        try:
+            results = search_patients(self.session, text)
+            if results:
+                print()
+                self.print_patient_search_results(results)
+                print(f"\nНайдено пациентов: {len(results)}")
+            else:
+                print("Пациенты не найдены.")
         except Exception as e:
-            print(f"Ошибка при получении пациентов: {e}")
+            print(f"Ошибка поиска пациентов: {e}")
         
         input("\nНажмите Enter для продолжения...")
     
+    def choose_patient(self):
+        """Выбор пациента по ID или поиском; возвращает ID или None"""
+        text = input("ID пациента или строка поиска (ФИО, телефон, паспорт, email): ").strip()
+        if text.isdigit() and len(text) < 4:
+            return int(text)
+        
+        results = search_patients(self.session, text, limit=10)
+        if not results:
+            if text.isdigit():
+                return int(text)
+            print("Пациенты не найдены!")
+            return None
+        if len(results) == 1:
+            print(f"Пациент: {results[0]['full_name']} (ID {results[0]['id']})")
+            return results[0]['id']
+        
+        self.print_patient_search_results(results)
+        choice = input("\nID пациента из списка: ").strip()
+        return int(choice) if choice.isdigit() else None
+    
     def view_doctors(self):
         """Просмотр списка врачей"""
         self.print_header("СПИСОК ВРАЧЕЙ")
@@ -281,47 +435,44 @@ class MedicalClinicApp:
     
     def view_my_appointments(self):
         """Просмотр своих записей на прием"""
-        self.print_header("МОИ ЗАПИСИ НА ПРИЕМ")
-        
-        try:
-            if self.current_user['role'] == 'patient' and 'patient_id' in self.current_user:
-                # Для пациентов - показываем их записи
-                appointments = self.session.query(Appointment).filter(
-                    Appointment.patient_id == self.current_user['patient_id']
-                ).order_by(Appointment.appointment_date.desc()).all()
-            elif self.current_user['role'] == 'doctor' and 'employee_id' in self.current_user:
-                # Для врачей - показываем записи к ним
-                appointments = self.session.query(Appointment).filter(
-                    Appointment.doctor_id == self.current_user['employee_id']
-                ).order_by(Appointment.appointment_date.desc()).all()
-            else:
-                # Для остальных - показываем все записи
-                appointments = self.session.query(Appointment).order_by(Appointment.appointment_date.desc()).limit(20).all()
-            
-            if not appointments:
-                print("Записи на прием не найдены.")
-                input("\nНажмите Enter для продолжения...")
-                return
-            
-            print(f"{'ID':<5} {'Дата':<12} {'Время':<8} {'Пациент':<25} {'Врач':<25} {'Статус':<15}")
-            print("-" * 90)
-            
-            for appt in appointments:
-                patient_name = appt.patient.full_name if appt.patient else "Не указан"
-                doctor_name = appt.doctor.full_name if appt.doctor else "Не указан"
-                status = appt.status.value if appt.status else "Не указан"
-                
-                print(f"{appt.id:<5} "
-                      f"{appt.appointment_date.strftime('%d.%m.%Y') if appt.appointment_date else '':<12} "
-                      f"{str(appt.appointment_time) if appt.appointment_time else '':<8} "
-                      f"{patient_name:<25} {doctor_name:<25} {status:<15}")
-            
-            print(f"\nВсего записей: {len(appointments)}")
-        
-        except Exception as e:
-            print(f"Ошибка при получении записей: {e}")
-        
-        input("\nНажмите Enter для продолжения...")
+        query = (
+            select(
+                Appointment.id, Appointment.appointment_date, Appointment.appointment_time,
+                Appointment.status,
+                Patient.last_name.label('patient_last_name'),
+                Patient.first_name.label('patient_first_name'),
+                Patient.patronymic.label('patient_patronymic'),
+                Employee.last_name.label('doctor_last_name'),
+                Employee.first_name.label('doctor_first_name'),
+                Employee.patronymic.label('doctor_patronymic'),
+            )
+            .outerjoin(Patient, Patient.id == Appointment.patient_id)
+            .outerjoin(Employee, Employee.id == Appointment.doctor_id)
+        )
+        # Пациент и врач видят только свои записи: условие добавляет AccessPolicy.
+        # Новые записи первыми.
+        paginator = KeysetPaginator(
+            query,
+            [Appointment.appointment_date, Appointment.appointment_time, Appointment.id],
+            descending=True
+        )
+        
+        def format_row(row):
+            patient_name = (f"{row.patient_last_name} {row.patient_first_name} "
+                            f"{row.patient_patronymic or ''}".strip() if row.patient_last_name else "Не указан")
+            doctor_name = (f"{row.doctor_last_name} {row.doctor_first_name} "
+                           f"{row.doctor_patronymic or ''}".strip() if row.doctor_last_name else "Не указан")
+            status = row.status.value if row.status else "Не указан"
+            return (f"{row.id:<5} "
+                    f"{row.appointment_date.strftime('%d.%m.%Y') if row.appointment_date else '':<12} "
+                    f"{str(row.appointment_time) if row.appointment_time else '':<8} "
+                    f"{patient_name:<25} {doctor_name:<25} {status:<15}")
+        
+        self.browse_pages(
+            "МОИ ЗАПИСИ НА ПРИЕМ", paginator,
+            f"{'ID':<5} {'Дата':<12} {'Время':<8} {'Пациент':<25} {'Врач':<25} {'Статус':<15}",
+            format_row, "Записи на прием не найдены."
+        )
     
     def view_statistics(self):
         """Просмотр статистики клиники"""
@@ -600,6 +751,7 @@ class MedicalClinicApp:
             print("2. 📋 Список резервных копий")
             print("3. 🔄 Восстановить из резервной копии")
             print("4. ⏰ Настроить автоматическое копирование")
+            print("5. ✅ Проверить резервные копии")
             print("0. ↩️ Назад")
             
             choice = input("\nВыберите действие: ").strip()
@@ -612,6 +764,8 @@ class MedicalClinicApp:
                 self.restore_backup()
             elif choice == '4':
                 self.schedule_backup()
+            elif choice == '5':
+                self.verify_backups()
             elif choice == '0':
                 break
             else:
@@ -624,8 +778,8 @@ class MedicalClinicApp:
         
         print("\nТип резервного копирования:")
         print("1. 💻 Локальное (на этот компьютер)")
-        print("2. 🌐 Удаленное (имитация)")
-        print("3. ☁️ Облачное (имитация)")
+        print("2. 🌐 Удаленное (сетевой каталог)")
+        print("3. ☁️ Облачное (S3)")
         
         choice = input("\nВыберите тип: ").strip()
         
@@ -634,6 +788,10 @@ class MedicalClinicApp:
             backup_type = 'local'
         elif choice == '2':
             backup_type = 'remote'
+            if not self.backup_manager.remote_backup_dir:
+                remote_dir = input("Каталог для удаленных копий: ").strip()
+                if remote_dir:
+                    self.backup_manager.remote_backup_dir = Path(remote_dir)
         elif choice == '3':
             backup_type = 'cloud'
         else:
@@ -667,6 +825,33 @@ class MedicalClinicApp:
         
         input("\nНажмите Enter для продолжения...")
     
+    def verify_backups(self):
+        """Проверка резервных копий"""
+        self.print_header("ПРОВЕРКА РЕЗЕРВНЫХ КОПИЙ")
+        
+        try:
+            sample = input("Сколько копий проверить полностью (по умолчанию 1): ").strip()
+            sample_size = int(sample) if sample else 1
+            
+            print("\nПроверка...")
+            success, message, results = self.backup_manager.verify_backups(sample_size)
+            
+            for result in results:
+                status = "✓" if result['ok'] else "✗"
+                mode = "полная" if result.get('deep_checked') else "быстрая"
+                print(f"{status} {result['filename']:<30} ({mode})")
+                for error in result['errors']:
+                    print(f"   {error}")
+            
+            print(f"\n{'✓' if success else '✗'} {message}")
+        
+        except ValueError:
+            print("Неверный ввод!")
+        except Exception as e:
+            print(f"Ошибка проверки: {e}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
     def restore_backup(self):
         """Восстановление из резервной копии"""
         self.print_header("ВОССТАНОВЛЕНИЕ ИЗ РЕЗЕРВНОЙ КОПИИ")
@@ -693,6 +878,9 @@ class MedicalClinicApp:
                 confirm = input(f"\nВосстановить из {backups[index]['filename']}? (д/н): ").lower()
                 
                 if confirm == 'д':
+                    # Открытая транзакция сессии и соединения пула мешают записи в базу
+                    self.session.rollback()
+                    self.db_manager.engine.dispose()
                     success, message = self.backup_manager.restore_backup(backups[index]['filename'])
                     
                     if success:
@@ -721,15 +909,18 @@ class MedicalClinicApp:
         try:
             interval = input("Интервал (часы, по умолчанию 24): ").strip()
             interval_hours = int(interval) if interval else 24
+            start = input("Время первого запуска (ЧЧ:ММ, Enter - через интервал): ").strip()
+            start_time = datetime.strptime(start, "%H:%M").time() if start else None
             
             print("\nТип копирования:")
             print("1. 💻 Локальное")
-            print("2. 🌐 Удаленное (имитация)")
+            print("2. 🌐 Удаленное (сетевой каталог)")
+            print("3. ☁️ Облачное (S3)")
             
             type_choice = input("Выберите тип: ").strip()
-            backup_type = 'local' if type_choice == '1' else 'remote'
+            backup_type = {'1': 'local', '2': 'remote', '3': 'cloud'}.get(type_choice, 'local')
             
-            success, message = self.backup_manager.schedule_backup(interval_hours, backup_type)
+            success, message = self.backup_manager.schedule_backup(interval_hours, backup_type, start_time)
             
             if success:
                 print(f"\n✓ {message}")
@@ -737,7 +928,7 @@ class MedicalClinicApp:
                 print(f"\n✗ {message}")
         
         except ValueError:
-            print("Неверный формат интервала!")
+            print("Неверный формат интервала или времени!")
         except Exception as e:
             print(f"Ошибка настройки: {e}")
         
@@ -753,6 +944,10 @@ class MedicalClinicApp:
             print("2. ✏️ Изменить запись")
             print("3. ❌ Отменить запись")
             print("4. 🔍 Поиск записей")
+            print("5. ⏱️ Ближайшее свободное время")
+            print("6. 🔁 Перенос записей недоступного врача")
+            print("7. 📋 Лист ожидания")
+            print("8. 📥 Импорт записей из файла")
             print("0. ↩️ Назад")
             
             choice = input("\nВыберите действие: ").strip()
@@ -765,6 +960,14 @@ class MedicalClinicApp:
                 self.cancel_appointment()
             elif choice == '4':
                 self.search_appointments()
+            elif choice == '5':
+                self.find_free_slot()
+            elif choice == '6':
+                self.reschedule_doctor_appointments()
+            elif choice == '7':
+                self.waitlist_menu()
+            elif choice == '8':
+                self.import_appointments()
             elif choice == '0':
                 break
             else:
@@ -777,7 +980,10 @@ class MedicalClinicApp:
         
         try:
             # Запрос данных
-            patient_id = input("ID пациента: ").strip()
+            patient_id = self.choose_patient()
+            if patient_id is None:
+                input("\nНажмите Enter для продолжения...")
+                return
             doctor_id = input("ID врача: ").strip()
             appointment_date = input("Дата приема (ГГГГ-ММ-ДД): ").strip()
             appointment_time = input("Время приема (ЧЧ:ММ): ").strip()
@@ -797,36 +1003,21 @@ class MedicalClinicApp:
                 input("\nНажмите Enter для продолжения...")
                 return
             
-            # Создание записи
-            new_appointment = Appointment(
-                patient_id=int(patient_id),
-                doctor_id=int(doctor_id),
-                appointment_date=datetime.strptime(appointment_date, "%Y-%m-%d").date(),
-                appointment_time=datetime.strptime(appointment_time, "%H:%M").time(),
-                reason=reason,
-                status=AppointmentStatus.SCHEDULED,
-                created_at=datetime.now()
+            # Проверка свободного места и вставка выполняются атомарно
+            success, message, appointment_id = book_appointment(
+                self.session,
+                int(patient_id),
+                int(doctor_id),
+                datetime.strptime(appointment_date, "%Y-%m-%d").date(),
+                datetime.strptime(appointment_time, "%H:%M").time(),
+                reason
             )
             
-            # Поиск подходящего расписания
-            schedule = self.session.query(Schedule).filter(
-                Schedule.employee_id == int(doctor_id),
-                Schedule.work_date == new_appointment.appointment_date,
-                Schedule.start_time <= new_appointment.appointment_time,
-                Schedule.end_time > new_appointment.appointment_time,
-                Schedule.available_slots > 0
-            ).first()
-            
-            if schedule:
-                new_appointment.schedule_id = schedule.id
-                
-                self.session.add(new_appointment)
-                self.session.commit()
-                
-                print(f"\n✓ Запись создана успешно!")
-                print(f"ID записи: {new_appointment.id}")
+            if success:
+                print(f"\n✓ {message}")
+                print(f"ID записи: {appointment_id}")
             else:
-                print("\n✗ Нет свободных слотов в расписании на выбранное время!")
+                print(f"\n✗ {message}")
         
         except ValueError as e:
             print(f"Ошибка ввода данных: {e}")
@@ -836,6 +1027,228 @@ class MedicalClinicApp:
         
         input("\nНажмите Enter для продолжения...")
     
+    def find_free_slot(self):
+        """Поиск ближайшего свободного времени по специализации или врачу и запись"""
+        self.print_header("БЛИЖАЙШЕЕ СВОБОДНОЕ ВРЕМЯ")
+        
+        try:
+            for specialization in self.session.query(Specialization).order_by(Specialization.id).all():
+                print(f"{specialization.id}. {specialization.name}")
+            specialization_id = input("\nID специализации (Enter - любая): ").strip()
+            doctor_id = input("ID врача (Enter - любой): ").strip()
+            within_days = input("Искать в пределах дней [14]: ").strip()
+            
+            slots = self.slot_finder.find(
+                specialization_id=int(specialization_id) if specialization_id else None,
+                doctor_id=int(doctor_id) if doctor_id else None,
+                within_days=int(within_days) if within_days else 14,
+                limit=10
+            )
+            if not slots:
+                print("\nСвободного времени не найдено.")
+                input("\nНажмите Enter для продолжения...")
+                return
+            
+            doctors = {
+                doctor.id: doctor.full_name
+                for doctor in self.session.query(Employee).filter(
+                    Employee.id.in_({slot['doctor_id'] for slot in slots})
+                )
+            }
+            print(f"\n{'№':<4} {'Дата':<12} {'Время':<13} {'Врач':<35} {'Каб.':<6} {'Мест':<5}")
+            print("-" * 80)
+            for number, slot in enumerate(slots, 1):
+                print(f"{number:<4} {slot['work_date'].strftime('%d.%m.%Y'):<12} "
+                      f"{slot['start_time'].strftime('%H:%M')}-{slot['end_time'].strftime('%H:%M'):<7} "
+                      f"{doctors.get(slot['doctor_id'], ''):<35} {slot['cabinet_number'] or '':<6} "
+                      f"{slot['free_places']:<5}")
+            
+            choice = input("\nНомер слота для записи (Enter - не записывать): ").strip()
+            if not choice:
+                return
+            slot = slots[int(choice) - 1]
+            patient_id = self.choose_patient()
+            if patient_id is None:
+                input("\nНажмите Enter для продолжения...")
+                return
+            reason = input("Причина приема: ").strip()
+            
+            success, message, appointment_id = book_appointment(
+                self.session, patient_id, slot['doctor_id'],
+                slot['work_date'], slot['start_time'], reason
+            )
+            if success:
+                print(f"\n✓ {message}")
+                print(f"ID записи: {appointment_id}")
+            else:
+                print(f"\n✗ {message}")
+        
+        except (ValueError, IndexError):
+            print("Ошибка ввода данных!")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def reschedule_doctor_appointments(self):
+        """Перенос всех записей врача за период к врачам той же специализации"""
+        self.print_header("ПЕРЕНОС ЗАПИСЕЙ ВРАЧА")
+        
+        try:
+            doctor_id = int(input("ID недоступного врача: ").strip())
+            date_from = datetime.strptime(input("Дата начала (ГГГГ-ММ-ДД): ").strip(), "%Y-%m-%d").date()
+            date_to = input("Дата окончания (ГГГГ-ММ-ДД, Enter - тот же день): ").strip()
+            date_to = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else date_from
+            
+            rescheduler = AppointmentRescheduler(self.session)
+            success, message, plan = rescheduler.run(doctor_id, date_from, date_to, apply=False)
+            print(f"\n{'✓' if success else '✗'} {message}")
+            if not success or not plan['assignments']:
+                input("\nНажмите Enter для продолжения...")
+                return
+            
+            doctor_ids = {item['new']['doctor_id'] for item in plan['assignments']}
+            doctors = {
+                doctor.id: doctor.full_name
+                for doctor in self.session.query(Employee).filter(Employee.id.in_(doctor_ids))
+            }
+            print(f"\n{'Запись':<8} {'Было':<18} {'Стало':<18} {'Врач':<35}")
+            print("-" * 80)
+            for item in plan['assignments'][:30]:
+                old, new = item['old'], item['new']
+                print(f"{item['appointment_id']:<8} {old['date'].strftime('%d.%m.%Y')} {old['time'].strftime('%H:%M'):<7} "
+                      f"{new['date'].strftime('%d.%m.%Y')} {new['time'].strftime('%H:%M'):<7} "
+                      f"{doctors.get(new['doctor_id'], ''):<35}")
+            if len(plan['assignments']) > 30:
+                print(f"... и еще: {len(plan['assignments']) - 30}")
+            for item in plan['unassigned']:
+                print(f"Запись {item['appointment_id']}: свободного слота не найдено")
+            
+            confirm = input("\nПрименить перенос? (д/н): ").strip().lower()
+            if confirm == 'д':
+                success, message = rescheduler.apply(plan)
+                print(f"\n{'✓' if success else '✗'} {message}")
+            else:
+                print("Перенос не выполнен.")
+        
+        except ValueError as e:
+            print(f"Ошибка ввода данных: {e}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def import_appointments(self):
+        """Импорт записей на прием из файла внешнего канала записи"""
+        self.print_header("ИМПОРТ ЗАПИСЕЙ НА ПРИЕМ")
+        
+        print("Столбцы файла: пациент (id пациента, Паспорт или Телефон с датой рождения),")
+        print("врач (id врача или Врач - ФИО), Дата приема, Время приема, Причина")
+        path = input("\nПуть к файлу: ").strip().strip('"')
+        if path:
+            # Импорт использует pandas: модуль загружается только при первом импорте
+            from appointment_import import AppointmentImporter
+            success, message, report = AppointmentImporter(self.db_manager.engine).import_file(path)
+            print(f"\n{'✓' if success else '✗'} {message}")
+            if report:
+                for reason, count in sorted(report['reasons'].items(), key=lambda item: -item[1]):
+                    print(f"  {reason}: {count}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def waitlist_menu(self):
+        """Лист ожидания: просмотр, добавление и снятие заявок"""
+        while True:
+            self.print_header("ЛИСТ ОЖИДАНИЯ")
+            
+            entries = self.session.query(WaitlistEntry).filter(
+                WaitlistEntry.status == WaitlistStatus.WAITING
+            ).order_by(WaitlistEntry.priority.desc(), WaitlistEntry.created_at).limit(20).all()
+            if entries:
+                print(f"{'ID':<6} {'Пациент':<30} {'Врач / специализация':<30} {'Период':<24} {'Пр.':<4}")
+                print("-" * 96)
+                for entry in entries:
+                    target = entry.doctor.full_name if entry.doctor else (entry.specialization.name if entry.specialization else '')
+                    period = f"{entry.date_from.strftime('%d.%m.%Y')}-{entry.date_to.strftime('%d.%m.%Y')}"
+                    print(f"{entry.id:<6} {entry.patient.full_name[:29]:<30} {target[:29]:<30} {period:<24} {entry.priority:<4}")
+            else:
+                print("Ожидающих заявок нет.")
+            
+            print("\nДоступные действия:")
+            print("1. ➕ Добавить заявку")
+            print("2. ❌ Снять заявку")
+            print("0. ↩️ Назад")
+            
+            choice = input("\nВыберите действие: ").strip()
+            
+            if choice == '1':
+                self.add_waitlist_entry()
+            elif choice == '2':
+                try:
+                    success, message = self.waitlist.cancel_entry(int(input("ID заявки: ").strip()))
+                    print(f"\n{'✓' if success else '✗'} {message}")
+                except ValueError:
+                    print("Неверный формат ID!")
+                input("\nНажмите Enter для продолжения...")
+            elif choice == '0':
+                break
+            else:
+                print("Неверный выбор!")
+                input("Нажмите Enter для продолжения...")
+    
+    def add_waitlist_entry(self):
+        """Постановка пациента в лист ожидания"""
+        try:
+            patient_id = self.choose_patient()
+            if patient_id is None:
+                input("\nНажмите Enter для продолжения...")
+                return
+            doctor_id = input("ID врача (Enter - любой врач специализации): ").strip()
+            specialization_id = None
+            if not doctor_id:
+                for specialization in self.session.query(Specialization).order_by(Specialization.id).all():
+                    print(f"{specialization.id}. {specialization.name}")
+                specialization_id = int(input("ID специализации: ").strip())
+            date_from = datetime.strptime(input("Ожидать с (ГГГГ-ММ-ДД): ").strip(), "%Y-%m-%d").date()
+            date_to = datetime.strptime(input("Ожидать по (ГГГГ-ММ-ДД): ").strip(), "%Y-%m-%d").date()
+            time_from = input("Время приема с (ЧЧ:ММ, Enter - любое): ").strip()
+            time_to = input("Время приема до (ЧЧ:ММ, Enter - любое): ").strip()
+            priority = input("Приоритет (0 - обычный, больше - срочнее) [0]: ").strip()
+            notes = input("Причина приема: ").strip()
+            
+            success, message, entry_id = self.waitlist.add_entry(
+                patient_id, date_from, date_to,
+                doctor_id=int(doctor_id) if doctor_id else None,
+                specialization_id=specialization_id,
+                time_from=datetime.strptime(time_from, "%H:%M").time() if time_from else None,
+                time_to=datetime.strptime(time_to, "%H:%M").time() if time_to else None,
+                priority=int(priority) if priority else 0,
+                notes=notes or None
+            )
+            print(f"\n{'✓' if success else '✗'} {message}")
+            if success:
+                print(f"ID заявки: {entry_id}")
+        
+        except ValueError as e:
+            print(f"Ошибка ввода данных: {e}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def cancel_appointment(self):
+        """Отмена записи на прием"""
+        self.print_header("ОТМЕНА ЗАПИСИ")
+        
+        try:
+            appointment_id = int(input("ID записи: ").strip())
+            confirm = input(f"Отменить запись #{appointment_id}? (д/н): ").lower()
+            
+            if confirm == 'д':
+                success, message = cancel_appointment(self.session, appointment_id)
+                print(f"\n{'✓' if success else '✗'} {message}")
+            else:
+                print("Отмена не выполнена.")
+        
+        except ValueError:
+            print("Неверный формат ID!")
+        
+        input("\nНажмите Enter для продолжения...")
+    
     def medical_records_menu(self):
         """Меню управления медицинскими записями"""
         while True:
@@ -845,6 +1258,8 @@ class MedicalClinicApp:
             print("1. 📖 Просмотр медицинских записей")
             print("2. ✍️ Создать медицинскую запись")
             print("3. 💊 Добавить назначение")
+            print("4. 💉 Текущие назначения пациента")
+            print("5. 🗄️ Полная история пациента (с архивом)")
             print("0. ↩️ Назад")
             
             choice = input("\nВыберите действие: ").strip()
@@ -855,12 +1270,58 @@ class MedicalClinicApp:
                 self.create_medical_record()
             elif choice == '3':
                 self.add_prescription()
+            elif choice == '4':
+                self.view_current_medications()
+            elif choice == '5':
+                self.view_patient_history()
             elif choice == '0':
                 break
             else:
                 print("Неверный выбор!")
                 input("Нажмите Enter для продолжения...")
     
+    def view_current_medications(self):
+        """Действующие назначения пациента на сегодня"""
+        self.print_header("ТЕКУЩИЕ НАЗНАЧЕНИЯ ПАЦИЕНТА")
+        
+        patient_id = self.choose_patient()
+        if patient_id is not None:
+            medications = current_medications(self.session, patient_id)
+            if not medications:
+                print("\nДействующих назначений нет")
+            else:
+                print(f"\n{'Препарат':<25} {'Дозировка':<12} {'Прием':<16} {'С':<11} {'По':<11} {'Врач':<20}")
+                print("-" * 100)
+                for row in medications:
+                    print(f"{row.medication_name:<25} {row.dosage or '':<12} {row.frequency or '':<16} "
+                          f"{row.start_date.strftime('%d.%m.%Y') if row.start_date else '':<11} "
+                          f"{row.end_date.strftime('%d.%m.%Y') if row.end_date else 'бессрочно':<11} "
+                          f"{row.doctor_last_name} {row.doctor_first_name[:1]}.")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def view_patient_history(self):
+        """История медицинских записей пациента вместе с архивами прошлых лет"""
+        self.print_header("ПОЛНАЯ ИСТОРИЯ ПАЦИЕНТА")
+        
+        patient_id = self.choose_patient()
+        if patient_id is not None:
+            history = ArchiveManager(self.db_manager.engine).patient_history(
+                patient_id, self.access_policy.current_principal(self.session)
+            )
+            if not history:
+                print("\nМедицинских записей нет")
+            else:
+                print(f"\n{'Дата':<12} {'Врач':<22} {'Диагноз':<30} {'Архив':<6}")
+                print("-" * 75)
+                for row in history:
+                    diagnosis = f"{row.diagnosis_code} {row.diagnosis_name}" if row.diagnosis_code else ''
+                    print(f"{row.record_date.strftime('%d.%m.%Y') if row.record_date else '':<12} "
+                          f"{row.doctor_last_name + ' ' + row.doctor_first_name[:1] + '.':<22} "
+                          f"{diagnosis[:30]:<30} {row.archive_year or '':<6}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
     def system_management_menu(self):
         """Меню управления системой (только для администраторов)"""
         while True:
@@ -871,6 +1332,12 @@ class MedicalClinicApp:
             print("2. 🗃️ Управление справочниками")
             print("3. 🧹 Очистка базы данных")
             print("4. 🔄 Пересоздать тестовые данные")
+            print("5. 🧬 Дубликаты карт пациентов")
+            print("6. 📐 Конфликты в расписании")
+            print("7. 📥 Импорт пациентов из CSV/XLSX")
+            print("8. 🗄️ Перенос записей прошлых лет в архив")
+            print("9. 📊 Статистика SQL-запросов")
+            print("10. ⏱️ Профилирование действий")
             print("0. ↩️ Назад")
             
             choice = input("\nВыберите действие: ").strip()
@@ -883,12 +1350,221 @@ class MedicalClinicApp:
                 self.clean_database()
             elif choice == '4':
                 self.recreate_test_data()
+            elif choice == '5':
+                self.deduplicate_patients()
+            elif choice == '6':
+                self.check_schedule_conflicts()
+            elif choice == '7':
+                self.import_patients()
+            elif choice == '8':
+                self.archive_old_records()
+            elif choice == '9':
+                self.query_stats_menu()
+            elif choice == '10':
+                self.profiling_menu()
             elif choice == '0':
                 break
             else:
                 print("Неверный выбор!")
                 input("Нажмите Enter для продолжения...")
     
+    def deduplicate_patients(self):
+        """Поиск и объединение дубликатов карт пациентов"""
+        self.print_header("ДУБЛИКАТЫ КАРТ ПАЦИЕНТОВ")
+        
+        print("Поиск дубликатов...")
+        deduplicator = PatientDeduplicator(self.session)
+        success, message, report = deduplicator.run(merge=False)
+        print(f"\n{'✓' if success else '✗'} {message}")
+        if not success:
+            input("\nНажмите Enter для продолжения...")
+            return
+        
+        for group in report['groups'][:20]:
+            patients = self.session.query(Patient).filter(Patient.id.in_(group)).all()
+            names = {patient.id: f"{patient.full_name} ({patient.birth_date.strftime('%d.%m.%Y')})" for patient in patients}
+            print(f"\nОсновная карта {group[0]}: {names.get(group[0], '')}")
+            for patient_id in group[1:]:
+                print(f"  дубликат {patient_id}: {names.get(patient_id, '')}")
+        if len(report['groups']) > 20:
+            print(f"\n... и еще групп: {len(report['groups']) - 20}")
+        if report['review']:
+            print(f"\nПары для ручной проверки ({len(report['review'])}) сохранены в отчет: {report['report_path']}")
+        
+        if report['groups']:
+            choice = input("\nОбъединить найденные группы? (д/н): ").strip().lower()
+            if choice == 'д':
+                merged = 0
+                for group in report['groups']:
+                    ok, merge_message = deduplicator.merge_patients(group[0], group[1:])
+                    if ok:
+                        merged += len(group) - 1
+                    else:
+                        print(f"✗ {merge_message}")
+                print(f"\n✓ Объединено карт: {merged}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def import_patients(self):
+        """Импорт реестра пациентов из файла CSV/XLSX"""
+        self.print_header("ИМПОРТ ПАЦИЕНТОВ")
+        
+        print("Столбцы файла: Фамилия, Имя, Отчество, Дата рождения, Пол, Телефон, Адрес,")
+        print("Серия паспорта, Номер паспорта, Email (или названия полей на английском)")
+        path = input("\nПуть к файлу: ").strip().strip('"')
+        if path:
+            from patient_import import PatientImporter
+            importer = PatientImporter(self.db_manager.engine)
+            success, message, _ = importer.import_file(path)
+            print(f"\n{'✓' if success else '✗'} {message}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def clean_database(self):
+        """Удаление и обезличивание устаревших данных по правилам хранения"""
+        self.print_header("ОЧИСТКА БАЗЫ ДАННЫХ")
+        
+        print("Правила хранения:")
+        for rule in DEFAULT_RULES:
+            print(f"  - {rule.description}")
+        confirm = input("\nВыполнить очистку? (д/н): ").strip().lower()
+        if confirm == 'д':
+            # Очистка идет короткими пачками и не мешает работе других пользователей
+            success, message, _ = MaintenanceEngine(self.db_manager.engine).run()
+            print(f"\n{'✓' if success else '✗'} {message}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def query_stats_menu(self):
+        """Сбор статистики SQL-запросов и журнал медленных запросов"""
+        stats = self.db_manager.query_stats
+        while True:
+            self.print_header("СТАТИСТИКА SQL-ЗАПРОСОВ")
+            
+            state = f"включен, выборка {stats.sample_rate:.0%}" if stats.enabled else "выключен"
+            print(f"Сбор статистики: {state}; порог медленного запроса {stats.slow_ms:g} мс")
+            print("\nДоступные действия:")
+            print("1. ▶️ Включить сбор")
+            print("2. ⏹️ Выключить сбор")
+            print("3. 📋 Показать отчет")
+            print("4. 💾 Сохранить в файл")
+            print("5. 🧹 Сбросить статистику")
+            print("0. ↩️ Назад")
+            
+            choice = input("\nВыберите действие: ").strip()
+            
+            try:
+                if choice == '1':
+                    rate = input("Доля замеряемых запросов, % (Enter - 100): ").strip()
+                    slow_ms = input(f"Порог медленного запроса, мс (Enter - {stats.slow_ms:g}): ").strip()
+                    self.db_manager.enable_query_stats(float(rate) / 100 if rate else 1.0,
+                                                       float(slow_ms) if slow_ms else None)
+                elif choice == '2':
+                    self.db_manager.disable_query_stats()
+                elif choice == '3':
+                    print("\n" + stats.report())
+                    input("\nНажмите Enter для продолжения...")
+                elif choice == '4':
+                    print(f"\n✓ Статистика сохранена в {stats.dump()}")
+                    input("\nНажмите Enter для продолжения...")
+                elif choice == '5':
+                    stats.reset()
+                elif choice == '0':
+                    break
+                else:
+                    print("Неверный выбор!")
+                    input("Нажмите Enter для продолжения...")
+            except ValueError as e:
+                print(f"Ошибка ввода данных: {e}")
+                input("Нажмите Enter для продолжения...")
+    
+    def install_profiler(self):
+        """Замеры действий меню, экспорта и резервного копирования"""
+        self.profiler.install(self.db_manager.engine, self, self.exporter, self.backup_manager)
+    
+    def profiling_menu(self):
+        """Замеры времени, запросов и памяти по действиям приложения"""
+        profiler = self.profiler
+        while True:
+            self.print_header("ПРОФИЛИРОВАНИЕ ДЕЙСТВИЙ")
+            
+            state = {MODE_METRICS: "замеры", MODE_CAPTURE: f"замеры и профили в {profiler.report_dir}"}
+            print(f"Профилирование: {state.get(profiler.mode, 'выключено')}")
+            print("\nДоступные действия:")
+            print("1. ▶️ Включить замеры")
+            print("2. 🔬 Включить замеры и снятие профилей (cProfile, tracemalloc)")
+            print("3. ⏹️ Выключить")
+            print("4. 📋 Показать отчет")
+            print("5. 💾 Сохранить в файл")
+            print("6. 🧹 Сбросить замеры")
+            print("0. ↩️ Назад")
+            
+            choice = input("\nВыберите действие: ").strip()
+            
+            if choice in ('1', '2', '3'):
+                profiler.uninstall()
+                profiler.mode = {'1': MODE_METRICS, '2': MODE_CAPTURE}.get(choice)
+                self.install_profiler()
+            elif choice == '4':
+                print("\n" + profiler.report())
+                input("\nНажмите Enter для продолжения...")
+            elif choice == '5':
+                print(f"\n✓ Замеры сохранены в {profiler.dump()}")
+                input("\nНажмите Enter для продолжения...")
+            elif choice == '6':
+                profiler.reset()
+            elif choice == '0':
+                break
+            else:
+                print("Неверный выбор!")
+                input("Нажмите Enter для продолжения...")
+    
+    def archive_old_records(self):
+        """Перенос закрытых записей прошлых лет в годовые архивы"""
+        self.print_header("АРХИВ ЗАПИСЕЙ ПРОШЛЫХ ЛЕТ")
+        
+        try:
+            cutoff = input("Переносить записи до даты (ГГГГ-ММ-ДД, Enter - старше двух лет): ").strip()
+            cutoff = datetime.strptime(cutoff, "%Y-%m-%d").date() if cutoff else None
+            success, message, _ = ArchiveManager(self.db_manager.engine).archive(cutoff)
+            print(f"\n{'✓' if success else '✗'} {message}")
+        except ValueError as e:
+            print(f"Ошибка ввода данных: {e}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
+    def check_schedule_conflicts(self):
+        """Поиск пересекающихся слотов расписания врачей и кабинетов"""
+        self.print_header("КОНФЛИКТЫ В РАСПИСАНИИ")
+        
+        try:
+            date_from = input("Дата начала (ГГГГ-ММ-ДД, Enter - все): ").strip()
+            date_to = input("Дата окончания (ГГГГ-ММ-ДД, Enter - все): ").strip()
+            conflicts = ScheduleConflictChecker(self.session).find_conflicts(
+                datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None,
+                datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None
+            )
+            
+            if not conflicts:
+                print("\n✓ Пересечений в расписании не найдено")
+            else:
+                print(f"\n✗ Найдено конфликтов: {len(conflicts)}")
+                print(f"\n{'Тип':<10} {'Врач/каб.':<10} {'Дата':<12} {'Время':<13} {'Слоты':<15}")
+                print("-" * 65)
+                for conflict in conflicts[:50]:
+                    kind = {'doctor': 'врач', 'cabinet': 'кабинет', 'invalid': 'время'}[conflict['kind']]
+                    slots = f"{conflict['first']}, {conflict['second']}" if conflict['second'] else str(conflict['first'])
+                    print(f"{kind:<10} {str(conflict['resource']):<10} "
+                          f"{conflict['work_date'].strftime('%d.%m.%Y'):<12} "
+                          f"{conflict['start'].strftime('%H:%M')}-{conflict['end'].strftime('%H:%M'):<7} {slots:<15}")
+                if len(conflicts) > 50:
+                    print(f"\n... и еще: {len(conflicts) - 50}")
+        
+        except ValueError as e:
+            print(f"Ошибка ввода данных: {e}")
+        
+        input("\nНажмите Enter для продолжения...")
+    
     def run(self):
         """Запуск приложения"""
         try:
@@ -918,6 +1594,10 @@ class MedicalClinicApp:
         finally:
             if self.session:
                 self.db_manager.close_session(self.session)
+            self.metrics_exporter.stop()
+            self.profiler.uninstall()
+            if self.profiler.actions:
+                print(f"Замеры действий сохранены в {self.profiler.dump()}")
 
 # Точка входа в приложение
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+import argparse
+import os
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, delete, update, func, literal_column
+from models import ReminderOutbox, ReminderStatus, WaitlistEntry, WaitlistStatus
+
+# Начальный, минимальный и максимальный шаг диапазона rowid одной пачки
+DEFAULT_STEP = 5000
+MIN_STEP = 100
+MAX_STEP = 200000
+
+# Целевая длительность одной транзакции: шаг подстраивается под нее
+TARGET_BATCH_SECONDS = 0.05
+
+# Ожидание блокировки записи, выше которого пачки уменьшаются, а паузы растут
+LOCK_WAIT_THRESHOLD = 0.02
+
+# Пауза между пачками: базовая и максимальная при конкуренции за запись
+BASE_PAUSE = 0.01
+MAX_PAUSE = 2.0
+
+# Страниц, возвращаемых одним PRAGMA incremental_vacuum
+VACUUM_PAGES_PER_STEP = 2000
+
+
+class RetentionRule:
+    """Правило хранения: удаление или обезличивание строк таблицы по условию
+
+    condition - функция даты запуска, возвращающая условие WHERE;
+    values - None для удаления или словарь новых значений для обезличивания.
+    """
+
+    def __init__(self, name, description, table, condition, values=None):
+        self.name = name
+        self.description = description
+        self.table = table
+        self.condition = condition
+        self.values = values
+
+    def statement(self, today, low, high):
+        """Оператор для строк с rowid в [low, high)"""
+        rowid = literal_column('rowid')
+        where = (rowid >= low, rowid < high, self.condition(today))
+        if self.values is None:
+            return delete(self.table).where(*where)
+        return update(self.table).where(*where).values(**self.values)
+
+
+def _days_before(today, days):
+    return datetime.combine(today - timedelta(days=days), datetime.min.time())
+
+
+DEFAULT_RULES = [
+    RetentionRule(
+        'reminder_contacts', "Обезличивание адресов и текстов отправленных напоминаний старше 30 дней",
+        ReminderOutbox.__table__,
+        lambda today: (ReminderOutbox.status == ReminderStatus.SENT)
+        & (ReminderOutbox.sent_at < _days_before(today, 30)) & (ReminderOutbox.recipient != ''),
+        values={'recipient': '', 'message': ''}
+    ),
+    RetentionRule(
+        'reminders', "Удаление отправленных и неотправленных напоминаний старше 180 дней",
+        ReminderOutbox.__table__,
+        lambda today: ReminderOutbox.status.in_([ReminderStatus.SENT, ReminderStatus.FAILED])
+        & (ReminderOutbox.created_at < _days_before(today, 180))
+    ),
+    RetentionRule(
+        'waitlist', "Удаление закрытых заявок листа ожидания старше года",
+        WaitlistEntry.__table__,
+        lambda today: (WaitlistEntry.status != WaitlistStatus.WAITING)
+        & (WaitlistEntry.updated_at < _days_before(today, 365))
+    ),
+]
+
+
+class MaintenanceEngine:
+    """Пакетное удаление и обезличивание устаревших данных без долгих блокировок
+
+    Таблица проходится диапазонами rowid: каждая пачка - отдельная короткая
+    транзакция BEGIN IMMEDIATE, после которой делается пауза. Время
+    получения блокировки записи измеряется на каждой пачке: если клиника
+    активно пишет (ожидание выше LOCK_WAIT_THRESHOLD), шаг уменьшается
+    вдвое, а пауза удваивается; в тишине шаг растет, пока транзакция
+    укладывается в TARGET_BATCH_SECONDS. После правил выполняются ANALYZE
+    с ограничением выборки, PRAGMA optimize и incremental_vacuum порциями.
+    """
+
+    def __init__(self, engine, step=DEFAULT_STEP, base_pause=BASE_PAUSE,
+                 lock_wait_threshold=LOCK_WAIT_THRESHOLD, target_batch_seconds=TARGET_BATCH_SECONDS):
+        self.engine = engine
+        self.step = step
+        self.base_pause = base_pause
+        self.pause = base_pause
+        self.lock_wait_threshold = lock_wait_threshold
+        self.target_batch_seconds = target_batch_seconds
+        self.max_lock_wait = 0.0
+
+    def _throttle(self, lock_wait, batch_seconds):
+        """Подстройка шага и паузы по ожиданию блокировки и длительности пачки"""
+        self.max_lock_wait = max(self.max_lock_wait, lock_wait)
+        if lock_wait > self.lock_wait_threshold:
+            self.step = max(MIN_STEP, self.step // 2)
+            self.pause = min(MAX_PAUSE, max(self.pause, self.base_pause) * 2)
+            return
+        self.pause = max(self.base_pause, self.pause / 2)
+        if batch_seconds > self.target_batch_seconds:
+            self.step = max(MIN_STEP, self.step // 2)
+        elif batch_seconds < self.target_batch_seconds / 2:
+            self.step = min(MAX_STEP, self.step * 2)
+
+    def run_rule(self, rule, today=None):
+        """Применение одного правила; возвращает (число строк, число пачек)"""
+        today = today or date.today()
+        with self.engine.connect() as conn:
+            low, high = conn.execute(
+                select(func.min(literal_column('rowid')), func.max(literal_column('rowid'))).select_from(rule.table)
+            ).one()
+            conn.rollback()
+            if low is None:
+                return 0, 0
+            affected = batches = 0
+            while low <= high:
+                upper = low + self.step
+                started = time.perf_counter()
+                # Блокировка записи берется сразу: время ее ожидания - мера нагрузки
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                locked = time.perf_counter()
+                try:
+                    affected += conn.execute(rule.statement(today, low, upper)).rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                self._throttle(locked - started, time.perf_counter() - locked)
+                batches += 1
+                low = upper
+                time.sleep(self.pause)
+        return affected, batches
+
+    def optimize(self):
+        """Статистика планировщика и возврат свободных страниц порциями"""
+        with self.engine.connect() as conn:
+            # Ограничение выборки ANALYZE: статистика по части строк каждого индекса
+            conn.exec_driver_sql("PRAGMA analysis_limit=1000")
+            conn.exec_driver_sql("ANALYZE")
+            conn.exec_driver_sql("PRAGMA optimize")
+            conn.commit()
+
+            auto_vacuum = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if auto_vacuum != 2:
+                return free_pages, 0
+            released = 0
+            while free_pages:
+                # PRAGMA возвращает строку без столбцов на каждую страницу: через execute
+                # модуль sqlite3 выполняет только первый шаг, executescript - оператор целиком
+                conn.connection.driver_connection.executescript(
+                    f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})"
+                )
+                conn.commit()
+                left = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+                released += free_pages - left
+                if left >= free_pages:
+                    break
+                free_pages = left
+                time.sleep(self.pause)
+        return free_pages, released
+
+    def enable_incremental_vacuum(self):
+        """Перевод существующей базы в режим auto_vacuum=INCREMENTAL
+
+        Требует полного VACUUM: база блокируется на все время, запускать вне приема.
+        """
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            return conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+
+    def run(self, rules=None, today=None, optimize=True):
+        """Применение правил хранения и обслуживание базы
+
+        Возвращает (успех, сообщение, статистика по правилам).
+        """
+        rules = DEFAULT_RULES if rules is None else rules
+        stats = {}
+        try:
+            for rule in rules:
+                started = time.perf_counter()
+                affected, batches = self.run_rule(rule, today)
+                stats[rule.name] = {'rows': affected, 'batches': batches, 'seconds': time.perf_counter() - started}
+                print(f"{rule.description}: строк {affected}, пачек {batches}")
+            if optimize:
+                free_pages, released = self.optimize()
+                stats['vacuum'] = {'released_pages': released, 'free_pages': free_pages}
+                if free_pages:
+                    print(f"Свободных страниц осталось {free_pages}: база не в режиме auto_vacuum=INCREMENTAL")
+        except Exception as e:
+            return False, f"Ошибка обслуживания базы: {str(e)}", stats
+
+        total = sum(rule_stats['rows'] for name, rule_stats in stats.items() if name != 'vacuum')
+        message = (f"Обслуживание завершено: обработано строк {total}, "
+                   f"наибольшее ожидание блокировки {self.max_lock_wait * 1000:.0f} мс")
+        return True, message, stats
+
+
+def main():
+    """Ночной запуск: python maintenance.py --db medical_clinic.db"""
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Удаление устаревших данных и обслуживание базы")
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--date', type=date.fromisoformat, help="дата запуска (по умолчанию - сегодня)")
+    parser.add_argument('--rule', action='append', choices=[rule.name for rule in DEFAULT_RULES],
+                        help="применить только указанные правила")
+    parser.add_argument('--no-optimize', action='store_true', help="без ANALYZE и incremental_vacuum")
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help="однократно перевести базу в auto_vacuum=INCREMENTAL (полный VACUUM)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    db_manager.init_database()
+    maintenance = MaintenanceEngine(db_manager.engine)
+    if args.enable_incremental_vacuum:
+        print("Режим incremental_vacuum включен" if maintenance.enable_incremental_vacuum()
+              else "Не удалось включить incremental_vacuum")
+    rules = [rule for rule in DEFAULT_RULES if not args.rule or rule.name in args.rule]
+    success, message, _ = maintenance.run(rules, args.date, optimize=not args.no_optimize)
+    print(message)
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,448 @@
+import bisect
+import functools
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Границы корзин гистограмм длительности, секунды
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Период записи файла метрик, секунды
+DEFAULT_INTERVAL = 15
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Sharded:
+    """Значение, которое каждый поток изменяет в своей ячейке
+
+    Поток пишет только в свою ячейку, поэтому увеличение не требует
+    блокировки; при чтении ячейки всех потоков суммируются. Ячейки
+    завершившихся потоков сохраняются - счетчики не уменьшаются.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._cells = []
+
+    def cell(self):
+        cell = getattr(self._local, 'cell', None)
+        if cell is None:
+            cell = self._local.cell = [0] * self._size
+            # list.append атомарен, блокировка не нужна
+            self._cells.append(cell)
+        return cell
+
+    def totals(self):
+        totals = [0] * self._size
+        for cell in list(self._cells):
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+
+class _Metric(ABC):
+    """Общая часть метрик: имя, описание и дочерние метрики по значениям меток"""
+
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._children = {}
+
+    def labels(self, **values):
+        """Метрика с конкретными значениями меток"""
+        key = tuple(str(values[name]) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            # setdefault атомарен: при гонке оба потока получат одну и ту же метрику
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        if self.label_names:
+            raise ValueError(f"Метрика {self.name} требует метки: {', '.join(self.label_names)}")
+        return self.labels()
+
+    @abstractmethod
+    def _new_child(self):
+        """Значение метрики для одного набора меток"""
+
+    @abstractmethod
+    def _samples(self, child):
+        """Строки выборки значения: (суффикс имени, дополнительные метки, значение)"""
+
+    def render(self, extra_labels=()):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            for suffix, extra, value in self._samples(child):
+                labels = _format_labels(self.label_names, key, tuple(extra_labels) + extra)
+                lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class _CounterValue(_Sharded):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self.cell()[0] += amount
+
+    def get(self):
+        return self.totals()[0]
+
+
+class Counter(_Metric):
+    """Счетчик событий (только растет)"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def value(self, **labels):
+        return self.labels(**labels).get()
+
+    def _samples(self, child):
+        return [('', (), child.get())]
+
+
+class _GaugeValue:
+    __slots__ = ('value', 'callback')
+
+    def __init__(self):
+        self.value = 0
+        self.callback = None
+
+    def set(self, value):
+        # Присваивание атомарно: последнее записанное значение и будет прочитано
+        self.value = value
+
+    def set_function(self, callback):
+        """Значение вычисляется при каждом чтении метрик"""
+        self.callback = callback
+
+    def get(self):
+        if self.callback is None:
+            return self.value
+        try:
+            return self.callback()
+        except Exception:
+            return math.nan
+
+
+class Gauge(_Metric):
+    """Текущее значение (размер, число, время последнего события)"""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, callback):
+        self._default().set_function(callback)
+
+    def value(self, **labels):
+        return self.labels(**labels).get()
+
+    def _samples(self, child):
+        value = child.get()
+        return [] if value is None else [('', (), value)]
+
+
+class _HistogramValue(_Sharded):
+    def __init__(self, buckets):
+        # Ячейка: число наблюдений по корзинам (последняя - +Inf) и сумма
+        super().__init__(len(buckets) + 2)
+        self.buckets = buckets
+
+    def observe(self, value):
+        cell = self.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+
+class Histogram(_Metric):
+    """Распределение длительностей по корзинам с суммой и числом наблюдений"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def count(self, **labels):
+        return sum(self.labels(**labels).totals()[:-1])
+
+    def _samples(self, child):
+        totals = child.totals()
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), totals):
+            cumulative += count
+            samples.append(('_bucket', (('le', _format_value(float(bound))),), cumulative))
+        samples.append(('_sum', (), totals[-1]))
+        samples.append(('_count', (), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Набор метрик процесса и их представление в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, description, labels, **options):
+        # Повторная регистрация возвращает уже созданную метрику
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = cls(name, description, labels, **options)
+        if not isinstance(metric, cls):
+            raise ValueError(f"Метрика {name} уже зарегистрирована с типом {metric.kind}")
+        return metric
+
+    def counter(self, name, description, labels=()):
+        return self._register(Counter, name, description, labels)
+
+    def gauge(self, name, description, labels=()):
+        return self._register(Gauge, name, description, labels)
+
+    def histogram(self, name, description, labels=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram, name, description, labels, buckets=buckets)
+
+    def render(self, extra_labels=()):
+        """Все метрики в текстовом формате Prometheus 0.0.4; extra_labels добавляются к каждому значению"""
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render(extra_labels))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path, extra_labels=()):
+        """Запись метрик в файл для textfile collector node_exporter (атомарная замена)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render(extra_labels))
+        os.replace(temp_path, path)
+        return str(path)
+
+
+REGISTRY = MetricsRegistry()
+
+BOOKINGS = REGISTRY.counter(
+    'clinic_bookings_total', "События записи на прием (booked - запись, cancelled - отмена)", ['event']
+)
+LOGINS = REGISTRY.counter(
+    'clinic_logins_total', "Попытки входа в систему по результату (success, failure, error)", ['result']
+)
+EXPORTS = REGISTRY.counter(
+    'clinic_exports_total', "Выполненные экспорты по формату и результату", ['format', 'result']
+)
+EXPORT_SECONDS = REGISTRY.histogram(
+    'clinic_export_duration_seconds', "Длительность экспорта данных", ['format']
+)
+BACKUPS = REGISTRY.counter(
+    'clinic_backups_total', "Резервные копии по типу и результату", ['type', 'result']
+)
+BACKUP_SECONDS = REGISTRY.histogram(
+    'clinic_backup_duration_seconds', "Длительность создания резервной копии", ['type']
+)
+BACKUP_SIZE = REGISTRY.gauge(
+    'clinic_backup_size_bytes', "Размер последней созданной резервной копии", ['type']
+)
+BACKUP_LAST_SUCCESS = REGISTRY.gauge(
+    'clinic_backup_last_success_timestamp_seconds', "Время последнего успешного резервного копирования", ['type']
+)
+DATABASE_SIZE = REGISTRY.gauge(
+    'clinic_database_size_bytes', "Размер файлов базы данных (main - основной файл, wal - журнал WAL)", ['file']
+)
+
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def track_database(db_path):
+    """Размеры файла базы и журнала WAL вычисляются при каждом чтении метрик"""
+    db_path = str(db_path)
+    DATABASE_SIZE.labels(file='main').set_function(lambda: _file_size(db_path))
+    DATABASE_SIZE.labels(file='wal').set_function(lambda: _file_size(db_path + '-wal'))
+
+
+def _count_booking(event_name, info):
+    BOOKINGS.labels(event=event_name).inc()
+
+
+def install_booking_metrics():
+    """Подсчет записей и отмен через подписку на события записи"""
+    from booking import add_booking_listener
+    add_booking_listener(_count_booking)
+
+
+def track_export(export_format):
+    """Декоратор метода экспорта, возвращающего (успех, сообщение, путь)"""
+    def decorator(func):
+        duration = EXPORT_SECONDS.labels(format=export_format)
+        succeeded = EXPORTS.labels(format=export_format, result='success')
+        failed = EXPORTS.labels(format=export_format, result='failure')
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            duration.observe(time.perf_counter() - started)
+            (succeeded if result[0] else failed).inc()
+            return result
+        return wrapper
+    return decorator
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0].rstrip('/') not in ('', '/metrics'):
+            self.send_error(404)
+            return
+        data = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsExporter:
+    """Публикация метрик: файл для node_exporter и/или локальный HTTP-адрес /metrics
+
+    Файл перезаписывается каждые interval секунд фоновым потоком и при
+    остановке. Счетчики живут в памяти процесса, поэтому при нескольких
+    процессах (рабочие процессы API-сервера) каждый пишет свой файл
+    с меткой worker, а HTTP-адрес открывает только один процесс.
+    """
+
+    def __init__(self, registry=REGISTRY, path=None, port=None, host='127.0.0.1', interval=DEFAULT_INTERVAL,
+                 extra_labels=()):
+        self.registry = registry
+        self.extra_labels = tuple(extra_labels)
+        self.path = path
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.server = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @classmethod
+    def from_env(cls, registry=REGISTRY, worker=None):
+        """Настройки из CLINIC_METRICS_FILE, CLINIC_METRICS_PORT и CLINIC_METRICS_INTERVAL
+
+        Для рабочего процесса (worker) к имени файла и к каждому значению
+        добавляется его номер, а HTTP-адрес не открывается.
+        """
+        path = os.environ.get('CLINIC_METRICS_FILE') or None
+        port = os.environ.get('CLINIC_METRICS_PORT') or None
+        extra_labels = ()
+        if worker is not None:
+            extra_labels = (('worker', worker),)
+            port = None
+            if path:
+                path = Path(path)
+                path = path.with_name(f"{path.stem}_{worker}{path.suffix}")
+        return cls(
+            registry, path=path, port=int(port) if port else None,
+            interval=float(os.environ.get('CLINIC_METRICS_INTERVAL') or DEFAULT_INTERVAL), extra_labels=extra_labels,
+        )
+
+    @property
+    def enabled(self):
+        return self.path is not None or self.port is not None
+
+    def start(self):
+        """Запуск публикации; возвращает (успех, сообщение)"""
+        if not self.enabled:
+            return False, "Публикация метрик не настроена"
+        try:
+            if self.port is not None:
+                self.server = ThreadingHTTPServer((self.host, self.port), _MetricsRequestHandler)
+                self.server.daemon_threads = True
+                self.server.registry = self.registry
+                threading.Thread(target=self.server.serve_forever, daemon=True, name='clinic-metrics-http').start()
+            if self.path is not None:
+                self.registry.write_textfile(self.path, self.extra_labels)
+                self._thread = threading.Thread(target=self._write_loop, daemon=True, name='clinic-metrics-file')
+                self._thread.start()
+        except OSError as e:
+            self.stop()
+            return False, f"Ошибка запуска публикации метрик: {e}"
+        targets = []
+        if self.server is not None:
+            targets.append(f"http://{self.host}:{self.server.server_address[1]}/metrics")
+        if self.path is not None:
+            targets.append(str(self.path))
+        return True, f"Метрики публикуются: {', '.join(targets)}"
+
+    def _write_loop(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.registry.write_textfile(self.path, self.extra_labels)
+            except OSError as e:
+                print(f"Ошибка записи файла метрик: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            try:
+                self.registry.write_textfile(self.path, self.extra_labels)
+            except OSError:
+                pass
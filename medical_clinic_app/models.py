@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, ForeignKey, Text, Float, Time, Enum, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, ForeignKey, Text, Float, Time, Enum, Boolean, Index
+from sqlalchemy import event, inspect, select, bindparam, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 from sqlalchemy.ext.hybrid import hybrid_property
 import enum
-from datetime import datetime
+from datetime import datetime, timedelta
+import normalization
 
 Base = declarative_base()
 
@@ -20,6 +23,19 @@ class AppointmentStatus(enum.Enum):
     CANCELLED = "cancelled"
     NO_SHOW = "no_show"
 
+# Перечисление для статусов заявки в листе ожидания
+class WaitlistStatus(enum.Enum):
+    WAITING = "waiting"
+    BOOKED = "booked"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"
+
+# Перечисление для статусов напоминания в исходящей очереди
+class ReminderStatus(enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
 # 1. Сущность Пользователь (для аутентификации)
 class User(Base):
     __tablename__ = 'users'
@@ -59,11 +75,29 @@ class Patient(Base):
     email = Column(String(100))
     registration_date = Column(Date, default=datetime.now().date())
     
+    # Нормализованные ключи поиска (заполняются автоматически, см. normalization.py)
+    name_key = Column(String(300))
+    phone_digits = Column(String(20))
+    phone_reversed = Column(String(20))
+    email_key = Column(String(100))
+    passport_key = Column(String(30))
+    
     # Связи
     user_account = relationship("User", back_populates="patient", uselist=False)
     medical_records = relationship("MedicalRecord", back_populates="patient")
     appointments = relationship("Appointment", back_populates="patient")
     
+    # Индекс под список пациентов по алфавиту (постраничная выборка по ключу)
+    # и индексы поиска по нормализованным ключам
+    __table_args__ = (
+        Index('ix_patients_name', 'last_name', 'first_name'),
+        Index('ix_patients_name_key', 'name_key'),
+        Index('ix_patients_phone_digits', 'phone_digits'),
+        Index('ix_patients_phone_reversed', 'phone_reversed'),
+        Index('ix_patients_email_key', 'email_key'),
+        Index('ix_patients_passport_key', 'passport_key'),
+    )
+    
     @hybrid_property
     def full_name(self):
         return f"{self.last_name} {self.first_name} {self.patronymic or ''}".strip()
@@ -160,11 +194,19 @@ class Schedule(Base):
     max_patients = Column(Integer, default=1)
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     # Связи
     employee = relationship("Employee", back_populates="schedules")
     appointments = relationship("Appointment", back_populates="schedule")
     
+    # Индексы под выборку расписания по датам, по врачу и по кабинету
+    __table_args__ = (
+        Index('ix_schedules_date', 'work_date', 'start_time'),
+        Index('ix_schedules_employee_date', 'employee_id', 'work_date'),
+        Index('ix_schedules_cabinet_date', 'cabinet_number', 'work_date'),
+    )
+    
     @hybrid_property
     def available_slots(self):
         if self.appointments:
@@ -195,6 +237,14 @@ class Appointment(Base):
     doctor = relationship("Employee", back_populates="appointments")
     medical_record = relationship("MedicalRecord", back_populates="appointment", uselist=False)
     
+    # Индексы под выборки по пациенту и врачу (в том числе с ограничением доступа)
+    __table_args__ = (
+        Index('ix_appointments_patient_date', 'patient_id', 'appointment_date'),
+        Index('ix_appointments_doctor_date', 'doctor_id', 'appointment_date'),
+        Index('ix_appointments_schedule', 'schedule_id'),
+        Index('ix_appointments_date', 'appointment_date'),
+    )
+    
     def __repr__(self):
         return f"<Appointment(id={self.id}, patient='{self.patient.full_name if self.patient else None}', date={self.appointment_date})>"
 
@@ -221,6 +271,13 @@ class MedicalRecord(Base):
     diagnosis = relationship("Diagnosis", back_populates="medical_records")
     prescriptions = relationship("Prescription", back_populates="medical_record")
     
+    __table_args__ = (
+        Index('ix_medical_records_patient_date', 'patient_id', 'record_date'),
+        Index('ix_medical_records_doctor_date', 'doctor_id', 'record_date'),
+        Index('ix_medical_records_appointment', 'appointment_id'),
+        Index('ix_medical_records_next_visit', 'next_visit_date'),
+    )
+    
     def __repr__(self):
         return f"<MedicalRecord(id={self.id}, patient='{self.patient.full_name if self.patient else None}', date={self.record_date})>"
 
@@ -251,14 +308,25 @@ class Prescription(Base):
     dosage = Column(String(100))
     frequency = Column(String(100))
     duration = Column(String(50))
+    # Длительность в днях, разобранная из duration (заполняется автоматически)
+    duration_days = Column(Integer)
     instructions = Column(Text)
     start_date = Column(Date)
+    # Последний день приема; если не задан, вычисляется по start_date и duration
     end_date = Column(Date)
     is_completed = Column(Boolean, default=False)
     
     # Связи
     medical_record = relationship("MedicalRecord", back_populates="prescriptions")
     
+    # Частичные индексы только по действующим назначениям: текущие назначения
+    # пациента и ночное закрытие истекших не читают завершенные
+    __table_args__ = (
+        Index('ix_prescriptions_medical_record', 'medical_record_id'),
+        Index('ix_prescriptions_active_record', 'medical_record_id', 'end_date', sqlite_where=text('is_completed = 0')),
+        Index('ix_prescriptions_active_end', 'end_date', sqlite_where=text('is_completed = 0')),
+    )
+    
     def __repr__(self):
         return f"<Prescription(id={self.id}, medication='{self.medication_name}')>"
 
@@ -276,4 +344,220 @@ class Service(Base):
     is_available = Column(Boolean, default=True)
     
     def __repr__(self):
-        return f"<Service(id={self.id}, name='{self.name}', price={self.price})>"
\ No newline at end of file
+        return f"<Service(id={self.id}, name='{self.name}', price={self.price})>"
+
+# 12. N-граммы фамилий пациентов для поиска с опечатками
+class PatientNameNgram(Base):
+    __tablename__ = 'patient_name_ngrams'
+    
+    ngram = Column(String(3), primary_key=True)
+    patient_id = Column(Integer, primary_key=True)
+    
+    # Строки хранятся прямо в первичном ключе: поиск по n-грамме читает только индекс
+    __table_args__ = (
+        Index('ix_patient_name_ngrams_patient', 'patient_id'),
+        {'sqlite_with_rowid': False},
+    )
+    
+    def __repr__(self):
+        return f"<PatientNameNgram(ngram='{self.ngram}', patient_id={self.patient_id})>"
+
+
+def patient_search_keys(last_name, first_name, patronymic, phone, email, passport_series, passport_number):
+    """Значения столбцов поиска пациента по исходным полям"""
+    phone_digits = normalization.normalize_phone(phone)
+    return {
+        'name_key': normalization.name_key(last_name, first_name, patronymic),
+        'phone_digits': phone_digits,
+        'phone_reversed': phone_digits[::-1] if phone_digits else None,
+        'email_key': normalization.normalize_email(email),
+        'passport_key': normalization.passport_key(passport_series, passport_number),
+    }
+
+
+def patient_ngram_rows(patient_id, last_name):
+    """Строки таблицы n-грамм для фамилии пациента"""
+    return [{'ngram': ngram, 'patient_id': patient_id} for ngram in normalization.ngrams(last_name)]
+
+
+@event.listens_for(Patient, 'before_insert')
+@event.listens_for(Patient, 'before_update')
+def _update_patient_search_keys(mapper, connection, target):
+    """Пересчет ключей поиска при сохранении пациента через ORM"""
+    keys = patient_search_keys(
+        target.last_name, target.first_name, target.patronymic, target.phone, target.email,
+        target.passport_series, target.passport_number
+    )
+    for column, value in keys.items():
+        if getattr(target, column) != value:
+            setattr(target, column, value)
+
+
+def prescription_end_date(start_date, duration_days):
+    """Последний день приема по дате начала и длительности в днях"""
+    if start_date is None or not duration_days:
+        return None
+    return start_date + timedelta(days=duration_days - 1)
+
+
+@event.listens_for(Prescription, 'before_insert')
+@event.listens_for(Prescription, 'before_update')
+def _update_prescription_dates(mapper, connection, target):
+    """Разбор длительности назначения и вычисление и проверка даты окончания"""
+    attrs = inspect(target).attrs
+    duration_days = normalization.parse_duration_days(target.duration)
+    if target.duration_days != duration_days:
+        target.duration_days = duration_days
+    # Явно заданная дата окончания сохраняется; вычисленная (совпадающая с расчетом
+    # по прежним началу и длительности) пересчитывается при их изменении
+    recompute = target.end_date is None
+    if not recompute and not attrs.end_date.history.has_changes():
+        previous = {}
+        for name in ('start_date', 'duration'):
+            history = getattr(attrs, name).history
+            if history.has_changes():
+                previous[name] = history.deleted[0] if history.deleted else None
+        if previous:
+            recompute = target.end_date == prescription_end_date(
+                previous.get('start_date', target.start_date),
+                normalization.parse_duration_days(previous.get('duration', target.duration))
+            )
+    if recompute:
+        end_date = prescription_end_date(target.start_date, duration_days)
+        if end_date is not None and target.end_date != end_date:
+            target.end_date = end_date
+    if target.start_date and target.end_date and target.end_date < target.start_date:
+        raise ValueError(f"Дата окончания назначения {target.end_date} раньше даты начала {target.start_date}")
+
+
+# 13. Число пациентов с каждой n-граммой (для выбора самых редких n-грамм при поиске)
+class PatientNgramCount(Base):
+    __tablename__ = 'patient_ngram_counts'
+    
+    ngram = Column(String(3), primary_key=True)
+    patients = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<PatientNgramCount(ngram='{self.ngram}', patients={self.patients})>"
+
+
+def replace_patient_ngrams(connection, patient_id, last_name):
+    """Замена n-грамм фамилии пациента с пересчетом частот n-грамм"""
+    table = PatientNameNgram.__table__
+    counts = PatientNgramCount.__table__
+    old_ngrams = select(table.c.ngram).where(table.c.patient_id == patient_id)
+    connection.execute(
+        counts.update()
+        .where(counts.c.ngram.in_(old_ngrams))
+        .values(patients=counts.c.patients - 1)
+    )
+    connection.execute(table.delete().where(table.c.patient_id == patient_id))
+    
+    rows = patient_ngram_rows(patient_id, last_name) if last_name is not None else []
+    if rows:
+        connection.execute(table.insert(), rows)
+        upsert = sqlite_insert(counts).values(ngram=bindparam('ngram'), patients=1)
+        connection.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[counts.c.ngram], set_={'patients': counts.c.patients + 1}
+            ),
+            [{'ngram': row['ngram']} for row in rows]
+        )
+
+
+@event.listens_for(Patient, 'after_insert')
+@event.listens_for(Patient, 'after_update')
+def _update_patient_ngrams(mapper, connection, target):
+    """Обновление n-грамм фамилии, если она изменилась"""
+    if inspect(target).attrs.last_name.history.has_changes():
+        replace_patient_ngrams(connection, target.id, target.last_name)
+
+
+@event.listens_for(Patient, 'after_delete')
+def _delete_patient_ngrams(mapper, connection, target):
+    replace_patient_ngrams(connection, target.id, None)
+
+
+# 14. Сущность Заявка в листе ожидания
+class WaitlistEntry(Base):
+    __tablename__ = 'waitlist_entries'
+    
+    id = Column(Integer, primary_key=True)
+    patient_id = Column(Integer, ForeignKey('patients.id'), nullable=False)
+    # Нужен конкретный врач или любой врач специализации
+    doctor_id = Column(Integer, ForeignKey('employees.id'), nullable=True)
+    specialization_id = Column(Integer, ForeignKey('specializations.id'), nullable=True)
+    date_from = Column(Date, nullable=False)
+    date_to = Column(Date, nullable=False)
+    time_from = Column(Time)
+    time_to = Column(Time)
+    # Чем больше, тем раньше заявка получает освободившееся место
+    priority = Column(Integer, default=0, nullable=False)
+    status = Column(Enum(WaitlistStatus), default=WaitlistStatus.WAITING, nullable=False)
+    appointment_id = Column(Integer, ForeignKey('appointments.id'), nullable=True)
+    notes = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    # Связи
+    patient = relationship("Patient")
+    doctor = relationship("Employee")
+    specialization = relationship("Specialization")
+    appointment = relationship("Appointment")
+    
+    __table_args__ = (
+        Index('ix_waitlist_status_id', 'status', 'id'),
+        Index('ix_waitlist_patient', 'patient_id'),
+        # Поиск заявок, закрытых другими процессами, и очистка старых заявок
+        Index('ix_waitlist_updated_at', 'updated_at'),
+    )
+    
+    def __repr__(self):
+        return f"<WaitlistEntry(id={self.id}, patient_id={self.patient_id}, status='{self.status}')>"
+
+
+# 15. Напоминание в исходящей очереди (отправляется отдельным отправителем)
+class ReminderOutbox(Base):
+    __tablename__ = 'reminder_outbox'
+    
+    id = Column(Integer, primary_key=True)
+    # Вид напоминания: 'appointment' (запись на прием) или 'follow_up' (повторный визит)
+    kind = Column(String(20), nullable=False)
+    # id записи на прием или пациента (для повторного приема), по которому создано напоминание
+    source_id = Column(Integer, nullable=False)
+    event_date = Column(Date, nullable=False)
+    patient_id = Column(Integer, ForeignKey('patients.id'), nullable=False)
+    channel = Column(String(10), nullable=False)
+    recipient = Column(String(100), nullable=False)
+    message = Column(Text, nullable=False)
+    status = Column(Enum(ReminderStatus), default=ReminderStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+    sent_at = Column(DateTime)
+    
+    # Уникальный ключ делает повторный запуск задания идемпотентным
+    __table_args__ = (
+        Index('ix_reminder_outbox_source', 'kind', 'source_id', 'event_date', unique=True),
+        Index('ix_reminder_outbox_status_id', 'status', 'id'),
+    )
+    
+    def __repr__(self):
+        return f"<ReminderOutbox(id={self.id}, kind='{self.kind}', source_id={self.source_id}, status='{self.status}')>"
+
+
+# 16. Отозванный токен сессии (выход виден всем процессам API-сервера)
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+    
+    # SHA-256 токена: сами токены в базе не хранятся
+    token_hash = Column(String(64), primary_key=True)
+    # Время истечения токена (Unix time): после него запись не нужна
+    expires_at = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_revoked_tokens_expires_at', 'expires_at'),
+    )
+    
+    def __repr__(self):
+        return f"<RevokedToken(token_hash='{self.token_hash[:12]}', expires_at={self.expires_at})>"
@@ -0,0 +1,157 @@
+import re
+
+# Нормализованные ключи для поиска пациентов: вычисляются в Python и хранятся
+# в отдельных индексируемых столбцах, потому что SQLite не умеет приводить
+# кириллицу к одному регистру (LIKE и lower() работают только с ASCII).
+
+_NON_DIGITS = re.compile(r'\D+')
+_NON_NAME_CHARS = re.compile(r"[^\w\s-]+")
+_SPACES = re.compile(r'\s+')
+
+# Верхняя граница для поиска по префиксу диапазоном: key >= prefix AND key < prefix + PREFIX_END
+PREFIX_END = '\U0010ffff'
+
+# Длина n-граммы для нечеткого поиска по фамилии
+NGRAM_SIZE = 3
+
+
+def digits_only(value):
+    """Только цифры строки"""
+    return _NON_DIGITS.sub('', value or '')
+
+
+def normalize_phone(phone):
+    """Телефон в виде 11 цифр с кодом страны 7 (None, если цифр нет)
+
+    +7 (921) 111-22-33, 8 921 111 22 33 и 9211112233 дают 79211112233.
+    """
+    digits = digits_only(phone)
+    if not digits:
+        return None
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    return digits
+
+
+def fold_name(text):
+    """Имя в нижнем регистре с ё -> е и без лишних символов и пробелов"""
+    text = (text or '').casefold().replace('ё', 'е')
+    text = _NON_NAME_CHARS.sub(' ', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def name_key(last_name, first_name, patronymic=None):
+    """Ключ ФИО для поиска по началу фамилии, имени и отчества"""
+    return fold_name(' '.join(part for part in (last_name, first_name, patronymic) if part)) or None
+
+
+def normalize_email(email):
+    """Email без пробелов в нижнем регистре"""
+    email = (email or '').strip().casefold()
+    return email or None
+
+
+def passport_key(series, number):
+    """Серия и номер паспорта одной строкой цифр (4510 123456 -> 4510123456)"""
+    key = digits_only(series) + digits_only(number)
+    return key or None
+
+
+def ngrams(text, size=NGRAM_SIZE):
+    """Множество n-грамм слова с границами (пробел в начале и конце)"""
+    text = fold_name(text)
+    if not text:
+        return set()
+    padded = f" {text} "
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+
+def similarity(left, right):
+    """Сходство строк по n-граммам (коэффициент Жаккара от 0 до 1)"""
+    left_grams, right_grams = ngrams(left), ngrams(right)
+    if not left_grams or not right_grams:
+        return 0.0
+    return len(left_grams & right_grams) / len(left_grams | right_grams)
+
+
+# Транслитерация кириллицы для сравнения записей, внесенных латиницей и кириллицей
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'iu', 'я': 'ia',
+})
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'), 'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+
+
+def transliterate(text):
+    """Имя латиницей: Иванов -> ivanov (латиница остается без изменений)"""
+    return fold_name(text).translate(_TRANSLIT)
+
+
+def soundex(text):
+    """Код Soundex транслитерированного слова (Иванов и Ivanoff -> I151)"""
+    letters = [char for char in transliterate(text) if 'a' <= char <= 'z']
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = _SOUNDEX_CODES.get(letters[0], '')
+    for char in letters[1:]:
+        digit = _SOUNDEX_CODES.get(char, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h и w не разделяют одинаковые согласные, гласные разделяют
+        if char not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+# Длительность назначения: единицы в днях (месяц и год - приближенно)
+_DURATION_UNITS = (
+    ('дн', 1), ('ден', 1), ('сут', 1), ('нед', 7), ('мес', 30), ('год', 365), ('лет', 365),
+)
+_DURATION_WORDS = {
+    'один': 1, 'одна': 1, 'одну': 1, 'два': 2, 'две': 2, 'три': 3, 'четыре': 4, 'пять': 5,
+    'шесть': 6, 'семь': 7, 'восемь': 8, 'девять': 9, 'десять': 10,
+}
+# Количество (число с дробной частью через запятую или точку, диапазон, слово
+# или "пол") и единица с начала слова: "ежедневно" - не дни
+_DURATION_NUMBER = r'(\d+(?:[.,]\d+)?)'
+_DURATION_PART = re.compile(
+    r'(?:' + _DURATION_NUMBER + r'(?:\s*[-–]\s*' + _DURATION_NUMBER + r')?\s*'
+    r'|\b(' + '|'.join(_DURATION_WORDS) + r')\s+|\b(пол)[\s-]*|\b)'
+    r'(дн|ден|сут|нед|мес|год|лет)\w*'
+)
+_BARE_NUMBER = re.compile(r'^\s*(\d+)\s*$')
+
+
+def parse_duration_days(text):
+    """Длительность назначения в днях из текста ('30 дней', '2 недели', '1-2 мес.')
+
+    Из диапазона берется верхняя граница, части складываются ('1 месяц 2 недели').
+    Единица без количества ('в день' в '2 раза в день 5 дней') - это кратность
+    приема: она считается за одну единицу, только если явного количества нет.
+    None, если длительность не указана или бессрочна ('постоянно').
+    """
+    text = (text or '').casefold().replace('ё', 'е')
+    bare = _BARE_NUMBER.match(text)
+    if bare:
+        return int(bare.group(1)) or None
+    counted, uncounted = 0, 0
+    for low, high, word, half, unit in _DURATION_PART.findall(text):
+        days = next(days for prefix, days in _DURATION_UNITS if unit.startswith(prefix))
+        if high or low:
+            counted += float((high or low).replace(',', '.')) * days
+        elif word or half:
+            counted += (_DURATION_WORDS[word] if word else 0.5) * days
+        else:
+            uncounted += days
+    return int(round(counted or uncounted)) or None
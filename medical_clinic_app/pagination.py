@@ -0,0 +1,118 @@
+import base64
+import json
+from datetime import date, datetime, time
+from sqlalchemy import tuple_
+
+
+def _encode_value(value):
+    """Значение ключа сортировки в JSON-совместимом виде"""
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, time):
+        return {'t': value.isoformat()}
+    if hasattr(value, 'value') and hasattr(value, 'name'):
+        # Перечисления хранятся по имени, как в SQLAlchemy Enum
+        return {'e': value.name}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 't' in value:
+            return time.fromisoformat(value['t'])
+        if 'e' in value:
+            return value['e']
+    return value
+
+
+def encode_cursor(key):
+    """Курсор страницы: ключ сортировки граничной строки в виде строки для URL"""
+    payload = json.dumps([_encode_value(value) for value in key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Ключ сортировки из курсора; ValueError для поврежденного курсора"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return tuple(_decode_value(value) for value in json.loads(payload))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Некорректный курсор страницы: {cursor}") from e
+
+
+class KeysetPaginator:
+    """Постраничная выборка по ключу (seek-пагинация)
+
+    Вместо OFFSET следующая страница начинается условием
+    (c1, c2, ..., id) > (значения последней строки), поэтому каждая страница
+    читается по индексу за время, не зависящее от номера страницы.
+    Столбцы сортировки должны однозначно упорядочивать строки (последним
+    обычно идет первичный ключ) и входить в выборку.
+    """
+
+    def __init__(self, statement, sort_columns, descending=False, scalars=False):
+        self.statement = statement
+        self.sort_columns = list(sort_columns)
+        self.descending = descending
+        self.scalars = scalars
+
+    def _key(self, row):
+        return tuple(getattr(row, column.key) for column in self.sort_columns)
+
+    def _ordered(self, statement, reverse):
+        descending = self.descending != reverse
+        return statement.order_by(*[
+            column.desc() if descending else column.asc() for column in self.sort_columns
+        ])
+
+    def _seek(self, statement, key, backward):
+        columns = tuple_(*self.sort_columns)
+        values = tuple_(*key)
+        # Направление сравнения зависит от направления сортировки и навигации
+        if self.descending != backward:
+            return statement.where(columns < values)
+        return statement.where(columns > values)
+
+    def page(self, session, limit=20, after=None, before=None):
+        """Страница строк после курсора after или перед курсором before
+
+        Возвращает словарь: items, next (курсор следующей страницы или None),
+        prev (курсор предыдущей страницы или None).
+        """
+        backward = before is not None
+        cursor = before if backward else after
+
+        statement = self.statement
+        if cursor:
+            statement = self._seek(statement, decode_cursor(cursor), backward)
+        # Лишняя строка показывает, есть ли еще страница в этом направлении
+        statement = self._ordered(statement, backward).limit(limit + 1)
+
+        result = session.execute(statement)
+        rows = list(result.scalars() if self.scalars else result)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+
+        if not rows:
+            return {'items': [], 'next': None, 'prev': None}
+
+        first_cursor = encode_cursor(self._key(rows[0]))
+        last_cursor = encode_cursor(self._key(rows[-1]))
+        if backward:
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, cursor is not None
+
+        return {
+            'items': rows,
+            'next': last_cursor if has_next else None,
+            'prev': first_cursor if has_prev else None,
+        }
@@ -0,0 +1,408 @@
+import argparse
+import json
+import os
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from sqlalchemy import select, update, delete, func
+from models import Patient, Appointment, MedicalRecord, User, WaitlistEntry, ReminderOutbox
+from normalization import ngrams, soundex, transliterate
+
+# Ссылки на пациента, которые переносятся на основную карту при объединении:
+# (модель, имя столбца). Модули с новыми таблицами добавляют сюда свои ссылки.
+PATIENT_REFERENCES = [
+    (Appointment, 'patient_id'),
+    (MedicalRecord, 'patient_id'),
+    (User, 'patient_id'),
+    (WaitlistEntry, 'patient_id'),
+    (ReminderOutbox, 'patient_id'),
+]
+
+# Ссылки на пациента в столбцах без внешнего ключа: (модель, имя столбца, условие
+# отбора строк). Напоминание о повторном приеме хранит id пациента в source_id.
+PATIENT_SOURCE_REFERENCES = [
+    (ReminderOutbox, 'source_id', ReminderOutbox.kind == 'follow_up'),
+]
+
+# Поля, которые основная карта получает от дубликата, если у нее они не заполнены
+MERGE_FIELDS = (
+    'patronymic', 'gender', 'phone', 'address', 'passport_series', 'passport_number', 'email'
+)
+
+# Оценка сходства, начиная с которой карты объединяются автоматически;
+# без совпадения паспорта пара только попадает в отчет для ручной проверки
+AUTO_MERGE_THRESHOLD = 0.85
+
+# Оценка, начиная с которой пара попадает в отчет для ручной проверки
+REVIEW_THRESHOLD = 0.6
+
+# Окно метода отсортированного соседства
+WINDOW_SIZE = 10
+
+# Блоки больше этого (например, общий телефон регистратуры) сравниваются окном, а не попарно
+MAX_BLOCK_SIZE = 50
+
+COMPARE_COLUMNS = (
+    Patient.id, Patient.last_name, Patient.first_name, Patient.patronymic, Patient.birth_date,
+    Patient.gender, Patient.name_key, Patient.phone_digits, Patient.email_key, Patient.passport_key
+)
+
+
+class UnionFind:
+    """Система непересекающихся множеств для группировки найденных пар"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Сжатие путей
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, left, right):
+        left_root, right_root = self.find(left), self.find(right)
+        if left_root != right_root:
+            # Корнем становится меньший id: группа легко узнается по нему
+            if right_root < left_root:
+                left_root, right_root = right_root, left_root
+            self.parent[right_root] = left_root
+
+    def groups(self):
+        result = {}
+        for item in self.parent:
+            result.setdefault(self.find(item), []).append(item)
+        return [sorted(members) for members in result.values() if len(members) > 1]
+
+
+def _birth_dates_close(left, right):
+    """Даты рождения, отличающиеся похожей на опечатку ошибкой"""
+    if left.year != right.year:
+        return left.month == right.month and left.day == right.day and abs(left.year - right.year) in (1, 10)
+    return (left.month == right.month or left.day == right.day
+            or (left.month == right.day and left.day == right.month))
+
+
+@lru_cache(maxsize=100000)
+def _latin_ngrams(value):
+    """N-граммы части ФИО в латинице (имена повторяются, поэтому результат кэшируется)"""
+    return frozenset(ngrams(transliterate(value)))
+
+
+_soundex = lru_cache(maxsize=100000)(soundex)
+
+
+def name_similarity(left, right):
+    """Сходство ФИО по частям; отчество учитывается, только если указано в обеих картах"""
+    # Сравнение в латинице: карты, внесенные латиницей и кириллицей, сравнимы
+    def part(left_value, right_value):
+        left_grams, right_grams = _latin_ngrams(left_value), _latin_ngrams(right_value)
+        if not left_grams or not right_grams:
+            return 0.0
+        return len(left_grams & right_grams) / len(left_grams | right_grams)
+
+    last_name = part(left.last_name, right.last_name)
+    first_name = part(left.first_name, right.first_name)
+    if left.patronymic and right.patronymic:
+        return 0.5 * last_name + 0.3 * first_name + 0.2 * part(left.patronymic, right.patronymic)
+    return 0.6 * last_name + 0.4 * first_name
+
+
+def compare_patients(left, right):
+    """Оценка того, что две карты принадлежат одному пациенту (от 0 до 1)
+
+    Разные паспорта, разный пол или далекие даты рождения исключают
+    совпадение; одинаковые паспорт, дата рождения и контакты повышают
+    оценку сходства ФИО. Телефон и email считаются одним признаком:
+    у членов семьи они часто общие.
+    """
+    same_passport = bool(left.passport_key) and left.passport_key == right.passport_key
+    if left.passport_key and right.passport_key and not same_passport:
+        return 0.0
+    if left.gender and right.gender and left.gender != right.gender:
+        return 0.0
+
+    same_birth_date = left.birth_date == right.birth_date
+    if not same_birth_date and not same_passport:
+        if not (left.birth_date and right.birth_date and _birth_dates_close(left.birth_date, right.birth_date)):
+            return 0.0
+
+    score = 0.5 * name_similarity(left, right)
+    if same_passport:
+        score += 0.5
+    if same_birth_date:
+        score += 0.2
+    same_phone = bool(left.phone_digits) and left.phone_digits == right.phone_digits
+    same_email = bool(left.email_key) and left.email_key == right.email_key
+    if same_phone or same_email:
+        score += 0.2
+    return min(score, 1.0)
+
+
+class PatientDeduplicator:
+    """Поиск и объединение дубликатов карт пациентов
+
+    Попарное сравнение всех карт заменено сравнением внутри блоков:
+    одинаковые паспорт, телефон или email (группировка в SQL по индексам),
+    одинаковые дата рождения и Soundex фамилии и имени, а также окно
+    соседних карт в порядке ФИО (метод отсортированного соседства).
+    Число сравнений растет почти линейно с размером реестра.
+    """
+
+    def __init__(self, session, window_size=WINDOW_SIZE, max_block_size=MAX_BLOCK_SIZE):
+        self.session = session
+        self.window_size = window_size
+        self.max_block_size = max_block_size
+        self.comparisons = 0
+
+    def _execute(self, statement):
+        # Объединение выполняется от имени системы, ограничения доступа к строкам не применяются
+        return self.session.execute(statement.execution_options(skip_access_policy=True))
+
+    def _compare_into(self, left, right, pairs):
+        if left.id == right.id:
+            return
+        self.comparisons += 1
+        score = compare_patients(left, right)
+        if score >= REVIEW_THRESHOLD:
+            same_passport = bool(left.passport_key) and left.passport_key == right.passport_key
+            pairs[(left.id, right.id) if left.id < right.id else (right.id, left.id)] = (score, same_passport)
+
+    def _compare_block(self, block, pairs):
+        if len(block) > self.max_block_size:
+            self._compare_window(sorted(block, key=lambda row: (row.name_key or '', row.id)), pairs)
+            return
+        for index, left in enumerate(block):
+            for right in block[index + 1:]:
+                self._compare_into(left, right, pairs)
+
+    def _compare_window(self, rows, pairs):
+        """Метод отсортированного соседства: каждая карта сравнивается с предыдущими в окне"""
+        window = deque(maxlen=self.window_size)
+        for row in rows:
+            for previous in window:
+                self._compare_into(previous, row, pairs)
+            window.append(row)
+
+    def _exact_blocks(self, column, pairs):
+        """Блоки карт с одинаковым значением ключа (паспорт, телефон, email)"""
+        repeated = (
+            select(column)
+            .where(column.is_not(None))
+            .group_by(column)
+            .having(func.count() > 1)
+        )
+        rows = self._execute(
+            select(*COMPARE_COLUMNS).where(column.in_(repeated)).order_by(column, Patient.id)
+        )
+        block, block_key = [], None
+        for row in rows:
+            key = getattr(row, column.key)
+            if key != block_key and block:
+                self._compare_block(block, pairs)
+                block = []
+            block_key = key
+            block.append(row)
+        if block:
+            self._compare_block(block, pairs)
+
+    def _birth_date_blocks(self, pairs):
+        """Блоки по дате рождения и Soundex фамилии и имени (ловит Иванов/Ivanoff)"""
+        rows = self._execute(
+            select(*COMPARE_COLUMNS).order_by(Patient.birth_date, Patient.id)
+            .execution_options(yield_per=5000)
+        )
+        current_date, blocks = None, {}
+        for row in rows:
+            if row.birth_date != current_date:
+                for block in blocks.values():
+                    if len(block) > 1:
+                        self._compare_block(block, pairs)
+                current_date, blocks = row.birth_date, {}
+            blocks.setdefault((_soundex(row.last_name), _soundex(row.first_name)), []).append(row)
+        for block in blocks.values():
+            if len(block) > 1:
+                self._compare_block(block, pairs)
+
+    def _name_neighborhood(self, pairs):
+        """Окно соседних карт в порядке ФИО (опечатки в дате рождения)"""
+        rows = self._execute(
+            select(*COMPARE_COLUMNS).order_by(Patient.name_key, Patient.id)
+            .execution_options(yield_per=5000)
+        )
+        self._compare_window(rows, pairs)
+
+    def find_duplicates(self):
+        """Поиск дубликатов
+
+        Возвращает (группы для объединения, пары для ручной проверки):
+        группы - списки id, первый элемент - основная карта;
+        пары - (id, id, оценка) с оценкой ниже порога автоматического объединения
+        или без совпадения паспорта.
+        """
+        self.comparisons = 0
+        pairs = {}
+        for column in (Patient.passport_key, Patient.phone_digits, Patient.email_key):
+            self._exact_blocks(column, pairs)
+        self._birth_date_blocks(pairs)
+        self._name_neighborhood(pairs)
+
+        union_find = UnionFind()
+        review = []
+        for (left_id, right_id), (score, same_passport) in pairs.items():
+            if same_passport and score >= AUTO_MERGE_THRESHOLD:
+                union_find.union(left_id, right_id)
+            else:
+                review.append((left_id, right_id, round(score, 3)))
+
+        groups = [self._order_group(group) for group in union_find.groups()]
+        # Пары, которые уже попали в одну группу, проверять не нужно
+        review = [item for item in review if union_find.find(item[0]) != union_find.find(item[1])]
+        review.sort(key=lambda item: -item[2])
+        return groups, review
+
+    def _order_group(self, group):
+        """Основная карта группы - с учетной записью пользователя, иначе самая ранняя"""
+        with_account = set(self._execute(
+            select(User.patient_id).where(User.patient_id.in_(group))
+        ).scalars())
+        survivor = min(with_account) if with_account else group[0]
+        return [survivor] + [patient_id for patient_id in group if patient_id != survivor]
+
+    def merge_patients(self, survivor_id, duplicate_ids):
+        """Объединение карт: ссылки переносятся на основную карту, дубликаты удаляются
+
+        Возвращает (успех, сообщение).
+        """
+        duplicate_ids = [patient_id for patient_id in duplicate_ids if patient_id != survivor_id]
+        if not duplicate_ids:
+            return False, "Нет карт для объединения"
+        try:
+            survivor = self.session.get(Patient, survivor_id)
+            duplicates = self.session.scalars(
+                select(Patient).where(Patient.id.in_(duplicate_ids)).order_by(Patient.id)
+            ).all()
+            if survivor is None or len(duplicates) != len(duplicate_ids):
+                return False, "Карта пациента не найдена"
+
+            # Перенос ссылок одним UPDATE на таблицу
+            moved = 0
+            for model, column_name in PATIENT_REFERENCES:
+                column = getattr(model, column_name)
+                result = self._execute(
+                    update(model)
+                    .where(column.in_(duplicate_ids))
+                    .values({column_name: survivor_id})
+                    .execution_options(synchronize_session=False)
+                )
+                moved += result.rowcount
+
+            for model, column_name, condition in PATIENT_SOURCE_REFERENCES:
+                column = getattr(model, column_name)
+                # Строка, совпавшая по уникальному ключу со строкой основной карты,
+                # остается на месте и удаляется как повтор
+                result = self._execute(
+                    update(model)
+                    .where(condition, column.in_(duplicate_ids))
+                    .values({column_name: survivor_id})
+                    .prefix_with('OR IGNORE')
+                    .execution_options(synchronize_session=False)
+                )
+                moved += result.rowcount
+                self._execute(
+                    delete(model)
+                    .where(condition, column.in_(duplicate_ids))
+                    .execution_options(synchronize_session=False)
+                )
+
+            for field in MERGE_FIELDS:
+                if getattr(survivor, field) is None:
+                    value = next((getattr(item, field) for item in duplicates if getattr(item, field)), None)
+                    if value is not None:
+                        setattr(survivor, field, value)
+
+            for duplicate in duplicates:
+                # Коллекции дубликата уже перенесены, их загрузка не нужна
+                self.session.expire(duplicate, ['appointments', 'medical_records', 'user_account'])
+                self.session.delete(duplicate)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            return False, f"Ошибка объединения карт: {str(e)}"
+
+        return True, f"Карты {', '.join(map(str, duplicate_ids))} объединены с картой {survivor_id} (перенесено ссылок: {moved})"
+
+    def run(self, merge=True, report_dir='exports'):
+        """Поиск дубликатов, автоматическое объединение и отчет для ручной проверки
+
+        Возвращает (успех, сообщение, отчет).
+        """
+        started = datetime.now()
+        try:
+            groups, review = self.find_duplicates()
+        except Exception as e:
+            return False, f"Ошибка поиска дубликатов: {str(e)}", None
+
+        report = {
+            'started': started.isoformat(timespec='seconds'),
+            'comparisons': self.comparisons,
+            'groups': groups,
+            'review': review,
+            'merged': 0,
+            'errors': [],
+        }
+        if merge:
+            for group in groups:
+                success, message = self.merge_patients(group[0], group[1:])
+                if success:
+                    report['merged'] += len(group) - 1
+                else:
+                    report['errors'].append(message)
+        report['elapsed'] = (datetime.now() - started).total_seconds()
+
+        report_path = None
+        if report_dir:
+            Path(report_dir).mkdir(exist_ok=True)
+            report_path = Path(report_dir) / f"duplicates_{started.strftime('%Y%m%d_%H%M%S')}.json"
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        report['report_path'] = str(report_path) if report_path else None
+
+        return True, (f"Групп дубликатов: {len(groups)}, объединено карт: {report['merged']}, "
+                      f"пар для проверки: {len(review)}, сравнений: {self.comparisons}"), report
+
+
+def main():
+    """Ночной запуск: python patient_dedup.py --db medical_clinic.db"""
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Поиск и объединение дубликатов карт пациентов")
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--dry-run', action='store_true', help="только отчет, без объединения")
+    parser.add_argument('--report-dir', default='exports')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    session = db_manager.get_session()
+    try:
+        success, message, report = PatientDeduplicator(session).run(
+            merge=not args.dry_run, report_dir=args.report_dir
+        )
+    finally:
+        db_manager.close_session(session)
+    print(message)
+    if report and report['report_path']:
+        print(f"Отчет: {report['report_path']}")
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,385 @@
+import argparse
+import json
+import os
+from collections import Counter
+from datetime import date, datetime
+from pathlib import Path
+import pandas as pd
+from sqlalchemy import insert, select, func, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import Patient, PatientNameNgram, PatientNgramCount, patient_search_keys, patient_ngram_rows
+
+# Чтение XLSX построчно (pandas читает лист целиком)
+try:
+    from openpyxl import load_workbook
+    XLSX_AVAILABLE = True
+except ImportError:
+    XLSX_AVAILABLE = False
+
+# Строк в одной транзакции импорта
+CHUNK_SIZE = 5000
+
+# Названия столбцов файла -> поля пациента (сравниваются без регистра и пробелов по краям)
+COLUMN_ALIASES = {
+    'last_name': ('last_name', 'фамилия'),
+    'first_name': ('first_name', 'имя'),
+    'patronymic': ('patronymic', 'отчество'),
+    'birth_date': ('birth_date', 'дата рождения'),
+    'gender': ('gender', 'пол'),
+    'phone': ('phone', 'телефон'),
+    'address': ('address', 'адрес'),
+    'passport_series': ('passport_series', 'серия паспорта'),
+    'passport_number': ('passport_number', 'номер паспорта'),
+    'email': ('email', 'e-mail', 'эл. почта', 'электронная почта'),
+    'registration_date': ('registration_date', 'дата регистрации'),
+}
+
+REQUIRED_COLUMNS = ('last_name', 'first_name', 'birth_date')
+
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+
+GENDERS = {
+    'м': 'М', 'муж': 'М', 'мужской': 'М', 'm': 'М', 'male': 'М',
+    'ж': 'Ж', 'жен': 'Ж', 'женский': 'Ж', 'f': 'Ж', 'female': 'Ж',
+}
+
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+# Самая ранняя допустимая дата рождения
+MIN_BIRTH_DATE = pd.Timestamp(1900, 1, 1)
+
+
+def parse_dates(values):
+    """Даты в форматах ГГГГ-ММ-ДД и ДД.ММ.ГГГГ (NaT, если не распознана)"""
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for date_format in DATE_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(values[missing], format=date_format, errors='coerce')
+    return parsed
+
+
+def normalize_chunk(frame):
+    """Проверка и приведение столбцов порции к формату базы
+
+    Возвращает (принятые строки, отклоненные строки с причиной в столбце reason).
+    Все проверки выполняются над столбцами целиком, без цикла по строкам.
+    """
+    frame = frame.copy()
+    for column in COLUMN_ALIASES:
+        if column not in frame:
+            frame[column] = ''
+        frame[column] = frame[column].fillna('').astype(str).str.strip().str.replace(r'\s+', ' ', regex=True)
+    reasons = pd.Series('', index=frame.index)
+
+    def reject(mask, reason):
+        reasons[mask] = reasons[mask] + reason + '; '
+
+    reject(frame['last_name'] == '', "нет фамилии")
+    reject(frame['first_name'] == '', "нет имени")
+
+    birth_dates = parse_dates(frame['birth_date'])
+    reject(birth_dates.isna(), "неверная дата рождения")
+    reject(birth_dates.notna() & ((birth_dates < MIN_BIRTH_DATE) | (birth_dates > pd.Timestamp(date.today()))),
+           "дата рождения вне допустимого диапазона")
+    registration_dates = parse_dates(frame['registration_date'])
+    reject(registration_dates.isna() & (frame['registration_date'] != ''), "неверная дата регистрации")
+
+    genders = frame['gender'].str.lower().str.rstrip('.').map(GENDERS)
+    reject(genders.isna() & (frame['gender'] != ''), "неизвестный пол")
+
+    # Телефон хранится в виде +7 (921) 111-22-33, как в остальной базе
+    digits = frame['phone'].str.replace(r'\D', '', regex=True)
+    digits = digits.where(~((digits.str.len() == 11) & digits.str.startswith('8')), '7' + digits.str[1:])
+    digits = digits.where(digits.str.len() != 10, '7' + digits)
+    reject((digits != '') & ~digits.str.fullmatch(r'7\d{10}'), "неверный телефон")
+    phones = ('+7 (' + digits.str[1:4] + ') ' + digits.str[4:7] + '-' + digits.str[7:9] + '-' + digits.str[9:11])
+
+    series = frame['passport_series'].str.replace(r'\D', '', regex=True)
+    numbers = frame['passport_number'].str.replace(r'\D', '', regex=True)
+    has_passport = (series != '') | (numbers != '')
+    reject(has_passport & ~(series.str.fullmatch(r'\d{4}') & numbers.str.fullmatch(r'\d{6}')), "неверный паспорт")
+
+    emails = frame['email'].str.lower()
+    reject((emails != '') & ~emails.str.match(EMAIL_PATTERN), "неверный email")
+
+    clean = pd.DataFrame({
+        'last_name': frame['last_name'],
+        'first_name': frame['first_name'],
+        'patronymic': frame['patronymic'].where(frame['patronymic'] != ''),
+        'birth_date': birth_dates.dt.date,
+        'gender': genders,
+        'phone': phones.where(digits != ''),
+        'address': frame['address'].where(frame['address'] != ''),
+        'passport_series': series.where(has_passport),
+        'passport_number': numbers.where(has_passport),
+        'passport_key': (series + numbers).where(has_passport),
+        'email': emails.where(emails != ''),
+        'registration_date': registration_dates.dt.date.where(registration_dates.notna(), date.today()),
+    }, index=frame.index)
+
+    rejected = reasons != ''
+    rejected_rows = frame.loc[rejected, list(COLUMN_ALIASES)].assign(reason=reasons[rejected].str.rstrip('; '))
+    return clean[~rejected], rejected_rows
+
+
+def rename_columns(columns, aliases=COLUMN_ALIASES):
+    """Сопоставление заголовков файла полям по псевдонимам; лишние столбцы пропускаются"""
+    lookup = {alias: field for field, names in aliases.items() for alias in names}
+    return {column: lookup[str(column).strip().lower()] for column in columns
+            if str(column).strip().lower() in lookup}
+
+
+def _cell_text(value):
+    """Значение ячейки XLSX как текст (даты - в ISO, целые числа - без .0)"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _detect_separator(path):
+    """Разделитель CSV: Excel в русской локали сохраняет через точку с запятой"""
+    with open(path, encoding='utf-8-sig') as f:
+        header = f.readline()
+    return ';' if header.count(';') > header.count(',') else ','
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE, skip_rows=0):
+    """Порции файла CSV/XLSX как DataFrame из строк; skip_rows пропускает уже импортированные строки"""
+    suffix = Path(path).suffix.lower()
+    if suffix in ('.xlsx', '.xlsm'):
+        if not XLSX_AVAILABLE:
+            raise RuntimeError("Библиотека openpyxl не установлена")
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_cell_text(value) for value in next(rows, ())]
+            position, batch = 0, []
+            for row in rows:
+                position += 1
+                if position <= skip_rows:
+                    continue
+                batch.append([_cell_text(value) for value in row])
+                if len(batch) == chunk_size:
+                    yield pd.DataFrame(batch, columns=header, index=range(position - len(batch), position))
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header, index=range(position - len(batch), position))
+        finally:
+            workbook.close()
+    elif suffix in ('.csv', '.txt'):
+        reader = pd.read_csv(
+            path, sep=_detect_separator(path), dtype=str, keep_default_na=False, encoding='utf-8-sig',
+            chunksize=chunk_size, skiprows=range(1, skip_rows + 1)
+        )
+        position = skip_rows
+        for chunk in reader:
+            chunk.index = range(position, position + len(chunk))
+            position += len(chunk)
+            yield chunk
+    else:
+        raise ValueError(f"Неподдерживаемый формат файла: {suffix}")
+
+
+class PatientImporter:
+    """Потоковый импорт пациентов из CSV/XLSX
+
+    Файл читается порциями; каждая порция проверяется и нормализуется
+    векторно, сверяется с уже известными паспортами одним запросом и
+    вставляется через Core executemany в своей транзакции вместе с
+    n-граммами фамилий. После каждой порции сохраняется контрольная точка,
+    так что прерванный импорт продолжается с места остановки. Отклоненные
+    строки с причиной пишутся в CSV-отчет.
+    """
+
+    def __init__(self, engine, chunk_size=CHUNK_SIZE, report_dir='exports'):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.report_dir = Path(report_dir)
+        # Паспорта, уже принятые в этом запуске
+        self.seen_passports = set()
+
+    def _checkpoint_path(self, path):
+        return self.report_dir / f"import_{Path(path).name}.checkpoint.json"
+
+    @staticmethod
+    def _source_signature(path):
+        stat = os.stat(path)
+        return {'source': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _load_checkpoint(self, path):
+        """Состояние прерванного импорта того же файла (None, если файл изменился или импорта не было)"""
+        checkpoint_path = self._checkpoint_path(path)
+        if not checkpoint_path.exists():
+            return None
+        with open(checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        signature = self._source_signature(path)
+        if any(checkpoint.get(key) != value for key, value in signature.items()):
+            print(f"Файл {path} изменился после прерванного импорта, импорт начинается заново")
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, path, checkpoint):
+        # Запись через временный файл: при сбое остается предыдущая целая точка
+        checkpoint_path = self._checkpoint_path(path)
+        temp_path = checkpoint_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, checkpoint_path)
+
+    def _existing_passports(self, conn, keys):
+        """Паспорта из списка, которые уже есть в базе (один запрос на порцию)"""
+        if not keys:
+            return set()
+        return set(conn.execute(
+            select(Patient.passport_key).where(Patient.passport_key.in_(keys))
+        ).scalars())
+
+    def _split_duplicates(self, conn, clean):
+        """Отделение пациентов, чей паспорт уже есть в базе или встречался раньше в файле"""
+        keys = clean['passport_key']
+        with_passport = keys.notna()
+        known = self._existing_passports(conn, list(keys[with_passport].unique()))
+        in_database = with_passport & keys.isin(known)
+        in_file = with_passport & ~in_database & (keys.isin(self.seen_passports) | keys.duplicated())
+        duplicates = in_database | in_file
+        reasons = pd.Series("пациент с таким паспортом уже есть в базе", index=clean.index)[in_database]
+        reasons = pd.concat([reasons, pd.Series("паспорт повторяется в файле", index=clean.index)[in_file]])
+        return clean[~duplicates], reasons
+
+    def _insert_patients(self, conn, accepted):
+        """Вставка пациентов с ключами поиска, n-граммами фамилий и частотами n-грамм"""
+        records = accepted.drop(columns='passport_key')
+        records = records.astype(object).where(records.notna(), None)
+        rows = []
+        for record in records.to_dict('records'):
+            record.update(patient_search_keys(
+                record['last_name'], record['first_name'], record['patronymic'], record['phone'],
+                record['email'], record['passport_series'], record['passport_number']
+            ))
+            rows.append(record)
+        # RETURNING с сохранением порядка SQLite выполняет построчно. Вместо него:
+        # после первой вставки транзакция держит блокировку записи, поэтому
+        # строки получают подряд идущие id, а последний из них - max(id)
+        conn.execute(insert(Patient), rows)
+        last_id = conn.execute(select(func.max(Patient.id))).scalar()
+        patient_ids = range(last_id - len(rows) + 1, last_id + 1)
+
+        ngram_rows = [
+            item for patient_id, row in zip(patient_ids, rows)
+            for item in patient_ngram_rows(patient_id, row['last_name'])
+        ]
+        if ngram_rows:
+            # n-грамм на порядок больше, чем пациентов: кортежи идут прямо в драйвер,
+            # без построения параметров SQLAlchemy для каждой строки
+            conn.exec_driver_sql(
+                f"INSERT INTO {PatientNameNgram.__tablename__} (ngram, patient_id) VALUES (?, ?)",
+                [(row['ngram'], row['patient_id']) for row in ngram_rows]
+            )
+            counts = PatientNgramCount.__table__
+            upsert = sqlite_insert(counts).values(ngram=bindparam('ngram'), patients=bindparam('added'))
+            conn.execute(
+                upsert.on_conflict_do_update(
+                    index_elements=[counts.c.ngram], set_={'patients': counts.c.patients + upsert.excluded.patients}
+                ),
+                [{'ngram': ngram, 'added': added} for ngram, added in Counter(row['ngram'] for row in ngram_rows).items()]
+            )
+        return len(rows)
+
+    def _write_rejected(self, report_path, rejected):
+        """Дозапись отклоненных строк в CSV-отчет (номер строки считается с заголовком)"""
+        if rejected.empty:
+            return
+        rejected = rejected.assign(row=rejected.index + 2)[['row', *COLUMN_ALIASES, 'reason']]
+        header = not report_path.exists()
+        rejected.to_csv(report_path, mode='a', header=header, index=False, encoding='utf-8-sig' if header else 'utf-8')
+
+    def import_file(self, path, resume=True):
+        """Импорт пациентов из файла; возвращает (успех, сообщение, отчет)"""
+        if not os.path.exists(path):
+            return False, f"Файл не найден: {path}", None
+        self.report_dir.mkdir(exist_ok=True)
+        started = datetime.now()
+
+        checkpoint = self._load_checkpoint(path) if resume else None
+        if checkpoint is None:
+            report_path = self.report_dir / f"import_rejected_{Path(path).stem}_{started.strftime('%Y%m%d_%H%M%S')}.csv"
+            checkpoint = dict(self._source_signature(path), rows_done=0, inserted=0, duplicates=0, rejected=0,
+                              rejected_report=str(report_path), finished=False)
+        elif checkpoint['finished']:
+            return True, f"Файл уже импортирован: добавлено пациентов {checkpoint['inserted']}", checkpoint
+        else:
+            print(f"Продолжение импорта со строки {checkpoint['rows_done'] + 1}")
+        report_path = Path(checkpoint['rejected_report'])
+
+        try:
+            for chunk in read_chunks(path, self.chunk_size, checkpoint['rows_done']):
+                chunk = chunk.rename(columns=rename_columns(chunk.columns))
+                missing = [column for column in REQUIRED_COLUMNS if column not in chunk]
+                if missing:
+                    return False, f"В файле нет обязательных столбцов: {', '.join(missing)}", checkpoint
+
+                clean, rejected = normalize_chunk(chunk)
+                with self.engine.begin() as conn:
+                    accepted, duplicate_reasons = self._split_duplicates(conn, clean)
+                    inserted = self._insert_patients(conn, accepted) if not accepted.empty else 0
+
+                duplicates = chunk.loc[duplicate_reasons.index, [c for c in COLUMN_ALIASES if c in chunk]]
+                rejected = pd.concat([rejected, duplicates.assign(reason=duplicate_reasons)]).sort_index()
+                self._write_rejected(report_path, rejected)
+                self.seen_passports.update(accepted['passport_key'].dropna())
+
+                checkpoint['rows_done'] += len(chunk)
+                checkpoint['inserted'] += inserted
+                checkpoint['duplicates'] += len(duplicate_reasons)
+                checkpoint['rejected'] += len(rejected) - len(duplicate_reasons)
+                self._save_checkpoint(path, checkpoint)
+                print(f"Импорт: обработано строк {checkpoint['rows_done']}, добавлено {checkpoint['inserted']}")
+        except Exception as e:
+            return False, (f"Ошибка импорта после строки {checkpoint['rows_done']}: {str(e)}. "
+                           f"Повторный запуск продолжит импорт"), checkpoint
+
+        checkpoint['finished'] = True
+        checkpoint['elapsed'] = (datetime.now() - started).total_seconds()
+        self._save_checkpoint(path, checkpoint)
+        message = (f"Строк: {checkpoint['rows_done']}, добавлено пациентов: {checkpoint['inserted']}, "
+                   f"дубликатов: {checkpoint['duplicates']}, отклонено: {checkpoint['rejected']}")
+        if checkpoint['duplicates'] or checkpoint['rejected']:
+            message += f". Отчет: {report_path}"
+        return True, message, checkpoint
+
+
+def main():
+    """Импорт реестра: python patient_import.py patients.csv --db medical_clinic.db"""
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Потоковый импорт пациентов из CSV/XLSX")
+    parser.add_argument('path')
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--report-dir', default='exports')
+    parser.add_argument('--restart', action='store_true', help="начать заново, не продолжая прерванный импорт")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    db_manager.init_database()
+    success, message, _ = PatientImporter(db_manager.engine, args.chunk_size, args.report_dir).import_file(
+        args.path, resume=not args.restart
+    )
+    print(message)
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
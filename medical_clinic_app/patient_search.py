@@ -0,0 +1,258 @@
+import math
+import re
+from sqlalchemy import select, update, delete, insert, func, and_, bindparam
+from sqlalchemy.orm import aliased
+from models import (
+    Patient, PatientNameNgram, PatientNgramCount, patient_search_keys, patient_ngram_rows
+)
+from normalization import (
+    PREFIX_END, digits_only, fold_name, ngrams, normalize_email, normalize_phone,
+    passport_key, similarity
+)
+
+# Серия и номер паспорта РФ: 4 + 6 цифр
+PASSPORT_PATTERN = re.compile(r'^\s*\d{2}\s?\d{2}\s*№?\s*\d{6}\s*$')
+
+# Минимальное сходство фамилии при поиске с опечатками
+MIN_SIMILARITY = 0.3
+
+# Сколько кандидатов из таблицы n-грамм проверяется точной оценкой сходства
+NGRAM_CANDIDATES = 200
+
+# Сколько строк списков n-грамм можно прочитать при отборе кандидатов
+NGRAM_POSTINGS_BUDGET = 5000
+
+# Размер пачки при заполнении ключей поиска для существующих пациентов
+BACKFILL_BATCH_SIZE = 5000
+
+# Столбцы с нормализованными ключами (см. patient_search_keys)
+SEARCH_KEY_COLUMNS = ('name_key', 'phone_digits', 'phone_reversed', 'email_key', 'passport_key')
+
+RESULT_COLUMNS = (
+    Patient.id, Patient.last_name, Patient.first_name, Patient.patronymic,
+    Patient.birth_date, Patient.phone, Patient.email
+)
+
+
+def _prefix(column, prefix):
+    """Поиск по началу строки диапазоном: использует индекс, в отличие от LIKE для кириллицы"""
+    return and_(column >= prefix, column < prefix + PREFIX_END)
+
+
+def _to_dict(row, match):
+    return {
+        'id': row.id,
+        'full_name': f"{row.last_name} {row.first_name} {row.patronymic or ''}".strip(),
+        'birth_date': row.birth_date.isoformat() if row.birth_date else None,
+        'phone': row.phone,
+        'email': row.email,
+        'match': match,
+    }
+
+
+def _fetch(session, condition, limit, order_by=(Patient.name_key, Patient.id)):
+    return session.execute(
+        select(*RESULT_COLUMNS).where(condition).order_by(*order_by).limit(limit)
+    ).all()
+
+
+def find_by_phone(session, text, limit=20):
+    """Поиск по телефону: полный номер в любом формате или последние цифры (от 4)"""
+    digits = digits_only(text)
+    if len(digits) >= 10:
+        return _fetch(session, Patient.phone_digits == normalize_phone(digits), limit)
+    if len(digits) >= 4:
+        # Окончание номера ищется по индексу на перевернутой строке цифр
+        return _fetch(session, _prefix(Patient.phone_reversed, digits[::-1]), limit)
+    return []
+
+
+def find_by_passport(session, text, limit=20):
+    """Точный поиск по серии и номеру паспорта"""
+    key = passport_key(text, '')
+    if not key:
+        return []
+    return _fetch(session, Patient.passport_key == key, limit)
+
+
+def find_by_email(session, text, limit=20):
+    """Поиск по email: полный адрес или его начало"""
+    email = normalize_email(text)
+    if not email:
+        return []
+    if '@' in email and '.' in email.split('@', 1)[1]:
+        return _fetch(session, Patient.email_key == email, limit)
+    return _fetch(session, _prefix(Patient.email_key, email), limit)
+
+
+def find_by_name(session, text, limit=20):
+    """Поиск по началу ФИО без учета регистра и ё: «иванов ал», «ПЕТРОВА»"""
+    prefix = fold_name(text)
+    if not prefix:
+        return []
+    return _fetch(session, _prefix(Patient.name_key, prefix), limit)
+
+
+def find_similar_names(session, text, limit=20, min_similarity=MIN_SIMILARITY, exclude_ids=()):
+    """Поиск по фамилии с опечатками через n-граммы
+
+    Фамилия со сходством не ниже порога содержит хотя бы required общих
+    n-грамм, а значит хотя бы одну из (всего - required + 1) самых редких.
+    Кандидаты берутся только из списков этих редких n-грамм (в пределах
+    NGRAM_POSTINGS_BUDGET строк, поэтому фамилия только из частых n-грамм
+    может быть не найдена), для них в базе считается число общих n-грамм,
+    затем кандидаты упорядочиваются по точному коэффициенту сходства. Возвращает список пар (строка, сходство).
+    """
+    tokens = fold_name(text).split()
+    if not tokens:
+        return []
+    surname = tokens[0]
+    grams = sorted(ngrams(surname))
+    # Коэффициент Жаккара не меньше порога требует доли общих n-грамм не меньше порога
+    required = max(1, math.ceil(len(grams) * min_similarity))
+
+    frequency = dict(session.execute(
+        select(PatientNgramCount.ngram, PatientNgramCount.patients)
+        .where(PatientNgramCount.ngram.in_(grams))
+    ).all())
+    probe = []
+    postings_total = 0
+    for gram in sorted(grams, key=lambda gram: frequency.get(gram, 0))[:len(grams) - required + 1]:
+        postings = frequency.get(gram, 0)
+        if not postings:
+            continue
+        if probe and postings_total + postings > NGRAM_POSTINGS_BUDGET:
+            # Частые n-граммы (окончания -ов, -ова) почти не сужают выбор, но дорого стоят
+            break
+        probe.append(gram)
+        postings_total += postings
+    if not probe:
+        return []
+
+    candidates = (
+        select(PatientNameNgram.patient_id)
+        .where(PatientNameNgram.ngram.in_(probe))
+        .distinct()
+        .subquery()
+    )
+    postings = aliased(PatientNameNgram)
+    shared = func.count().label('shared')
+    matches = session.execute(
+        select(candidates.c.patient_id, shared)
+        .join(postings, and_(postings.patient_id == candidates.c.patient_id, postings.ngram.in_(grams)))
+        .group_by(candidates.c.patient_id)
+        .having(shared >= required)
+        .order_by(shared.desc())
+        .limit(NGRAM_CANDIDATES)
+    ).all()
+    candidate_ids = [row.patient_id for row in matches if row.patient_id not in exclude_ids]
+    if not candidate_ids:
+        return []
+
+    rows = session.execute(select(*RESULT_COLUMNS).where(Patient.id.in_(candidate_ids))).all()
+    scored = []
+    for row in rows:
+        score = similarity(surname, row.last_name)
+        if score < min_similarity:
+            continue
+        if len(tokens) > 1:
+            # Имя и отчество уточняют порядок, но не отсекают кандидатов
+            rest = ' ' + fold_name(f"{row.first_name} {row.patronymic or ''}")
+            score += 0.1 * sum(f" {token}" in rest for token in tokens[1:])
+        scored.append((row, score))
+    scored.sort(key=lambda item: (-item[1], item[0].last_name, item[0].id))
+    return scored[:limit]
+
+
+def search_patients(session, text, limit=20, fuzzy=True):
+    """Поиск пациента по строке: ФИО, телефон, паспорт или email
+
+    Тип поиска определяется по введенной строке. Если по началу ФИО найдено
+    никого, выполняется поиск похожих фамилий.
+    Возвращает список словарей; поле match - способ, которым найден пациент.
+    """
+    text = (text or '').strip()
+    if not text:
+        return []
+
+    results = []
+    seen = set()
+
+    def add(rows, match):
+        for row in rows:
+            if row.id not in seen and len(results) < limit:
+                seen.add(row.id)
+                results.append(_to_dict(row, match))
+
+    if '@' in text:
+        add(find_by_email(session, text, limit), 'email')
+        return results
+
+    if not any(char.isalpha() for char in text):
+        if PASSPORT_PATTERN.match(text):
+            add(find_by_passport(session, text, limit), 'passport')
+        add(find_by_phone(session, text, limit), 'phone')
+        return results
+
+    add(find_by_name(session, text, limit), 'name')
+    if text.isascii() and ' ' not in text:
+        # Латиница одним словом может быть началом email
+        add(find_by_email(session, text, limit), 'email')
+    if fuzzy and not results:
+        # Поиск с опечатками дороже точного и нужен, только если точный ничего не нашел
+        for row, score in find_similar_names(session, text, limit, exclude_ids=seen):
+            add([row], 'similar')
+    return results
+
+
+def backfill_search_keys(conn):
+    """Заполнение ключей поиска и n-грамм для пациентов, добавленных до их появления"""
+    table = Patient.__table__
+    ngram_table = PatientNameNgram.__table__
+    update_keys = (
+        update(table)
+        .where(table.c.id == bindparam('patient_id'))
+        .values({column: bindparam(f'new_{column}') for column in SEARCH_KEY_COLUMNS})
+    )
+
+    conn.execute(delete(ngram_table))
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(
+                table.c.id, table.c.last_name, table.c.first_name, table.c.patronymic,
+                table.c.phone, table.c.email, table.c.passport_series, table.c.passport_number
+            )
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        conn.execute(update_keys, [
+            dict(
+                {f'new_{column}': value for column, value in patient_search_keys(*row[1:]).items()},
+                patient_id=row.id
+            )
+            for row in rows
+        ])
+        ngram_rows = [item for row in rows for item in patient_ngram_rows(row.id, row.last_name)]
+        if ngram_rows:
+            conn.execute(insert(ngram_table), ngram_rows)
+
+    rebuild_ngram_counts(conn)
+
+
+def rebuild_ngram_counts(conn):
+    """Пересчет частот n-грамм по таблице patient_name_ngrams"""
+    ngram_table = PatientNameNgram.__table__
+    counts = PatientNgramCount.__table__
+    conn.execute(delete(counts))
+    conn.execute(
+        insert(counts).from_select(
+            ['ngram', 'patients'],
+            select(ngram_table.c.ngram, func.count()).group_by(ngram_table.c.ngram)
+        )
+    )
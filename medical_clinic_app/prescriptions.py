@@ -0,0 +1,114 @@
+import argparse
+import os
+from datetime import date
+from sqlalchemy import select, update, or_, false, bindparam
+from models import Employee, MedicalRecord, Prescription, prescription_end_date
+from normalization import parse_duration_days
+
+# Размер пачки при заполнении длительностей существующих назначений
+BACKFILL_BATCH_SIZE = 5000
+
+
+def current_medications(session, patient_id, on_date=None):
+    """Действующие назначения пациента на дату (по умолчанию - сегодня)
+
+    Условие is_completed = 0 совпадает с условием частичного индекса
+    ix_prescriptions_active_record, поэтому для каждой медицинской записи
+    пациента читаются только действующие назначения.
+    """
+    on_date = on_date or date.today()
+    return session.execute(
+        select(
+            Prescription.id, Prescription.medication_name, Prescription.dosage, Prescription.frequency,
+            Prescription.duration, Prescription.instructions, Prescription.start_date, Prescription.end_date,
+            MedicalRecord.id.label('medical_record_id'), MedicalRecord.doctor_id,
+            Employee.last_name.label('doctor_last_name'), Employee.first_name.label('doctor_first_name'),
+            Employee.patronymic.label('doctor_patronymic')
+        )
+        .join(MedicalRecord, MedicalRecord.id == Prescription.medical_record_id)
+        .join(Employee, Employee.id == MedicalRecord.doctor_id)
+        .where(
+            MedicalRecord.patient_id == patient_id,
+            Prescription.is_completed == false(),
+            or_(Prescription.end_date.is_(None), Prescription.end_date >= on_date),
+            or_(Prescription.start_date.is_(None), Prescription.start_date <= on_date)
+        )
+        .order_by(Prescription.start_date, Prescription.id)
+    ).all()
+
+
+def complete_expired_prescriptions(conn, today=None):
+    """Отметка завершенными всех назначений, последний день которых прошел
+
+    Один оператор UPDATE по частичному индексу ix_prescriptions_active_end.
+    Возвращает число закрытых назначений.
+    """
+    table = Prescription.__table__
+    today = today or date.today()
+    result = conn.execute(
+        update(table)
+        .where(table.c.is_completed == false(), table.c.end_date < today)
+        .values(is_completed=True)
+    )
+    return result.rowcount
+
+
+def backfill_prescription_durations(conn):
+    """Разбор длительности и дата окончания для назначений, созданных до их появления"""
+    table = Prescription.__table__
+    conn.execute(update(table).where(table.c.is_completed.is_(None)).values(is_completed=False))
+    update_dates = (
+        update(table)
+        .where(table.c.id == bindparam('prescription_id'))
+        .values(duration_days=bindparam('new_duration_days'), end_date=bindparam('new_end_date'))
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.duration, table.c.start_date, table.c.end_date)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        parameters = []
+        for row in rows:
+            duration_days = parse_duration_days(row.duration)
+            end_date = row.end_date or prescription_end_date(row.start_date, duration_days)
+            if duration_days is not None or end_date != row.end_date:
+                parameters.append({
+                    'prescription_id': row.id, 'new_duration_days': duration_days, 'new_end_date': end_date
+                })
+        if parameters:
+            conn.execute(update_dates, parameters)
+
+
+def main():
+    """Ночной запуск: python prescriptions.py --db medical_clinic.db"""
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Отметка завершенными истекших назначений")
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--date', type=date.fromisoformat, help="дата, на которую закрываются назначения")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    db_manager.init_database()
+    try:
+        with db_manager.engine.begin() as conn:
+            completed = complete_expired_prescriptions(conn, args.date)
+    except Exception as e:
+        print(f"Ошибка закрытия назначений: {str(e)}")
+        return 1
+    print(f"Завершено назначений: {completed}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
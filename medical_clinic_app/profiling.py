@@ -0,0 +1,355 @@
+import builtins
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import event
+
+# Пиковый RSS процесса (модуля resource нет в Windows)
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+# Режимы: замеры (время, процессор, запросы, память) и замеры со снятием профиля в файлы
+MODE_METRICS = 'metrics'
+MODE_CAPTURE = 'capture'
+
+PROFILE_DIR = 'profiles'
+
+# Строк в текстовых отчетах cProfile и tracemalloc
+PROFILE_TOP_FUNCTIONS = 30
+PROFILE_TOP_ALLOCATIONS = 15
+
+# Последних вызовов, хранимых в памяти
+RECENT_CALLS = 200
+
+# Служебные методы приложения, которые не являются действиями
+APP_SKIPPED_METHODS = ('clear_screen', 'print_header', 'run', 'init_application')
+
+# Циклы меню (main_menu, login_menu, backup_menu...) не замеряются: иначе все
+# действия экрана стали бы вложенными, а профиль снимался бы с меню целиком
+APP_SKIPPED_SUFFIXES = ('_menu',)
+
+_FILE_NAME_UNSAFE = re.compile(r'[^\w.-]+')
+
+
+def _peak_rss_kb():
+    """Пиковый RSS процесса, КБ (ru_maxrss в Linux - КБ, в macOS - байты)"""
+    if not RESOURCE_AVAILABLE:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if os.uname().sysname == 'Darwin' else peak
+
+
+class _Frame:
+    """Замеры одного выполняющегося действия"""
+
+    __slots__ = ('name', 'wall', 'cpu', 'queries', 'sql', 'wait', 'rss', 'traced', 'traced_peak', 'profile')
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.sql = 0.0
+        self.wait = 0.0
+        self.traced = None
+        self.traced_peak = 0
+        self.profile = None
+
+
+class ActionProfiler:
+    """Профилирование действий меню, экспорта и резервного копирования
+
+    Методы объектов оборачиваются на уровне экземпляра (install/instrument),
+    поэтому вызовы через self.method тоже замеряются. На каждый вызов
+    записываются время, время процессора, число и суммарное время SQL-запросов
+    движка и пиковая память; время ожидания ввода пользователя (input)
+    вычитается из времени действия и показывается отдельно.
+
+    В режиме metrics память - прирост пикового RSS процесса (дешево, но
+    растет только при новом максимуме). В режиме capture для внешнего
+    действия включаются cProfile и tracemalloc: пик памяти Python точный,
+    а профиль (.prof для pstats/snakeviz) и текстовый отчет с самыми
+    затратными функциями и местами выделения памяти пишутся в report_dir.
+    Вложенные действия замеряются всегда, профиль снимается только
+    с внешнего - cProfile не допускает вложенного запуска.
+    """
+
+    def __init__(self, mode=None, report_dir=PROFILE_DIR):
+        self.mode = mode
+        self.report_dir = Path(report_dir)
+        self.engine = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._instrumented = []
+        self._input = None
+        self._owns_tracing = False
+        self.actions = {}
+        self.recent = []
+        self.started_at = datetime.now()
+
+    @classmethod
+    def from_env(cls):
+        """Настройки из переменных CLINIC_PROFILE (metrics/capture) и CLINIC_PROFILE_DIR"""
+        mode = (os.environ.get('CLINIC_PROFILE') or '').strip().lower()
+        return cls(
+            mode=mode if mode in (MODE_METRICS, MODE_CAPTURE) else None,
+            report_dir=os.environ.get('CLINIC_PROFILE_DIR') or PROFILE_DIR,
+        )
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    @property
+    def installed(self):
+        return bool(self._instrumented)
+
+    # --- Подключение ---
+
+    def install(self, engine, *objects):
+        """Подключение к движку и оборачивание методов объектов, если профилирование включено"""
+        if not self.enabled or self.installed:
+            return
+        self.engine = engine
+        if engine is not None:
+            event.listen(engine, 'before_cursor_execute', self._before_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_execute)
+        self._input = builtins.input
+        builtins.input = self._timed_input
+        for obj in objects:
+            if type(obj).__name__ == 'MedicalClinicApp':
+                self.instrument(obj, APP_SKIPPED_METHODS, APP_SKIPPED_SUFFIXES)
+            else:
+                self.instrument(obj)
+
+    def uninstall(self):
+        """Восстановление исходных методов и отключение от движка (накопленные замеры сохраняются)"""
+        for obj, names in self._instrumented:
+            for name in names:
+                obj.__dict__.pop(name, None)
+        self._instrumented = []
+        if self._input is not None:
+            builtins.input = self._input
+            self._input = None
+        if self.engine is not None:
+            event.remove(self.engine, 'before_cursor_execute', self._before_execute)
+            event.remove(self.engine, 'after_cursor_execute', self._after_execute)
+            self.engine = None
+
+    def instrument(self, obj, skipped=(), skipped_suffixes=()):
+        """Оборачивание открытых методов экземпляра; действие называется Класс.метод"""
+        names = []
+        for name in dir(type(obj)):
+            if name.startswith('_') or name in skipped or name in obj.__dict__:
+                continue
+            if name.endswith(tuple(skipped_suffixes)):
+                continue
+            if not callable(getattr(type(obj), name, None)):
+                continue
+            setattr(obj, name, self.wrap(getattr(obj, name), f"{type(obj).__name__}.{name}"))
+            names.append(name)
+        self._instrumented.append((obj, names))
+        return names
+
+    def wrap(self, func, name):
+        """Функция с замером каждого вызова"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            frame = self._start(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._finish(frame)
+        return wrapper
+
+    def reset(self):
+        with self._lock:
+            self.actions = {}
+            self.recent = []
+            self.started_at = datetime.now()
+
+    # --- Замеры ---
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _start(self, name):
+        stack = self._stack()
+        frame = _Frame(name)
+        frame.rss = _peak_rss_kb()
+        if self.mode == MODE_CAPTURE:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # Пик внешнего действия до сброса учитывается при его завершении
+                stack[-1].traced_peak = max(stack[-1].traced_peak, peak)
+            else:
+                frame.profile = cProfile.Profile()
+            tracemalloc.reset_peak()
+            frame.traced = current
+        stack.append(frame)
+        frame.cpu = time.process_time()
+        frame.wall = time.perf_counter()
+        if frame.profile is not None:
+            try:
+                frame.profile.enable()
+            except ValueError:
+                # Профиль уже снимается в другом потоке (Python 3.12+)
+                frame.profile = None
+        return frame
+
+    def _finish(self, frame):
+        if frame.profile is not None:
+            frame.profile.disable()
+        wall = time.perf_counter() - frame.wall
+        cpu = time.process_time() - frame.cpu
+        stack = self._stack()
+        stack.pop()
+
+        if frame.traced is not None:
+            peak = max(frame.traced_peak, tracemalloc.get_traced_memory()[1])
+            peak_kb = max(0, peak - frame.traced) // 1024
+            if stack:
+                stack[-1].traced_peak = max(stack[-1].traced_peak, peak)
+        else:
+            peak_kb = max(0, _peak_rss_kb() - frame.rss)
+        if stack:
+            # Запросы и ожидание вложенного действия входят и во внешнее
+            stack[-1].queries += frame.queries
+            stack[-1].sql += frame.sql
+            stack[-1].wait += frame.wait
+
+        call = {
+            'action': frame.name, 'time': datetime.now().isoformat(timespec='seconds'),
+            'wall_ms': round((wall - frame.wait) * 1000, 3), 'cpu_ms': round(cpu * 1000, 3),
+            'wait_ms': round(frame.wait * 1000, 3), 'queries': frame.queries,
+            'sql_ms': round(frame.sql * 1000, 3), 'peak_kb': peak_kb,
+            'parent': stack[-1].name if stack else None,
+        }
+        if frame.profile is not None:
+            call['report'] = self._write_capture(frame, call)
+        self._record(call)
+
+    def _record(self, call):
+        with self._lock:
+            stats = self.actions.get(call['action'])
+            if stats is None:
+                stats = self.actions[call['action']] = {
+                    'action': call['action'], 'calls': 0, 'wall_ms': 0.0, 'max_wall_ms': 0.0, 'cpu_ms': 0.0,
+                    'queries': 0, 'sql_ms': 0.0, 'max_peak_kb': 0,
+                }
+            stats['calls'] += 1
+            stats['wall_ms'] += call['wall_ms']
+            stats['max_wall_ms'] = max(stats['max_wall_ms'], call['wall_ms'])
+            stats['cpu_ms'] += call['cpu_ms']
+            stats['queries'] += call['queries']
+            stats['sql_ms'] += call['sql_ms']
+            stats['max_peak_kb'] = max(stats['max_peak_kb'], call['peak_kb'])
+            self.recent.append(call)
+            del self.recent[:-RECENT_CALLS]
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._stack():
+            context._profiler_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_profiler_started', None)
+        stack = self._stack()
+        if started is None or not stack:
+            return
+        context._profiler_started = None
+        stack[-1].queries += 1
+        stack[-1].sql += time.perf_counter() - started
+
+    def _timed_input(self, *args):
+        """input с учетом времени ожидания пользователя"""
+        started = time.perf_counter()
+        try:
+            return self._input(*args)
+        finally:
+            stack = self._stack()
+            if stack:
+                stack[-1].wait += time.perf_counter() - started
+
+    def _write_capture(self, frame, call):
+        """Профиль cProfile и текстовый отчет внешнего действия; возвращает путь к отчету"""
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        base = self.report_dir / f"{datetime.now():%Y%m%d_%H%M%S_%f}_{_FILE_NAME_UNSAFE.sub('_', frame.name)}"
+        frame.profile.dump_stats(f"{base}.prof")
+
+        output = io.StringIO()
+        output.write(f"{frame.name}: {call['wall_ms']:.1f} мс (без ожидания ввода {call['wait_ms']:.0f} мс), "
+                     f"процессор {call['cpu_ms']:.1f} мс, запросов {call['queries']} на {call['sql_ms']:.1f} мс, "
+                     f"пик памяти Python {call['peak_kb']} КБ\n\n")
+        pstats.Stats(frame.profile, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+
+        output.write(f"\nНеосвобожденная память по строкам кода (первые {PROFILE_TOP_ALLOCATIONS}):\n")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]:
+            output.write(f"  {stat}\n")
+        if self._owns_tracing and not self._stack():
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(output.getvalue())
+        return f"{base}.txt"
+
+    # --- Отчеты ---
+
+    def snapshot(self, order_by='wall_ms'):
+        """Сводка по действиям, отсортированная по убыванию order_by"""
+        with self._lock:
+            items = [dict(stats) for stats in self.actions.values()]
+        for item in items:
+            item['avg_wall_ms'] = round(item['wall_ms'] / item['calls'], 3)
+        return sorted(items, key=lambda item: -item[order_by])
+
+    def report(self, limit=15, order_by='wall_ms'):
+        """Текстовый отчет по самым долгим действиям"""
+        mode = {MODE_METRICS: 'замеры', MODE_CAPTURE: 'замеры и профили'}.get(self.mode, 'выключено')
+        lines = [f"Профилирование действий с {self.started_at:%d.%m.%Y %H:%M:%S}, режим: {mode}"]
+        for item in self.snapshot(order_by)[:limit]:
+            other_ms = item['wall_ms'] - item['sql_ms']
+            lines.append(
+                f"{item['calls']:>5} выз. {item['action']}: всего {item['wall_ms']:.1f} мс, "
+                f"сред. {item['avg_wall_ms']:.1f}, макс. {item['max_wall_ms']:.1f} мс"
+            )
+            lines.append(
+                f"        процессор {item['cpu_ms']:.1f} мс, SQL {item['queries']} запр. на {item['sql_ms']:.1f} мс, "
+                f"Python и вывод {other_ms:.1f} мс, пик памяти {item['max_peak_kb']} КБ"
+            )
+        reports = [call['report'] for call in self.recent if call.get('report')]
+        if reports:
+            lines.append(f"\nПрофили последних действий: {', '.join(reports[-3:])}")
+        return '\n'.join(lines)
+
+    def dump(self, path=None):
+        """Сохранение сводки и последних вызовов в JSON; возвращает путь"""
+        path = Path(path or self.report_dir / f"actions_{datetime.now():%Y%m%d_%H%M%S}.json")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            recent = list(self.recent)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'started_at': self.started_at.isoformat(timespec='seconds'), 'mode': self.mode,
+                'actions': self.snapshot(), 'recent': recent,
+            }, f, ensure_ascii=False, indent=2)
+        return str(path)
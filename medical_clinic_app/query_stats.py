@@ -0,0 +1,312 @@
+import bisect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import event
+
+# Границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# Запрос медленнее этого порога попадает в журнал медленных запросов, мс
+DEFAULT_SLOW_MS = 100
+
+# Размер журнала медленных запросов и число мест вызова на один оператор
+SLOW_LOG_SIZE = 200
+MAX_CALL_SITES = 10
+
+# Операторы без плана выполнения
+_NO_PLAN = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'ANALYZE', 'VACUUM', 'ATTACH',
+            'DETACH', 'CREATE', 'DROP', 'ALTER', 'EXPLAIN')
+
+# Операторы, возвращающие строки: время замеряется до исчерпания или закрытия курсора
+_ROW_STATEMENTS = ('SELECT', 'WITH')
+
+_IN_LIST = re.compile(r'\(\?(?:,\s*\?)+\)')
+_SPACES = re.compile(r'\s+')
+
+# Кадры этих модулей пропускаются при поиске места вызова
+_SKIPPED_PATHS = (
+    os.path.join('sqlalchemy', ''), os.path.abspath(__file__), os.path.join('contextlib.py'),
+)
+
+
+def normalize_statement(statement):
+    """Текст оператора без лишних пробелов и с одинаковым видом списков IN (?, ?, ...)"""
+    return _IN_LIST.sub('(?, ...)', _SPACES.sub(' ', statement).strip())
+
+
+def call_site():
+    """Первый кадр стека вне SQLAlchemy: файл:строка функция"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not any(part in filename for part in _SKIPPED_PATHS):
+            return f"{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return '?'
+
+
+class StatementStats:
+    """Накопленная статистика одного оператора"""
+
+    __slots__ = ('statement', 'calls', 'total', 'max', 'rows', 'histogram', 'call_sites')
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        # None - число строк неизвестно (DDL и служебные операторы)
+        self.rows = None
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.call_sites = Counter()
+
+    def add(self, elapsed_ms, rows, site):
+        self.calls += 1
+        self.total += elapsed_ms
+        self.max = max(self.max, elapsed_ms)
+        if rows >= 0:
+            self.rows = (self.rows or 0) + rows
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        if site in self.call_sites or len(self.call_sites) < MAX_CALL_SITES:
+            self.call_sites[site] += 1
+
+    def percentile(self, fraction):
+        """Верхняя граница корзины, в которую попадает заданная доля вызовов, мс"""
+        threshold = self.calls * fraction
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if seen >= threshold:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            'statement': self.statement, 'calls': self.calls, 'total_ms': round(self.total, 3),
+            'avg_ms': round(self.total / self.calls, 3) if self.calls else 0, 'max_ms': round(self.max, 3),
+            'p50_ms': self.percentile(0.5), 'p99_ms': self.percentile(0.99), 'rows': self.rows,
+            'histogram': dict(zip([f'<={bound}' for bound in LATENCY_BUCKETS_MS] + ['>1000'], self.histogram)),
+            'call_sites': dict(self.call_sites.most_common()),
+        }
+
+
+class TimedCursor:
+    """Курсор выборки, который считает строки и сообщает о ее завершении
+
+    Модуль sqlite3 выполняет SELECT по мере чтения строк, поэтому выборка
+    завершается, когда строки исчерпаны или курсор закрыт (SQLAlchemy
+    закрывает его после first(), scalar() и чтения всех строк). Остальные
+    атрибуты берутся у исходного курсора.
+    """
+
+    def __init__(self, cursor, finish):
+        self._cursor = cursor
+        self._finish = finish
+        self.rows_fetched = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _done(self):
+        if self._finish is not None:
+            finish, self._finish = self._finish, None
+            finish(self.rows_fetched)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is None:
+            self._done()
+        else:
+            self.rows_fetched += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(self._cursor.arraysize if size is None else size)
+        self.rows_fetched += len(rows)
+        if not rows:
+            self._done()
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self.rows_fetched += len(rows)
+        self._done()
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._done()
+        self._cursor.close()
+
+
+class QueryStats:
+    """Статистика SQL-запросов движка: задержки, строки, места вызова и медленные запросы
+
+    Подписывается на before/after_cursor_execute движка. Время замеряется
+    только у выборки операторов (sample_rate); при sample_rate = 0 обработчики
+    событий не подключаются вовсе и накладных расходов нет. Для медленных
+    запросов сразу снимается EXPLAIN QUERY PLAN с теми же параметрами.
+
+    Модуль sqlite3 выполняет SELECT по мере чтения строк, поэтому курсор
+    выборки заменяется на TimedCursor: время замеряется до исчерпания строк
+    или закрытия результата, а число строк - по прочитанным. При потоковом
+    чтении (yield_per) в это время входит и обработка строк приложением.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_ms=DEFAULT_SLOW_MS, slow_log_size=SLOW_LOG_SIZE):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.engine = None
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._normalized = {}
+        self.slow_log = deque(maxlen=slow_log_size)
+        self.started_at = datetime.now()
+
+    @classmethod
+    def from_env(cls):
+        """Настройки из переменных CLINIC_QUERY_SAMPLE_RATE и CLINIC_SLOW_QUERY_MS"""
+        return cls(
+            sample_rate=float(os.environ.get('CLINIC_QUERY_SAMPLE_RATE') or 0),
+            slow_ms=float(os.environ.get('CLINIC_SLOW_QUERY_MS') or DEFAULT_SLOW_MS),
+        )
+
+    @property
+    def enabled(self):
+        return self.engine is not None
+
+    def install(self, engine):
+        """Подключение к движку, если выборка не нулевая"""
+        if self.engine is not None or self.sample_rate <= 0:
+            return
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        self.engine = engine
+
+    def uninstall(self):
+        if self.engine is None:
+            return
+        event.remove(self.engine, 'before_cursor_execute', self._before_execute)
+        event.remove(self.engine, 'after_cursor_execute', self._after_execute)
+        self.engine = None
+
+    def reset(self):
+        with self._lock:
+            self._statements = {}
+            self.slow_log.clear()
+            self.started_at = datetime.now()
+
+    # --- Обработчики событий ---
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            context._query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        context._query_started = None
+        site = call_site()
+
+        if (not executemany and cursor.description is not None
+                and statement.lstrip().upper().startswith(_ROW_STATEMENTS)):
+            # Результат SQLAlchemy создается по context.cursor после этого события
+            def finish(rows):
+                self._record(conn, statement, parameters, executemany,
+                             (time.perf_counter() - started) * 1000, rows, site)
+            context.cursor = TimedCursor(cursor, finish)
+            return
+
+        self._record(conn, statement, parameters, executemany,
+                     (time.perf_counter() - started) * 1000, cursor.rowcount, site)
+
+    def _record(self, conn, statement, parameters, executemany, elapsed_ms, rows, site):
+        """Учет выполненного оператора и запись в журнал медленных запросов"""
+        normalized = self._normalized.get(statement)
+        if normalized is None:
+            if len(self._normalized) > 10000:
+                self._normalized.clear()
+            normalized = self._normalized[statement] = normalize_statement(statement)
+
+        with self._lock:
+            stats = self._statements.get(normalized)
+            if stats is None:
+                stats = self._statements[normalized] = StatementStats(normalized)
+            stats.add(elapsed_ms, rows, site)
+
+        if elapsed_ms >= self.slow_ms:
+            self.slow_log.append({
+                'time': datetime.now().isoformat(timespec='seconds'), 'elapsed_ms': round(elapsed_ms, 3),
+                'statement': normalized, 'parameters': repr(parameters[0] if executemany else parameters)[:300],
+                'call_site': site, 'plan': self._explain(conn, statement, parameters, executemany),
+            })
+
+    def _explain(self, conn, statement, parameters, executemany):
+        """План выполнения медленного запроса на том же соединении"""
+        if statement.lstrip().upper().startswith(_NO_PLAN):
+            return []
+        if conn.closed or conn.invalidated:
+            # Результат выборки закрыт после возврата соединения в пул
+            return ["план недоступен: соединение закрыто"]
+        try:
+            cursor = conn.connection.driver_connection.cursor()
+            try:
+                rows = cursor.execute(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters[0] if executemany else parameters
+                ).fetchall()
+            finally:
+                cursor.close()
+            return [row[-1] for row in rows]
+        except Exception as e:
+            return [f"план недоступен: {e}"]
+
+    # --- Отчеты ---
+
+    def snapshot(self, order_by='total_ms'):
+        """Статистика операторов, отсортированная по убыванию order_by"""
+        with self._lock:
+            items = [stats.as_dict() for stats in self._statements.values()]
+        return sorted(items, key=lambda item: -item[order_by])
+
+    def report(self, limit=10, order_by='total_ms'):
+        """Текстовый отчет по самым затратным операторам и последним медленным запросам"""
+        lines = [f"Статистика запросов с {self.started_at:%d.%m.%Y %H:%M:%S}, выборка {self.sample_rate:.0%}"]
+        for item in self.snapshot(order_by)[:limit]:
+            lines.append(
+                f"{item['calls']:>7} выз. {item['total_ms']:>10.1f} мс всего, сред. {item['avg_ms']:.2f}, "
+                f"p99 ≤ {item['p99_ms']} мс, макс. {item['max_ms']:.1f} мс"
+                + (f", строк {item['rows']}" if item['rows'] is not None else "")
+            )
+            lines.append(f"        {item['statement'][:150]}")
+            site, count = next(iter(item['call_sites'].items()), ('?', 0))
+            lines.append(f"        чаще всего из {site} ({count})")
+        if self.slow_log:
+            lines.append(f"\nМедленные запросы (≥ {self.slow_ms:g} мс), последние:")
+            for entry in list(self.slow_log)[-limit:]:
+                lines.append(f"  {entry['time']} {entry['elapsed_ms']:.1f} мс, {entry['call_site']}: "
+                             f"{entry['statement'][:120]}")
+                lines.extend(f"      {step}" for step in entry['plan'])
+        return '\n'.join(lines)
+
+    def dump(self, path=None):
+        """Сохранение статистики и журнала медленных запросов в JSON; возвращает путь"""
+        path = Path(path or Path('exports') / f"query_stats_{datetime.now():%Y%m%d_%H%M%S}.json")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'sample_rate': self.sample_rate, 'slow_ms': self.slow_ms,
+                'statements': self.snapshot(), 'slow_queries': list(self.slow_log),
+            }, f, ensure_ascii=False, indent=2)
+        return str(path)
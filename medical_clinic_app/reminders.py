@@ -0,0 +1,352 @@
+import argparse
+from abc import ABC, abstractmethod
+import json
+import os
+import string
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from sqlalchemy import select, update, exists, func, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import (
+    Appointment, AppointmentStatus, Employee, MedicalRecord, Patient, ReminderOutbox, ReminderStatus, Schedule
+)
+
+# Размер пачки при чтении записей и при записи напоминаний в очередь
+BATCH_SIZE = 2000
+
+# За сколько дней до события создается напоминание
+APPOINTMENT_DAYS_AHEAD = 1
+FOLLOW_UP_DAYS_AHEAD = 3
+
+# Число попыток отправки, после которого напоминание считается неотправленным
+MAX_SEND_ATTEMPTS = 3
+
+# Каталог с шаблонами, переопределяющими встроенные: <вид>_<канал>.txt
+TEMPLATE_DIR = os.path.join('templates', 'reminders')
+
+DEFAULT_TEMPLATES = {
+    ('appointment', 'sms'): "$patient_name, напоминаем о приеме $date в $time: $doctor_name, кабинет $cabinet.",
+    ('appointment', 'email'): (
+        "Здравствуйте, $patient_name!\n\n"
+        "Напоминаем о записи на прием $date в $time.\n"
+        "Врач: $doctor_name\nКабинет: $cabinet\n\n"
+        "Если вы не сможете прийти, пожалуйста, отмените запись."
+    ),
+    ('follow_up', 'sms'): "$patient_name, врач $doctor_name рекомендовал повторный прием $date. Запишитесь в регистратуре.",
+    ('follow_up', 'email'): (
+        "Здравствуйте, $patient_name!\n\n"
+        "Врач $doctor_name рекомендовал вам повторный прием $date.\n"
+        "Запишитесь на прием в регистратуре или по телефону клиники."
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def load_template(kind, channel, template_dir=TEMPLATE_DIR):
+    """Шаблон напоминания (файл из template_dir или встроенный); читается один раз"""
+    path = os.path.join(template_dir, f'{kind}_{channel}.txt')
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return string.Template(f.read().strip())
+    return string.Template(DEFAULT_TEMPLATES[(kind, channel)])
+
+
+def short_name(last_name, first_name, patronymic):
+    """Фамилия с инициалами: Иванов И. И."""
+    initials = ' '.join(f'{part[0]}.' for part in (first_name, patronymic) if part)
+    return f'{last_name} {initials}'.strip()
+
+
+def contact_channel(phone, email):
+    """Канал и адрес напоминания: SMS, если есть телефон, иначе email"""
+    if phone:
+        return 'sms', phone
+    if email:
+        return 'email', email
+    return None, None
+
+
+class ReminderJob:
+    """Формирование напоминаний о записях и повторных приемах в исходящей очереди
+
+    Записи на прием и медицинские записи с рекомендованным повторным приемом
+    читаются потоком пачками по BATCH_SIZE строк, сообщения собираются по
+    кэшированным шаблонам и вставляются в reminder_outbox с
+    ON CONFLICT DO NOTHING по ключу (вид, id источника, дата события).
+    Повторный запуск за тот же день пропускает уже поставленные напоминания
+    еще в запросе и не создает дублей. Отправкой занимается ReminderDispatcher.
+    """
+
+    def __init__(self, engine, batch_size=BATCH_SIZE, template_dir=TEMPLATE_DIR):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.template_dir = template_dir
+
+    def run(self, on_date=None):
+        """Постановка напоминаний на дату запуска
+
+        Возвращает (успех, сообщение, статистика).
+        """
+        on_date = on_date or date.today()
+        stats = {'appointment': 0, 'follow_up': 0, 'no_contact': 0}
+        try:
+            self._queue(self._appointment_query(on_date + timedelta(days=APPOINTMENT_DAYS_AHEAD)),
+                        'appointment', stats)
+            self._queue(self._follow_up_query(on_date, on_date + timedelta(days=FOLLOW_UP_DAYS_AHEAD)),
+                        'follow_up', stats)
+        except Exception as e:
+            return False, f"Ошибка формирования напоминаний: {str(e)}", stats
+        message = (f"Поставлено напоминаний: о записях {stats['appointment']}, "
+                   f"о повторных приемах {stats['follow_up']}; без контактов {stats['no_contact']}")
+        print(message)
+        return True, message, stats
+
+    def _not_queued(self, kind, source_id, event_date):
+        outbox = ReminderOutbox.__table__
+        return ~exists().where(
+            outbox.c.kind == kind, outbox.c.source_id == source_id, outbox.c.event_date == event_date
+        )
+
+    def _appointment_query(self, event_date):
+        """Запланированные записи на дату, по которым еще нет напоминания"""
+        return (
+            select(
+                Appointment.id.label('source_id'), Appointment.appointment_date.label('event_date'),
+                Appointment.appointment_time, Appointment.patient_id,
+                Patient.first_name, Patient.patronymic, Patient.phone, Patient.email,
+                Employee.last_name.label('doctor_last_name'), Employee.first_name.label('doctor_first_name'),
+                Employee.patronymic.label('doctor_patronymic'),
+                func.coalesce(Schedule.cabinet_number, Employee.cabinet_number).label('cabinet')
+            )
+            .join(Patient, Patient.id == Appointment.patient_id)
+            .join(Employee, Employee.id == Appointment.doctor_id)
+            .join(Schedule, Schedule.id == Appointment.schedule_id)
+            .where(
+                Appointment.appointment_date == event_date,
+                Appointment.status == AppointmentStatus.SCHEDULED,
+                self._not_queued('appointment', Appointment.id, Appointment.appointment_date)
+            )
+            .order_by(Appointment.id)
+        )
+
+    def _follow_up_query(self, on_date, event_date):
+        """Пациенты с рекомендованным на дату повторным приемом, еще не записанные на прием
+
+        Источник напоминания - пациент, поэтому несколько медицинских записей
+        с одной датой повторного приема дают одно напоминание (по последней записи).
+        """
+        booked = exists().where(
+            Appointment.patient_id == MedicalRecord.patient_id,
+            Appointment.appointment_date >= on_date,
+            Appointment.status == AppointmentStatus.SCHEDULED
+        )
+        return (
+            select(
+                MedicalRecord.patient_id.label('source_id'), MedicalRecord.next_visit_date.label('event_date'),
+                MedicalRecord.patient_id,
+                Patient.first_name, Patient.patronymic, Patient.phone, Patient.email,
+                Employee.last_name.label('doctor_last_name'), Employee.first_name.label('doctor_first_name'),
+                Employee.patronymic.label('doctor_patronymic')
+            )
+            .join(Patient, Patient.id == MedicalRecord.patient_id)
+            .join(Employee, Employee.id == MedicalRecord.doctor_id)
+            .where(
+                MedicalRecord.next_visit_date == event_date,
+                ~booked,
+                self._not_queued('follow_up', MedicalRecord.patient_id, MedicalRecord.next_visit_date)
+            )
+            .order_by(MedicalRecord.patient_id, MedicalRecord.record_date.desc())
+        )
+
+    def _render(self, kind, row):
+        """Строка очереди для одной записи или None, если у пациента нет контактов"""
+        channel, recipient = contact_channel(row.phone, row.email)
+        if channel is None:
+            return None
+        values = {
+            'patient_name': f"{row.first_name} {row.patronymic or ''}".strip(),
+            'doctor_name': short_name(row.doctor_last_name, row.doctor_first_name, row.doctor_patronymic),
+            'date': row.event_date.strftime('%d.%m.%Y'),
+        }
+        if kind == 'appointment':
+            values['time'] = row.appointment_time.strftime('%H:%M')
+            values['cabinet'] = row.cabinet or '-'
+        return {
+            'kind': kind, 'source_id': row.source_id, 'event_date': row.event_date, 'patient_id': row.patient_id,
+            'channel': channel, 'recipient': recipient,
+            'message': load_template(kind, channel, self.template_dir).safe_substitute(values),
+        }
+
+    def _queue(self, query, kind, stats):
+        """Потоковое чтение источника и запись напоминаний пачками"""
+        table = ReminderOutbox.__table__
+        insert_reminders = sqlite_insert(table).values(
+            kind=bindparam('kind'), source_id=bindparam('source_id'), event_date=bindparam('event_date'),
+            patient_id=bindparam('patient_id'), channel=bindparam('channel'), recipient=bindparam('recipient'),
+            message=bindparam('message'), status=ReminderStatus.PENDING, attempts=0, created_at=datetime.now()
+        ).on_conflict_do_nothing(index_elements=['kind', 'source_id', 'event_date'])
+
+        seen = set()
+        with self.engine.connect() as reader:
+            result = reader.execution_options(yield_per=self.batch_size).execute(query)
+            for rows in result.partitions():
+                batch = []
+                for row in rows:
+                    key = (row.source_id, row.event_date)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    reminder = self._render(kind, row)
+                    if reminder is None:
+                        stats['no_contact'] += 1
+                    else:
+                        batch.append(reminder)
+                if batch:
+                    # Каждая пачка фиксируется отдельно: прерванный запуск продолжается повторным
+                    with self.engine.begin() as conn:
+                        stats[kind] += conn.execute(insert_reminders, batch).rowcount
+
+
+class ReminderSender(ABC):
+    """Базовый класс отправителя напоминаний
+
+    send получает строку очереди и при ошибке выбрасывает исключение;
+    напоминание тогда остается в очереди до MAX_SEND_ATTEMPTS попыток.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def send(self, reminder):
+        """Отправка одного напоминания"""
+
+
+class StubSender(ReminderSender):
+    """Отправитель-заглушка: сообщения только сохраняются в списке sent"""
+
+    name = 'stub'
+
+    def __init__(self, fail_for=()):
+        self.sent = []
+        # id напоминаний, отправка которых завершается ошибкой (для проверки повторов)
+        self.fail_for = set(fail_for)
+
+    def send(self, reminder):
+        if reminder.id in self.fail_for:
+            raise OSError(f"Отправка напоминания {reminder.id} не удалась")
+        self.sent.append(reminder)
+
+
+class SpoolSender(ReminderSender):
+    """Запись сообщений в локальный каталог-спул для внешнего шлюза SMS/email
+
+    Каждое напоминание - отдельный JSON-файл с именем по id, поэтому повторная
+    отправка того же напоминания перезаписывает файл, а не создает второй.
+    """
+
+    name = 'spool'
+
+    def __init__(self, spool_dir):
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+
+    def send(self, reminder):
+        target = self.spool_dir / f'{reminder.id:010d}_{reminder.channel}.json'
+        part_path = target.with_name(target.name + '.part')
+        with open(part_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'id': reminder.id, 'channel': reminder.channel, 'recipient': reminder.recipient,
+                'message': reminder.message,
+            }, f, ensure_ascii=False)
+        os.replace(part_path, target)
+
+
+class ReminderDispatcher:
+    """Отправка ожидающих напоминаний из очереди через отправителя"""
+
+    def __init__(self, engine, sender, batch_size=BATCH_SIZE):
+        self.engine = engine
+        self.sender = sender
+        self.batch_size = batch_size
+
+    def deliver(self):
+        """Отправка всех ожидающих напоминаний; возвращает (успех, сообщение, статистика)"""
+        table = ReminderOutbox.__table__
+        mark_sent = (
+            update(table)
+            .where(table.c.id == bindparam('reminder_id'))
+            .values(status=ReminderStatus.SENT, attempts=table.c.attempts + 1, sent_at=bindparam('sent'),
+                    last_error=None)
+        )
+        mark_failed = (
+            update(table)
+            .where(table.c.id == bindparam('reminder_id'))
+            .values(attempts=table.c.attempts + 1, last_error=bindparam('error'),
+                    status=bindparam('new_status'))
+        )
+        stats = {'sent': 0, 'retry': 0, 'failed': 0}
+        last_id = 0
+        while True:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(table.c.id, table.c.channel, table.c.recipient, table.c.message, table.c.attempts)
+                    .where(table.c.status == ReminderStatus.PENDING, table.c.id > last_id)
+                    .order_by(table.c.id)
+                    .limit(self.batch_size)
+                ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            sent, failed = [], []
+            for row in rows:
+                try:
+                    self.sender.send(row)
+                    sent.append({'reminder_id': row.id, 'sent': datetime.now()})
+                except Exception as e:
+                    final = row.attempts + 1 >= MAX_SEND_ATTEMPTS
+                    failed.append({
+                        'reminder_id': row.id, 'error': str(e),
+                        'new_status': ReminderStatus.FAILED if final else ReminderStatus.PENDING,
+                    })
+                    stats['failed' if final else 'retry'] += 1
+            with self.engine.begin() as conn:
+                if sent:
+                    conn.execute(mark_sent, sent)
+                if failed:
+                    conn.execute(mark_failed, failed)
+            stats['sent'] += len(sent)
+
+        message = (f"Отправлено напоминаний: {stats['sent']}, будет повторено: {stats['retry']}, "
+                   f"не отправлено: {stats['failed']}")
+        print(message)
+        return True, message, stats
+
+
+def main():
+    """Ежедневный запуск: python reminders.py --db medical_clinic.db --spool exports/outbox"""
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Формирование и отправка напоминаний пациентам")
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--date', type=date.fromisoformat, help="дата запуска (по умолчанию - сегодня)")
+    parser.add_argument('--spool', help="каталог-спул для отправки; без него напоминания только ставятся в очередь")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    db_manager.init_database()
+    success, message, _ = ReminderJob(db_manager.engine).run(args.date)
+    if not success:
+        print(message)
+        return 1
+    if args.spool:
+        ReminderDispatcher(db_manager.engine, SpoolSender(args.spool)).deliver()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
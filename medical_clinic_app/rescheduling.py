@@ -0,0 +1,436 @@
+import argparse
+import os
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, update, bindparam
+from models import Appointment, AppointmentStatus, Employee, Schedule
+from booking import booked_count_subquery, notify_booking_listeners
+
+# На сколько дней раньше или позже исходной даты можно перенести запись
+MAX_SHIFT_DAYS = 7
+
+# Сколько самых дешевых слотов рассматривается для каждой записи
+CANDIDATES_PER_APPOINTMENT = 20
+
+# Глубина поиска цепочки переносов для записи, не получившей слот сразу
+MAX_AUGMENT_DEPTH = 50
+
+# Стоимость переноса: за день позже, за день раньше, за час сдвига времени
+# приема и за врача, у которого пациент еще не был
+DAY_LATER_COST = 10
+DAY_EARLIER_COST = 15
+HOUR_COST = 3
+NEW_DOCTOR_COST = 5
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+class AppointmentRescheduler:
+    """Перенос записей врача, который не может принять пациентов
+
+    Записи врача за период переносятся в свободные слоты врачей той же
+    специализации (и в слоты самого врача вне периода) в пределах
+    max_shift_days от исходной даты. Стоимость переноса учитывает сдвиг
+    даты и времени, знакомого пациенту врача и пожелания пациента.
+    Назначение строится жадно по возрастанию стоимости с учетом числа мест
+    в слоте, затем для оставшихся записей ищутся цепочки переносов
+    (увеличивающие пути, как в алгоритме Куна). Все переносы применяются
+    одной транзакцией.
+    """
+
+    def __init__(self, session, max_shift_days=MAX_SHIFT_DAYS):
+        self.session = session
+        self.max_shift_days = max_shift_days
+
+    # --- Исходные данные ---
+
+    def affected_appointments(self, doctor_id, date_from, date_to):
+        """Активные записи врача за период"""
+        return self.session.execute(
+            select(
+                Appointment.id, Appointment.patient_id, Appointment.schedule_id,
+                Appointment.appointment_date, Appointment.appointment_time
+            )
+            .where(
+                Appointment.doctor_id == doctor_id,
+                Appointment.appointment_date >= date_from,
+                Appointment.appointment_date <= date_to,
+                Appointment.status == AppointmentStatus.SCHEDULED
+            )
+            .order_by(Appointment.appointment_date, Appointment.appointment_time, Appointment.id)
+            .execution_options(skip_access_policy=True)
+        ).all()
+
+    def candidate_slots(self, doctor_id, date_from, date_to):
+        """Свободные слоты врачей той же специализации в окне переноса
+
+        Слоты самого врача в период недоступности не берутся. Возвращает
+        список (начало, id слота, врач, свободных мест), отсортированный по началу.
+        """
+        specialization_id = self.session.execute(
+            select(Employee.specialization_id).where(Employee.id == doctor_id)
+            .execution_options(skip_access_policy=True)
+        ).scalar()
+        doctors = select(Employee.id).where(Employee.specialization_id == specialization_id)
+        if specialization_id is None:
+            doctors = select(Employee.id).where(Employee.id == doctor_id)
+
+        now = datetime.now()
+        first_day = max(now.date(), date_from - timedelta(days=self.max_shift_days))
+        last_day = date_to + timedelta(days=self.max_shift_days)
+        free_places = (Schedule.max_patients - booked_count_subquery()).label('free_places')
+        rows = self.session.execute(
+            select(Schedule.id, Schedule.employee_id, Schedule.work_date, Schedule.start_time, free_places)
+            .where(
+                Schedule.employee_id.in_(doctors),
+                Schedule.work_date >= first_day,
+                Schedule.work_date <= last_day,
+                Schedule.max_patients > booked_count_subquery()
+            )
+            .execution_options(skip_access_policy=True)
+        ).all()
+
+        slots = []
+        for row in rows:
+            if row.employee_id == doctor_id and date_from <= row.work_date <= date_to:
+                continue
+            start = datetime.combine(row.work_date, row.start_time)
+            if start >= now:
+                slots.append((start, row.id, row.employee_id, row.free_places))
+        slots.sort()
+        return slots
+
+    def _patient_context(self, doctor_id, date_from, date_to):
+        """Врачи, у которых пациенты уже были, и занятое пациентами время"""
+        affected_patients = (
+            select(Appointment.patient_id)
+            .where(
+                Appointment.doctor_id == doctor_id,
+                Appointment.appointment_date >= date_from,
+                Appointment.appointment_date <= date_to,
+                Appointment.status == AppointmentStatus.SCHEDULED
+            )
+        )
+        rows = self.session.execute(
+            select(
+                Appointment.patient_id, Appointment.doctor_id, Appointment.appointment_date,
+                Appointment.appointment_time, Appointment.status
+            )
+            .where(Appointment.patient_id.in_(affected_patients), Appointment.status != AppointmentStatus.CANCELLED)
+            .execution_options(skip_access_policy=True)
+        ).all()
+        known_doctors = {}
+        busy = {}
+        for row in rows:
+            known_doctors.setdefault(row.patient_id, set()).add(row.doctor_id)
+            affected = row.doctor_id == doctor_id and date_from <= row.appointment_date <= date_to
+            if row.status == AppointmentStatus.SCHEDULED and not affected:
+                key = (row.patient_id, row.appointment_date, row.appointment_time)
+                busy[key] = busy.get(key, 0) + 1
+        return known_doctors, busy
+
+    # --- Построение плана ---
+
+    def _cost(self, appointment, slot, known_doctors, preference):
+        start, _, slot_doctor_id, _ = slot
+        days = (start.date() - appointment.appointment_date).days
+        cost = days * DAY_LATER_COST if days >= 0 else -days * DAY_EARLIER_COST
+        cost += abs(_minutes(start) - _minutes(appointment.appointment_time)) / 60 * HOUR_COST
+        preferred_doctor = preference.get('doctor_id')
+        if preferred_doctor is not None:
+            if slot_doctor_id != preferred_doctor:
+                cost += NEW_DOCTOR_COST
+        elif slot_doctor_id not in known_doctors.get(appointment.patient_id, ()):
+            cost += NEW_DOCTOR_COST
+        return cost
+
+    def _options(self, appointment, slots_by_day, known_doctors, preference, limit=None):
+        """Допустимые слоты записи по возрастанию стоимости: [(стоимость, id слота), ...]
+
+        Дни перебираются от исходного наружу; перебор останавливается, когда
+        даже самый дешевый слот следующего дня не дешевле limit-го найденного.
+        """
+        options = []
+        day_cost = min(DAY_LATER_COST, DAY_EARLIER_COST)
+        for shift in range(self.max_shift_days + 1):
+            if limit and len(options) >= limit:
+                options.sort()
+                del options[limit:]
+                if options[-1][0] <= shift * day_cost:
+                    break
+            days = {appointment.appointment_date + timedelta(days=shift),
+                    appointment.appointment_date - timedelta(days=shift)}
+            for day in days:
+                for slot in slots_by_day.get(day, ()):
+                    if self._allowed(slot, preference):
+                        options.append((self._cost(appointment, slot, known_doctors, preference), slot[1]))
+        options.sort()
+        return options[:limit] if limit else options
+
+    @staticmethod
+    def _allowed(slot, preference):
+        """Жесткие пожелания пациента: окно дат и времени приема"""
+        start = slot[0]
+        if preference.get('date_from') and start.date() < preference['date_from']:
+            return False
+        if preference.get('date_to') and start.date() > preference['date_to']:
+            return False
+        if preference.get('time_from') and start.time() < preference['time_from']:
+            return False
+        if preference.get('time_to') and start.time() > preference['time_to']:
+            return False
+        return True
+
+    def plan(self, doctor_id, date_from, date_to=None, preferences=None):
+        """План переноса записей врача за период
+
+        preferences - словарь {id пациента: пожелания}: date_from/date_to и
+        time_from/time_to ограничивают выбор, doctor_id задает желаемого врача.
+        Возвращает словарь с ключами assignments (перенесенные записи) и
+        unassigned (записи, для которых не нашлось слота).
+        """
+        date_to = date_to or date_from
+        preferences = preferences or {}
+        appointments = self.affected_appointments(doctor_id, date_from, date_to)
+        slots = self.candidate_slots(doctor_id, date_from, date_to)
+        known_doctors, busy = self._patient_context(doctor_id, date_from, date_to)
+        slot_by_id = {slot[1]: slot for slot in slots}
+        slots_by_day = {}
+        for slot in slots:
+            slots_by_day.setdefault(slot[0].date(), []).append(slot)
+
+        def options(appointment, limit):
+            return self._options(
+                appointment, slots_by_day, known_doctors, preferences.get(appointment.patient_id, {}), limit
+            )
+
+        # Самые дешевые допустимые слоты каждой записи
+        edges = {appointment.id: options(appointment, CANDIDATES_PER_APPOINTMENT) for appointment in appointments}
+
+        by_id = {appointment.id: appointment for appointment in appointments}
+        free = {slot_id: slot[3] for slot_id, slot in slot_by_id.items()}
+        holders = {}
+        placed = {}
+
+        def busy_key(appointment_id, slot_id):
+            start = slot_by_id[slot_id][0]
+            return by_id[appointment_id].patient_id, start.date(), start.time()
+
+        def place(appointment_id, slot_id, cost):
+            placed[appointment_id] = (slot_id, cost)
+            holders.setdefault(slot_id, set()).add(appointment_id)
+            free[slot_id] -= 1
+            key = busy_key(appointment_id, slot_id)
+            busy[key] = busy.get(key, 0) + 1
+
+        def unplace(appointment_id):
+            slot_id, cost = placed.pop(appointment_id)
+            holders[slot_id].discard(appointment_id)
+            free[slot_id] += 1
+            busy[busy_key(appointment_id, slot_id)] -= 1
+            return slot_id, cost
+
+        def augment(appointment_id, seen, depth):
+            # Слот для записи, возможно ценой переноса уже назначенной записи в другой слот
+            for cost, slot_id in edges[appointment_id]:
+                if slot_id in seen or busy.get(busy_key(appointment_id, slot_id)):
+                    continue
+                seen.add(slot_id)
+                if free[slot_id] > 0:
+                    place(appointment_id, slot_id, cost)
+                    return True
+                if depth >= MAX_AUGMENT_DEPTH:
+                    continue
+                for other_id in list(holders.get(slot_id, ())):
+                    _, other_cost = unplace(other_id)
+                    if augment(other_id, seen, depth + 1):
+                        place(appointment_id, slot_id, cost)
+                        return True
+                    place(other_id, slot_id, other_cost)
+            return False
+
+        # Жадное назначение: сначала самые дешевые переносы
+        all_edges = sorted(
+            (cost, appointment_id, slot_id)
+            for appointment_id, options in edges.items() for cost, slot_id in options
+        )
+        for cost, appointment_id, slot_id in all_edges:
+            if appointment_id in placed or free[slot_id] <= 0 or busy.get(busy_key(appointment_id, slot_id)):
+                continue
+            place(appointment_id, slot_id, cost)
+        for appointment in appointments:
+            if appointment.id not in placed:
+                augment(appointment.id, set(), 0)
+        for appointment in appointments:
+            if appointment.id not in placed:
+                # Все дешевые слоты разобраны: рассматриваются все слоты окна
+                edges[appointment.id] = options(appointment, None)
+                augment(appointment.id, set(), 0)
+
+        assignments, unassigned = [], []
+        for appointment in appointments:
+            old = {
+                'doctor_id': doctor_id, 'schedule_id': appointment.schedule_id,
+                'date': appointment.appointment_date, 'time': appointment.appointment_time,
+            }
+            if appointment.id not in placed:
+                unassigned.append({'appointment_id': appointment.id, 'patient_id': appointment.patient_id, 'old': old})
+                continue
+            slot_id, cost = placed[appointment.id]
+            start, _, new_doctor_id, _ = slot_by_id[slot_id]
+            assignments.append({
+                'appointment_id': appointment.id,
+                'patient_id': appointment.patient_id,
+                'old': old,
+                'new': {'doctor_id': new_doctor_id, 'schedule_id': slot_id, 'date': start.date(), 'time': start.time()},
+                'cost': round(cost, 2),
+            })
+        return {
+            'doctor_id': doctor_id, 'date_from': date_from, 'date_to': date_to,
+            'assignments': assignments, 'unassigned': unassigned,
+        }
+
+    # --- Применение ---
+
+    def apply(self, plan, block_schedule=True):
+        """Применение плана одной транзакцией
+
+        Запись переносится, только если она все еще активна и стоит в
+        прежнем слоте; после переносов проверяется, что ни один слот не
+        переполнен. Иначе транзакция откатывается целиком. При block_schedule
+        в слотах врача за период не остается мест для новых записей.
+        Возвращает (успех, сообщение).
+        """
+        assignments = plan['assignments']
+        now = datetime.now()
+        moves = [
+            {
+                'appointment_id': item['appointment_id'],
+                'old_schedule_id': item['old']['schedule_id'],
+                'target_schedule_id': item['new']['schedule_id'],
+                'target_doctor_id': item['new']['doctor_id'],
+                'target_date': item['new']['date'],
+                'target_time': item['new']['time'],
+                'moved_at': now,
+            }
+            for item in assignments
+        ]
+        table = Appointment.__table__
+        try:
+            if moves:
+                result = self.session.execute(
+                    update(table)
+                    .where(
+                        table.c.id == bindparam('appointment_id'),
+                        table.c.schedule_id == bindparam('old_schedule_id'),
+                        table.c.status == AppointmentStatus.SCHEDULED
+                    )
+                    .values(
+                        schedule_id=bindparam('target_schedule_id'),
+                        doctor_id=bindparam('target_doctor_id'),
+                        appointment_date=bindparam('target_date'),
+                        appointment_time=bindparam('target_time'),
+                        updated_at=bindparam('moved_at')
+                    ),
+                    moves
+                )
+                if result.rowcount != len(moves):
+                    self.session.rollback()
+                    return False, "Записи изменились во время переноса, постройте план заново"
+
+                overbooked = self.session.execute(
+                    select(Schedule.id)
+                    .where(
+                        Schedule.id.in_({move['target_schedule_id'] for move in moves}),
+                        Schedule.max_patients < booked_count_subquery()
+                    )
+                    .execution_options(skip_access_policy=True)
+                ).scalars().all()
+                if overbooked:
+                    self.session.rollback()
+                    return False, f"Слоты заняты другими записями ({len(overbooked)}), постройте план заново"
+
+            if block_schedule:
+                # Через ORM, чтобы подписчики на изменения расписания узнали о закрытых слотах
+                schedules = self.session.execute(
+                    select(Schedule)
+                    .where(
+                        Schedule.employee_id == plan['doctor_id'],
+                        Schedule.work_date >= plan['date_from'],
+                        Schedule.work_date <= plan['date_to']
+                    )
+                    .execution_options(skip_access_policy=True)
+                ).scalars().all()
+                for schedule in schedules:
+                    schedule.max_patients = 0
+                    schedule.notes = "Врач недоступен"
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            return False, f"Ошибка переноса записей: {str(e)}"
+
+        for item in assignments:
+            old, new = item['old'], item['new']
+            notify_booking_listeners('cancelled', {
+                'id': item['appointment_id'], 'patient_id': item['patient_id'], 'doctor_id': old['doctor_id'],
+                'schedule_id': old['schedule_id'], 'appointment_date': old['date'], 'appointment_time': old['time'],
+            })
+            notify_booking_listeners('booked', {
+                'id': item['appointment_id'], 'patient_id': item['patient_id'], 'doctor_id': new['doctor_id'],
+                'schedule_id': new['schedule_id'], 'appointment_date': new['date'], 'appointment_time': new['time'],
+            })
+        return True, f"Перенесено записей: {len(assignments)}, без слота: {len(plan['unassigned'])}"
+
+    def run(self, doctor_id, date_from, date_to=None, preferences=None, apply=True):
+        """Построение и применение плана; возвращает (успех, сообщение, план)"""
+        try:
+            plan = self.plan(doctor_id, date_from, date_to, preferences)
+        except Exception as e:
+            return False, f"Ошибка построения плана: {str(e)}", None
+        if not plan['assignments'] and not plan['unassigned']:
+            return True, "У врача нет активных записей за период", plan
+        if not apply:
+            return True, (f"Можно перенести записей: {len(plan['assignments'])}, "
+                          f"без слота: {len(plan['unassigned'])}"), plan
+        success, message = self.apply(plan)
+        return success, message, plan
+
+
+def main():
+    """Перенос записей: python rescheduling.py --doctor 3 --date-from 2024-05-20 --date-to 2024-05-24"""
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Перенос записей недоступного врача к врачам той же специализации")
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--doctor', type=int, required=True)
+    parser.add_argument('--date-from', type=date.fromisoformat, required=True)
+    parser.add_argument('--date-to', type=date.fromisoformat)
+    parser.add_argument('--max-shift-days', type=int, default=MAX_SHIFT_DAYS)
+    parser.add_argument('--dry-run', action='store_true', help="только план, без переноса")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    session = db_manager.get_session()
+    try:
+        success, message, plan = AppointmentRescheduler(session, args.max_shift_days).run(
+            args.doctor, args.date_from, args.date_to, apply=not args.dry_run
+        )
+    finally:
+        db_manager.close_session(session)
+    if plan:
+        for item in plan['assignments']:
+            old, new = item['old'], item['new']
+            print(f"{item['appointment_id']:>6}: {old['date']} {old['time']:%H:%M} -> "
+                  f"врач {new['doctor_id']} {new['date']} {new['time']:%H:%M}")
+        for item in plan['unassigned']:
+            print(f"{item['appointment_id']:>6}: {item['old']['date']} {item['old']['time']:%H:%M} - нет слота")
+    print(message)
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
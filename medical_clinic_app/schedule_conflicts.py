@@ -0,0 +1,201 @@
+import argparse
+import heapq
+import os
+from sqlalchemy import select, event, or_
+from models import Schedule
+
+# Сколько строк расписания читается из базы за одну выборку при полной проверке
+SCAN_BATCH_SIZE = 5000
+
+
+class ScheduleConflictError(ValueError):
+    """Слот расписания пересекается с другим слотом врача или кабинета"""
+
+    def __init__(self, conflicts):
+        super().__init__(describe_conflicts(conflicts))
+        self.conflicts = conflicts
+
+
+def describe_conflicts(conflicts, limit=5):
+    """Описание конфликтов для сообщения пользователю"""
+    lines = []
+    for conflict in conflicts[:limit]:
+        if conflict['kind'] == 'invalid':
+            lines.append(f"{conflict['work_date']}: время окончания слота не позже начала "
+                         f"({conflict['start']:%H:%M}-{conflict['end']:%H:%M})")
+            continue
+        resource = f"врач {conflict['resource']}" if conflict['kind'] == 'doctor' else f"кабинет {conflict['resource']}"
+        lines.append(f"{conflict['work_date']} {conflict['start']:%H:%M}-{conflict['end']:%H:%M}: "
+                     f"{resource} занят в двух слотах")
+    if len(conflicts) > limit:
+        lines.append(f"... и еще конфликтов: {len(conflicts) - limit}")
+    return '; '.join(lines)
+
+
+def _field(item, name):
+    return item.get(name) if isinstance(item, dict) else getattr(item, name)
+
+
+def sweep_conflicts(intervals, report=None):
+    """Пересечения интервалов заметающей прямой за O(n log n + k)
+
+    intervals - последовательность (дата, начало, конец, врач, кабинет, ссылка),
+    упорядоченная по дате и началу. Для каждого врача и кабинета хранится куча
+    концов активных интервалов: при новом начале из нее удаляются закончившиеся,
+    оставшиеся пересекаются с новым интервалом. Слоты, стыкующиеся концом к
+    началу, конфликтом не считаются. report(ссылка1, ссылка2) решает, попадет
+    ли пара в результат (по умолчанию - все пары).
+    """
+    conflicts = []
+    active = {}
+    current_date = None
+    for position, (work_date, start, end, employee_id, cabinet_number, ref) in enumerate(intervals):
+        if work_date != current_date:
+            # Слоты не переходят через полночь: активные интервалы прошлого дня закончились
+            active.clear()
+            current_date = work_date
+        if end <= start:
+            if report is None or report(ref, ref):
+                conflicts.append({
+                    'kind': 'invalid', 'resource': employee_id, 'work_date': work_date,
+                    'start': start, 'end': end, 'first': ref, 'second': None,
+                })
+            continue
+
+        resources = [('doctor', employee_id)]
+        if cabinet_number:
+            resources.append(('cabinet', cabinet_number))
+        for resource in resources:
+            heap = active.setdefault(resource, [])
+            while heap and heap[0][0] <= start:
+                heapq.heappop(heap)
+            for other_end, other_start, _, other_ref in heap:
+                if report is None or report(other_ref, ref):
+                    conflicts.append({
+                        'kind': resource[0], 'resource': resource[1], 'work_date': work_date,
+                        'start': max(start, other_start), 'end': min(end, other_end),
+                        'first': other_ref, 'second': ref,
+                    })
+            # Позиция в куче исключает сравнение самих ссылок при равных концах
+            heapq.heappush(heap, (end, start, position, ref))
+    return conflicts
+
+
+class ScheduleConflictChecker:
+    """Проверка пересечений слотов расписания по врачам и кабинетам
+
+    Полная проверка читает расписание по индексу на дату и время одним
+    проходом (find_conflicts); проверка новых слотов сравнивает их между
+    собой и с существующими слотами тех же дней, врачей и кабинетов
+    (validate). После install() проверка выполняется при каждом flush
+    сессии, в которой добавлены или изменены слоты.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def find_conflicts(self, date_from=None, date_to=None):
+        """Все пересечения в расписании за период; список словарей с id слотов"""
+        statement = (
+            select(
+                Schedule.work_date, Schedule.start_time, Schedule.end_time,
+                Schedule.employee_id, Schedule.cabinet_number, Schedule.id
+            )
+            .order_by(Schedule.work_date, Schedule.start_time, Schedule.id)
+            .execution_options(yield_per=SCAN_BATCH_SIZE, skip_access_policy=True)
+        )
+        if date_from is not None:
+            statement = statement.where(Schedule.work_date >= date_from)
+        if date_to is not None:
+            statement = statement.where(Schedule.work_date <= date_to)
+        return sweep_conflicts(tuple(row) for row in self.session.execute(statement))
+
+    def validate(self, schedules, exclude_ids=()):
+        """Конфликты новых или измененных слотов (словари или объекты Schedule)
+
+        Возвращает только конфликты, в которых участвует хотя бы один из
+        переданных слотов; в 'first'/'second' - сам переданный слот или id
+        существующего. exclude_ids - слоты, которые не нужно брать из базы
+        (удаляемые или заменяемые переданными).
+        """
+        if not schedules:
+            return []
+        intervals = [
+            (_field(item, 'work_date'), _field(item, 'start_time'), _field(item, 'end_time'),
+             _field(item, 'employee_id'), _field(item, 'cabinet_number'), item)
+            for item in schedules
+        ]
+        # Измененные слоты уже есть в базе со старым временем
+        exclude_ids = set(exclude_ids) | {_field(item, 'id') for item in schedules} - {None}
+
+        dates = {interval[0] for interval in intervals}
+        doctors = {interval[3] for interval in intervals}
+        cabinets = {interval[4] for interval in intervals if interval[4]}
+        resource_filter = Schedule.employee_id.in_(doctors)
+        if cabinets:
+            resource_filter = or_(resource_filter, Schedule.cabinet_number.in_(cabinets))
+        existing = self.session.execute(
+            select(
+                Schedule.work_date, Schedule.start_time, Schedule.end_time,
+                Schedule.employee_id, Schedule.cabinet_number, Schedule.id
+            )
+            .where(Schedule.work_date.in_(dates), resource_filter)
+            .execution_options(skip_access_policy=True)
+        ).all()
+        intervals.extend(tuple(row) for row in existing if row.id not in exclude_ids)
+
+        intervals.sort(key=lambda interval: (interval[0], interval[1]))
+        # Существующие слоты представлены целыми id, новые - самими объектами
+        return sweep_conflicts(
+            intervals,
+            report=lambda first, second: not isinstance(first, int) or not isinstance(second, int)
+        )
+
+    @staticmethod
+    def install(session_factory):
+        """Проверка слотов расписания перед каждой записью изменений в базу"""
+        event.listen(session_factory, 'before_flush', ScheduleConflictChecker._before_flush)
+
+    @staticmethod
+    def _before_flush(session, flush_context, instances):
+        changed = [
+            item for item in (*session.new, *session.dirty)
+            if isinstance(item, Schedule) and item not in session.deleted
+        ]
+        if not changed:
+            return
+        deleted_ids = {item.id for item in session.deleted if isinstance(item, Schedule)}
+        conflicts = ScheduleConflictChecker(session).validate(changed, exclude_ids=deleted_ids)
+        if conflicts:
+            raise ScheduleConflictError(conflicts)
+
+
+def main():
+    """Проверка всего расписания: python schedule_conflicts.py --db medical_clinic.db"""
+    from datetime import date
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Поиск пересечений в расписании врачей и кабинетов")
+    parser.add_argument('--db', default='medical_clinic.db')
+    parser.add_argument('--date-from', type=date.fromisoformat)
+    parser.add_argument('--date-to', type=date.fromisoformat)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База данных не найдена: {args.db}")
+        return 1
+    db_manager = DatabaseManager(args.db)
+    session = db_manager.get_session()
+    try:
+        conflicts = ScheduleConflictChecker(session).find_conflicts(args.date_from, args.date_to)
+    finally:
+        db_manager.close_session(session)
+    for conflict in conflicts:
+        print(f"{conflict['kind']:<8} {str(conflict['resource']):<6} {conflict['work_date']} "
+              f"{conflict['start']:%H:%M}-{conflict['end']:%H:%M}  слоты {conflict['first']} и {conflict['second']}")
+    print(f"Конфликтов: {len(conflicts)}")
+    return 1 if conflicts else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -287,7 +287,6 @@ def seed_database(session):
             duration='30 дней' if i == 0 else '10 дней' if i == 1 else '30 дней' if i == 2 else '7 дней' if i == 3 else '14 дней',
             instructions='Принимать утром и вечером' if i == 0 else 'После еды' if i == 1 else 'Утром' if i == 2 else 'До еды' if i == 3 else 'За 30 минут до еды',
             start_date=today,
-            end_date=today + timedelta(days=30 if i == 0 else 10 if i == 1 else 30 if i == 2 else 7 if i == 3 else 14),
             is_completed=False
         )
         session.add(prescription)
@@ -319,9 +318,15 @@ def create_test_users(auth_manager):
         ('patient2', 'patient123', 'patient', 'nikolaeva@mail.ru', None, 2),  # Связано с пациентом ID 2
     ]
     
-    for username, password, role, email, employee_id, patient_id in users:
-        success, message = auth_manager.register_user(username, password, role, email, employee_id, patient_id)
-        if success:
+    success, message, report = auth_manager.bulk_register_users(users)
+    
+    if not success:
+        print(message)
+        return
+    
+    skipped = {username for username, _ in report['skipped']}
+    for username, _, role, _, _, _ in users:
+        if username not in skipped:
             print(f"Создан пользователь: {username} ({role})")
-        else:
-            print(f"Ошибка создания пользователя {username}: {message}")
\ No newline at end of file
+    for username, reason in report['skipped']:
+        print(f"Ошибка создания пользователя {username}: {reason}")
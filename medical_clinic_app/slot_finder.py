@@ -0,0 +1,205 @@
+import threading
+import time as time_module
+from bisect import bisect_left, insort
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select, event
+from models import Employee, Schedule
+from booking import add_booking_listener, remove_booking_listener, booked_count_subquery
+
+# На сколько дней вперед строится индекс свободных слотов
+DEFAULT_HORIZON_DAYS = 60
+
+# Через сколько секунд индекс перестраивается из базы: записи, сделанные другими
+# процессами (рабочими процессами API), не приходят в этот процесс событиями
+REFRESH_INTERVAL = 60
+
+# Окно поиска по умолчанию, дней
+DEFAULT_WITHIN_DAYS = 14
+
+
+class SlotFinder:
+    """Индекс свободных слотов расписания в памяти
+
+    Для каждого врача, каждой специализации и клиники в целом хранятся
+    отсортированные по времени начала списки слотов, в которых есть свободные
+    места. Ближайший слот находится двоичным поиском, без запросов к базе.
+    Индекс строится одним запросом и обновляется по событиям записи и отмены
+    из booking; изменения расписания помечают его устаревшим, а раз в
+    refresh_interval секунд он перестраивается целиком. Найденный слот -
+    подсказка: окончательно место проверяется при записи (book_into_schedule).
+    """
+
+    def __init__(self, session_factory, horizon_days=DEFAULT_HORIZON_DAYS, refresh_interval=REFRESH_INTERVAL):
+        self.session_factory = session_factory
+        self.horizon_days = horizon_days
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._slots = {}               # id слота -> (начало, конец, врач, специализация, кабинет)
+        self._free = {}                # id слота -> число свободных мест
+        self._by_doctor = {}           # id врача -> [(начало, id слота), ...]
+        self._by_specialization = {}   # id специализации -> [(начало, id слота), ...]
+        self._all = []
+        self._specialization_of = {}   # id врача -> id специализации
+        self._loaded_at = None
+        self._loaded_for = None
+        self._stale = True
+        self._installed = False
+
+    # --- Подписка на события ---
+
+    def install(self):
+        """Подписка на события записи и изменения расписания"""
+        if self._installed:
+            return
+        add_booking_listener(self._on_booking_event)
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(Schedule, name, self._on_schedule_changed)
+        self._installed = True
+
+    def uninstall(self):
+        """Отписка от событий"""
+        if not self._installed:
+            return
+        remove_booking_listener(self._on_booking_event)
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.remove(Schedule, name, self._on_schedule_changed)
+        self._installed = False
+
+    def _on_schedule_changed(self, mapper, connection, target):
+        # Новые и измененные слоты попадут в индекс при следующем обращении
+        self._stale = True
+
+    def _on_booking_event(self, event_name, info):
+        schedule_id = info.get('schedule_id')
+        if event_name == 'booked':
+            self._change_free(schedule_id, -1)
+        elif event_name == 'cancelled':
+            self._change_free(schedule_id, +1)
+
+    # --- Построение индекса ---
+
+    def rebuild(self):
+        """Полное построение индекса одним запросом к базе"""
+        today = date.today()
+        last_day = today + timedelta(days=self.horizon_days)
+        free_places = (Schedule.max_patients - booked_count_subquery()).label('free_places')
+        session = self.session_factory()
+        try:
+            rows = session.execute(
+                select(
+                    Schedule.id, Schedule.employee_id, Schedule.work_date, Schedule.start_time,
+                    Schedule.end_time, Schedule.cabinet_number, Employee.specialization_id, free_places
+                )
+                .join(Employee, Employee.id == Schedule.employee_id)
+                .where(Schedule.work_date >= today, Schedule.work_date <= last_day)
+                .execution_options(skip_access_policy=True)
+            ).all()
+            specializations = dict(session.execute(
+                select(Employee.id, Employee.specialization_id)
+                .execution_options(skip_access_policy=True)
+            ).all())
+        finally:
+            session.close()
+
+        slots, free = {}, {}
+        by_doctor, by_specialization, all_slots = {}, {}, []
+        for row in rows:
+            start = datetime.combine(row.work_date, row.start_time)
+            slots[row.id] = (start, row.end_time, row.employee_id, row.specialization_id, row.cabinet_number)
+            free[row.id] = row.free_places
+            if row.free_places > 0:
+                key = (start, row.id)
+                by_doctor.setdefault(row.employee_id, []).append(key)
+                if row.specialization_id is not None:
+                    by_specialization.setdefault(row.specialization_id, []).append(key)
+                all_slots.append(key)
+        for keys in (*by_doctor.values(), *by_specialization.values(), all_slots):
+            keys.sort()
+
+        with self._lock:
+            self._slots, self._free = slots, free
+            self._by_doctor, self._by_specialization, self._all = by_doctor, by_specialization, all_slots
+            self._specialization_of = specializations
+            self._loaded_at = time_module.monotonic()
+            self._loaded_for = today
+            self._stale = False
+
+    def _ensure_fresh(self):
+        if (self._stale or self._loaded_for != date.today()
+                or time_module.monotonic() - self._loaded_at > self.refresh_interval):
+            self.rebuild()
+
+    def _lists_for(self, slot):
+        start, _, doctor_id, specialization_id, _ = slot
+        lists = [self._by_doctor.setdefault(doctor_id, []), self._all]
+        if specialization_id is not None:
+            lists.append(self._by_specialization.setdefault(specialization_id, []))
+        return lists
+
+    def _change_free(self, schedule_id, delta):
+        """Изменение числа свободных мест слота; слот без мест убирается из списков"""
+        with self._lock:
+            slot = self._slots.get(schedule_id)
+            if slot is None:
+                # Слот за пределами горизонта или создан после построения индекса
+                return
+            before = self._free[schedule_id]
+            after = before + delta
+            self._free[schedule_id] = after
+            key = (slot[0], schedule_id)
+            if before > 0 and after <= 0:
+                for keys in self._lists_for(slot):
+                    index = bisect_left(keys, key)
+                    if index < len(keys) and keys[index] == key:
+                        del keys[index]
+            elif before <= 0 and after > 0:
+                for keys in self._lists_for(slot):
+                    insort(keys, key)
+
+    # --- Поиск ---
+
+    def find(self, specialization_id=None, doctor_id=None, within_days=DEFAULT_WITHIN_DAYS, after=None, limit=1):
+        """Ближайшие свободные слоты по специализации и/или врачу
+
+        Ищутся слоты, начинающиеся не раньше after (по умолчанию - сейчас)
+        и не позже последнего дня окна within_days. Возвращает список словарей,
+        упорядоченный по времени начала.
+        """
+        self._ensure_fresh()
+        after = after or datetime.now()
+        deadline = datetime.combine(after.date() + timedelta(days=within_days), time.max)
+
+        with self._lock:
+            if doctor_id is not None:
+                if specialization_id is not None and self._specialization_of.get(doctor_id) != specialization_id:
+                    return []
+                keys = self._by_doctor.get(doctor_id, [])
+            elif specialization_id is not None:
+                keys = self._by_specialization.get(specialization_id, [])
+            else:
+                keys = self._all
+
+            result = []
+            index = bisect_left(keys, (after, 0))
+            while index < len(keys) and len(result) < limit:
+                start, schedule_id = keys[index]
+                if start > deadline:
+                    break
+                _, end_time, slot_doctor_id, slot_specialization_id, cabinet_number = self._slots[schedule_id]
+                result.append({
+                    'schedule_id': schedule_id,
+                    'doctor_id': slot_doctor_id,
+                    'specialization_id': slot_specialization_id,
+                    'work_date': start.date(),
+                    'start_time': start.time(),
+                    'end_time': end_time,
+                    'cabinet_number': cabinet_number,
+                    'free_places': self._free[schedule_id],
+                })
+                index += 1
+        return result
+
+    def earliest(self, specialization_id=None, doctor_id=None, within_days=DEFAULT_WITHIN_DAYS, after=None):
+        """Ближайший свободный слот или None"""
+        slots = self.find(specialization_id, doctor_id, within_days, after, limit=1)
+        return slots[0] if slots else None
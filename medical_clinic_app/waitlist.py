@@ -0,0 +1,389 @@
+import heapq
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, update, insert
+from models import Appointment, AppointmentStatus, Employee, WaitlistEntry, WaitlistStatus
+from booking import add_booking_listener, remove_booking_listener, book_into_schedule, notify_booking_listeners
+
+# Максимальная длина окна дат заявки: заявка индексируется по каждому дню окна
+MAX_WINDOW_DAYS = 90
+
+# Сколько заявок пробуется на одно освободившееся место, если лучшие уже заняты
+MAX_CLAIM_ATTEMPTS = 5
+
+# Запас при поиске заявок, закрытых другими процессами: updated_at ставится
+# до фиксации транзакции, поэтому окно поиска начинается раньше прошлой проверки
+CLOSED_SYNC_MARGIN = timedelta(minutes=1)
+
+
+class WaitlistManager:
+    """Лист ожидания с автоматической записью на освободившиеся места
+
+    Заявки ожидания хранятся в памяти в очередях с приоритетом (кучах) по
+    ключам (врач, день) и (специализация, день): при отмене записи
+    лучшая подходящая заявка находится без запроса к базе. Заявка занимается
+    оптимистично - UPDATE ... WHERE status = 'waiting' в одной транзакции с
+    атомарной записью в слот (book_into_schedule), поэтому при параллельных
+    отменах и записях, в том числе из других процессов, заявка не будет
+    записана дважды, а слот не будет переполнен. Новые заявки других
+    процессов подгружаются по возрастанию id перед каждым подбором, а
+    записанные и отмененные ими - по updated_at.
+
+    Каждая заявка лежит в очереди дня ровно один раз: снятые заявки
+    удаляются из очередей лениво (их нет в _entries), а заявки, которые
+    сейчас пробуются на место, временно пропускаются (_claiming).
+    """
+
+    def __init__(self, session_factory, slot_finder=None):
+        self.session_factory = session_factory
+        self.slot_finder = slot_finder
+        self._lock = threading.Lock()
+        self._entries = {}            # id заявки -> строка заявки
+        self._claiming = set()        # id заявок, которые сейчас пробуются на место
+        self._queues = {}             # (вид, id, день) -> [(-приоритет, создана, id заявки), ...]
+        self._specialization_of = {}  # id врача -> id специализации
+        self._last_id = 0
+        self._closed_checked_at = None
+        self._loaded_for = None
+        self._installed = False
+
+    # --- Подписка на события ---
+
+    def install(self):
+        """Подписка на отмены записей"""
+        if not self._installed:
+            add_booking_listener(self._on_booking_event)
+            self._installed = True
+
+    def uninstall(self):
+        """Отписка от событий записи"""
+        if self._installed:
+            remove_booking_listener(self._on_booking_event)
+            self._installed = False
+
+    def _on_booking_event(self, event_name, info):
+        if event_name == 'cancelled':
+            self.fill_slot(info['schedule_id'], info['doctor_id'], info['appointment_date'], info['appointment_time'])
+
+    # --- Индекс заявок ---
+
+    def load(self):
+        """Полная загрузка ожидающих заявок; просроченные заявки закрываются"""
+        loaded_at = datetime.now()
+        session = self.session_factory()
+        try:
+            session.execute(
+                update(WaitlistEntry)
+                .where(WaitlistEntry.status == WaitlistStatus.WAITING, WaitlistEntry.date_to < date.today())
+                .values(status=WaitlistStatus.EXPIRED, updated_at=datetime.now())
+                .execution_options(synchronize_session=False, skip_access_policy=True)
+            )
+            session.commit()
+            specializations = dict(session.execute(
+                select(Employee.id, Employee.specialization_id).execution_options(skip_access_policy=True)
+            ).all())
+        finally:
+            session.close()
+
+        with self._lock:
+            self._entries, self._queues = {}, {}
+            self._specialization_of = specializations
+            self._last_id = 0
+            self._closed_checked_at = loaded_at
+            self._loaded_for = date.today()
+        self._sync()
+
+    def _sync(self):
+        """Подгрузка заявок, добавленных после последней загрузки, и снятие закрытых
+
+        Учитываются изменения, сделанные в том числе другими процессами.
+        """
+        if self._loaded_for != date.today():
+            self.load()
+            return
+        checked_at = datetime.now()
+        session = self.session_factory()
+        try:
+            closed = session.execute(
+                select(WaitlistEntry.id)
+                .where(
+                    WaitlistEntry.updated_at >= self._closed_checked_at - CLOSED_SYNC_MARGIN,
+                    WaitlistEntry.status != WaitlistStatus.WAITING,
+                    WaitlistEntry.id <= self._last_id
+                )
+                .execution_options(skip_access_policy=True)
+            ).scalars().all()
+            rows = session.execute(
+                select(
+                    WaitlistEntry.id, WaitlistEntry.patient_id, WaitlistEntry.doctor_id,
+                    WaitlistEntry.specialization_id, WaitlistEntry.date_from, WaitlistEntry.date_to,
+                    WaitlistEntry.time_from, WaitlistEntry.time_to, WaitlistEntry.priority,
+                    WaitlistEntry.created_at, WaitlistEntry.notes
+                )
+                .where(
+                    WaitlistEntry.status == WaitlistStatus.WAITING,
+                    WaitlistEntry.id > self._last_id,
+                    WaitlistEntry.date_to >= date.today()
+                )
+                .order_by(WaitlistEntry.id)
+                .execution_options(skip_access_policy=True)
+            ).all()
+        finally:
+            session.close()
+        with self._lock:
+            # Из очередей закрытые заявки удаляются лениво при подборе
+            for entry_id in closed:
+                self._entries.pop(entry_id, None)
+            for row in rows:
+                self._index(row)
+            if rows:
+                self._last_id = max(self._last_id, rows[-1].id)
+            self._closed_checked_at = checked_at
+
+    def _index(self, entry):
+        """Помещение заявки в очереди всех дней ее окна"""
+        if entry.id in self._entries:
+            return
+        self._entries[entry.id] = entry
+        item = (-entry.priority, entry.created_at, entry.id)
+        kind, key = ('doctor', entry.doctor_id) if entry.doctor_id else ('specialization', entry.specialization_id)
+        day = max(entry.date_from, date.today())
+        while day <= entry.date_to:
+            heapq.heappush(self._queues.setdefault((kind, key, day), []), item)
+            day += timedelta(days=1)
+
+    def _best_candidate(self, doctor_id, work_date, appointment_time, skip):
+        """Лучшая подходящая заявка из очередей врача и его специализации
+
+        Заявки, уже снятые из индекса, удаляются из очередей лениво; заявки,
+        которым не подходит время или которые сейчас пробуются на другое
+        место, временно вынимаются и возвращаются обратно.
+        """
+        best = None
+        queue_keys = [('doctor', doctor_id, work_date)]
+        specialization_id = self._specialization_of.get(doctor_id)
+        if specialization_id is not None:
+            queue_keys.append(('specialization', specialization_id, work_date))
+        for queue_key in queue_keys:
+            queue = self._queues.get(queue_key)
+            if not queue:
+                continue
+            postponed = []
+            while queue:
+                item = queue[0]
+                entry = self._entries.get(item[2])
+                if entry is None:
+                    heapq.heappop(queue)
+                    continue
+                if (entry.id in skip or entry.id in self._claiming
+                        or (entry.time_from and appointment_time < entry.time_from)
+                        or (entry.time_to and appointment_time > entry.time_to)):
+                    postponed.append(heapq.heappop(queue))
+                    continue
+                if best is None or item < best:
+                    best = item
+                break
+            for item in postponed:
+                heapq.heappush(queue, item)
+        return self._entries[best[2]] if best else None
+
+    # --- Подбор заявки на освободившееся место ---
+
+    def fill_slot(self, schedule_id, doctor_id, work_date, appointment_time):
+        """Запись лучшей ожидающей заявки на освободившееся место
+
+        Возвращает (id заявки, id записи) или None, если заявки нет, место
+        уже занято или время приема уже прошло.
+        """
+        # Отмена на сегодняшнее прошедшее время не должна записывать пациента в прошлое
+        if datetime.combine(work_date, appointment_time) <= datetime.now():
+            return None
+        self._sync()
+        skip = set()
+        for _ in range(MAX_CLAIM_ATTEMPTS):
+            with self._lock:
+                entry = self._best_candidate(doctor_id, work_date, appointment_time, skip)
+                if entry is None:
+                    return None
+                # Заявка помечается до записи: другой поток ее уже не выберет
+                self._claiming.add(entry.id)
+
+            outcome, appointment_id = self._claim(entry, schedule_id, work_date, appointment_time)
+            with self._lock:
+                self._claiming.discard(entry.id)
+                if outcome in ('booked', 'taken'):
+                    # Заявка больше не ожидает; из очередей она удалится лениво
+                    self._entries.pop(entry.id, None)
+            if outcome == 'booked':
+                notify_booking_listeners('booked', {
+                    'id': appointment_id, 'patient_id': entry.patient_id, 'doctor_id': doctor_id,
+                    'schedule_id': schedule_id, 'appointment_date': work_date, 'appointment_time': appointment_time,
+                })
+                print(f"Лист ожидания: заявка {entry.id} записана на {work_date} {appointment_time:%H:%M} (запись {appointment_id})")
+                return entry.id, appointment_id
+            if outcome == 'taken':
+                # Заявку уже обработал другой процесс или ее отменили
+                continue
+            if outcome == 'slot_full':
+                return None
+            # Пациент занят в это время: место достается следующей заявке
+            skip.add(entry.id)
+        return None
+
+    def _claim(self, entry, schedule_id, work_date, appointment_time):
+        """Занятие заявки и запись в слот одной транзакцией
+
+        Возвращает (исход, id записи): 'booked', 'taken' (заявка уже не
+        ожидает), 'slot_full' (место заняли раньше) или 'busy' (у пациента
+        уже есть запись на это время).
+        """
+        session = self.session_factory()
+        try:
+            claimed = session.execute(
+                update(WaitlistEntry)
+                .where(WaitlistEntry.id == entry.id, WaitlistEntry.status == WaitlistStatus.WAITING)
+                .values(status=WaitlistStatus.BOOKED, updated_at=datetime.now())
+                .execution_options(synchronize_session=False, skip_access_policy=True)
+            )
+            if claimed.rowcount != 1:
+                session.rollback()
+                return 'taken', None
+
+            busy = session.execute(
+                select(Appointment.id)
+                .where(
+                    Appointment.patient_id == entry.patient_id,
+                    Appointment.appointment_date == work_date,
+                    Appointment.appointment_time == appointment_time,
+                    Appointment.status == AppointmentStatus.SCHEDULED
+                )
+                .limit(1)
+                .execution_options(skip_access_policy=True)
+            ).first()
+            if busy:
+                session.rollback()
+                return 'busy', None
+
+            reason = "Из листа ожидания" + (f": {entry.notes}" if entry.notes else "")
+            appointment_id = book_into_schedule(session, schedule_id, entry.patient_id, reason, appointment_time)
+            if appointment_id is None:
+                session.rollback()
+                return 'slot_full', None
+
+            session.execute(
+                update(WaitlistEntry)
+                .where(WaitlistEntry.id == entry.id)
+                .values(appointment_id=appointment_id)
+                .execution_options(synchronize_session=False, skip_access_policy=True)
+            )
+            session.commit()
+            return 'booked', appointment_id
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка записи из листа ожидания: {e}")
+            return 'slot_full', None
+        finally:
+            session.close()
+
+    # --- Заявки ---
+
+    def add_entry(self, patient_id, date_from, date_to, doctor_id=None, specialization_id=None,
+                  time_from=None, time_to=None, priority=0, notes=None):
+        """Постановка пациента в лист ожидания
+
+        Если в окне заявки уже есть свободное место (по индексу slot_finder),
+        пациент записывается сразу. Возвращает (успех, сообщение, id заявки).
+        """
+        if not doctor_id and not specialization_id:
+            return False, "Укажите врача или специализацию", None
+        if date_to < date_from:
+            return False, "Дата окончания раньше даты начала", None
+        if (date_to - date_from).days > MAX_WINDOW_DAYS:
+            return False, f"Окно ожидания не может превышать {MAX_WINDOW_DAYS} дней", None
+        if date_to < date.today():
+            return False, "Окно ожидания уже прошло", None
+
+        session = self.session_factory()
+        try:
+            result = session.execute(
+                insert(WaitlistEntry).values(
+                    patient_id=patient_id, doctor_id=doctor_id,
+                    specialization_id=None if doctor_id else specialization_id,
+                    date_from=date_from, date_to=date_to, time_from=time_from, time_to=time_to,
+                    priority=priority, status=WaitlistStatus.WAITING, notes=notes,
+                    created_at=datetime.now(), updated_at=datetime.now()
+                )
+            )
+            entry_id = result.inserted_primary_key[0]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            return False, f"Ошибка добавления в лист ожидания: {str(e)}", None
+        finally:
+            session.close()
+
+        booked = self._book_free_slot(entry_id) if self.slot_finder else None
+        if booked:
+            return True, f"Свободное место найдено, пациент записан (запись {booked})", entry_id
+        self._sync()
+        return True, "Пациент добавлен в лист ожидания", entry_id
+
+    def _book_free_slot(self, entry_id):
+        """Немедленная запись новой заявки, если подходящее место уже свободно"""
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(entry_id)
+        if entry is None:
+            return None
+        after = max(datetime.now(), datetime.combine(entry.date_from, entry.time_from or datetime.min.time()))
+        within_days = (entry.date_to - after.date()).days
+        for slot in self.slot_finder.find(entry.specialization_id, entry.doctor_id, within_days, after, limit=20):
+            if ((entry.time_from and slot['start_time'] < entry.time_from)
+                    or (entry.time_to and slot['start_time'] > entry.time_to)):
+                continue
+            with self._lock:
+                if entry.id not in self._entries or entry.id in self._claiming:
+                    return None
+                self._claiming.add(entry.id)
+            outcome, appointment_id = self._claim(entry, slot['schedule_id'], slot['work_date'], slot['start_time'])
+            with self._lock:
+                self._claiming.discard(entry.id)
+                if outcome in ('booked', 'taken'):
+                    self._entries.pop(entry.id, None)
+            if outcome == 'booked':
+                notify_booking_listeners('booked', {
+                    'id': appointment_id, 'patient_id': entry.patient_id, 'doctor_id': slot['doctor_id'],
+                    'schedule_id': slot['schedule_id'], 'appointment_date': slot['work_date'],
+                    'appointment_time': slot['start_time'],
+                })
+                return appointment_id
+            if outcome == 'taken':
+                return None
+        return None
+
+    def cancel_entry(self, entry_id):
+        """Снятие заявки из листа ожидания; возвращает (успех, сообщение)"""
+        session = self.session_factory()
+        try:
+            result = session.execute(
+                update(WaitlistEntry)
+                .where(WaitlistEntry.id == entry_id, WaitlistEntry.status == WaitlistStatus.WAITING)
+                .values(status=WaitlistStatus.CANCELLED, updated_at=datetime.now())
+                .execution_options(synchronize_session=False, skip_access_policy=True)
+            )
+            if result.rowcount != 1:
+                session.rollback()
+                return False, "Заявка не найдена или уже не ожидает"
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            return False, f"Ошибка отмены заявки: {str(e)}"
+        finally:
+            session.close()
+        with self._lock:
+            self._entries.pop(entry_id, None)
+        return True, "Заявка снята из листа ожидания"
+
+    def waiting_count(self):
+        """Число ожидающих заявок в индексе"""
+        return len(self._entries)